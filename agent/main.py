@@ -23,11 +23,20 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from agent.device_detector import DeviceDetector
 from agent.security import AgentApiClient
 from shared.collector import (
+    AnalysisWorkerOptions,
+    AnalysisWorkerPool,
+    ClassificationPolicy,
     DomainHintCache,
     FlowManager,
     FlowSummary,
+    LoadGovernor,
     PacketObservation,
+    RateBudget,
+    UploadJournal,
+    UploadScheduler,
     build_capture_backend,
+    build_tls_reassembler,
+    queue_fill_ratio,
 )
 try:
     from agent.dpi import WebInspectionController
@@ -42,6 +51,8 @@ logger = logging.getLogger(__name__)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_CONFIG_PATH = PROJECT_ROOT / "config" / "agent.json"
 AGENT_RUNTIME_DIR = PROJECT_ROOT / "runtime" / "agent"
+AGENT_DOMAIN_HINTS_SNAPSHOT = AGENT_RUNTIME_DIR / "domain_hints.bin"
+AGENT_UPLOAD_JOURNAL_DIR = AGENT_RUNTIME_DIR / "upload_journal"
 
 # =========================================================
 # THREAD SAFE DEVICE INVENTORY (PERSISTENT)
@@ -108,7 +119,14 @@ class DeviceInventory:
 
 class NetworkAgent:
 
-    def __init__(self, config_path=DEFAULT_CONFIG_PATH, *, start_background_workers: bool = True):
+    def __init__(
+        self,
+        config_path=DEFAULT_CONFIG_PATH,
+        *,
+        start_background_workers: bool = True,
+        replay_path: str | None = None,
+        replay_speed: str | None = None,
+    ):
         self.config = self._load_config(config_path)
         self.hostname = socket.gethostname()
         self.agent_version = "v3.0-hybrid"
@@ -142,6 +160,24 @@ class NetworkAgent:
             or os.getenv("NETVISOR_CAPTURE_BACKEND")
             or "auto"
         ).strip() or "auto"
+        self.capture_filter = (
+            os.getenv("NETVISOR_AGENT_CAPTURE_FILTER")
+            or os.getenv("NETVISOR_CAPTURE_FILTER")
+            or self.config.get("capture_filter")
+            or ""
+        ).strip() or None
+        self.capture_filter_program = (
+            os.getenv("NETVISOR_AGENT_CAPTURE_FILTER_PROGRAM")
+            or os.getenv("NETVISOR_CAPTURE_FILTER_PROGRAM")
+            or self.config.get("capture_filter_program")
+            or None
+        )
+        # Offline replay of pcap/pcapng captures, e.g. to load-test the upload path.
+        self.capture_replay_path = (replay_path or os.getenv("NETVISOR_CAPTURE_REPLAY_PATH") or "").strip() or None
+        if replay_path:
+            self.capture_backend_name = "pcap"
+        self.capture_replay_speed = replay_speed or os.getenv("NETVISOR_CAPTURE_REPLAY_SPEED", "realtime")
+        self.capture_replay_watch = str(os.getenv("NETVISOR_CAPTURE_REPLAY_WATCH", "false")).strip().lower() in {"1", "true", "yes", "on"}
         self.api_client = AgentApiClient(
             state_path=AGENT_RUNTIME_DIR / "security" / "agent_transport_state.dpapi",
             bootstrap_api_key=self.api_key,
@@ -166,7 +202,17 @@ class NetworkAgent:
             logger.info("Discovery network set to %s", self.local_network)
         else:
             logger.warning("Unable to infer local network for ARP discovery; falling back to passive ARP cache only.")
-        self.domain_cache = DomainHintCache()
+        self.domain_cache = DomainHintCache(
+            ttl_seconds=int(os.getenv("NETVISOR_DOMAIN_CACHE_TTL_SECONDS", "300")),
+            max_entries=int(os.getenv("NETVISOR_DOMAIN_CACHE_MAX_ENTRIES", "2048")),
+        )
+        self.domain_cache_snapshot_interval = float(os.getenv("NETVISOR_DOMAIN_CACHE_SNAPSHOT_SECONDS", "60") or 0)
+        if self.domain_cache_snapshot_interval > 0:
+            self.domain_cache.load_snapshot(AGENT_DOMAIN_HINTS_SNAPSHOT)
+        self.tls_reassembler = build_tls_reassembler(
+            int(os.getenv("NETVISOR_TLS_REASSEMBLY_FLOW_BYTES", "16384") or 16384),
+            int(os.getenv("NETVISOR_TLS_REASSEMBLY_BUDGET_BYTES", "1048576") or 0),
+        )
         self.probing_ips = set()
         
         # OUI Vendor Cache
@@ -179,6 +225,11 @@ class NetworkAgent:
         }
 
         # --- FLOW MANAGER (PHASE 1) ---
+        self.classification_policy = ClassificationPolicy(
+            min_confidence=float(os.getenv("NETVISOR_FLOW_CLASSIFICATION_MIN_CONFIDENCE", "0.9")),
+            recheck_interval=float(os.getenv("NETVISOR_FLOW_CLASSIFICATION_RECHECK_SECONDS", "30")),
+        )
+        self.capture_backend = self._build_capture_backend(self.capture_backend_name)
         self.flow_manager = FlowManager(
             agent_id=self.agent_id,
             organization_id=self.organization_id,
@@ -189,17 +240,50 @@ class NetworkAgent:
             cleanup_interval=float(os.getenv("NETVISOR_FLOW_CLEANUP_INTERVAL_SECONDS", "5")),
             max_flows=int(os.getenv("NETVISOR_FLOW_MAX_ACTIVE_FLOWS", "50000")),
             start_worker=self._background_workers_enabled,
+            classification_policy=self.classification_policy,
+            stripe_count=int(os.getenv("NETVISOR_FLOW_TABLE_STRIPES", "16")),
+            bidirectional=str(os.getenv("NETVISOR_FLOW_BIDIRECTIONAL", "false")).strip().lower() in {"1", "true", "yes", "on"},
+            flow_storage=os.getenv("NETVISOR_FLOW_TABLE_STORAGE", "dict"),
+            clock=self.capture_backend.clock,
+            flow_features=str(os.getenv("NETVISOR_FLOW_FEATURES", "true")).strip().lower() in {"1", "true", "yes", "on"},
         )
-        self.capture_backend = build_capture_backend(
-            role="agent",
-            interface=self.capture_interface,
-            requested_backend=self.capture_backend_name,
-        )
+        self.analysis_pool = self._build_analysis_pool()
 
         # Queues and Thread Pools
         self.upload_q = queue.Queue(maxsize=10000)
+        # Flow summaries are journaled to disk before upload and released once
+        # the backend accepts them, so an outage or restart does not lose them.
+        self.upload_journal = UploadJournal(
+            AGENT_UPLOAD_JOURNAL_DIR,
+            max_bytes=int(float(os.getenv("NETVISOR_UPLOAD_JOURNAL_MAX_MB", "256") or 256) * 1024 * 1024),
+            segment_bytes=int(float(os.getenv("NETVISOR_UPLOAD_JOURNAL_SEGMENT_MB", "4") or 4) * 1024 * 1024),
+        )
+        self.replay_budget = RateBudget(float(os.getenv("NETVISOR_UPLOAD_REPLAY_RATE", "1000") or 0))
+        self.upload_scheduler = UploadScheduler(
+            min_batch=int(os.getenv("NETVISOR_UPLOAD_BATCH_MIN", "20") or 20),
+            max_batch=int(os.getenv("NETVISOR_UPLOAD_BATCH_MAX", "500") or 500),
+            max_batch_bytes=int(os.getenv("NETVISOR_UPLOAD_BATCH_MAX_BYTES", "1048576") or 1048576),
+            linger=float(os.getenv("NETVISOR_UPLOAD_BATCH_LINGER_SECONDS", "5") or 5),
+            target_latency=float(os.getenv("NETVISOR_UPLOAD_TARGET_LATENCY_SECONDS", "1") or 1),
+            max_in_flight=self.api_client.max_in_flight,
+        )
+        self.upload_pool = ThreadPoolExecutor(max_workers=self.api_client.max_in_flight, thread_name_prefix="netvisor-upload")
         self.discovery_pool = ThreadPoolExecutor(max_workers=5)
 
+        # Load shedding: CPU, queue and upload backlog pressure step down inspection, then sample, then aggregate.
+        queue_providers = [lambda: queue_fill_ratio(self.upload_q), self.upload_journal.fill_ratio]
+        if self.analysis_pool is not None:
+            queue_providers.append(self.analysis_pool.queue_fill)
+        self.load_governor = LoadGovernor(
+            enabled=str(os.getenv("NETVISOR_LOAD_SHED_ENABLED", "true")).strip().lower() in {"1", "true", "yes", "on"},
+            high_watermark=float(os.getenv("NETVISOR_LOAD_SHED_HIGH_WATERMARK", "0.85")),
+            low_watermark=float(os.getenv("NETVISOR_LOAD_SHED_LOW_WATERMARK", "0.6")),
+            sample_rate=int(os.getenv("NETVISOR_LOAD_SHED_SAMPLE_RATE", "10")),
+            queue_providers=queue_providers,
+        )
+        self.load_shed_interval = max(float(os.getenv("NETVISOR_LOAD_SHED_INTERVAL_SECONDS", "2") or 2), 0.5)
+        self._inspect_flow = self.load_governor.inspect_flow(self.flow_manager.should_inspect)
+
         if self._background_workers_enabled:
             self._register_agent(force_reenroll=not self.api_client.has_credentials())
             if not self._enrollment_pending:
@@ -218,6 +302,41 @@ class NetworkAgent:
             f.write(new_id)
         return new_id
 
+    def _build_capture_backend(self, requested_backend):
+        return build_capture_backend(
+            role="agent",
+            interface=self.capture_interface,
+            requested_backend=requested_backend,
+            ring_block_size=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCK_SIZE", "0") or 0),
+            ring_block_count=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCKS", "0") or 0),
+            capture_filter=self.capture_filter,
+            capture_filter_program=self.capture_filter_program,
+            replay_path=self.capture_replay_path,
+            replay_speed=self.capture_replay_speed,
+            replay_watch=self.capture_replay_watch,
+        )
+
+    def _build_analysis_pool(self) -> AnalysisWorkerPool | None:
+        worker_count = int(os.getenv("NETVISOR_AGENT_ANALYSIS_WORKERS", "0") or 0)
+        if worker_count <= 0:
+            return None
+        options = AnalysisWorkerOptions(
+            source_type="agent",
+            metadata_only=False,
+            queue_batches=max(int(os.getenv("NETVISOR_AGENT_ANALYSIS_QUEUE_BATCHES", "256") or 256), 1),
+            domain_cache_ttl=self.domain_cache.ttl_seconds,
+            domain_cache_max_entries=self.domain_cache.max_entries,
+            domain_cache_snapshot_path=(
+                str(AGENT_DOMAIN_HINTS_SNAPSHOT) if self.domain_cache_snapshot_interval > 0 else None
+            ),
+            domain_cache_snapshot_interval=max(self.domain_cache_snapshot_interval, 1.0),
+            tls_reassembly_flow_bytes=self.tls_reassembler.max_flow_bytes if self.tls_reassembler else 16384,
+            tls_reassembly_budget_bytes=(
+                max(self.tls_reassembler.max_total_bytes // worker_count, 1) if self.tls_reassembler else 0
+            ),
+        )
+        return AnalysisWorkerPool(worker_count=worker_count, options=options, on_observations=self.apply_observations)
+
     def _load_config(self, path):
         try:
             config_path = Path(path)
@@ -265,9 +384,15 @@ class NetworkAgent:
             "enrollment_pending": self._enrollment_pending,
             "enrollment_message": self._enrollment_message,
             "upload_queue_depth": self.upload_q.qsize(),
+            "upload_journal": self.upload_journal.status_snapshot(),
+            "upload_scheduler": self.upload_scheduler.status_snapshot(),
             "device_inventory_size": len(self.device_inventory.devices),
             "flow_manager": self.flow_manager.status_snapshot(),
+            "domain_cache": self.domain_cache.status_snapshot(),
+            "tls_reassembly": self.tls_reassembler.status_snapshot() if self.tls_reassembler else None,
             "capture": self.capture_backend.status_snapshot(),
+            "analysis_pipeline": self.analysis_pool.status_snapshot() if self.analysis_pool else None,
+            "load_shedding": self.load_governor.status_snapshot(),
             "transport": self.api_client.status_snapshot(),
             "web_inspection": web_inspection,
         }
@@ -279,11 +404,15 @@ class NetworkAgent:
         # Start workers only after enrollment so the backend can return the
         # canonical organization id before discovery/heartbeat traffic begins.
         print("[*] Starting upload worker...")
+        self.upload_journal.open()
         threading.Thread(target=self._upload_worker, daemon=True).start()
         print("[*] Starting heartbeat worker...")
         threading.Thread(target=self._heartbeat_worker, daemon=True).start()
+        threading.Thread(target=self._load_governor_worker, daemon=True).start()
         print("[*] Starting discovery engine...")
         threading.Thread(target=self._discovery_engine, daemon=True).start()
+        if self.domain_cache_snapshot_interval > 0 and self.analysis_pool is None:
+            threading.Thread(target=self._domain_cache_snapshot_worker, daemon=True).start()
 
         if WebInspectionController is not None:
             self.web_inspection = WebInspectionController(
@@ -405,17 +534,26 @@ class NetworkAgent:
         except queue.Full:
             logger.warning("Upload queue full - dropping flow summary")
 
+    def _is_tracked_flow(self, key) -> bool:
+        return self.flow_manager.flow_state(key) is not None
+
     def process_packet(self, packet) -> bool:
         """Phase 1: Direct packet to FlowManager for feature extraction."""
         try:
+            kept, weight = self.load_governor.sample([packet])
+            if not kept:
+                return True
             observation = PacketObservation.from_packet(
                 packet,
                 source_type="agent",
                 metadata_only=False,
                 domain_cache=self.domain_cache,
+                inspect_flow=self._inspect_flow,
+                reassembler=self.tls_reassembler,
             )
             if observation is None:
                 return False
+            observation = self.load_governor.shape([observation], weight, self._is_tracked_flow)[0]
 
             if observation.domain and self.verbose:
                 print(f"{Fore.CYAN}[APP]{Style.RESET_ALL} {observation.src_ip} -> {observation.domain}")
@@ -427,30 +565,133 @@ class NetworkAgent:
             logger.error(f"Packet error: {e}")
             return False
 
+    def process_batch(self, packets: list) -> int:
+        """Batched variant of process_packet: one FlowManager lock per capture poll."""
+        kept, weight = self.load_governor.sample(packets)
+        observations = []
+        for packet in kept:
+            try:
+                observation = PacketObservation.from_packet(
+                    packet,
+                    source_type="agent",
+                    metadata_only=False,
+                    domain_cache=self.domain_cache,
+                    inspect_flow=self._inspect_flow,
+                    reassembler=self.tls_reassembler,
+                )
+            except Exception as e:
+                logger.error(f"Packet error: {e}")
+                continue
+            if observation is None:
+                continue
+            if observation.domain and self.verbose:
+                print(f"{Fore.CYAN}[APP]{Style.RESET_ALL} {observation.src_ip} -> {observation.domain}")
+            observations.append(observation)
+        observations = self.load_governor.shape(observations, weight, self._is_tracked_flow)
+        applied = self.flow_manager.update_from_observations(observations)
+        # Sampled-out packets are represented by the scaled counters, not dropped.
+        return max(len(packets) - (len(kept) - applied) * weight, 0)
+
+    def _submit_to_analysis_pool(self, frames: list) -> int:
+        kept, weight = self.load_governor.sample(frames)
+        accepted = self.analysis_pool.submit(kept, sample_weight=weight, shed_level=self.load_governor.level)
+        return max(len(frames) - (len(kept) - accepted) * weight, 0)
+
+    def apply_observations(self, observations: list) -> int:
+        """Collector stage of the pipelined mode: apply worker observations to the FlowManager."""
+        if self.verbose:
+            for observation in observations:
+                if observation.domain:
+                    print(f"{Fore.CYAN}[APP]{Style.RESET_ALL} {observation.src_ip} -> {observation.domain}")
+        observations = self.load_governor.shape(observations, 1, self._is_tracked_flow)
+        return self.flow_manager.update_from_observations(observations)
+
+    def _journal_pending_summaries(self) -> int:
+        records = []
+        while True:
+            try:
+                records.append(self.upload_q.get_nowait())
+            except queue.Empty:
+                break
+            self.upload_q.task_done()
+        return self.upload_journal.append(records)
+
     def _upload_worker(self):
-        batch = []
-        last_send = time.time()
         while self.is_running:
             try:
-                try:
-                    record = self.upload_q.get(timeout=1.0)
-                    batch.append(record)
-                    self.upload_q.task_done()
-                except queue.Empty:
-                    pass
-
-                if len(batch) >= 20 or (time.time() - last_send > 5 and batch):
+                self._journal_pending_summaries()
+                if not self.upload_scheduler.due(self.upload_journal.unsent_records):
                     try:
-                        r = self.api_client.request("POST", self.flow_url, json_body=batch, timeout=10.0)
-                        r.raise_for_status()
-                        batch = []
-                        last_send = time.time()
-                    except Exception as e:
-                        logger.error(f"Flow upload failed: {e}")
-                        time.sleep(2) # Backoff
+                        record = self.upload_q.get(timeout=1.0)
+                        self.upload_q.task_done()
+                        self.upload_journal.append([record])
+                    except queue.Empty:
+                        pass
+                    continue
+                if not self.upload_scheduler.acquire_slot(timeout=1.0):
+                    continue
+                batch = self.upload_journal.next_batch(
+                    self.upload_scheduler.batch_size, max_bytes=self.upload_scheduler.batch_bytes
+                )
+                if batch is None:
+                    self.upload_scheduler.release_slot()
+                    continue
+                if batch.replay:
+                    # Backlog from an outage drains at its own pace so it does
+                    # not crowd out live flows or swamp the backend on reconnect.
+                    time.sleep(self.replay_budget.delay(len(batch.records)))
+                # Batches are acked by sequence range, so they may complete in any order.
+                self.upload_pool.submit(self._send_flow_batch, batch)
             except Exception as e:
                 logger.error(f"Upload worker error: {e}")
 
+    def _send_flow_batch(self, batch) -> None:
+        started = time.monotonic()
+        try:
+            r = self.api_client.post_flow_batch(self.flow_url, batch.records, timeout=10.0)
+            r.raise_for_status()
+            accepted = r.json().get("count", len(batch.records))
+            if accepted < len(batch.records):
+                raise RuntimeError(f"backend queued {accepted}/{len(batch.records)} flows")
+            self.upload_journal.ack(batch)
+            self.upload_scheduler.record_success(len(batch.records), time.monotonic() - started)
+        except Exception as e:
+            # The scheduler backs off (or honours Retry-After) before the next attempt.
+            too_large = self.upload_scheduler.record_failure(getattr(e, "response", None))
+            if too_large and len(batch.records) == 1:
+                # A lone record over the size limit can never be sent; keeping
+                # it would block every newer record behind it.
+                self.upload_journal.reject(batch)
+                logger.warning("Dropping flow record %s: the backend rejects it as too large on its own", batch.first_seq)
+            else:
+                self.upload_journal.requeue(batch, split=too_large)
+            logger.error(f"Flow upload failed: {e}")
+        finally:
+            self.upload_scheduler.release_slot()
+
+    def _save_domain_cache_snapshot(self) -> None:
+        if getattr(self, "analysis_pool", None) is not None:
+            # Analysis workers own the live caches and snapshot them per worker.
+            return
+        try:
+            self.domain_cache.save_snapshot(AGENT_DOMAIN_HINTS_SNAPSHOT)
+        except OSError as exc:
+            logger.warning("Domain hint snapshot failed: %s", exc)
+
+    def _domain_cache_snapshot_worker(self) -> None:
+        while self.is_running:
+            time.sleep(self.domain_cache_snapshot_interval)
+            self._save_domain_cache_snapshot()
+
+    def _load_governor_worker(self) -> None:
+        psutil.cpu_percent(interval=None)
+        while self.is_running:
+            time.sleep(self.load_shed_interval)
+            previous = self.load_governor.level
+            level = self.load_governor.update(psutil.cpu_percent(interval=None))
+            if level != previous:
+                logger.warning("Load shedding level %s -> %s (%s)", previous, level, self.load_governor.level_name)
+
     def _heartbeat_worker(self):
         while self.is_running:
             try:
@@ -473,6 +714,8 @@ class NetworkAgent:
                     "time": datetime.now().isoformat(),
                     "organization_id": self.organization_id,
                     "web_inspection": self.web_inspection.status_snapshot() if hasattr(self, "web_inspection") else {},
+                    "load_shedding": self.load_governor.status_snapshot(),
+                    "upload_journal": self.upload_journal.status_snapshot(),
                 }
                 response = self.api_client.request("POST", self.heartbeat_url, json_body=payload, timeout=5)
                 response.raise_for_status()
@@ -627,10 +870,18 @@ class NetworkAgent:
         self.is_running = False
         if hasattr(self, "capture_backend"):
             self.capture_backend.stop()
+        if getattr(self, "analysis_pool", None) is not None:
+            self.analysis_pool.stop()
         if hasattr(self, "web_inspection"):
             self.web_inspection.stop()
         self.flow_manager.stop()
+        self.upload_pool.shutdown(wait=False, cancel_futures=True)
+        if self._workers_started:
+            self._journal_pending_summaries()
+            self.upload_journal.close()
         self.device_inventory.save_inventory()
+        if self.domain_cache_snapshot_interval > 0:
+            self._save_domain_cache_snapshot()
         sys.exit(0)
 
     def start(self, timeout=None):
@@ -644,16 +895,18 @@ class NetworkAgent:
             self._start_operational_workers()
 
         print(f"{Fore.BLUE}[*] Netvisor Hybrid Agent Starting...")
-        success, error = self.capture_backend.start(self.process_packet, timeout=timeout)
-        if not success and self.capture_backend.backend_name != "scapy":
+        on_batch = self.process_batch
+        if self.analysis_pool is not None:
+            self.analysis_pool.start()
+            on_batch = self._submit_to_analysis_pool
+        success, error = self.capture_backend.start(timeout=timeout, on_batch=on_batch)
+        if not success and self.capture_backend.live and self.capture_backend.backend_name != "scapy":
             logger.warning("Primary capture backend failed: %s. Falling back to Scapy.", error)
             self.capture_backend.stop()
-            self.capture_backend = build_capture_backend(
-                role="agent",
-                interface=self.capture_interface,
-                requested_backend="scapy",
-            )
-            success, error = self.capture_backend.start(self.process_packet, timeout=timeout)
+            self.capture_backend = self._build_capture_backend("scapy")
+            success, error = self.capture_backend.start(timeout=timeout, on_batch=on_batch)
+        if self.analysis_pool is not None:
+            self.analysis_pool.stop()
         if not success and error:
             logger.error("Capture backend failed: %s", error)
 
@@ -667,10 +920,26 @@ def main(config_path=DEFAULT_CONFIG_PATH) -> None:
         default=None,
         help="Packet sniff timeout in seconds. Omit to run continuously until interrupted.",
     )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        default=None,
+        help="Replay a pcap/pcapng file, or a directory of captures, instead of capturing live.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        default=None,
+        help="Replay pacing: 'realtime' (default), a multiplier such as '10x', or 'max'.",
+    )
     args = parser.parse_args()
 
     if args.health_check or args.reset_enrollment:
-        agent = NetworkAgent(config_path, start_background_workers=False)
+        agent = NetworkAgent(
+            config_path,
+            start_background_workers=False,
+            replay_path=args.replay,
+            replay_speed=args.replay_speed,
+        )
         if args.reset_enrollment:
             agent.api_client.reset_enrollment()
         snapshot = agent.status_snapshot()
@@ -679,7 +948,7 @@ def main(config_path=DEFAULT_CONFIG_PATH) -> None:
         print(json.dumps(snapshot, indent=2, sort_keys=True))
         sys.exit(0)
 
-    agent = NetworkAgent(config_path)
+    agent = NetworkAgent(config_path, replay_path=args.replay, replay_speed=args.replay_speed)
     try:
         agent.start(timeout=args.timeout)
     except KeyboardInterrupt:
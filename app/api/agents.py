@@ -5,12 +5,14 @@ from fastapi.responses import JSONResponse
 
 from ..core.config import settings
 from ..core.dependencies import request_rate_limit
+from ..core.request_encoding import DecodedBodyRoute, signed_request_body
 from ..db.session import get_db_connection
 from ..services.agent_service import agent_service
 from ..services.agent_enrollment_service import agent_enrollment_service
 from ..services.agent_auth_service import agent_auth_service, AgentAuthenticationError
 from ..services.audit_service import audit_service
 from ..services.device_service import device_service
+from ..services.load_shedding_service import load_shedding_service
 from ..services.managed_device_service import managed_device_service
 from ..services.metrics_service import metrics_service
 from ..services.web_inspection_service import web_inspection_service
@@ -23,7 +25,7 @@ import logging
 
 
 logger = logging.getLogger("netvisor.api.agents")
-router = APIRouter()
+router = APIRouter(route_class=DecodedBodyRoute)
 
 agent_bootstrap_rate_limit = request_rate_limit(
     limit=settings.AGENT_BOOTSTRAP_RATE_LIMIT_PER_MINUTE,
@@ -81,7 +83,7 @@ async def validate_agent_bootstrap_key(request: Request):
 async def validate_agent_key(request: Request):
     conn = get_db_connection()
     try:
-        body = await request.body()
+        body = await signed_request_body(request)
         context = agent_auth_service.authenticate_request(conn, request, body)
         conn.commit()
         return context
@@ -362,6 +364,7 @@ async def agent_heartbeat(
             create_if_missing=True,
         )
         conn.commit()
+        load_shedding_service.record(agent_id, hb.get("load_shedding"))
         return _collect_response(
             auth_context=auth_context,
             organization_id=org_id,
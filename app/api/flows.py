@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from typing import List
 from ..core.config import settings
 from ..core.dependencies import request_rate_limit
-from ..schemas.flow_schema import FlowBase
+from ..core.request_encoding import DecodedBodyRoute, flow_batch_body
+from ..schemas.flow_schema import FlowBase, FlowBatch
 from ..schemas.user_schema import GenericResponse
 from ..services.flow_service import FlowQueueBackpressureError, flow_service
+from ..services.load_shedding_service import load_shedding_service
 from .agents import validate_agent_key, _require_authenticated_agent_id, _collect_response
 import logging
 
 logger = logging.getLogger("netvisor.api.flows")
-router = APIRouter()
+router = APIRouter(route_class=DecodedBodyRoute)
 
 agent_flow_rate_limit = request_rate_limit(
     limit=settings.AGENT_FLOW_RATE_LIMIT_PER_MINUTE,
@@ -24,11 +25,12 @@ async def ingest_flow(
     _rate_limited: bool = Depends(agent_flow_rate_limit),
     auth_context: dict = Depends(validate_agent_key)
 ):
-    _require_authenticated_agent_id(auth_context, flow.agent_id, source="flow payload")
+    agent_id = _require_authenticated_agent_id(auth_context, flow.agent_id, source="flow payload")
+    [flow] = load_shedding_service.annotate([flow], agent_id)
     try:
         success = await flow_service.buffer_flow(flow)
     except FlowQueueBackpressureError as exc:
-        raise HTTPException(status_code=429, detail=str(exc))
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
     if not success:
         raise HTTPException(status_code=503, detail="Unable to queue flow batch")
     return _collect_response(
@@ -39,16 +41,23 @@ async def ingest_flow(
 
 @router.post("/batch", response_model=GenericResponse)
 async def ingest_batch(
-    flows: List[FlowBase],
+    request: Request,
+    flows: FlowBatch,
     _rate_limited: bool = Depends(agent_flow_rate_limit),
     auth_context: dict = Depends(validate_agent_key)
 ):
     for f in flows:
         _require_authenticated_agent_id(auth_context, f.agent_id, source="flow payload")
+    heartbeat_fallback = not any(load_shedding_service.reported_level(f) for f in flows)
+    flows = load_shedding_service.annotate(flows, auth_context.get("agent_id"))
+    wire_batch = await flow_batch_body(request)
+    wire_overrides = None
+    if wire_batch and heartbeat_fallback and flows and flows[0].load_shed_level:
+        wire_overrides = {"load_shed_level": flows[0].load_shed_level}
     try:
-        success = await flow_service.buffer_flows(flows)
+        success = await flow_service.buffer_flows(flows, wire_batch=wire_batch, wire_overrides=wire_overrides)
     except FlowQueueBackpressureError as exc:
-        raise HTTPException(status_code=429, detail=str(exc))
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
     count = len(flows) if success else 0
     return _collect_response(
         auth_context=auth_context,
@@ -3,23 +3,24 @@ from __future__ import annotations
 from datetime import datetime, timezone
 import hmac
 import logging
-from typing import List
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
 
 from ..core.config import settings
 from ..core.dependencies import request_rate_limit
+from ..core.request_encoding import DecodedBodyRoute, flow_batch_body, signed_request_body
 from ..db.session import get_db_connection
-from ..schemas.flow_schema import FlowBase
+from ..schemas.flow_schema import FlowBase, FlowBatch
 from ..schemas.user_schema import GenericResponse
 from ..services.flow_service import FlowQueueBackpressureError, flow_service
 from ..services.gateway_auth_service import GatewayAuthenticationError, gateway_auth_service
 from ..services.gateway_service import gateway_service
+from ..services.load_shedding_service import load_shedding_service
 from ..services.metrics_service import metrics_service
 from shared.security import REENROLL_REQUEST_HEADER
 
 logger = logging.getLogger("netvisor.api.gateway")
-router = APIRouter()
+router = APIRouter(route_class=DecodedBodyRoute)
 
 gateway_bootstrap_rate_limit = request_rate_limit(
     limit=settings.AGENT_BOOTSTRAP_RATE_LIMIT_PER_MINUTE,
@@ -83,7 +84,7 @@ async def validate_gateway_bootstrap_key(request: Request):
 async def validate_gateway_request(request: Request):
     conn = get_db_connection()
     try:
-        body = await request.body()
+        body = await signed_request_body(request)
         context = gateway_auth_service.authenticate_request(conn, request, body)
         conn.commit()
         return context
@@ -235,6 +236,7 @@ async def gateway_heartbeat(
             capture_mode=hb.get("capture_mode"),
         )
         conn.commit()
+        load_shedding_service.record(gateway_id, hb.get("load_shedding"))
         return _collect_response(
             auth_context=auth_context,
             organization_id=org_id,
@@ -248,7 +250,8 @@ async def gateway_heartbeat(
 
 @router.post("/flows/batch", response_model=GenericResponse)
 async def ingest_gateway_batch(
-    flows: List[FlowBase],
+    request: Request,
+    flows: FlowBatch,
     _rate_limited: bool = Depends(gateway_flow_rate_limit),
     auth_context: dict = Depends(validate_gateway_request),
 ):
@@ -275,6 +278,7 @@ async def ingest_gateway_batch(
             cursor.close()
         conn.close()
 
+    load_shed_level = load_shedding_service.level_for(authenticated_gateway_id)
     gateway_flows: list[FlowBase] = []
     for index, flow in enumerate(flows):
         _require_authenticated_gateway_id(
@@ -288,20 +292,38 @@ async def ingest_gateway_batch(
                 "organization_id": org_id or flow.organization_id,
                 "source_type": "gateway",
                 "metadata_only": True,
+                "load_shed_level": (
+                    flow.load_shed_level if load_shedding_service.reported_level(flow) else load_shed_level
+                ),
             }
         )
         gateway_flows.append(gateway_flow)
 
+    wire_batch = await flow_batch_body(request)
+    wire_overrides = None
+    if wire_batch:
+        wire_overrides = {
+            "agent_id": authenticated_gateway_id,
+            "source_type": "gateway",
+            "metadata_only": True,
+        }
+        if not any(load_shedding_service.reported_level(flow) for flow in flows):
+            wire_overrides["load_shed_level"] = load_shed_level
+        if org_id:
+            wire_overrides["organization_id"] = org_id
+
     try:
-        success = await flow_service.buffer_flows(gateway_flows)
+        success = await flow_service.buffer_flows(gateway_flows, wire_batch=wire_batch, wire_overrides=wire_overrides)
     except FlowQueueBackpressureError as exc:
-        raise HTTPException(status_code=429, detail=str(exc))
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
     count = len(gateway_flows) if success else 0
 
     return _collect_response(
         auth_context=auth_context,
         organization_id=org_id,
         message=f"Queued {count}/{len(flows)} gateway flows",
+        count=count,
+        requested=len(flows),
     )
 
 
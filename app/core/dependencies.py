@@ -127,7 +127,12 @@ def request_rate_limit(
                     bucket=bucket,
                     path=request.url.path,
                 )
-                raise HTTPException(status_code=429, detail="Too many requests")
+                retry_after = max(int(request_times[0] + window - now) + 1, 1)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(retry_after)},
+                )
 
             request_times.append(now)
 
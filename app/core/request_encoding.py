@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+from shared.security.body_encoding import (
+    ACCEPT_ENCODING_HEADER,
+    CONTENT_ENCODING_HEADER,
+    IDENTITY_ENCODING,
+    BodyEncodingError,
+    BodyTooLargeError,
+    decode_body,
+    normalize_encoding,
+    supported_body_encodings,
+)
+from shared.wire import ACCEPT_POST_HEADER, FLOW_BATCH_MEDIA_TYPE
+
+from .config import settings
+
+
+def accepted_request_encodings() -> str:
+    return ", ".join(supported_body_encodings())
+
+
+def accepted_post_media_types() -> str:
+    return f"application/json, {FLOW_BATCH_MEDIA_TYPE}"
+
+
+class DecodedBodyRequest(Request):
+    """
+    Request whose ``body()`` is the decompressed payload.
+
+    Collector signatures cover the body as sent, so authentication reads
+    ``raw_body()`` while FastAPI parses the decoded JSON.
+    """
+
+    async def raw_body(self) -> bytes:
+        return await super().body()
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_decoded_body"):
+            raw = await super().body()
+            encoding = normalize_encoding(self.headers.get(CONTENT_ENCODING_HEADER))
+            if encoding == IDENTITY_ENCODING:
+                self._decoded_body = raw
+            else:
+                try:
+                    self._decoded_body = decode_body(
+                        raw,
+                        encoding,
+                        max_bytes=settings.REQUEST_MAX_DECOMPRESSED_BYTES,
+                    )
+                except BodyTooLargeError as exc:
+                    raise HTTPException(status_code=413, detail=str(exc))
+                except BodyEncodingError as exc:
+                    unsupported = encoding not in supported_body_encodings()
+                    raise HTTPException(
+                        status_code=415 if unsupported else 400,
+                        detail=str(exc),
+                        headers={ACCEPT_ENCODING_HEADER: accepted_request_encodings()},
+                    )
+        return self._decoded_body
+
+
+class DecodedBodyRoute(APIRoute):
+    """
+    Route class for collector endpoints that accept gzip/zstd request bodies.
+
+    Responses advertise the accepted encodings and, through ``Accept-Post``,
+    the binary flow batch format, so collectors can negotiate both from any
+    authenticated call.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            response = await handler(DecodedBodyRequest(request.scope, request.receive))
+            response.headers[ACCEPT_ENCODING_HEADER] = accepted_request_encodings()
+            response.headers[ACCEPT_POST_HEADER] = accepted_post_media_types()
+            return response
+
+        return route_handler
+
+
+async def signed_request_body(request: Request) -> bytes:
+    """The body bytes a collector signed: compressed if it was sent compressed."""
+    if isinstance(request, DecodedBodyRequest):
+        return await request.raw_body()
+    return await request.body()
+
+
+async def flow_batch_body(request: Request) -> bytes | None:
+    """The decoded binary flow batch, or ``None`` when the body is JSON."""
+    content_type = str(request.headers.get("content-type") or "").split(";", 1)[0].strip().lower()
+    if content_type != FLOW_BATCH_MEDIA_TYPE:
+        return None
+    return await request.body()
@@ -153,6 +153,8 @@ REQUIRED_RUNTIME_COLUMNS = {
         "source_type",
         "batch_json",
         "flow_count",
+        "batch_format",
+        "batch_blob",
         "status",
         "attempt_count",
         "available_at",
@@ -174,6 +176,12 @@ REQUIRED_RUNTIME_COLUMNS = {
         "external_endpoint_ip",
         "session_id",
         "application",
+        "packets_out",
+        "packets_in",
+        "bytes_out",
+        "bytes_in",
+        "eviction_reason",
+        "load_shed_level",
     },
     "web_events": {
         "search_query",
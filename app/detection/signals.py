@@ -160,12 +160,18 @@ class DetectionSignals:
         return None
 
     def detect_data_exfiltration(self, flow, observed_at: datetime) -> DetectionSignal | None:
-        uploaded_bytes = float(getattr(flow, "bytes_out", 0) or 0)
-        if uploaded_bytes <= 0:
-            internal_ip = getattr(flow, "internal_device_ip", None)
-            external_ip = getattr(flow, "external_endpoint_ip", None)
-            if internal_ip and external_ip:
-                uploaded_bytes = float(getattr(flow, "byte_count", 0) or 0)
+        internal_ip = getattr(flow, "internal_device_ip", None)
+        external_ip = getattr(flow, "external_endpoint_ip", None)
+        bytes_out = float(getattr(flow, "bytes_out", 0) or 0)
+        bytes_in = float(getattr(flow, "bytes_in", 0) or 0)
+        # bytes_out runs from the flow's src (initiator) to its dst; when the
+        # internal device is the dst, its uploads are the reply direction.
+        if internal_ip and internal_ip == getattr(flow, "dst_ip", None) and internal_ip != getattr(flow, "src_ip", None):
+            uploaded_bytes = bytes_in
+        else:
+            uploaded_bytes = bytes_out
+        if bytes_out <= 0 and bytes_in <= 0 and internal_ip and external_ip:
+            uploaded_bytes = float(getattr(flow, "byte_count", 0) or 0)
         if uploaded_bytes > 5_000_000:
             return DetectionSignal("Suspected Data Exfiltration", 0.75, confidence=0.7)
         return None
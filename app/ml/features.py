@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from typing import Any
+import math
+from typing import Any, Sequence
 
 
-FEATURE_VERSION = "flow-v1"
-FEATURE_NAMES = (
+FEATURE_VERSION = "flow-v2"
+FLOW_COUNTER_FEATURE_NAMES = (
     "packet_count",
     "byte_count",
     "duration",
@@ -12,24 +13,47 @@ FEATURE_NAMES = (
     "src_port",
     "dst_port",
 )
+# Computed by the collectors and uploaded as ``flow_features``, in this order
+# (shared.collector.flow_features.FLOW_FEATURE_NAMES). Flows from collectors
+# that do not send them score with zeros in these positions.
+EDGE_FEATURE_NAMES = (
+    "size_le_64_ratio",
+    "size_le_128_ratio",
+    "size_le_256_ratio",
+    "size_le_512_ratio",
+    "size_le_1024_ratio",
+    "size_gt_1024_ratio",
+    "iat_mean",
+    "iat_std",
+    "syn_ratio",
+    "fin_ratio",
+    "rst_ratio",
+    "psh_ratio",
+    "direction_changes",
+)
+FEATURE_NAMES = FLOW_COUNTER_FEATURE_NAMES + EDGE_FEATURE_NAMES
 
 
 def _numeric(value: Any) -> float:
     try:
-        return float(value or 0)
+        number = float(value or 0)
     except (TypeError, ValueError):
         return 0.0
+    return number if math.isfinite(number) else 0.0
+
 
+def extract_flow_features(flow: Any, feature_names: Sequence[str] | None = None) -> list[float]:
+    """
+    Build the model input for ``flow``.
 
-def extract_flow_features(flow: Any) -> list[float]:
-    return [
-        _numeric(getattr(flow, "packet_count", 0)),
-        _numeric(getattr(flow, "byte_count", 0)),
-        _numeric(getattr(flow, "duration", 0)),
-        _numeric(getattr(flow, "average_packet_size", 0)),
-        _numeric(getattr(flow, "src_port", 0)),
-        _numeric(getattr(flow, "dst_port", 0)),
-    ]
+    ``feature_names`` selects and orders the features; models persisted with
+    an older feature list pass theirs so they keep receiving the same vector.
+    """
+    edge_values = tuple(getattr(flow, "flow_features", None) or ())
+    values = {name: _numeric(getattr(flow, name, 0)) for name in FLOW_COUNTER_FEATURE_NAMES}
+    for index, name in enumerate(EDGE_FEATURE_NAMES):
+        values[name] = _numeric(edge_values[index]) if index < len(edge_values) else 0.0
+    return [values.get(name, 0.0) for name in (feature_names or FEATURE_NAMES)]
 
 
 def feature_metadata() -> dict:
@@ -24,6 +24,12 @@ class NetVisorModel:
                     self.feature_version = loaded.get("feature_version") or FEATURE_VERSION
                     self.feature_names = list(loaded.get("feature_names") or FEATURE_NAMES)
                     return loaded["model"]
+                # Bare estimators predate the persisted feature list; they
+                # were trained on a prefix of the current features.
+                feature_count = getattr(loaded, "n_features_in_", None)
+                if feature_count:
+                    self.feature_version = "flow-v1"
+                    self.feature_names = list(FEATURE_NAMES[: int(feature_count)])
                 return loaded
             except (OSError, ValueError, EOFError) as e:
                 logger.warning(f"Failed to load model: {e}, using default")
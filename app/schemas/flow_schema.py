@@ -1,6 +1,8 @@
-from typing import Literal, Optional
+from typing import Annotated, List, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, field_validator
+from pydantic import BaseModel, BeforeValidator, ConfigDict, field_validator
+
+from shared.wire import FlowBatchError, decode_flow_batch
 
 class FlowBase(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -21,6 +23,13 @@ class FlowBase(BaseModel):
     analysis_signals: tuple[str, ...] = ()
     packet_count: int
     byte_count: int
+    packets_out: int = 0
+    packets_in: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    eviction_reason: Optional[str] = None
+    load_shed_level: int = 0
+    flow_features: tuple[float, ...] = ()
     duration: float
     agent_id: str
     organization_id: str
@@ -39,3 +48,16 @@ class Flow(FlowBase):
     id: int
     start_time: str
     last_seen: str
+
+
+def _decode_wire_batch(value):
+    # Non-JSON bodies reach validation as raw bytes; those are binary flow batches.
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return decode_flow_batch(value)
+        except FlowBatchError as exc:
+            raise ValueError(str(exc)) from exc
+    return value
+
+
+FlowBatch = Annotated[List[FlowBase], BeforeValidator(_decode_wire_batch)]
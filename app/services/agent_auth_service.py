@@ -19,6 +19,7 @@ from shared.security.agent_auth import (
     TIMESTAMP_HEADER,
     verify_signature,
 )
+from shared.security.body_encoding import CONTENT_ENCODING_HEADER
 from ..core.config import settings
 from .metrics_service import metrics_service
 
@@ -380,6 +381,7 @@ class AgentAuthService:
                     timestamp=provided_timestamp,
                     nonce=provided_nonce,
                     body=body,
+                    content_encoding=request.headers.get(CONTENT_ENCODING_HEADER),
                 ):
                     self._raise_auth_error("invalid_signature", "Invalid agent request signature.")
                 cursor.execute(
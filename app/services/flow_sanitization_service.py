@@ -6,11 +6,18 @@ from hashlib import sha1
 from typing import Any, Optional
 
 import logging
+import math
 
-from ..utils.network import classify_ip_scope, is_unicast_mac, normalize_ip, normalize_mac
+from shared.network.scope import ip_scope
+
+from ..utils.network import is_unicast_mac, normalize_mac
 
 logger = logging.getLogger("netvisor.services.flow_sanitization")
 
+# Collector feature vectors are short (13 values in edge-v1); anything much
+# longer is not one of ours.
+MAX_FLOW_FEATURES = 64
+
 @dataclass(frozen=True)
 class SanitizedFlow:
     organization_id: Optional[str]
@@ -41,6 +48,14 @@ class SanitizedFlow:
     internal_device_mac: Optional[str]
     external_endpoint_ip: Optional[str]
     network_scope: str
+    packets_out: int = 0
+    packets_in: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    eviction_reason: Optional[str] = None
+    load_shed_level: int = 0
+    # Scored by the anomaly model only; not stored in flow_logs.
+    flow_features: tuple[float, ...] = ()
 
     @property
     def ingest_hash(self) -> str:
@@ -97,6 +112,34 @@ class FlowSanitizationService:
                 normalized.append(text)
         return tuple(normalized)
 
+    def _direction_counter(self, flow: Any, name: str) -> int:
+        try:
+            return max(int(getattr(flow, name, 0) or 0), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _eviction_reason(self, flow: Any) -> Optional[str]:
+        text = str(getattr(flow, "eviction_reason", "") or "").strip().lower()
+        return text[:32] or None
+
+    def _load_shed_level(self, flow: Any) -> int:
+        try:
+            return min(max(int(getattr(flow, "load_shed_level", 0) or 0), 0), 3)
+        except (TypeError, ValueError):
+            return 0
+
+    def _flow_features(self, flow: Any) -> tuple[float, ...]:
+        values = getattr(flow, "flow_features", None) or ()
+        if isinstance(values, (str, bytes)):
+            return ()
+        try:
+            features = tuple(float(value) for value in values)
+        except (TypeError, ValueError):
+            return ()
+        if len(features) > MAX_FLOW_FEATURES or not all(math.isfinite(value) for value in features):
+            return ()
+        return features
+
     def _resolve_scope(self, src_scope: str, dst_scope: str) -> str:
         if src_scope == "internal" and dst_scope == "internal":
             return "internal_lan"
@@ -109,13 +152,14 @@ class FlowSanitizationService:
         return "unknown"
 
     def sanitize_flow(self, flow: Any, *, organization_id: Optional[str]) -> Optional[SanitizedFlow]:
-        src_ip = normalize_ip(getattr(flow, "src_ip", None))
-        dst_ip = normalize_ip(getattr(flow, "dst_ip", None))
+        src = ip_scope(getattr(flow, "src_ip", None))
+        dst = ip_scope(getattr(flow, "dst_ip", None))
+        src_ip, dst_ip = src.address, dst.address
         if not src_ip or not dst_ip:
             return None
 
-        src_scope = classify_ip_scope(src_ip)
-        dst_scope = classify_ip_scope(dst_ip)
+        src_scope = src.scope
+        dst_scope = dst.scope
         if src_scope in self.CONTROL_SCOPES or dst_scope in self.CONTROL_SCOPES:
             return None
 
@@ -171,6 +215,15 @@ class FlowSanitizationService:
         elif src_scope == "external" and dst_scope == "external":
             external_ip = dst_ip
 
+        # Per-direction counters are optional (older collectors omit them);
+        # inconsistent splits are dropped rather than trusted.
+        packets_out = self._direction_counter(flow, "packets_out")
+        packets_in = self._direction_counter(flow, "packets_in")
+        bytes_out = self._direction_counter(flow, "bytes_out")
+        bytes_in = self._direction_counter(flow, "bytes_in")
+        if packets_out + packets_in > packet_count or bytes_out + bytes_in > byte_count:
+            packets_out = packets_in = bytes_out = bytes_in = 0
+
         duration = max(float(getattr(flow, "duration", 0) or 0), 0.0)
         average_packet_size = float(getattr(flow, "average_packet_size", 0) or 0)
         if average_packet_size <= 0 and packet_count > 0:
@@ -209,6 +262,13 @@ class FlowSanitizationService:
             internal_device_mac=internal_mac,
             external_endpoint_ip=external_ip,
             network_scope=self._resolve_scope(src_scope, dst_scope),
+            packets_out=packets_out,
+            packets_in=packets_in,
+            bytes_out=bytes_out,
+            bytes_in=bytes_in,
+            eviction_reason=self._eviction_reason(flow),
+            load_shed_level=self._load_shed_level(flow),
+            flow_features=self._flow_features(flow),
         )
 
 
@@ -11,6 +11,8 @@ from datetime import datetime, timedelta, timezone
 import mysql.connector
 from pydantic import TypeAdapter
 
+from shared.wire import decode_flow_batch, replace_flow_batch_columns
+
 from ..core.config import settings
 from ..db.session import require_runtime_schema
 from ..db.session import get_db_connection
@@ -31,11 +33,20 @@ logger = logging.getLogger("netvisor.services.flow")
 
 FLOW_WORKER_TYPE = "flow_ingest"
 FLOW_BATCH_ADAPTER = TypeAdapter(list[FlowBase])
+# flow_ingest_batches.batch_format: JSON text in batch_json, or a binary
+# flow batch (shared.wire) in batch_blob.
+JSON_BATCH_FORMAT = "json"
+FLOW_BATCH_FORMAT = "flow-batch"
 
 
 class FlowQueueBackpressureError(RuntimeError):
     """Raised when the durable flow queue is too far behind to accept more work."""
 
+    def __init__(self, message: str, *, retry_after: int = 5) -> None:
+        super().__init__(message)
+        # Seconds a collector should wait before retrying, sent as Retry-After.
+        self.retry_after = max(int(retry_after), 1)
+
 
 class FlowService:
     def __init__(self) -> None:
@@ -320,16 +331,20 @@ class FlowService:
         pending_flows = max(int(counts.get("pending_flows") or 0), 0)
         oldest_pending_age = max(int(counts.get("oldest_pending_age_seconds") or 0), 0)
 
+        retry_seconds = max(int(settings.FLOW_INGEST_RETRY_SECONDS or 0), 1)
         max_pending_flows = max(int(settings.FLOW_INGEST_MAX_PENDING_FLOWS or 0), 0)
         if max_pending_flows and (pending_flows + max(int(incoming_flows or 0), 0)) > max_pending_flows:
             raise FlowQueueBackpressureError(
-                f"Flow ingest queue depth {pending_flows} exceeds configured limit {max_pending_flows}."
+                f"Flow ingest queue depth {pending_flows} exceeds configured limit {max_pending_flows}.",
+                retry_after=retry_seconds,
             )
 
         max_lag_seconds = max(int(settings.FLOW_INGEST_MAX_LAG_SECONDS or 0), 0)
         if max_lag_seconds and oldest_pending_age > max_lag_seconds:
+            # The further behind the workers are, the longer collectors should hold off.
             raise FlowQueueBackpressureError(
-                f"Flow ingest lag {oldest_pending_age}s exceeds configured limit {max_lag_seconds}s."
+                f"Flow ingest lag {oldest_pending_age}s exceeds configured limit {max_lag_seconds}s.",
+                retry_after=min(max(oldest_pending_age - max_lag_seconds, retry_seconds), 60),
             )
 
     def _column_exists(self, cursor, table_name: str, column_name: str) -> bool:
@@ -463,19 +478,31 @@ class FlowService:
             return dict(flow_data)
         return dict(vars(flow_data))
 
-    def _enqueue_batch_sync(self, flows: list) -> bool:
+    def _enqueue_batch_sync(self, flows: list, wire_batch: bytes | None = None, wire_overrides: dict | None = None) -> bool:
         if not flows:
             return True
 
-        payloads = [self._serialize_flow(flow) for flow in flows]
-        payload_json = self._payload_json(payloads)
-        batch_id = self._batch_id_from_payload_json(payload_json)
-        first = payloads[0]
+        flow_count = len(flows)
+        if wire_batch is not None:
+            # A binary batch is queued as received, apart from the constant
+            # columns the API stamped (identity, load-shedding level).
+            batch_format = FLOW_BATCH_FORMAT
+            batch_blob = replace_flow_batch_columns(wire_batch, wire_overrides) if wire_overrides else bytes(wire_batch)
+            payload_json = ""
+            batch_id = sha256(batch_blob).hexdigest()
+            first = self._serialize_flow(flows[0])
+        else:
+            payloads = [self._serialize_flow(flow) for flow in flows]
+            batch_format = JSON_BATCH_FORMAT
+            batch_blob = None
+            payload_json = self._payload_json(payloads)
+            batch_id = self._batch_id_from_payload_json(payload_json)
+            first = payloads[0]
         conn = get_db_connection()
         cursor = None
         try:
             self._ensure_processing_ready(conn)
-            self._enforce_backpressure(conn, len(payloads))
+            self._enforce_backpressure(conn, flow_count)
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -486,9 +513,11 @@ class FlowService:
                     batch_id,
                     batch_json,
                     flow_count,
+                    batch_format,
+                    batch_blob,
                     status,
                     available_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, 'pending', UTC_TIMESTAMP())
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', UTC_TIMESTAMP())
                 """,
                 (
                     str(first.get("source_type") or "agent"),
@@ -496,26 +525,28 @@ class FlowService:
                     str(first.get("organization_id") or "") or None,
                     batch_id,
                     payload_json,
-                    len(payloads),
+                    flow_count,
+                    batch_format,
+                    batch_blob,
                 ),
             )
             conn.commit()
             self._increment_metric("buffered_batches_total")
             self._increment_metric("buffered_flows_total")
-            self._set_metric("last_batch_size", len(payloads))
+            self._set_metric("last_batch_size", flow_count)
             self._set_metric("last_error", None)
             metrics_service.increment("flow_buffered_batches_total")
-            metrics_service.increment("flow_buffered_flows_total", amount=len(payloads))
+            metrics_service.increment("flow_buffered_flows_total", amount=flow_count)
             self._refresh_queue_depth(conn)
             return True
         except FlowQueueBackpressureError:
             if conn:
                 conn.rollback()
             self._increment_metric("backpressure_rejections_total")
-            self._increment_metric("dropped_flows_total", len(payloads))
+            self._increment_metric("dropped_flows_total", flow_count)
             self._set_metric("last_error", "enqueue_backpressure")
             metrics_service.increment("flow_backpressure_rejections_total")
-            metrics_service.increment("flow_dropped_flows_total", amount=len(payloads), reason="backpressure")
+            metrics_service.increment("flow_dropped_flows_total", amount=flow_count, reason="backpressure")
             self._refresh_queue_depth(conn)
             raise
         except mysql.connector.Error as exc:
@@ -523,17 +554,17 @@ class FlowService:
                 conn.rollback()
             if int(getattr(exc, "errno", 0) or 0) == 1062:
                 self._increment_metric("deduplicated_batches_total")
-                self._increment_metric("deduplicated_flows_total", len(payloads))
-                self._set_metric("last_batch_size", len(payloads))
+                self._increment_metric("deduplicated_flows_total", flow_count)
+                self._set_metric("last_batch_size", flow_count)
                 self._set_metric("last_error", None)
                 metrics_service.increment("flow_deduplicated_batches_total")
-                metrics_service.increment("flow_deduplicated_flows_total", amount=len(payloads))
+                metrics_service.increment("flow_deduplicated_flows_total", amount=flow_count)
                 self._refresh_queue_depth(conn)
                 return True
             logger.exception("Failed to enqueue flow batch with %s flow(s).", len(flows))
-            self._increment_metric("dropped_flows_total", len(payloads))
+            self._increment_metric("dropped_flows_total", flow_count)
             self._set_metric("last_error", "enqueue_failure")
-            metrics_service.increment("flow_dropped_flows_total", amount=len(payloads), reason="enqueue_failure")
+            metrics_service.increment("flow_dropped_flows_total", amount=flow_count, reason="enqueue_failure")
             metrics_service.increment("flow_enqueue_failures_total")
             self._refresh_queue_depth(conn)
             return False
@@ -541,9 +572,9 @@ class FlowService:
             if conn:
                 conn.rollback()
             logger.exception("Failed to enqueue flow batch with %s flow(s).", len(flows))
-            self._increment_metric("dropped_flows_total", len(payloads))
+            self._increment_metric("dropped_flows_total", flow_count)
             self._set_metric("last_error", "enqueue_failure")
-            metrics_service.increment("flow_dropped_flows_total", amount=len(payloads), reason="enqueue_failure")
+            metrics_service.increment("flow_dropped_flows_total", amount=flow_count, reason="enqueue_failure")
             metrics_service.increment("flow_enqueue_failures_total")
             self._refresh_queue_depth(conn)
             return False
@@ -553,8 +584,20 @@ class FlowService:
             if conn:
                 conn.close()
 
-    async def buffer_flows(self, flows: list) -> bool:
-        return await asyncio.to_thread(self._enqueue_batch_sync, list(flows))
+    async def buffer_flows(
+        self,
+        flows: list,
+        *,
+        wire_batch: bytes | None = None,
+        wire_overrides: dict | None = None,
+    ) -> bool:
+        """
+        Queue validated flows for the writer worker.
+
+        ``wire_batch`` is the binary flow batch the flows were decoded from;
+        it is queued as-is, with ``wire_overrides`` applied as constant columns.
+        """
+        return await asyncio.to_thread(self._enqueue_batch_sync, list(flows), wire_batch, wire_overrides)
 
     async def buffer_flow(self, flow_data):
         return await self.buffer_flows([flow_data])
@@ -635,7 +678,7 @@ class FlowService:
 
             cursor.execute(
                 f"""
-                SELECT id, batch_id, batch_json, flow_count, attempt_count, source_id, source_type, organization_id
+                SELECT id, batch_id, batch_json, batch_format, batch_blob, flow_count, attempt_count, source_id, source_type, organization_id
                 FROM flow_ingest_batches
                 WHERE claimed_by = %s
                   AND status = 'processing'
@@ -803,6 +846,8 @@ class FlowService:
             await asyncio.sleep(interval)
 
     def _deserialize_batch(self, queue_record: dict) -> list[FlowBase]:
+        if queue_record.get("batch_format") == FLOW_BATCH_FORMAT:
+            return list(FLOW_BATCH_ADAPTER.validate_python(decode_flow_batch(queue_record.get("batch_blob") or b"")))
         raw_payload = json.loads(queue_record.get("batch_json") or "[]")
         if not isinstance(raw_payload, list):
             raise ValueError("Queued flow batch payload must be a list")
@@ -996,8 +1041,9 @@ class FlowService:
                     protocol, start_time, last_seen, packet_count, byte_count,
                     duration, average_packet_size, domain, sni, src_mac, dst_mac,
                     network_scope, internal_device_ip, external_endpoint_ip, session_id,
-                    application, agent_id
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    application, agent_id, packets_out, packets_in, bytes_out, bytes_in,
+                    eviction_reason, load_shed_level
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
                 (
                     org_id,
@@ -1022,6 +1068,12 @@ class FlowService:
                     session_id,
                     application,
                     sanitized.agent_id,
+                    sanitized.packets_out,
+                    sanitized.packets_in,
+                    sanitized.bytes_out,
+                    sanitized.bytes_in,
+                    sanitized.eviction_reason,
+                    sanitized.load_shed_level,
                 ),
             )
 
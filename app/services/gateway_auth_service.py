@@ -21,6 +21,7 @@ from shared.security.agent_auth import (
     TIMESTAMP_HEADER,
     verify_signature,
 )
+from shared.security.body_encoding import CONTENT_ENCODING_HEADER
 from .metrics_service import metrics_service
 
 logger = logging.getLogger("netvisor.gateway_auth")
@@ -354,6 +355,7 @@ class GatewayAuthService:
                 timestamp=provided_timestamp,
                 nonce=provided_nonce,
                 body=body,
+                content_encoding=request.headers.get(CONTENT_ENCODING_HEADER),
             ):
                 self._raise_auth_error("invalid_signature", "Invalid gateway request signature.")
             cursor.execute(
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Iterable
+
+
+LOAD_SHED_LEVEL_MAX = 3
+# Collectors heartbeat every 10s by default; a report missing for a few
+# intervals means the collector recovered or went away.
+LOAD_SHED_REPORT_TTL_SECONDS = 60.0
+
+
+class LoadSheddingService:
+    """
+    Remembers the load-shedding level each collector reported in its heartbeat.
+
+    Collectors stamp each flow with the highest level in force while it was
+    captured, which stays correct when a journaled backlog is uploaded after
+    the episode. Flows from collectors that do not report it are annotated
+    with the heartbeat level at ingest instead. The registry lives in the API
+    process; with several API workers each one only sees the heartbeats it
+    served, so that fallback is best effort.
+    """
+
+    def __init__(self, ttl_seconds: float = LOAD_SHED_REPORT_TTL_SECONDS) -> None:
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._levels: dict[str, tuple[int, float]] = {}
+
+    @staticmethod
+    def _level_from(report: Any) -> int:
+        if not isinstance(report, dict):
+            return 0
+        try:
+            level = int(report.get("level") or 0)
+        except (TypeError, ValueError):
+            return 0
+        return min(max(level, 0), LOAD_SHED_LEVEL_MAX)
+
+    def record(self, source_id: str | None, report: Any) -> int:
+        if not source_id:
+            return 0
+        level = self._level_from(report)
+        with self._lock:
+            if level:
+                self._levels[source_id] = (level, time.monotonic())
+            else:
+                self._levels.pop(source_id, None)
+        return level
+
+    def level_for(self, source_id: str | None) -> int:
+        if not source_id:
+            return 0
+        with self._lock:
+            entry = self._levels.get(source_id)
+            if entry is None:
+                return 0
+            level, recorded_at = entry
+            if time.monotonic() - recorded_at > self.ttl_seconds:
+                self._levels.pop(source_id, None)
+                return 0
+            return level
+
+    @staticmethod
+    def reported_level(flow: Any) -> bool:
+        """True when the collector sent the level the flow was captured under."""
+        return "load_shed_level" in getattr(flow, "model_fields_set", ())
+
+    def annotate(self, flows: Iterable[Any], source_id: str | None) -> list[Any]:
+        flows = list(flows)
+        level = self.level_for(source_id)
+        if not level:
+            return flows
+        return [
+            flow if self.reported_level(flow) else flow.model_copy(update={"load_shed_level": level})
+            for flow in flows
+        ]
+
+
+load_shedding_service = LoadSheddingService()
@@ -3,7 +3,7 @@ from ..ml.features import extract_flow_features, feature_metadata
 
 class MLService:
     def predict_anomaly(self, flow) -> float:
-        return model.predict(extract_flow_features(flow))
+        return model.predict(extract_flow_features(flow, model.feature_names))
 
     def feature_metadata(self) -> dict:
         return feature_metadata()
@@ -1,62 +1,22 @@
 from __future__ import annotations
 
-import ipaddress
 from typing import Optional
 
-
-RFC1918_DEVICE_NETWORKS = (
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
+from shared.network.scope import (
+    classify_ip_scope,
+    is_multicast_or_broadcast_ip,
+    is_rfc1918_device_ip,
+    normalize_ip,
 )
 
-
-def normalize_ip(value: object) -> Optional[str]:
-    if value is None:
-        return None
-    try:
-        return str(ipaddress.ip_address(str(value).strip()))
-    except ValueError:
-        return None
-
-
-def is_rfc1918_device_ip(value: object) -> bool:
-    ip_value = normalize_ip(value)
-    if not ip_value:
-        return False
-
-    parsed = ipaddress.ip_address(ip_value)
-    if parsed.version != 4:
-        return False
-
-    return any(parsed in network for network in RFC1918_DEVICE_NETWORKS)
-
-
-def is_multicast_or_broadcast_ip(value: object) -> bool:
-    ip_value = normalize_ip(value)
-    if not ip_value:
-        return False
-
-    parsed = ipaddress.ip_address(ip_value)
-    if parsed.is_multicast or parsed.is_unspecified or parsed.is_loopback:
-        return True
-
-    if isinstance(parsed, ipaddress.IPv4Address):
-        octets = ip_value.split(".")
-        if octets[-1] == "255":
-            return True
-    return False
-
-
-def classify_ip_scope(value: object) -> str:
-    ip_value = normalize_ip(value)
-    if not ip_value:
-        return "invalid"
-    if is_multicast_or_broadcast_ip(ip_value):
-        return "control"
-    if is_rfc1918_device_ip(ip_value):
-        return "internal"
-    return "external"
+__all__ = [
+    "classify_ip_scope",
+    "is_multicast_or_broadcast_ip",
+    "is_rfc1918_device_ip",
+    "is_unicast_mac",
+    "normalize_ip",
+    "normalize_mac",
+]
 
 
 def normalize_mac(value: object) -> Optional[str]:
@@ -135,6 +135,8 @@ CREATE TABLE IF NOT EXISTS flow_ingest_batches (
     batch_id CHAR(64) NOT NULL,
     batch_json LONGTEXT NOT NULL,
     flow_count INT NOT NULL DEFAULT 1,
+    batch_format VARCHAR(32) NOT NULL DEFAULT 'json',
+    batch_blob LONGBLOB NULL,
     status VARCHAR(20) NOT NULL DEFAULT 'pending',
     attempt_count INT NOT NULL DEFAULT 0,
     available_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -183,6 +185,12 @@ CREATE TABLE IF NOT EXISTS flow_logs (
     session_id CHAR(40),
     application VARCHAR(50) NOT NULL DEFAULT 'Other',
     agent_id VARCHAR(100),
+    packets_out INT NOT NULL DEFAULT 0,
+    packets_in INT NOT NULL DEFAULT 0,
+    bytes_out BIGINT NOT NULL DEFAULT 0,
+    bytes_in BIGINT NOT NULL DEFAULT 0,
+    eviction_reason VARCHAR(32) NULL,
+    load_shed_level TINYINT NOT NULL DEFAULT 0,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_flow_logs_org (organization_id),
     INDEX idx_flow_logs_src (src_ip),
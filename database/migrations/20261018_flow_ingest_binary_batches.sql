@@ -0,0 +1,3 @@
+ALTER TABLE flow_ingest_batches
+    ADD COLUMN IF NOT EXISTS batch_format VARCHAR(32) NOT NULL DEFAULT 'json' AFTER flow_count,
+    ADD COLUMN IF NOT EXISTS batch_blob LONGBLOB NULL AFTER batch_format;
@@ -0,0 +1,5 @@
+ALTER TABLE flow_logs
+    ADD COLUMN IF NOT EXISTS packets_out INT NOT NULL DEFAULT 0 AFTER agent_id,
+    ADD COLUMN IF NOT EXISTS packets_in INT NOT NULL DEFAULT 0 AFTER packets_out,
+    ADD COLUMN IF NOT EXISTS bytes_out BIGINT NOT NULL DEFAULT 0 AFTER packets_in,
+    ADD COLUMN IF NOT EXISTS bytes_in BIGINT NOT NULL DEFAULT 0 AFTER bytes_out;
@@ -0,0 +1,2 @@
+ALTER TABLE flow_logs
+    ADD COLUMN IF NOT EXISTS eviction_reason VARCHAR(32) NULL AFTER bytes_in;
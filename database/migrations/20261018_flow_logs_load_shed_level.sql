@@ -0,0 +1,2 @@
+ALTER TABLE flow_logs
+    ADD COLUMN IF NOT EXISTS load_shed_level TINYINT NOT NULL DEFAULT 0 AFTER eviction_reason;
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+from mysql.connector import Error
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.db.session import get_db_connection
+
+
+DUPLICATE_COLUMN_ERROR = 1060
+
+
+def column_exists(cursor, table_name: str, column_name: str) -> bool:
+    cursor.execute(
+        """
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE()
+          AND table_name = %s
+          AND column_name = %s
+        LIMIT 1
+        """,
+        (table_name, column_name),
+    )
+    return cursor.fetchone() is not None
+
+
+def main() -> None:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    applied: list[str] = []
+    columns = (
+        ("eviction_reason", "ALTER TABLE flow_logs ADD COLUMN eviction_reason VARCHAR(32) NULL AFTER bytes_in"),
+    )
+
+    try:
+        for column_name, sql in columns:
+            if column_exists(cursor, "flow_logs", column_name):
+                continue
+            try:
+                cursor.execute(sql)
+                applied.append(f"flow_logs.{column_name}")
+            except Error as exc:
+                if exc.errno != DUPLICATE_COLUMN_ERROR:
+                    raise
+        conn.commit()
+        print("Applied flow_logs eviction_reason column.")
+        for item in applied:
+            print(f" - {item}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
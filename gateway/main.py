@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import argparse
 import json
+import logging
 import os
 import queue
 import socket
@@ -9,17 +10,29 @@ import sys
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
+import psutil
 from colorama import Fore, Style
 
 from shared.collector import (
+    ClassificationPolicy,
+    CaptureShardOptions,
     DomainHintCache,
+    FanoutCaptureSupervisor,
     FlowManager,
     FlowSummary,
+    LoadGovernor,
     PacketObservation,
+    RateBudget,
+    UploadJournal,
+    UploadScheduler,
     build_capture_backend,
+    build_tls_reassembler,
+    default_fanout_group,
+    queue_fill_ratio,
 )
 
 from .security.transport import GatewayApiClient
@@ -27,10 +40,20 @@ from .security.transport import GatewayApiClient
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 GATEWAY_RUNTIME_DIR = PROJECT_ROOT / "runtime" / "gateway"
 GATEWAY_SECURITY_STATE = GATEWAY_RUNTIME_DIR / "security" / "gateway_transport_state.secure"
+GATEWAY_DOMAIN_HINTS_SNAPSHOT = GATEWAY_RUNTIME_DIR / "domain_hints.bin"
+GATEWAY_UPLOAD_JOURNAL_DIR = GATEWAY_RUNTIME_DIR / "upload_journal"
+
+logger = logging.getLogger(__name__)
 
 
 class GatewayCollector:
-    def __init__(self, *, start_background_workers: bool = True) -> None:
+    def __init__(
+        self,
+        *,
+        start_background_workers: bool = True,
+        replay_path: str | None = None,
+        replay_speed: str | None = None,
+    ) -> None:
         base_url = os.getenv("NETVISOR_SERVER_URL", "http://127.0.0.1:8000").rstrip("/")
         if "/api/v1" in base_url:
             base_url = base_url.split("/api/v1")[0]
@@ -57,42 +80,104 @@ class GatewayCollector:
             or os.getenv("NETVISOR_CAPTURE_BACKEND")
             or "auto"
         ).strip() or "auto"
+        self.capture_filter = (
+            os.getenv("NETVISOR_GATEWAY_CAPTURE_FILTER")
+            or os.getenv("NETVISOR_CAPTURE_FILTER")
+            or ""
+        ).strip() or None
+        self.capture_filter_program = (
+            os.getenv("NETVISOR_GATEWAY_CAPTURE_FILTER_PROGRAM")
+            or os.getenv("NETVISOR_CAPTURE_FILTER_PROGRAM")
+            or None
+        )
+        # Offline replay of pcap/pcapng captures, e.g. to load-test the upload path.
+        self.capture_replay_path = (replay_path or os.getenv("NETVISOR_CAPTURE_REPLAY_PATH") or "").strip() or None
+        if replay_path:
+            self.capture_backend_name = "pcap"
+        self.capture_replay_speed = replay_speed or os.getenv("NETVISOR_CAPTURE_REPLAY_SPEED", "realtime")
+        self.capture_replay_watch = str(os.getenv("NETVISOR_CAPTURE_REPLAY_WATCH", "false")).strip().lower() in {"1", "true", "yes", "on"}
+        self.capture_workers = max(int(os.getenv("NETVISOR_GATEWAY_CAPTURE_WORKERS", "1") or 1), 1)
+        self.fanout_group = int(os.getenv("NETVISOR_GATEWAY_FANOUT_GROUP", "0") or 0) or default_fanout_group()
         self.bootstrap_api_key = str(os.getenv("GATEWAY_API_KEY", "") or "")
         self.is_running = True
         self.upload_q: queue.Queue[dict] = queue.Queue(maxsize=10000)
-        self.domain_cache = DomainHintCache()
+        self.domain_cache = DomainHintCache(
+            ttl_seconds=int(os.getenv("NETVISOR_DOMAIN_CACHE_TTL_SECONDS", "300")),
+            max_entries=int(os.getenv("NETVISOR_DOMAIN_CACHE_MAX_ENTRIES", "65536")),
+        )
+        self.domain_cache_snapshot_interval = float(os.getenv("NETVISOR_DOMAIN_CACHE_SNAPSHOT_SECONDS", "60") or 0)
+        if self.domain_cache_snapshot_interval > 0 and self.capture_workers == 1:
+            self.domain_cache.load_snapshot(GATEWAY_DOMAIN_HINTS_SNAPSHOT)
+        self.tls_reassembly_flow_bytes = int(os.getenv("NETVISOR_TLS_REASSEMBLY_FLOW_BYTES", "16384") or 16384)
+        self.tls_reassembly_budget_bytes = int(os.getenv("NETVISOR_TLS_REASSEMBLY_BUDGET_BYTES", "8388608") or 0)
+        self.tls_reassembler = build_tls_reassembler(self.tls_reassembly_flow_bytes, self.tls_reassembly_budget_bytes)
         self.client = GatewayApiClient(
             state_path=GATEWAY_SECURITY_STATE,
             bootstrap_api_key=self.bootstrap_api_key,
             initial_pins=self._load_initial_pins(),
         )
+        self.upload_journal = UploadJournal(
+            GATEWAY_UPLOAD_JOURNAL_DIR,
+            max_bytes=int(float(os.getenv("NETVISOR_UPLOAD_JOURNAL_MAX_MB", "256") or 256) * 1024 * 1024),
+            segment_bytes=int(float(os.getenv("NETVISOR_UPLOAD_JOURNAL_SEGMENT_MB", "4") or 4) * 1024 * 1024),
+        )
+        self.replay_budget = RateBudget(float(os.getenv("NETVISOR_UPLOAD_REPLAY_RATE", "1000") or 0))
+        self.upload_scheduler = UploadScheduler(
+            min_batch=int(os.getenv("NETVISOR_UPLOAD_BATCH_MIN", "20") or 20),
+            max_batch=int(os.getenv("NETVISOR_UPLOAD_BATCH_MAX", "500") or 500),
+            max_batch_bytes=int(os.getenv("NETVISOR_UPLOAD_BATCH_MAX_BYTES", "1048576") or 1048576),
+            linger=float(os.getenv("NETVISOR_UPLOAD_BATCH_LINGER_SECONDS", "5") or 5),
+            target_latency=float(os.getenv("NETVISOR_UPLOAD_TARGET_LATENCY_SECONDS", "1") or 1),
+            max_in_flight=self.client.max_in_flight,
+        )
+        self.upload_pool = ThreadPoolExecutor(max_workers=self.client.max_in_flight, thread_name_prefix="netvisor-upload")
         self._last_enrollment_warning = None
         self._background_workers_enabled = bool(start_background_workers)
 
-        self.flow_manager = FlowManager(
-            agent_id=self.gateway_id,
-            organization_id=self.organization_id,
-            on_flow_expired=self._on_flow_expired,
-            source_type="gateway",
-            metadata_only=True,
-            flush_interval=float(os.getenv("NETVISOR_FLOW_FLUSH_INTERVAL_SECONDS", "5")),
-            cleanup_interval=float(os.getenv("NETVISOR_FLOW_CLEANUP_INTERVAL_SECONDS", "5")),
-            max_flows=int(os.getenv("NETVISOR_FLOW_MAX_ACTIVE_FLOWS", "50000")),
-            start_worker=self._background_workers_enabled,
+        self.classification_policy = ClassificationPolicy(
+            min_confidence=float(os.getenv("NETVISOR_FLOW_CLASSIFICATION_MIN_CONFIDENCE", "0.9")),
+            recheck_interval=float(os.getenv("NETVISOR_FLOW_CLASSIFICATION_RECHECK_SECONDS", "30")),
         )
-        self.capture_backend = build_capture_backend(
-            role="gateway",
-            interface=self.capture_interface,
-            requested_backend=self.capture_backend_name,
+        self.capture_backend = self._build_capture_backend(self.capture_backend_name)
+        self.flow_manager_options = {
+            "flush_interval": float(os.getenv("NETVISOR_FLOW_FLUSH_INTERVAL_SECONDS", "5")),
+            "cleanup_interval": float(os.getenv("NETVISOR_FLOW_CLEANUP_INTERVAL_SECONDS", "5")),
+            "max_flows": int(os.getenv("NETVISOR_FLOW_MAX_ACTIVE_FLOWS", "50000")),
+            "stripe_count": int(os.getenv("NETVISOR_FLOW_TABLE_STRIPES", "16")),
+            "bidirectional": str(os.getenv("NETVISOR_FLOW_BIDIRECTIONAL", "false")).strip().lower() in {"1", "true", "yes", "on"},
+            "flow_storage": os.getenv("NETVISOR_FLOW_TABLE_STORAGE", "dict"),
+            "flow_features": str(os.getenv("NETVISOR_FLOW_FEATURES", "true")).strip().lower() in {"1", "true", "yes", "on"},
+        }
+        # PACKET_FANOUT needs a live interface; replay always runs in-process.
+        self.capture_fanout = (
+            self._build_capture_fanout() if self.capture_workers > 1 and self.capture_backend.live else None
         )
+        # Under fan-out every shard owns a FlowManager; the parent only builds
+        # one if it has to fall back to single-process capture.
+        self.flow_manager: FlowManager | None = None
+        self._inspect_flow = None
+        self.load_governor = LoadGovernor(
+            enabled=str(os.getenv("NETVISOR_LOAD_SHED_ENABLED", "true")).strip().lower() in {"1", "true", "yes", "on"},
+            high_watermark=float(os.getenv("NETVISOR_LOAD_SHED_HIGH_WATERMARK", "0.85")),
+            low_watermark=float(os.getenv("NETVISOR_LOAD_SHED_LOW_WATERMARK", "0.6")),
+            sample_rate=int(os.getenv("NETVISOR_LOAD_SHED_SAMPLE_RATE", "10")),
+            queue_providers=[lambda: queue_fill_ratio(self.upload_q), self.upload_journal.fill_ratio],
+        )
+        self.load_shed_interval = max(float(os.getenv("NETVISOR_LOAD_SHED_INTERVAL_SECONDS", "2") or 2), 0.5)
+        if self.capture_fanout is None:
+            self._build_flow_manager()
 
         if self._background_workers_enabled:
             if not self._ensure_enrolled(initial=True, force_reenroll=not self.client.has_credentials()):
                 raise RuntimeError(
                     "Gateway enrollment failed. The gateway requires a valid signed credential before it can continue."
                 )
+            self.upload_journal.open()
             threading.Thread(target=self._upload_worker, daemon=True).start()
             threading.Thread(target=self._heartbeat_worker, daemon=True).start()
+            threading.Thread(target=self._load_governor_worker, daemon=True).start()
+            if self.domain_cache_snapshot_interval > 0 and self.capture_workers == 1:
+                threading.Thread(target=self._domain_cache_snapshot_worker, daemon=True).start()
         else:
             print(f"{Fore.YELLOW}[!] Gateway background workers disabled for probe mode.")
 
@@ -108,6 +193,70 @@ class GatewayCollector:
             handle.write(gateway_id)
         return gateway_id
 
+    def _build_capture_backend(self, requested_backend: str):
+        return build_capture_backend(
+            role="gateway",
+            interface=self.capture_interface,
+            requested_backend=requested_backend,
+            ring_block_size=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCK_SIZE", "0") or 0),
+            ring_block_count=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCKS", "0") or 0),
+            capture_filter=self.capture_filter,
+            capture_filter_program=self.capture_filter_program,
+            replay_path=self.capture_replay_path,
+            replay_speed=self.capture_replay_speed,
+            replay_watch=self.capture_replay_watch,
+        )
+
+    def _build_flow_manager(self) -> None:
+        self.flow_manager = FlowManager(
+            agent_id=self.gateway_id,
+            organization_id=self.organization_id,
+            on_flow_expired=self._on_flow_expired,
+            source_type="gateway",
+            metadata_only=True,
+            start_worker=self._background_workers_enabled,
+            classification_policy=self.classification_policy,
+            clock=self.capture_backend.clock,
+            **self.flow_manager_options,
+        )
+        self._inspect_flow = self.load_governor.inspect_flow(self.flow_manager.should_inspect)
+
+    def _build_capture_fanout(self) -> FanoutCaptureSupervisor:
+        options = CaptureShardOptions(
+            role="gateway",
+            interface=self.capture_interface,
+            requested_backend=self.capture_backend_name,
+            fanout_group=self.fanout_group,
+            agent_id=self.gateway_id,
+            organization_id=self.organization_id,
+            source_type="gateway",
+            metadata_only=True,
+            flush_interval=self.flow_manager_options["flush_interval"],
+            cleanup_interval=self.flow_manager_options["cleanup_interval"],
+            max_flows=max(self.flow_manager_options["max_flows"] // self.capture_workers, 1),
+            ring_block_size=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCK_SIZE", "0") or 0) or None,
+            ring_block_count=int(os.getenv("NETVISOR_CAPTURE_RING_BLOCKS", "0") or 0) or None,
+            capture_filter=self.capture_filter,
+            capture_filter_program=self.capture_filter_program,
+            classification_policy=self.classification_policy,
+            bidirectional=self.flow_manager_options["bidirectional"],
+            flow_storage=self.flow_manager_options["flow_storage"],
+            flow_features=self.flow_manager_options["flow_features"],
+            domain_cache_ttl=self.domain_cache.ttl_seconds,
+            domain_cache_max_entries=self.domain_cache.max_entries,
+            domain_cache_snapshot_path=(
+                str(GATEWAY_DOMAIN_HINTS_SNAPSHOT) if self.domain_cache_snapshot_interval > 0 else None
+            ),
+            domain_cache_snapshot_interval=self.domain_cache_snapshot_interval,
+            tls_reassembly_flow_bytes=self.tls_reassembly_flow_bytes,
+            tls_reassembly_budget_bytes=max(self.tls_reassembly_budget_bytes // self.capture_workers, 0),
+        )
+        return FanoutCaptureSupervisor(
+            worker_count=self.capture_workers,
+            options=options,
+            on_flow_expired=self._on_flow_expired,
+        )
+
     def _load_initial_pins(self) -> list[dict]:
         raw = str(os.getenv("NETVISOR_BACKEND_TLS_PINS_JSON", "[]") or "[]").strip()
         if not raw:
@@ -134,7 +283,8 @@ class GatewayCollector:
         organization_id = str(payload.get("organization_id") or "").strip()
         if organization_id:
             self.organization_id = organization_id
-            self.flow_manager.organization_id = organization_id
+            if self.flow_manager is not None:
+                self.flow_manager.organization_id = organization_id
 
     def status_snapshot(self) -> dict:
         return {
@@ -144,8 +294,14 @@ class GatewayCollector:
             "heartbeat_interval_seconds": self.heartbeat_interval,
             "running": self.is_running,
             "upload_queue_depth": self.upload_q.qsize(),
-            "flow_manager": self.flow_manager.status_snapshot(),
+            "upload_journal": self.upload_journal.status_snapshot(),
+            "upload_scheduler": self.upload_scheduler.status_snapshot(),
+            "flow_manager": self.flow_manager.status_snapshot() if self.flow_manager is not None else None,
+            "domain_cache": self.domain_cache.status_snapshot(),
+            "tls_reassembly": self.tls_reassembler.status_snapshot() if self.tls_reassembler else None,
+            "load_shedding": self.load_governor.status_snapshot(),
             "capture": self.capture_backend.status_snapshot(),
+            "capture_fanout": self.capture_fanout.status_snapshot() if self.capture_fanout else None,
             "transport": self.client.status_snapshot(),
             "background_workers_enabled": self._background_workers_enabled,
         }
@@ -196,17 +352,45 @@ class GatewayCollector:
             retry_delay = min(retry_delay * 2, 30)
         return False
 
+    def _save_domain_cache_snapshot(self) -> None:
+        if self.capture_workers > 1:
+            # Capture shards own the live caches and snapshot them per shard.
+            return
+        try:
+            self.domain_cache.save_snapshot(GATEWAY_DOMAIN_HINTS_SNAPSHOT)
+        except OSError as exc:
+            print(f"{Fore.YELLOW}[!] Domain hint snapshot failed: {exc}")
+
+    def _domain_cache_snapshot_worker(self) -> None:
+        while self.is_running:
+            time.sleep(self.domain_cache_snapshot_interval)
+            self._save_domain_cache_snapshot()
+
     def _heartbeat_worker(self) -> None:
         while self.is_running:
             try:
                 if self._ensure_enrolled():
-                    response = self.client.request("POST", self.heartbeat_url, json_body=self._registration_payload(), timeout=5)
+                    payload = {
+                        **self._registration_payload(),
+                        "load_shedding": self.load_governor.status_snapshot(),
+                        "upload_journal": self.upload_journal.status_snapshot(),
+                    }
+                    response = self.client.request("POST", self.heartbeat_url, json_body=payload, timeout=5)
                     response.raise_for_status()
                     self._apply_server_metadata(response.json())
             except Exception as exc:
                 print(f"{Fore.YELLOW}[!] Gateway heartbeat failed: {exc}")
             time.sleep(self.heartbeat_interval)
 
+    def _load_governor_worker(self) -> None:
+        psutil.cpu_percent(interval=None)
+        while self.is_running:
+            time.sleep(self.load_shed_interval)
+            previous = self.load_governor.level
+            level = self.load_governor.update(psutil.cpu_percent(interval=None))
+            if level != previous:
+                logger.warning("Load shedding level %s -> %s (%s)", previous, level, self.load_governor.level_name)
+
     def _on_flow_expired(self, summary: FlowSummary) -> None:
         payload = dict(summary.__dict__)
         payload["organization_id"] = self.organization_id
@@ -217,45 +401,88 @@ class GatewayCollector:
         except queue.Full:
             print(f"{Fore.YELLOW}[!] Gateway upload queue full, dropping flow")
 
-    def _upload_worker(self) -> None:
-        batch: list[dict] = []
-        last_send = time.time()
+    def _journal_pending_summaries(self) -> int:
+        records = []
+        while True:
+            try:
+                records.append(self.upload_q.get_nowait())
+            except queue.Empty:
+                break
+            self.upload_q.task_done()
+        return self.upload_journal.append(records)
 
+    def _upload_worker(self) -> None:
         while self.is_running:
             try:
-                try:
-                    record = self.upload_q.get(timeout=1.0)
-                    batch.append(record)
-                    self.upload_q.task_done()
-                except queue.Empty:
-                    pass
-
-                if len(batch) >= 20 or (time.time() - last_send > 5 and batch):
-                    if not self._ensure_enrolled():
-                        time.sleep(2)
-                        continue
-
+                self._journal_pending_summaries()
+                if not self.upload_scheduler.due(self.upload_journal.unsent_records):
                     try:
-                        response = self.client.request("POST", self.gateway_flows_url, json_body=batch, timeout=10)
-                        response.raise_for_status()
-                        self._apply_server_metadata(response.json())
-                        batch = []
-                        last_send = time.time()
-                    except Exception as exc:
-                        print(f"{Fore.YELLOW}[!] Gateway flow upload failed: {exc}")
-                        time.sleep(2)
+                        record = self.upload_q.get(timeout=1.0)
+                        self.upload_q.task_done()
+                        self.upload_journal.append([record])
+                    except queue.Empty:
+                        pass
+                    continue
+                if not self._ensure_enrolled():
+                    time.sleep(2)
+                    continue
+                if not self.upload_scheduler.acquire_slot(timeout=1.0):
+                    continue
+                batch = self.upload_journal.next_batch(
+                    self.upload_scheduler.batch_size, max_bytes=self.upload_scheduler.batch_bytes
+                )
+                if batch is None:
+                    self.upload_scheduler.release_slot()
+                    continue
+                if batch.replay:
+                    time.sleep(self.replay_budget.delay(len(batch.records)))
+                self.upload_pool.submit(self._send_flow_batch, batch)
             except Exception:
                 pass
 
+    def _send_flow_batch(self, batch) -> None:
+        started = time.monotonic()
+        try:
+            response = self.client.post_flow_batch(self.gateway_flows_url, batch.records, timeout=10)
+            response.raise_for_status()
+            payload = response.json()
+            self._apply_server_metadata(payload)
+            accepted = payload.get("count", len(batch.records))
+            if accepted < len(batch.records):
+                raise RuntimeError(f"backend queued {accepted}/{len(batch.records)} flows")
+            self.upload_journal.ack(batch)
+            self.upload_scheduler.record_success(len(batch.records), time.monotonic() - started)
+        except Exception as exc:
+            too_large = self.upload_scheduler.record_failure(getattr(exc, "response", None))
+            if too_large and len(batch.records) == 1:
+                # A lone record over the size limit can never be sent; keeping
+                # it would block every newer record behind it.
+                self.upload_journal.reject(batch)
+                print(f"{Fore.YELLOW}[!] Dropping flow record {batch.first_seq}: the backend rejects it as too large on its own")
+            else:
+                self.upload_journal.requeue(batch, split=too_large)
+            print(f"{Fore.YELLOW}[!] Gateway flow upload failed: {exc}")
+        finally:
+            self.upload_scheduler.release_slot()
+
+    def _is_tracked_flow(self, key) -> bool:
+        return self.flow_manager.flow_state(key) is not None
+
     def process_packet(self, packet) -> bool:
+        kept, weight = self.load_governor.sample([packet])
+        if not kept:
+            return True
         observation = PacketObservation.from_packet(
             packet,
             source_type="gateway",
             metadata_only=True,
             domain_cache=self.domain_cache,
+            inspect_flow=self._inspect_flow,
+            reassembler=self.tls_reassembler,
         )
         if observation is None:
             return False
+        observation = self.load_governor.shape([observation], weight, self._is_tracked_flow)[0]
 
         if observation.domain and logger.isEnabledFor(logging.DEBUG):
             logger.debug("Gateway observed domain %s -> %s", observation.src_ip, observation.domain)
@@ -263,18 +490,45 @@ class GatewayCollector:
         self.flow_manager.update_from_observation(observation)
         return True
 
+    def process_batch(self, packets: list) -> int:
+        kept, weight = self.load_governor.sample(packets)
+        observations = []
+        for packet in kept:
+            try:
+                observation = PacketObservation.from_packet(
+                    packet,
+                    source_type="gateway",
+                    metadata_only=True,
+                    domain_cache=self.domain_cache,
+                    inspect_flow=self._inspect_flow,
+                    reassembler=self.tls_reassembler,
+                )
+            except Exception as exc:
+                logger.debug("Gateway packet decode failed: %s", exc)
+                continue
+            if observation is not None:
+                observations.append(observation)
+        observations = self.load_governor.shape(observations, weight, self._is_tracked_flow)
+        applied = self.flow_manager.update_from_observations(observations)
+        # Sampled-out packets are represented by the scaled counters, not dropped.
+        return max(len(packets) - (len(kept) - applied) * weight, 0)
+
     def start(self, timeout: int | None = None) -> None:
         print(f"{Fore.BLUE}[*] NetVisor Gateway Starting...")
-        success, error = self.capture_backend.start(self.process_packet, timeout=timeout)
-        if not success and self.capture_backend.backend_name != "scapy":
+        if self.capture_fanout is not None:
+            print(f"[*] Capture fan-out: {self.capture_workers} workers in PACKET_FANOUT group {self.fanout_group}")
+            success, error = self.capture_fanout.start(timeout=timeout)
+            if success:
+                return
+            print(f"{Fore.YELLOW}[!] Capture fan-out failed: {error}. Falling back to single-process capture.")
+            self.capture_fanout = None
+            self._build_flow_manager()
+        success, error = self.capture_backend.start(timeout=timeout, on_batch=self.process_batch)
+        if not success and self.capture_backend.live and self.capture_backend.backend_name != "scapy":
             print(f"{Fore.YELLOW}[!] Primary capture backend failed: {error}. Falling back to Scapy.")
             self.capture_backend.stop()
-            self.capture_backend = build_capture_backend(
-                role="gateway",
-                interface=self.capture_interface,
-                requested_backend="scapy",
-            )
-            success, error = self.capture_backend.start(self.process_packet, timeout=timeout)
+            self.capture_backend = self._build_capture_backend("scapy")
+            success, error = self.capture_backend.start(timeout=timeout, on_batch=self.process_batch)
         if not success and error:
             print(f"{Fore.YELLOW}[!] Gateway capture backend failed: {error}")
 
@@ -282,7 +536,16 @@ class GatewayCollector:
         self.is_running = False
         if hasattr(self, "capture_backend"):
             self.capture_backend.stop()
-        self.flow_manager.stop()
+        if getattr(self, "capture_fanout", None) is not None:
+            self.capture_fanout.stop()
+        if getattr(self, "flow_manager", None) is not None:
+            self.flow_manager.stop()
+        self.upload_pool.shutdown(wait=False, cancel_futures=True)
+        if self._background_workers_enabled:
+            self._journal_pending_summaries()
+            self.upload_journal.close()
+        if self.domain_cache_snapshot_interval > 0:
+            self._save_domain_cache_snapshot()
 
 
 def main() -> None:
@@ -290,10 +553,25 @@ def main() -> None:
     parser.add_argument("--health-check", action="store_true", help="Print a startup health snapshot and exit.")
     parser.add_argument("--reset-enrollment", action="store_true", help="Clear stored signed credentials and exit.")
     parser.add_argument("--timeout", type=int, default=None, help="Packet sniff timeout in seconds.")
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        default=None,
+        help="Replay a pcap/pcapng file, or a directory of captures, instead of capturing live.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        default=None,
+        help="Replay pacing: 'realtime' (default), a multiplier such as '10x', or 'max'.",
+    )
     args = parser.parse_args()
 
     if args.health_check or args.reset_enrollment:
-        collector = GatewayCollector(start_background_workers=False)
+        collector = GatewayCollector(
+            start_background_workers=False,
+            replay_path=args.replay,
+            replay_speed=args.replay_speed,
+        )
         if args.reset_enrollment:
             collector.client.reset_enrollment()
         snapshot = collector.status_snapshot()
@@ -302,7 +580,7 @@ def main() -> None:
         print(json.dumps(snapshot, indent=2, sort_keys=True))
         sys.exit(0)
 
-    collector = GatewayCollector()
+    collector = GatewayCollector(replay_path=args.replay, replay_speed=args.replay_speed)
     try:
         collector.start(timeout=args.timeout)
     except KeyboardInterrupt:
@@ -4,13 +4,16 @@ import ipaddress
 import os
 import hashlib
 import json
+import threading
 import time
 import uuid
+import weakref
 from pathlib import Path
 from typing import Any
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from cryptography import x509
 from cryptography.hazmat.primitives import serialization
 
@@ -22,8 +25,14 @@ from shared.security import (
     REENROLL_REQUEST_HEADER,
     SIGNATURE_HEADER,
     TIMESTAMP_HEADER,
+    ACCEPT_ENCODING_HEADER,
+    CONTENT_ENCODING_HEADER,
+    choose_body_encoding,
+    encode_body,
+    parse_accept_encoding,
     sign_request,
 )
+from shared.wire import ACCEPT_POST_HEADER, FLOW_BATCH_MEDIA_TYPE, encode_flow_batch, parse_media_types
 
 from .state import GatewayStateStore
 
@@ -37,9 +46,34 @@ class GatewayApiClient:
         store: GatewayStateStore | None = None,
         initial_pins: list[dict] | None = None,
     ) -> None:
+        # Uploads may run this many batches concurrently; the keep-alive pool
+        # leaves room for heartbeat and control requests on top of them.
+        self.max_in_flight = max(int(os.getenv("NETVISOR_UPLOAD_MAX_IN_FLIGHT", "2") or 1), 1)
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_in_flight + 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        # Sockets whose peer certificate already matched the pin set, keyed to
+        # that pin set so a rotation forces a fresh check.
+        self._pinned_sockets: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._pin_checks = 0
+        self._pin_cache_hits = 0
         self.bootstrap_api_key = str(bootstrap_api_key or "")
         self.allow_lan_http = str(os.getenv("NETVISOR_ALLOW_LAN_HTTP", "false")).strip().lower() in {"1", "true", "yes", "on"}
+        self.upload_compression = str(os.getenv("NETVISOR_UPLOAD_COMPRESSION", "auto")).strip().lower()
+        self.compression_min_bytes = max(int(os.getenv("NETVISOR_UPLOAD_COMPRESSION_MIN_BYTES", "1024") or 0), 0)
+        # Request codings the backend advertised (RFC 7694 Accept-Encoding);
+        # bodies stay uncompressed until it has answered once.
+        self._server_request_encodings: tuple[str, ...] = ()
+        self._compressed_requests = 0
+        self._compressed_raw_bytes = 0
+        self._compressed_sent_bytes = 0
+        self.upload_wire_format = str(os.getenv("NETVISOR_UPLOAD_WIRE_FORMAT", "auto")).strip().lower()
+        # Media types the backend accepts for batch uploads (Accept-Post);
+        # flow batches stay JSON until it has advertised the binary format.
+        self._server_post_formats: tuple[str, ...] = ()
+        self._binary_flow_batches = 0
         self.store = store or GatewayStateStore(
             state_path,
             description="netvisor-gateway-transport-state",
@@ -80,6 +114,15 @@ class GatewayApiClient:
             "credential_key_version": credentials.get("key_version"),
             "backend_tls_pin_count": len(self._pinset()),
             "state_path": str(self.store.path),
+            "request_encoding": choose_body_encoding(self._server_request_encodings, self.upload_compression),
+            "compressed_requests": self._compressed_requests,
+            "compressed_raw_bytes": self._compressed_raw_bytes,
+            "compressed_sent_bytes": self._compressed_sent_bytes,
+            "flow_wire_format": self.flow_wire_format(),
+            "binary_flow_batches": self._binary_flow_batches,
+            "max_in_flight": self.max_in_flight,
+            "pin_checks": self._pin_checks,
+            "pin_cache_hits": self._pin_cache_hits,
         }
 
     def reset_enrollment(self, *, preserve_pins: bool = True) -> None:
@@ -147,14 +190,30 @@ class GatewayApiClient:
         url: str,
         *,
         json_body: Any = None,
+        body: bytes | None = None,
+        content_type: str | None = None,
         params: dict | None = None,
         timeout: float = 10.0,
     ) -> requests.Response:
         body_bytes = b""
         headers: dict[str, str] = {}
-        if json_body is not None:
+        if body is not None:
+            body_bytes = bytes(body)
+            headers["Content-Type"] = content_type or "application/octet-stream"
+        elif json_body is not None:
             body_bytes = json.dumps(json_body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
             headers["Content-Type"] = "application/json"
+        content_encoding = None
+        if body_bytes and len(body_bytes) >= self.compression_min_bytes:
+            content_encoding = choose_body_encoding(self._server_request_encodings, self.upload_compression)
+        if content_encoding:
+            raw_size = len(body_bytes)
+            body_bytes = encode_body(body_bytes, content_encoding)
+            headers[CONTENT_ENCODING_HEADER] = content_encoding
+            with self._lock:
+                self._compressed_requests += 1
+                self._compressed_raw_bytes += raw_size
+                self._compressed_sent_bytes += len(body_bytes)
 
         credentials = self._credentials()
         if credentials:
@@ -175,6 +234,7 @@ class GatewayApiClient:
                 timestamp=timestamp,
                 nonce=nonce,
                 body=body_bytes,
+                content_encoding=content_encoding,
             )
             prepared.headers[GATEWAY_ID_HEADER] = str(credentials.get("gateway_id") or "")
             prepared.headers[KEY_VERSION_HEADER] = str(credentials.get("key_version") or "")
@@ -196,9 +256,42 @@ class GatewayApiClient:
         response = self.session.send(prepared, timeout=timeout, stream=True)
         self._enforce_tls_pins(prepared.url or url, response)
         response.content
+        self._consume_request_encodings(response)
         self._consume_security_metadata(response)
         return response
 
+    def flow_wire_format(self) -> str:
+        if self.upload_wire_format != "json" and FLOW_BATCH_MEDIA_TYPE in self._server_post_formats:
+            return FLOW_BATCH_MEDIA_TYPE
+        return "application/json"
+
+    def post_flow_batch(self, url: str, records: list[dict], *, timeout: float = 10.0) -> requests.Response:
+        """POST flow summaries, as a binary flow batch once the backend accepts one."""
+        if self.flow_wire_format() != FLOW_BATCH_MEDIA_TYPE:
+            return self.request("POST", url, json_body=records, timeout=timeout)
+        with self._lock:
+            self._binary_flow_batches += 1
+        return self.request(
+            "POST",
+            url,
+            body=encode_flow_batch(records),
+            content_type=FLOW_BATCH_MEDIA_TYPE,
+            timeout=timeout,
+        )
+
+    def _consume_request_encodings(self, response: requests.Response) -> None:
+        offered = response.headers.get(ACCEPT_ENCODING_HEADER)
+        if offered is not None:
+            self._server_request_encodings = parse_accept_encoding(offered)
+        elif response.status_code == 415:
+            # Something in the path rejected the coding without saying what it takes.
+            self._server_request_encodings = ()
+        accepted = response.headers.get(ACCEPT_POST_HEADER)
+        if accepted is not None:
+            self._server_post_formats = parse_media_types(accepted)
+        elif response.status_code == 415:
+            self._server_post_formats = ()
+
     def _consume_security_metadata(self, response: requests.Response) -> None:
         content_type = str(response.headers.get("Content-Type") or "").lower()
         if "json" not in content_type:
@@ -211,6 +304,10 @@ class GatewayApiClient:
             return
 
         credentials = payload.get("gateway_credentials")
+        with self._lock:
+            self._apply_security_metadata(credentials, payload.get("backend_tls_pins"))
+
+    def _apply_security_metadata(self, credentials, pins) -> None:
         if isinstance(credentials, dict) and credentials.get("secret"):
             self._state["gateway_credentials"] = {
                 "gateway_id": str(credentials.get("gateway_id") or ""),
@@ -218,15 +315,17 @@ class GatewayApiClient:
                 "secret": str(credentials.get("secret") or ""),
                 "issued_at": credentials.get("issued_at"),
             }
-        pins = payload.get("backend_tls_pins")
         if isinstance(pins, list):
             self._state["backend_tls_pins"] = pins
         if isinstance(credentials, dict) or isinstance(pins, list):
             self._persist()
 
-    def _extract_peer_certificate(self, response: requests.Response) -> bytes | None:
+    def _peer_socket(self, response: requests.Response):
         connection = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
-        sock = getattr(connection, "sock", None)
+        return getattr(connection, "sock", None)
+
+    def _extract_peer_certificate(self, response: requests.Response) -> bytes | None:
+        sock = self._peer_socket(response)
         if sock is None:
             return None
         try:
@@ -251,6 +350,17 @@ class GatewayApiClient:
         pinset = [pin for pin in self._pinset() if str(pin.get("status") or "active") in {"active", "next"}]
         if not pinset:
             return
+        pin_key = tuple(sorted((str(pin.get("pin_type") or ""), str(pin.get("pin_sha256") or "").upper()) for pin in pinset))
+        sock = self._peer_socket(response)
+        with self._lock:
+            try:
+                if sock is not None and self._pinned_sockets.get(sock) == pin_key:
+                    # A kept-alive connection presents the certificate it was opened with.
+                    self._pin_cache_hits += 1
+                    return
+            except TypeError:
+                pass
+            self._pin_checks += 1
         certificate_der = self._extract_peer_certificate(response)
         if not certificate_der:
             response.close()
@@ -267,3 +377,9 @@ class GatewayApiClient:
         if not matched:
             response.close()
             raise requests.exceptions.SSLError("Backend TLS pin mismatch.")
+        if sock is not None:
+            with self._lock:
+                try:
+                    self._pinned_sockets[sock] = pin_key
+                except TypeError:
+                    pass
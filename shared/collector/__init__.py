@@ -1,26 +1,69 @@
 """Shared packet capture and flow aggregation helpers."""
 
-from .capture import CaptureBackend, LinuxRawSocketCaptureBackend, ScapyCaptureBackend, build_capture_backend
-from .analysis import PacketAnalysis, analyze_packet
-from .flow_manager import FlowKey, FlowManager, FlowState, FlowSummary
+from .capture import (
+    CaptureBackend,
+    LinuxMmapCaptureBackend,
+    LinuxRawSocketCaptureBackend,
+    ScapyCaptureBackend,
+    build_capture_backend,
+)
+from .fanout import CaptureShardOptions, FanoutCaptureSupervisor, default_fanout_group
+from .analysis import PacketAnalysis, analyze_frame, analyze_packet
+from .decoder import DecodedFrame, decode_frame
+from .flow_features import FLOW_FEATURE_NAMES, FLOW_FEATURE_VERSION, flow_feature_vector
+from .flow_table import ColumnarFlowTable
+from .flow_manager import ClassificationPolicy, FlowKey, FlowManager, FlowState, FlowSummary
+from .journal import JournalBatch, RateBudget, UploadJournal
+from .load_shedding import LoadGovernor, queue_fill_ratio
 from .observations import DpiObservation, FlowObservation, PacketObservation
+from .payload import PayloadInspection, inspect_payload
+from .pipeline import AnalysisWorkerOptions, AnalysisWorkerPool
+from .reassembly import TlsHelloReassembler, build_tls_reassembler
+from .replay import PcapReplayCaptureBackend, iter_capture_records
+from .upload_scheduler import UploadScheduler
 from .traffic_metadata import DomainHintCache, extract_domain_hint, extract_flow_hints
 
 __all__ = [
+    "FLOW_FEATURE_NAMES",
+    "FLOW_FEATURE_VERSION",
+    "AnalysisWorkerOptions",
+    "AnalysisWorkerPool",
     "CaptureBackend",
+    "CaptureShardOptions",
+    "ClassificationPolicy",
+    "ColumnarFlowTable",
+    "DecodedFrame",
     "DomainHintCache",
     "DpiObservation",
+    "FanoutCaptureSupervisor",
     "FlowKey",
     "FlowManager",
     "FlowObservation",
     "FlowState",
     "FlowSummary",
+    "JournalBatch",
+    "LinuxMmapCaptureBackend",
     "LinuxRawSocketCaptureBackend",
+    "LoadGovernor",
     "PacketAnalysis",
     "PacketObservation",
+    "PayloadInspection",
+    "PcapReplayCaptureBackend",
+    "RateBudget",
     "ScapyCaptureBackend",
+    "TlsHelloReassembler",
+    "UploadJournal",
+    "UploadScheduler",
     "build_capture_backend",
+    "build_tls_reassembler",
+    "default_fanout_group",
+    "analyze_frame",
     "analyze_packet",
+    "decode_frame",
     "extract_domain_hint",
     "extract_flow_hints",
+    "flow_feature_vector",
+    "inspect_payload",
+    "iter_capture_records",
+    "queue_fill_ratio",
 ]
@@ -4,11 +4,12 @@ from functools import lru_cache
 from dataclasses import dataclass
 from typing import Optional
 
-from .traffic_metadata import DomainHintCache, _extract_http_host, _extract_tls_sni, extract_flow_hints
+from .decoder import DecodedFrame, _protocol_name, decode_frame, dns_payload, parse_dns_message
+from .payload import EMPTY_INSPECTION, OPAQUE_INSPECTION, PayloadInspection, inspect_payload
+from .reassembly import TlsHelloReassembler
+from .traffic_metadata import DomainHintCache, extract_flow_hints, extract_frame_hints
 
-
-HTTP_METHOD_PREFIXES = ("GET ", "POST ", "PUT ", "PATCH ", "DELETE ", "HEAD ", "OPTIONS ", "CONNECT ")
-HTTP_RESPONSE_PREFIX = "HTTP/"
+TLS_PORTS = {443, 8443, 9443}
 
 TCP_SIGNATURE_PORTS = {
     22: ("SSH", "ssh"),
@@ -87,29 +88,6 @@ UDP_SIGNATURE_PORTS = {
     8443: ("QUIC", "quic"),
 }
 
-IP_PROTO_MAP = {
-    1: "ICMP",
-    6: "TCP",
-    17: "UDP",
-    41: "IPv6",
-    47: "GRE",
-    50: "ESP",
-    51: "AH",
-    58: "ICMPv6",
-}
-
-IPV6_NEXT_HEADER_MAP = {
-    1: "ICMP",
-    6: "TCP",
-    17: "UDP",
-    41: "IPv6",
-    47: "GRE",
-    50: "ESP",
-    51: "AH",
-    58: "ICMPv6",
-}
-
-
 @lru_cache(maxsize=1)
 def _load_scapy_primitives():
     from scapy.all import ARP, DNS, DNSQR, ICMP, IP, IPv6, Raw, TCP, UDP  # type: ignore
@@ -165,22 +143,6 @@ def _select_port(src_port: int, dst_port: int, mapping: dict[int, tuple[str, str
     return None, None
 
 
-def _looks_like_http(payload: bytes) -> bool:
-    if not payload:
-        return False
-    try:
-        text = payload.decode("utf-8", errors="ignore")
-    except Exception:
-        return False
-
-    first_line = text.splitlines()[0].strip() if text.splitlines() else ""
-    return first_line.startswith(HTTP_METHOD_PREFIXES) or first_line.startswith(HTTP_RESPONSE_PREFIX)
-
-
-def _looks_like_tls(payload: bytes) -> bool:
-    return bool(payload and len(payload) >= 5 and payload[0] == 0x16 and payload[1] == 0x03)
-
-
 def _transport_protocol(packet) -> str:
     ARP, _, _, ICMP, IP, IPv6, _, TCP, UDP = _load_scapy_primitives()
     if packet.haslayer(TCP):
@@ -197,24 +159,52 @@ def _transport_protocol(packet) -> str:
         return "UNKNOWN"
 
     if packet.haslayer(IP):
-        return IP_PROTO_MAP.get(int(getattr(ip_layer, "proto", 0) or 0), f"IP-{int(getattr(ip_layer, 'proto', 0) or 0)}")
+        return _protocol_name(4, int(getattr(ip_layer, "proto", 0) or 0))
 
     if packet.haslayer(IPv6):
-        return IPV6_NEXT_HEADER_MAP.get(int(getattr(ip_layer, "nh", 0) or 0), f"IPv6-{int(getattr(ip_layer, 'nh', 0) or 0)}")
+        return _protocol_name(6, int(getattr(ip_layer, "nh", 0) or 0))
 
     return "UNKNOWN"
 
 
-def _classify_application(packet, transport_protocol: str, src_port: int, dst_port: int, domain: str | None, sni: str | None) -> PacketAnalysis:
-    _, DNS, DNSQR, _, _, _, Raw, TCP, UDP = _load_scapy_primitives()
-    payload = bytes(packet[Raw].load) if packet.haslayer(Raw) else b""
+def _inspect_transport_payload(transport_protocol: str, payload) -> PayloadInspection:
+    if not payload:
+        return EMPTY_INSPECTION
+    if transport_protocol == "TCP":
+        return inspect_payload(payload)
+    return OPAQUE_INSPECTION
+
+
+def _classify_application(
+    packet,
+    transport_protocol: str,
+    src_port: int,
+    dst_port: int,
+    domain: str | None,
+    sni: str | None,
+    inspection: PayloadInspection,
+) -> PacketAnalysis:
+    _, DNS, DNSQR, _, _, _, _, _, _ = _load_scapy_primitives()
+    is_dns = bool(packet.haslayer(DNS) and packet.haslayer(DNSQR))
+    return _classify_payload(transport_protocol, src_port, dst_port, inspection, is_dns, domain, sni)
+
+
+def _classify_payload(
+    transport_protocol: str,
+    src_port: int,
+    dst_port: int,
+    inspection: PayloadInspection,
+    is_dns: bool,
+    domain: str | None,
+    sni: str | None,
+) -> PacketAnalysis:
     signals: list[str] = []
     application_protocol = transport_protocol
     service_name: Optional[str] = None
     source = "transport_fallback"
     confidence = 0.25 if transport_protocol not in {"UNKNOWN", "ARP"} else 0.1
 
-    if packet.haslayer(DNS) and packet.haslayer(DNSQR):
+    if is_dns:
         application_protocol = "DNS"
         service_name = "dns"
         source = "dns"
@@ -233,37 +223,24 @@ def _classify_application(packet, transport_protocol: str, src_port: int, dst_po
 
     if transport_protocol == "TCP":
         port, signature = _select_port(src_port, dst_port, TCP_SIGNATURE_PORTS)
-        if payload and _looks_like_http(payload):
+        if inspection.is_http:
             application_protocol = "HTTP"
             service_name = "http"
             source = "http_payload"
             confidence = 0.97
             signals.append("http_payload")
-            host = _extract_http_host(payload)
+            host = inspection.http_host
             if host and not domain:
                 domain = host
                 signals.append("http_host")
         else:
-            tls_domain = _extract_tls_sni(payload)
+            tls_domain = inspection.sni
             if tls_domain and not sni:
                 sni = tls_domain
                 domain = domain or tls_domain
                 signals.append("tls_sni")
-            if tls_domain:
-                if port in {443, 8443, 9443} or sni:
-                    application_protocol = "HTTPS"
-                    service_name = "https"
-                    source = "tls"
-                    confidence = 0.98 if sni else 0.92
-                    signals.append("tls_handshake")
-                else:
-                    application_protocol = "TLS"
-                    service_name = "tls"
-                    source = "tls"
-                    confidence = 0.9
-                    signals.append("tls_handshake")
-            elif payload and _looks_like_tls(payload):
-                if port in {443, 8443, 9443} or sni:
+            if tls_domain or inspection.tls_record:
+                if port in TLS_PORTS or sni:
                     application_protocol = "HTTPS"
                     service_name = "https"
                     source = "tls"
@@ -275,28 +252,23 @@ def _classify_application(packet, transport_protocol: str, src_port: int, dst_po
                     source = "tls"
                     confidence = 0.9
                     signals.append("tls_handshake")
+            elif inspection.banner:
+                application_protocol, service_name = inspection.banner
+                source = "payload_signature"
+                confidence = 0.95
+                signals.append(f"{service_name}_banner")
             elif signature:
                 application_protocol, service_name = signature
                 source = "port_signature"
                 confidence = 0.9
                 signals.append(f"port_{port}")
-            elif port in {443, 8443, 9443}:
+            elif port in TLS_PORTS:
                 application_protocol = "HTTPS"
                 service_name = "https"
                 source = "port_signature"
                 confidence = 0.8 if sni else 0.72
                 signals.append(f"port_{port}")
 
-        if application_protocol == transport_protocol and port is None:
-            host = _extract_http_host(payload)
-            if host:
-                domain = domain or host
-                application_protocol = "HTTP"
-                service_name = "http"
-                source = "http_payload"
-                confidence = 0.9
-                signals.append("http_host")
-
     elif transport_protocol == "UDP":
         port, signature = _select_port(src_port, dst_port, UDP_SIGNATURE_PORTS)
         if signature:
@@ -307,7 +279,7 @@ def _classify_application(packet, transport_protocol: str, src_port: int, dst_po
             if application_protocol in {"DNS", "DHCP", "NTP", "NBNS", "NBDS", "LLMNR", "mDNS", "SSDP", "CLDAP"}:
                 confidence = 1.0 if application_protocol == "DNS" else 0.95
         else:
-            if port in {443, 8443} and payload:
+            if port in {443, 8443} and inspection.has_payload:
                 application_protocol = "QUIC"
                 service_name = "quic"
                 source = "port_signature"
@@ -345,8 +317,66 @@ def _classify_application(packet, transport_protocol: str, src_port: int, dst_po
     )
 
 
-def analyze_packet(packet, domain_cache: DomainHintCache | None = None) -> PacketAnalysis | None:
-    _, _, _, _, IP, IPv6, _, TCP, UDP = _load_scapy_primitives()
+def _with_hints(analysis: PacketAnalysis, domain: str | None, sni: str | None) -> PacketAnalysis:
+    if analysis.domain or not domain:
+        domain = analysis.domain
+    if analysis.sni or not sni:
+        sni = analysis.sni
+    if domain == analysis.domain and sni == analysis.sni:
+        return analysis
+    return PacketAnalysis(
+        transport_protocol=analysis.transport_protocol,
+        application_protocol=analysis.application_protocol,
+        service_name=analysis.service_name,
+        classification_source=analysis.classification_source,
+        confidence=analysis.confidence,
+        signals=analysis.signals,
+        domain=domain,
+        sni=sni,
+    )
+
+
+def analyze_frame(
+    decoded: DecodedFrame | None,
+    domain_cache: DomainHintCache | None = None,
+    reassembler: TlsHelloReassembler | None = None,
+) -> PacketAnalysis | None:
+    """Classify a frame produced by :mod:`shared.collector.decoder` without scapy."""
+    if decoded is None:
+        return None
+
+    dns_message = parse_dns_message(dns_payload(decoded))
+    payload = decoded.payload if decoded.has_transport_header else None
+    inspection = _inspect_transport_payload(decoded.transport_protocol, payload)
+    if reassembler is not None and decoded.is_tcp:
+        inspection = reassembler.feed(
+            (decoded.src_ip, decoded.dst_ip, decoded.src_port, decoded.dst_port), decoded.tcp_seq, payload, inspection
+        )
+    hints = extract_frame_hints(decoded, domain_cache, dns_message=dns_message, inspection=inspection)
+    domain = hints.get("domain")
+    sni = hints.get("sni")
+
+    analysis = _classify_payload(
+        decoded.transport_protocol,
+        decoded.src_port,
+        decoded.dst_port,
+        inspection,
+        dns_message is not None,
+        domain,
+        sni,
+    )
+    return _with_hints(analysis, domain, sni)
+
+
+def analyze_packet(
+    packet,
+    domain_cache: DomainHintCache | None = None,
+    reassembler: TlsHelloReassembler | None = None,
+) -> PacketAnalysis | None:
+    if isinstance(packet, (bytes, bytearray, memoryview)):
+        return analyze_frame(decode_frame(packet), domain_cache, reassembler)
+
+    _, _, _, _, IP, IPv6, Raw, TCP, UDP = _load_scapy_primitives()
     ip_layer = _get_ip_layer(packet)
     if ip_layer is None:
         return None
@@ -355,31 +385,15 @@ def analyze_packet(packet, domain_cache: DomainHintCache | None = None) -> Packe
     src_port = _normalize_port(getattr(packet[TCP], "sport", 0) if packet.haslayer(TCP) else getattr(packet[UDP], "sport", 0) if packet.haslayer(UDP) else 0)
     dst_port = _normalize_port(getattr(packet[TCP], "dport", 0) if packet.haslayer(TCP) else getattr(packet[UDP], "dport", 0) if packet.haslayer(UDP) else 0)
 
-    hints = extract_flow_hints(packet, domain_cache)
+    payload = bytes(packet[Raw].load) if packet.haslayer(Raw) else b""
+    inspection = _inspect_transport_payload(transport_protocol, payload)
+    if reassembler is not None and packet.haslayer(TCP):
+        inspection = reassembler.feed(
+            (str(ip_layer.src), str(ip_layer.dst), src_port, dst_port), int(packet[TCP].seq), payload, inspection
+        )
+    hints = extract_flow_hints(packet, domain_cache, inspection=inspection)
     domain = hints.get("domain")
     sni = hints.get("sni")
 
-    analysis = _classify_application(packet, transport_protocol, src_port, dst_port, domain, sni)
-    if not analysis.domain and domain:
-        analysis = PacketAnalysis(
-            transport_protocol=analysis.transport_protocol,
-            application_protocol=analysis.application_protocol,
-            service_name=analysis.service_name,
-            classification_source=analysis.classification_source,
-            confidence=analysis.confidence,
-            signals=analysis.signals,
-            domain=domain,
-            sni=analysis.sni,
-        )
-    if not analysis.sni and sni:
-        analysis = PacketAnalysis(
-            transport_protocol=analysis.transport_protocol,
-            application_protocol=analysis.application_protocol,
-            service_name=analysis.service_name,
-            classification_source=analysis.classification_source,
-            confidence=analysis.confidence,
-            signals=analysis.signals,
-            domain=analysis.domain,
-            sni=sni,
-        )
-    return analysis
+    analysis = _classify_application(packet, transport_protocol, src_port, dst_port, domain, sni, inspection)
+    return _with_hints(analysis, domain, sni)
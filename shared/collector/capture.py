@@ -2,16 +2,56 @@ from __future__ import annotations
 
 from functools import lru_cache
 import logging
+import mmap
 import platform
+import select
 import socket
+import struct
 import threading
 import time
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
-from typing import Callable, Optional
+from pathlib import Path
+from typing import Callable, Optional, Sequence
 
 logger = logging.getLogger("netvisor.capture")
 
+# AF_PACKET constants from <linux/if_packet.h>; not all of them are exported by
+# the socket module, so keep the numeric values local.
+SOL_PACKET = getattr(socket, "SOL_PACKET", 263)
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# struct tpacket_req3: block_size, block_nr, frame_size, frame_nr,
+# retire_blk_tov, sizeof_priv, feature_req_word.
+_TPACKET_REQ3 = struct.Struct("=IIIIIII")
+# struct tpacket_stats_v3: tp_packets, tp_drops, tp_freeze_q_cnt.
+_TPACKET_STATS_V3 = struct.Struct("=III")
+# struct tpacket_block_desc + tpacket_hdr_v1 prefix: version, offset_to_priv,
+# block_status, num_pkts, offset_to_first_pkt.
+_TPACKET_BLOCK_HEADER = struct.Struct("=IIIII")
+_TPACKET_BLOCK_STATUS_OFFSET = 8
+_U32 = struct.Struct("=I")
+# struct tpacket3_hdr prefix: tp_next_offset, tp_sec, tp_nsec, tp_snaplen,
+# tp_len, tp_status, tp_mac, tp_net.
+_TPACKET3_FRAME_HEADER = struct.Struct("=IIIIIIHH")
+
+SO_ATTACH_FILTER = getattr(socket, "SO_ATTACH_FILTER", 26)
+# struct sock_filter: code, jt, jf, k.
+_SOCK_FILTER = struct.Struct("=HBBI")
+
+BpfProgram = list[tuple[int, int, int, int]]
+PacketCallback = Callable[[object], bool]
+# Batch callbacks return how many frames they accepted; None/True mean all.
+BatchCallback = Callable[[list], "int | bool | None"]
+
 
 @lru_cache(maxsize=1)
 def _load_scapy_primitives():
@@ -20,7 +60,66 @@ def _load_scapy_primitives():
     return Ether, sniff
 
 
+def parse_bpf_program(value: str | Sequence[Sequence[int]] | None) -> BpfProgram | None:
+    """
+    Parse a compiled classic BPF program.
+
+    Accepts the ``tcpdump -ddd`` / iptables ``--bytecode`` layout
+    (``"4,48 0 0 9,21 0 1 6,6 0 0 65535,6 0 0 0"``, commas or newlines) or a
+    list of ``(code, jt, jf, k)`` sequences.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        chunks = [chunk.strip() for chunk in value.replace("\n", ",").split(",") if chunk.strip()]
+        if not chunks:
+            return None
+        rows = [chunk.split() for chunk in chunks]
+        if len(rows[0]) == 1:
+            expected = int(rows[0][0])
+            rows = rows[1:]
+            if expected != len(rows):
+                raise ValueError(f"BPF program declares {expected} instructions but has {len(rows)}.")
+    else:
+        rows = [list(row) for row in value]
+
+    program: BpfProgram = []
+    for row in rows:
+        if len(row) != 4:
+            raise ValueError(f"Invalid BPF instruction: {row!r}")
+        code, jt, jf, k = (int(item, 0) if isinstance(item, str) else int(item) for item in row)
+        program.append((code, jt, jf, k))
+    return program or None
+
+
+def compile_bpf_filter(expression: str, interface: str | None = None) -> BpfProgram:
+    """Compile a BPF expression through scapy (libpcap or tcpdump)."""
+    from scapy.arch.common import compile_filter  # type: ignore
+
+    compiled = compile_filter(expression, iface=interface)
+    program: BpfProgram = []
+    for index in range(int(compiled.bf_len)):
+        instruction = compiled.bf_insns[index]
+        program.append((int(instruction.code), int(instruction.jt), int(instruction.jf), int(instruction.k)))
+    return program
+
+
+def attach_bpf_filter(raw_socket: socket.socket, program: BpfProgram) -> None:
+    import ctypes
+
+    instructions = b"".join(_SOCK_FILTER.pack(*instruction) for instruction in program)
+    buffer = ctypes.create_string_buffer(instructions, len(instructions))
+    # struct sock_fprog: unsigned short len; struct sock_filter *filter. The
+    # kernel copies the program during setsockopt, so the buffer only needs to
+    # outlive this call.
+    fprog = struct.pack("HP", len(program), ctypes.addressof(buffer))
+    raw_socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
 class CaptureBackend(ABC):
+    # Live backends read an interface; replay backends deliver recorded traffic.
+    live = True
+
     def __init__(
         self,
         *,
@@ -28,11 +127,17 @@ class CaptureBackend(ABC):
         interface: str | None = None,
         requested_backend: str = "auto",
         promiscuous: bool = True,
+        capture_filter: str | None = None,
+        capture_filter_program: str | Sequence[Sequence[int]] | None = None,
+        fanout_group: int | None = None,
     ) -> None:
         self.role = str(role or "capture")
         self.interface = str(interface or "").strip() or None
         self.requested_backend = str(requested_backend or "auto").strip().lower() or "auto"
         self.promiscuous = bool(promiscuous)
+        self.capture_filter = str(capture_filter or "").strip() or None
+        self.capture_filter_program = parse_bpf_program(capture_filter_program)
+        self.fanout_group = None if fanout_group is None else int(fanout_group) & 0xFFFF
         self._running = False
         self._stop_event = threading.Event()
         self._metrics_lock = threading.Lock()
@@ -43,12 +148,18 @@ class CaptureBackend(ABC):
         self._seen_packets = 0
         self._emitted_packets = 0
         self._dropped_packets = 0
+        self._filter_attached = False
+        self._filter_baseline_packets: Optional[int] = None
 
     @property
     @abstractmethod
     def backend_name(self) -> str:
         raise NotImplementedError
 
+    def clock(self) -> float:
+        """Current time in the timebase of the frames this backend delivers."""
+        return time.time()
+
     def _utc_now(self) -> str:
         return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
@@ -67,6 +178,8 @@ class CaptureBackend(ABC):
             self._seen_packets = 0
             self._emitted_packets = 0
             self._dropped_packets = 0
+            self._filter_attached = False
+            self._filter_baseline_packets = None
         self._stop_event.clear()
 
     def _mark_stopped(self) -> None:
@@ -91,6 +204,125 @@ class CaptureBackend(ABC):
             if message:
                 self._last_error = message
 
+    def _record_batch(self, seen: int, emitted: int, dropped: int, message: str | None = None) -> None:
+        now = time.time()
+        with self._metrics_lock:
+            self._seen_packets += seen
+            self._last_packet_at_ts = now
+            if emitted:
+                self._emitted_packets += emitted
+                self._last_emit_at_ts = now
+            if dropped:
+                self._dropped_packets += dropped
+            if message:
+                self._last_error = message
+
+    def _deliver(self, frames: list, on_packet: PacketCallback | None, on_batch: BatchCallback | None) -> None:
+        """Hand one poll's worth of frames to the consumer and update metrics once."""
+        if not frames:
+            return
+        message = None
+        if on_batch is not None:
+            try:
+                result = on_batch(frames)
+            except Exception as exc:
+                logger.debug("%s batch callback failed: %s", self.backend_name, exc)
+                self._record_batch(len(frames), 0, len(frames), str(exc))
+                return
+            if result is None or result is True:
+                emitted = len(frames)
+            elif result is False:
+                emitted = 0
+            else:
+                emitted = max(min(int(result), len(frames)), 0)
+            if emitted < len(frames):
+                message = "filtered"
+            self._record_batch(len(frames), emitted, len(frames) - emitted, message)
+            return
+
+        emitted = 0
+        for frame in frames:
+            try:
+                accepted = self._normalize_capture_result(on_packet(frame))
+            except Exception as exc:
+                message = str(exc)
+                logger.debug("%s capture callback failed: %s", self.backend_name, exc)
+                continue
+            if accepted:
+                emitted += 1
+            elif message is None:
+                message = "filtered"
+        self._record_batch(len(frames), emitted, len(frames) - emitted, message)
+
+    def _require_callback(self, on_packet: PacketCallback | None, on_batch: BatchCallback | None) -> None:
+        if on_packet is None and on_batch is None:
+            raise ValueError("Capture backends need an on_packet or on_batch callback.")
+
+    def _interface_packet_total(self) -> Optional[int]:
+        # ETH_P_ALL sockets see both directions, so the kernel's rx + tx totals
+        # are what the filter was offered.
+        if not self.interface:
+            return None
+        statistics = Path("/sys/class/net") / self.interface / "statistics"
+        try:
+            return int((statistics / "rx_packets").read_text()) + int((statistics / "tx_packets").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _mark_filter_attached(self) -> None:
+        # Fan-out members only see their share of the interface, so the
+        # interface totals cannot be attributed to one member's filter.
+        baseline = self._interface_packet_total() if self.fanout_group is None else None
+        with self._metrics_lock:
+            self._filter_attached = True
+            self._filter_baseline_packets = baseline
+
+    def _record_filter_failure(self, exc: Exception) -> None:
+        message = f"capture_filter_unavailable: {exc}"
+        logger.warning("Capture filter could not be applied; capturing unfiltered. %s", exc)
+        with self._metrics_lock:
+            self._filter_attached = False
+            self._filter_baseline_packets = None
+            self._last_error = message
+
+    def _resolve_filter_program(self) -> BpfProgram | None:
+        if self.capture_filter_program:
+            return self.capture_filter_program
+        if not self.capture_filter:
+            return None
+        try:
+            return compile_bpf_filter(self.capture_filter, self.interface)
+        except Exception as exc:
+            self._record_filter_failure(exc)
+            return None
+
+    def _attach_socket_filter(self, raw_socket: socket.socket) -> None:
+        program = self._resolve_filter_program()
+        if not program:
+            return
+        try:
+            attach_bpf_filter(raw_socket, program)
+        except OSError as exc:
+            self._record_filter_failure(exc)
+            return
+        self._mark_filter_attached()
+
+    def _join_fanout_group(self, raw_socket: socket.socket) -> None:
+        # PACKET_FANOUT_HASH keeps both directions of a flow on the same member
+        # socket, so every shard sees complete flows. The socket must already be
+        # bound to the interface.
+        if self.fanout_group is None:
+            return
+        fanout_arg = self.fanout_group | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16)
+        raw_socket.setsockopt(SOL_PACKET, PACKET_FANOUT, _U32.pack(fanout_arg))
+
+    def _filter_label(self) -> Optional[str]:
+        if self.capture_filter:
+            return self.capture_filter
+        if self.capture_filter_program:
+            return f"bpf_program[{len(self.capture_filter_program)}]"
+        return None
+
     def _normalize_capture_result(self, result) -> bool:
         if result is None:
             return True
@@ -110,11 +342,20 @@ class CaptureBackend(ABC):
             emitted_packets = self._emitted_packets
             dropped_packets = self._dropped_packets
             running = self._running
+            filter_attached = self._filter_attached
+            filter_baseline = self._filter_baseline_packets
 
         lag_seconds = None
         if last_packet_at is not None:
             lag_seconds = max(time.time() - last_packet_at, 0.0)
 
+        filter_accepted = seen_packets if filter_attached else None
+        filter_rejected = None
+        if filter_attached and filter_baseline is not None:
+            current_total = self._interface_packet_total()
+            if current_total is not None:
+                filter_rejected = max(current_total - filter_baseline - seen_packets, 0)
+
         return {
             "requested_backend": self.requested_backend,
             "active_backend": self.backend_name,
@@ -128,11 +369,34 @@ class CaptureBackend(ABC):
             "packets_seen": seen_packets,
             "packets_emitted": emitted_packets,
             "packets_dropped": dropped_packets,
+            "fanout_group": self.fanout_group,
+            "capture_filter": self._filter_label(),
+            "capture_filter_attached": filter_attached,
+            "filter_packets_accepted": filter_accepted,
+            "filter_packets_rejected": filter_rejected,
             "last_error": last_error,
         }
 
     @abstractmethod
-    def start(self, on_packet: Callable[[object], bool], timeout: int | float | None = None) -> tuple[bool, Optional[str]]:
+    def start(
+        self,
+        on_packet: PacketCallback | None = None,
+        timeout: int | float | None = None,
+        *,
+        on_batch: BatchCallback | None = None,
+        batch_size: int = 256,
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Capture until stopped or ``timeout`` elapses.
+
+        ``on_packet`` is called once per frame. ``on_batch`` instead receives a
+        list of frames per poll (at most ``batch_size``) and returns how many
+        it accepted. Frames handed out by the Linux backends are raw Ethernet
+        buffers that are only valid for the duration of the callback; the mmap
+        backend's frames, and any slice of them, alias the ring and are
+        overwritten once the block goes back to the kernel, so callbacks must
+        copy (``bytes(frame)``) anything they keep.
+        """
         raise NotImplementedError
 
 
@@ -141,11 +405,32 @@ class ScapyCaptureBackend(CaptureBackend):
     def backend_name(self) -> str:
         return "scapy"
 
-    def start(self, on_packet: Callable[[object], bool], timeout: int | float | None = None) -> tuple[bool, Optional[str]]:
+    def start(
+        self,
+        on_packet: PacketCallback | None = None,
+        timeout: int | float | None = None,
+        *,
+        on_batch: BatchCallback | None = None,
+        batch_size: int = 256,
+    ) -> tuple[bool, Optional[str]]:
+        self._require_callback(on_packet, on_batch)
+        if self.fanout_group is not None:
+            message = "Scapy capture cannot join a PACKET_FANOUT group."
+            self._record_drop(message)
+            self._mark_stopped()
+            return False, message
+
         self._mark_started()
         deadline = None if timeout is None else time.time() + max(float(timeout), 0.0)
+        batch_limit = max(int(batch_size), 1)
+        pending: list = []
         try:
             _, sniff = _load_scapy_primitives()
+            active_filter = self.capture_filter
+            if self.capture_filter_program and not active_filter:
+                logger.warning("Scapy capture needs a BPF expression; the compiled capture filter program is ignored.")
+            elif active_filter:
+                self._mark_filter_attached()
             while not self._stop_event.is_set():
                 if deadline is not None:
                     remaining = deadline - time.time()
@@ -156,25 +441,28 @@ class ScapyCaptureBackend(CaptureBackend):
                     slice_timeout = 1.0
 
                 def _dispatch(packet) -> None:
-                    self._record_seen()
-                    try:
-                        accepted = self._normalize_capture_result(on_packet(packet))
-                    except Exception as exc:
-                        self._record_drop(str(exc))
-                        logger.debug("Scapy capture callback failed: %s", exc)
-                        return
-                    if accepted:
-                        self._record_emit()
-                    else:
-                        self._record_drop("filtered")
-
-                sniff(
-                    iface=self.interface,
-                    store=False,
-                    promisc=self.promiscuous,
-                    timeout=slice_timeout,
-                    prn=_dispatch,
-                )
+                    pending.append(packet)
+                    if on_batch is None or len(pending) >= batch_limit:
+                        self._deliver(pending[:], on_packet, on_batch)
+                        pending.clear()
+
+                try:
+                    sniff(
+                        iface=self.interface,
+                        store=False,
+                        promisc=self.promiscuous,
+                        timeout=slice_timeout,
+                        prn=_dispatch,
+                        filter=active_filter,
+                    )
+                except Exception as exc:
+                    if active_filter is None:
+                        raise
+                    # A filter that cannot be compiled must not stop capture.
+                    self._record_filter_failure(exc)
+                    active_filter = None
+                self._deliver(pending[:], on_packet, on_batch)
+                pending.clear()
         except Exception as exc:
             self._record_drop(str(exc))
             self._mark_stopped()
@@ -189,7 +477,26 @@ class LinuxRawSocketCaptureBackend(CaptureBackend):
     def backend_name(self) -> str:
         return "linux_raw"
 
-    def start(self, on_packet: Callable[[object], bool], timeout: int | float | None = None) -> tuple[bool, Optional[str]]:
+    def _drain_socket(self, raw_socket: socket.socket, batch_limit: int) -> list[bytes]:
+        # The socket is non-blocking: whatever the kernel already queued is
+        # collected in one pass, so one wake-up delivers a whole burst.
+        frames: list[bytes] = []
+        while len(frames) < batch_limit:
+            try:
+                frames.append(raw_socket.recv(65535))
+            except (BlockingIOError, InterruptedError):
+                break
+        return frames
+
+    def start(
+        self,
+        on_packet: PacketCallback | None = None,
+        timeout: int | float | None = None,
+        *,
+        on_batch: BatchCallback | None = None,
+        batch_size: int = 256,
+    ) -> tuple[bool, Optional[str]]:
+        self._require_callback(on_packet, on_batch)
         if platform.system().lower() != "linux":
             message = "Linux raw socket capture is only available on Linux hosts."
             self._record_drop(message)
@@ -204,47 +511,271 @@ class LinuxRawSocketCaptureBackend(CaptureBackend):
 
         self._mark_started()
         deadline = None if timeout is None else time.time() + max(float(timeout), 0.0)
+        batch_limit = max(int(batch_size), 1) if on_batch is not None else 64
         raw_socket: socket.socket | None = None
         try:
-            Ether, _ = _load_scapy_primitives()
             raw_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0003))
+            self._attach_socket_filter(raw_socket)
             raw_socket.bind((self.interface, 0))
-            raw_socket.settimeout(1.0)
+            self._join_fanout_group(raw_socket)
+            raw_socket.setblocking(False)
+            poller = select.poll()
+            poller.register(raw_socket.fileno(), select.POLLIN | select.POLLERR)
 
             while not self._stop_event.is_set():
                 if deadline is not None and time.time() >= deadline:
                     break
                 try:
-                    raw_frame = raw_socket.recv(65535)
-                except socket.timeout:
-                    continue
+                    if not poller.poll(1000):
+                        continue
+                    frames = self._drain_socket(raw_socket, batch_limit)
                 except OSError as exc:
                     self._record_drop(str(exc))
                     return False, str(exc)
 
-                self._record_seen()
+                self._deliver(frames, on_packet, on_batch)
+        except Exception as exc:
+            self._record_drop(str(exc))
+            self._mark_stopped()
+            return False, str(exc)
+        finally:
+            if raw_socket is not None:
                 try:
-                    packet = Ether(raw_frame)
-                except Exception as exc:
-                    self._record_drop(f"decode_error: {exc}")
-                    continue
+                    raw_socket.close()
+                except OSError:
+                    pass
+            self._mark_stopped()
+        return True, None
 
-                try:
-                    accepted = self._normalize_capture_result(on_packet(packet))
-                except Exception as exc:
-                    self._record_drop(str(exc))
-                    logger.debug("Raw capture callback failed: %s", exc)
+
+class LinuxMmapCaptureBackend(CaptureBackend):
+    """
+    AF_PACKET TPACKET_V3 capture backend.
+
+    The kernel fills a memory-mapped ring of blocks; each block is walked in
+    place and handed back to the kernel, so a busy interface costs one poll()
+    per block instead of one recv() per frame.
+    """
+
+    def __init__(
+        self,
+        *,
+        role: str,
+        interface: str | None = None,
+        requested_backend: str = "linux_mmap",
+        promiscuous: bool = True,
+        capture_filter: str | None = None,
+        capture_filter_program: str | Sequence[Sequence[int]] | None = None,
+        fanout_group: int | None = None,
+        block_size: int = 1 << 20,
+        block_count: int = 64,
+        frame_size: int = 2048,
+        block_timeout_ms: int = 100,
+    ) -> None:
+        super().__init__(
+            role=role,
+            interface=interface,
+            requested_backend=requested_backend,
+            promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            fanout_group=fanout_group,
+        )
+        page_size = mmap.PAGESIZE
+        self.block_size = max(page_size, (int(block_size) // page_size) * page_size)
+        self.block_count = max(int(block_count), 1)
+        self.frame_size = max(16, (int(frame_size) // 16) * 16)
+        self.block_timeout_ms = max(int(block_timeout_ms), 1)
+        self._ring_packets = 0
+        self._ring_drops = 0
+        self._ring_freezes = 0
+        self._stats_interval = 1.0
+
+    @property
+    def backend_name(self) -> str:
+        return "linux_mmap"
+
+    def _mark_started(self) -> None:
+        super()._mark_started()
+        with self._metrics_lock:
+            self._ring_packets = 0
+            self._ring_drops = 0
+            self._ring_freezes = 0
+
+    def _iter_block_frames(self, view: memoryview, block_offset: int):
+        """Yield ``(frame, timestamp)`` memoryviews for one user-owned block."""
+        _, _, _, num_packets, first_offset = _TPACKET_BLOCK_HEADER.unpack_from(view, block_offset)
+        frame_offset = block_offset + first_offset
+        block_end = block_offset + self.block_size
+        for _ in range(num_packets):
+            if frame_offset + _TPACKET3_FRAME_HEADER.size > block_end:
+                break
+            next_offset, ts_sec, ts_nsec, snaplen, _, _, mac_offset, _ = _TPACKET3_FRAME_HEADER.unpack_from(
+                view, frame_offset
+            )
+            frame_start = frame_offset + mac_offset
+            frame_end = frame_start + snaplen
+            if frame_end <= block_end:
+                yield view[frame_start:frame_end], ts_sec + ts_nsec / 1_000_000_000
+            if not next_offset:
+                break
+            frame_offset += next_offset
+
+    def _release_frame(self, frame: memoryview) -> None:
+        # Releasing the frame does not invalidate slices a callback kept: they
+        # still alias the ring and show whatever the kernel writes into the
+        # block next, so callbacks must copy anything they keep. Release only
+        # fails while a buffer export (e.g. a NumPy array) is still alive.
+        try:
+            frame.release()
+        except BufferError:
+            pass
+
+    def _collect_ring_statistics(self, raw_socket: socket.socket) -> None:
+        # PACKET_STATISTICS resets the kernel counters on every read, so the
+        # running totals live here.
+        try:
+            payload = raw_socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS_V3.size)
+        except OSError as exc:
+            logger.debug("PACKET_STATISTICS read failed: %s", exc)
+            return
+        if len(payload) < _TPACKET_STATS_V3.size:
+            return
+        packets, drops, freezes = _TPACKET_STATS_V3.unpack_from(payload)
+        with self._metrics_lock:
+            self._ring_packets += packets
+            self._ring_drops += drops
+            self._ring_freezes += freezes
+
+    def _open_ring(self) -> tuple[socket.socket, mmap.mmap]:
+        raw_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0003))
+        try:
+            self._attach_socket_filter(raw_socket)
+            raw_socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frame_count = (self.block_size * self.block_count) // self.frame_size
+            raw_socket.setsockopt(
+                SOL_PACKET,
+                PACKET_RX_RING,
+                _TPACKET_REQ3.pack(
+                    self.block_size,
+                    self.block_count,
+                    self.frame_size,
+                    frame_count,
+                    self.block_timeout_ms,
+                    0,
+                    0,
+                ),
+            )
+            ring = mmap.mmap(
+                raw_socket.fileno(),
+                self.block_size * self.block_count,
+                mmap.MAP_SHARED,
+                mmap.PROT_READ | mmap.PROT_WRITE,
+            )
+            raw_socket.bind((self.interface, 0))
+            self._join_fanout_group(raw_socket)
+        except Exception:
+            raw_socket.close()
+            raise
+        return raw_socket, ring
+
+    def status_snapshot(self) -> dict:
+        snapshot = super().status_snapshot()
+        with self._metrics_lock:
+            snapshot.update(
+                {
+                    "ring_block_size": self.block_size,
+                    "ring_block_count": self.block_count,
+                    "ring_packets": self._ring_packets,
+                    "ring_drops": self._ring_drops,
+                    "ring_freeze_count": self._ring_freezes,
+                }
+            )
+        return snapshot
+
+    def start(
+        self,
+        on_packet: PacketCallback | None = None,
+        timeout: int | float | None = None,
+        *,
+        on_batch: BatchCallback | None = None,
+        batch_size: int = 256,
+    ) -> tuple[bool, Optional[str]]:
+        self._require_callback(on_packet, on_batch)
+        if platform.system().lower() != "linux":
+            message = "Linux mmap capture is only available on Linux hosts."
+            self._record_drop(message)
+            self._mark_stopped()
+            return False, message
+
+        if not self.interface:
+            message = "Linux mmap capture requires an interface name."
+            self._record_drop(message)
+            self._mark_stopped()
+            return False, message
+
+        self._mark_started()
+        deadline = None if timeout is None else time.time() + max(float(timeout), 0.0)
+        batch_limit = max(int(batch_size), 1)
+        raw_socket: socket.socket | None = None
+        ring: mmap.mmap | None = None
+        view: memoryview | None = None
+        try:
+            raw_socket, ring = self._open_ring()
+            view = memoryview(ring)
+            poller = select.poll()
+            poller.register(raw_socket.fileno(), select.POLLIN | select.POLLERR)
+            block_index = 0
+            next_stats_at = time.time() + self._stats_interval
+
+            while not self._stop_event.is_set():
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    break
+                if now >= next_stats_at:
+                    self._collect_ring_statistics(raw_socket)
+                    next_stats_at = now + self._stats_interval
+
+                block_offset = block_index * self.block_size
+                block_status = _U32.unpack_from(view, block_offset + _TPACKET_BLOCK_STATUS_OFFSET)[0]
+                if not block_status & TP_STATUS_USER:
+                    poller.poll(self.block_timeout_ms)
                     continue
 
-                if accepted:
-                    self._record_emit()
-                else:
-                    self._record_drop("filtered")
+                frames: list[memoryview] = []
+                try:
+                    # A retired block is one batch; oversized blocks are split so
+                    # batch consumers never see more than batch_size frames.
+                    for frame, _ in self._iter_block_frames(view, block_offset):
+                        frames.append(frame)
+                        if len(frames) >= batch_limit:
+                            self._deliver(frames, on_packet, on_batch)
+                            for delivered in frames:
+                                self._release_frame(delivered)
+                            frames = []
+                    self._deliver(frames, on_packet, on_batch)
+                finally:
+                    for delivered in frames:
+                        self._release_frame(delivered)
+                    _U32.pack_into(view, block_offset + _TPACKET_BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+                block_index = (block_index + 1) % self.block_count
         except Exception as exc:
             self._record_drop(str(exc))
-            self._mark_stopped()
             return False, str(exc)
         finally:
+            if raw_socket is not None:
+                self._collect_ring_statistics(raw_socket)
+            if view is not None:
+                view.release()
+            if ring is not None:
+                try:
+                    ring.close()
+                except BufferError as exc:
+                    # A consumer still holds an export of ring memory, so the
+                    # mapping stays alive until that reference is dropped.
+                    logger.warning("Capture ring left mapped, a frame buffer is still referenced: %s", exc)
+                except OSError as exc:
+                    logger.debug("Capture ring close failed: %s", exc)
             if raw_socket is not None:
                 try:
                     raw_socket.close()
@@ -260,14 +791,55 @@ def build_capture_backend(
     interface: str | None,
     requested_backend: str = "auto",
     promiscuous: bool = True,
+    ring_block_size: int | None = None,
+    ring_block_count: int | None = None,
+    capture_filter: str | None = None,
+    capture_filter_program: str | Sequence[Sequence[int]] | None = None,
+    fanout_group: int | None = None,
+    replay_path: str | None = None,
+    replay_speed: float | str | None = None,
+    replay_watch: bool = False,
 ) -> CaptureBackend:
     backend_name = str(requested_backend or "auto").strip().lower() or "auto"
+    if backend_name in {"pcap", "pcapng", "replay"}:
+        from .replay import PcapReplayCaptureBackend, parse_replay_speed
+
+        return PcapReplayCaptureBackend(
+            role=role,
+            interface=interface,
+            requested_backend=backend_name,
+            promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            replay_path=replay_path,
+            speed=parse_replay_speed(replay_speed),
+            watch=replay_watch,
+        )
+    if backend_name in {"linux_mmap", "mmap", "tpacket_v3"}:
+        ring_options: dict[str, int] = {}
+        if ring_block_size:
+            ring_options["block_size"] = int(ring_block_size)
+        if ring_block_count:
+            ring_options["block_count"] = int(ring_block_count)
+        return LinuxMmapCaptureBackend(
+            role=role,
+            interface=interface,
+            requested_backend=backend_name,
+            promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            fanout_group=fanout_group,
+            **ring_options,
+        )
     if backend_name in {"linux", "linux_raw", "native"}:
         return LinuxRawSocketCaptureBackend(
             role=role,
             interface=interface,
             requested_backend=backend_name,
             promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            fanout_group=fanout_group,
         )
     if backend_name in {"scapy", "python"}:
         return ScapyCaptureBackend(
@@ -275,6 +847,9 @@ def build_capture_backend(
             interface=interface,
             requested_backend=backend_name,
             promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            fanout_group=fanout_group,
         )
 
     if platform.system().lower() == "linux":
@@ -283,6 +858,9 @@ def build_capture_backend(
             interface=interface,
             requested_backend=backend_name,
             promiscuous=promiscuous,
+            capture_filter=capture_filter,
+            capture_filter_program=capture_filter_program,
+            fanout_group=fanout_group,
         )
 
     return ScapyCaptureBackend(
@@ -290,4 +868,7 @@ def build_capture_backend(
         interface=interface,
         requested_backend=backend_name,
         promiscuous=promiscuous,
+        capture_filter=capture_filter,
+        capture_filter_program=capture_filter_program,
+        fanout_group=fanout_group,
     )
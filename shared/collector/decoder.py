@@ -0,0 +1,314 @@
+"""
+Scapy-free frame decoder for the capture hot path.
+
+Frames are parsed in place with ``struct.unpack_from`` over bytes or
+memoryviews; only the fields the collector needs (addresses, ports, the
+transport payload and DNS questions/answers) are materialised.
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Optional, Union
+
+FrameBuffer = Union[bytes, bytearray, memoryview]
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_ARP = 0x0806
+VLAN_ETHERTYPES = {0x8100, 0x88A8, 0x9100}
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV6_EXTENSION_HEADERS = {0, 43, 60}
+IPV6_FRAGMENT_HEADER = 44
+
+IP_PROTO_MAP = {
+    1: "ICMP",
+    6: "TCP",
+    17: "UDP",
+    41: "IPv6",
+    47: "GRE",
+    50: "ESP",
+    51: "AH",
+    58: "ICMPv6",
+}
+
+DNS_PORTS = {53, 5353}
+DNS_TCP_PORTS = {53}
+DNS_MAX_QUESTIONS = 8
+DNS_MAX_ANSWERS = 64
+
+_ETHER_HEADER = struct.Struct("!6s6sH")
+_VLAN_TAG = struct.Struct("!HH")
+_IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_IPV6_HEADER = struct.Struct("!IHBB16s16s")
+_PORTS = struct.Struct("!HH")
+_TCP_OFFSET_FLAGS = struct.Struct("!BB")
+_DNS_HEADER = struct.Struct("!HHHHHH")
+_DNS_RR_FIXED = struct.Struct("!HHIH")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+
+
+@dataclass(slots=True)
+class DecodedFrame:
+    frame_length: int
+    ip_version: int
+    src_ip: str
+    dst_ip: str
+    ip_protocol: int
+    transport_protocol: str
+    src_port: int = 0
+    dst_port: int = 0
+    payload: FrameBuffer = b""
+    src_mac: Optional[str] = None
+    dst_mac: Optional[str] = None
+    tcp_flags: int = 0
+    tcp_seq: int = 0
+    has_transport_header: bool = False
+
+    @property
+    def is_tcp(self) -> bool:
+        return self.has_transport_header and self.ip_protocol == IPPROTO_TCP
+
+    @property
+    def is_udp(self) -> bool:
+        return self.has_transport_header and self.ip_protocol == IPPROTO_UDP
+
+
+@dataclass(frozen=True, slots=True)
+class DnsAnswer:
+    name: str
+    rr_type: int
+    address: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class DnsMessage:
+    is_response: bool
+    question_name: str
+    answers: tuple[DnsAnswer, ...] = ()
+
+
+def _format_mac(value: bytes) -> str:
+    return value.hex(":")
+
+
+def _protocol_name(ip_version: int, ip_protocol: int) -> str:
+    # IPv4 protocol numbers and IPv6 next-header values share one registry.
+    prefix = "IP" if ip_version == 4 else "IPv6"
+    return IP_PROTO_MAP.get(ip_protocol, f"{prefix}-{ip_protocol}")
+
+
+def _decode_transport(frame: FrameBuffer, decoded: DecodedFrame, offset: int, end: int) -> DecodedFrame:
+    if decoded.ip_protocol == IPPROTO_TCP and offset + 14 <= end:
+        src_port, dst_port = _PORTS.unpack_from(frame, offset)
+        data_offset, flags = _TCP_OFFSET_FLAGS.unpack_from(frame, offset + 12)
+        header_length = (data_offset >> 4) * 4
+        if header_length < 20 or offset + header_length > end:
+            return decoded
+        decoded.src_port = src_port
+        decoded.dst_port = dst_port
+        decoded.tcp_flags = flags
+        decoded.tcp_seq = _U32.unpack_from(frame, offset + 4)[0]
+        decoded.payload = frame[offset + header_length : end]
+        decoded.transport_protocol = "TCP"
+        decoded.has_transport_header = True
+    elif decoded.ip_protocol == IPPROTO_UDP and offset + 8 <= end:
+        src_port, dst_port = _PORTS.unpack_from(frame, offset)
+        udp_length = _U16.unpack_from(frame, offset + 4)[0]
+        payload_end = min(end, offset + udp_length) if udp_length >= 8 else end
+        decoded.src_port = src_port
+        decoded.dst_port = dst_port
+        decoded.payload = frame[offset + 8 : payload_end]
+        decoded.transport_protocol = "UDP"
+        decoded.has_transport_header = True
+    elif decoded.ip_protocol == IPPROTO_ICMP and decoded.ip_version == 4:
+        decoded.transport_protocol = "ICMP"
+        decoded.payload = frame[offset:end]
+    return decoded
+
+
+def _decode_ipv4(frame: FrameBuffer, offset: int, frame_length: int) -> DecodedFrame | None:
+    if offset + 20 > len(frame):
+        return None
+    version_ihl, _, total_length, _, fragment, _, protocol, _, src, dst = _IPV4_HEADER.unpack_from(frame, offset)
+    if version_ihl >> 4 != 4:
+        return None
+    header_length = (version_ihl & 0x0F) * 4
+    if header_length < 20:
+        return None
+    end = min(len(frame), offset + total_length) if total_length >= header_length else len(frame)
+    decoded = DecodedFrame(
+        frame_length=frame_length,
+        ip_version=4,
+        src_ip=socket.inet_ntop(socket.AF_INET, bytes(src)),
+        dst_ip=socket.inet_ntop(socket.AF_INET, bytes(dst)),
+        ip_protocol=protocol,
+        transport_protocol=_protocol_name(4, protocol),
+    )
+    # Non-first fragments carry no transport header.
+    if fragment & 0x1FFF:
+        return decoded
+    return _decode_transport(frame, decoded, offset + header_length, end)
+
+
+def _decode_ipv6(frame: FrameBuffer, offset: int, frame_length: int) -> DecodedFrame | None:
+    if offset + 40 > len(frame):
+        return None
+    version_class_flow, payload_length, next_header, _, src, dst = _IPV6_HEADER.unpack_from(frame, offset)
+    if version_class_flow >> 28 != 6:
+        return None
+    end = min(len(frame), offset + 40 + payload_length) if payload_length else len(frame)
+    decoded = DecodedFrame(
+        frame_length=frame_length,
+        ip_version=6,
+        src_ip=socket.inet_ntop(socket.AF_INET6, bytes(src)),
+        dst_ip=socket.inet_ntop(socket.AF_INET6, bytes(dst)),
+        ip_protocol=next_header,
+        transport_protocol=_protocol_name(6, next_header),
+    )
+
+    cursor = offset + 40
+    protocol = next_header
+    while protocol in IPV6_EXTENSION_HEADERS or protocol == IPV6_FRAGMENT_HEADER:
+        if cursor + 8 > end:
+            return decoded
+        following = frame[cursor]
+        if protocol == IPV6_FRAGMENT_HEADER:
+            if _U16.unpack_from(frame, cursor + 2)[0] & 0xFFF8:
+                return decoded
+            cursor += 8
+        else:
+            cursor += (frame[cursor + 1] + 1) * 8
+        protocol = following
+
+    decoded.ip_protocol = protocol
+    decoded.transport_protocol = _protocol_name(6, protocol)
+    if protocol in {IPPROTO_TCP, IPPROTO_UDP}:
+        return _decode_transport(frame, decoded, cursor, end)
+    return decoded
+
+
+def decode_ip_packet(frame: FrameBuffer, *, offset: int = 0, frame_length: int | None = None) -> DecodedFrame | None:
+    """Decode an IPv4/IPv6 packet that starts at ``offset`` (no link header)."""
+    if offset >= len(frame):
+        return None
+    length = len(frame) if frame_length is None else frame_length
+    version = frame[offset] >> 4
+    if version == 4:
+        return _decode_ipv4(frame, offset, length)
+    if version == 6:
+        return _decode_ipv6(frame, offset, length)
+    return None
+
+
+def decode_frame(frame: FrameBuffer) -> DecodedFrame | None:
+    """Decode an Ethernet frame (with optional 802.1Q/802.1ad tags)."""
+    if len(frame) < _ETHER_HEADER.size:
+        return None
+    dst_mac, src_mac, ethertype = _ETHER_HEADER.unpack_from(frame, 0)
+    offset = _ETHER_HEADER.size
+    while ethertype in VLAN_ETHERTYPES:
+        if offset + _VLAN_TAG.size > len(frame):
+            return None
+        _, ethertype = _VLAN_TAG.unpack_from(frame, offset)
+        offset += _VLAN_TAG.size
+
+    if ethertype == ETH_P_IP:
+        decoded = _decode_ipv4(frame, offset, len(frame))
+    elif ethertype == ETH_P_IPV6:
+        decoded = _decode_ipv6(frame, offset, len(frame))
+    else:
+        return None
+    if decoded is None:
+        return None
+    decoded.src_mac = _format_mac(bytes(src_mac))
+    decoded.dst_mac = _format_mac(bytes(dst_mac))
+    return decoded
+
+
+def _read_dns_name(message: FrameBuffer, offset: int) -> tuple[str, int] | None:
+    labels: list[str] = []
+    next_offset: int | None = None
+    jumps = 0
+    while True:
+        if offset >= len(message):
+            return None
+        length = message[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= len(message) or jumps > 16:
+                return None
+            if next_offset is None:
+                next_offset = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            jumps += 1
+            continue
+        if length & 0xC0 or offset + 1 + length > len(message):
+            return None
+        labels.append(bytes(message[offset + 1 : offset + 1 + length]).decode("utf-8", errors="ignore"))
+        offset += 1 + length
+    return ".".join(labels) + ".", next_offset if next_offset is not None else offset
+
+
+def dns_payload(decoded: DecodedFrame) -> FrameBuffer | None:
+    """Return the DNS message carried by ``decoded``, mirroring scapy's DNS port bindings."""
+    if decoded.is_udp and (decoded.src_port in DNS_PORTS or decoded.dst_port in DNS_PORTS):
+        return decoded.payload
+    if decoded.is_tcp and (decoded.src_port in DNS_TCP_PORTS or decoded.dst_port in DNS_TCP_PORTS):
+        payload = decoded.payload
+        if len(payload) < 2:
+            return None
+        return payload[2 : 2 + _U16.unpack_from(payload, 0)[0]]
+    return None
+
+
+def parse_dns_message(message: FrameBuffer | None) -> DnsMessage | None:
+    """Parse the first question and the A/AAAA answers of a DNS message."""
+    if message is None or len(message) < _DNS_HEADER.size:
+        return None
+    _, flags, question_count, answer_count, _, _ = _DNS_HEADER.unpack_from(message, 0)
+    if question_count == 0:
+        return None
+
+    offset = _DNS_HEADER.size
+    question_name = None
+    for _ in range(min(question_count, DNS_MAX_QUESTIONS)):
+        parsed = _read_dns_name(message, offset)
+        if parsed is None:
+            return None
+        name, offset = parsed
+        offset += 4
+        if question_name is None:
+            question_name = name
+    if question_name is None:
+        return None
+
+    answers: list[DnsAnswer] = []
+    is_response = bool(flags & 0x8000)
+    if is_response:
+        for _ in range(min(answer_count, DNS_MAX_ANSWERS)):
+            parsed = _read_dns_name(message, offset)
+            if parsed is None or parsed[1] + _DNS_RR_FIXED.size > len(message):
+                break
+            name, offset = parsed
+            rr_type, _, _, rdata_length = _DNS_RR_FIXED.unpack_from(message, offset)
+            offset += _DNS_RR_FIXED.size
+            if offset + rdata_length > len(message):
+                break
+            address = None
+            if rr_type == 1 and rdata_length == 4:
+                address = socket.inet_ntop(socket.AF_INET, bytes(message[offset : offset + 4]))
+            elif rr_type == 28 and rdata_length == 16:
+                address = socket.inet_ntop(socket.AF_INET6, bytes(message[offset : offset + 16]))
+            answers.append(DnsAnswer(name=name, rr_type=rr_type, address=address))
+            offset += rdata_length
+
+    return DnsMessage(is_response=is_response, question_name=question_name, answers=tuple(answers))
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import queue
+import platform
+import signal
+import threading
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+from .capture import build_capture_backend
+from .flow_manager import ClassificationPolicy, FlowManager, FlowSummary
+from .observations import PacketObservation
+from .reassembly import build_tls_reassembler
+from .traffic_metadata import DomainHintCache
+
+logger = logging.getLogger("netvisor.capture.fanout")
+
+FANOUT_CAPABLE_BACKENDS = {"linux", "linux_raw", "native", "linux_mmap", "mmap", "tpacket_v3"}
+
+
+@dataclass(frozen=True, slots=True)
+class CaptureShardOptions:
+    role: str
+    interface: str | None
+    requested_backend: str
+    fanout_group: int
+    agent_id: str
+    organization_id: str
+    source_type: str = "gateway"
+    metadata_only: bool = True
+    flush_interval: float = 5.0
+    cleanup_interval: float = 5.0
+    max_flows: int = 50_000
+    ring_block_size: int | None = None
+    ring_block_count: int | None = None
+    capture_filter: str | None = None
+    capture_filter_program: str | Sequence[Sequence[int]] | None = None
+    status_interval: float = 2.0
+    classification_policy: ClassificationPolicy | None = None
+    bidirectional: bool = False
+    flow_storage: str = "dict"
+    flow_features: bool = True
+    domain_cache_ttl: int = 300
+    domain_cache_max_entries: int = 2048
+    domain_cache_snapshot_path: str | None = None
+    domain_cache_snapshot_interval: float = 60.0
+    tls_reassembly_flow_bytes: int = 16384
+    tls_reassembly_budget_bytes: int = 4 * 1024 * 1024
+
+
+def _shard_snapshot_path(path: str | None, shard_index: int) -> Path | None:
+    if not path:
+        return None
+    base = Path(path)
+    return base.with_name(f"{base.stem}.shard{shard_index}{base.suffix}")
+
+
+def _run_capture_shard(shard_index: int, options: CaptureShardOptions, results, stop_event, timeout) -> None:
+    """
+    Capture worker process body.
+
+    Each shard owns its capture socket (a member of the shared PACKET_FANOUT
+    group), its DomainHintCache and its FlowManager. Expired summaries and
+    periodic status snapshots are sent back to the parent over ``results``.
+    """
+    # Ctrl-C reaches the whole process group; shut down through stop_event
+    # instead, so the shard still flushes its flows and reports "exit".
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def _on_flow_expired(summary: FlowSummary) -> None:
+        results.put(("flow", shard_index, dict(summary.__dict__)))
+
+    domain_cache = DomainHintCache(ttl_seconds=options.domain_cache_ttl, max_entries=options.domain_cache_max_entries)
+    snapshot_path = _shard_snapshot_path(options.domain_cache_snapshot_path, shard_index)
+    if snapshot_path is not None:
+        # DNS answers hash to arbitrary shards, so warm up from every shard's file.
+        base = Path(options.domain_cache_snapshot_path)
+        for candidate in sorted(base.parent.glob(f"{base.stem}*{base.suffix}")):
+            domain_cache.load_snapshot(candidate)
+    reassembler = build_tls_reassembler(options.tls_reassembly_flow_bytes, options.tls_reassembly_budget_bytes)
+    flow_manager = FlowManager(
+        agent_id=options.agent_id,
+        organization_id=options.organization_id,
+        on_flow_expired=_on_flow_expired,
+        source_type=options.source_type,
+        metadata_only=options.metadata_only,
+        flush_interval=options.flush_interval,
+        cleanup_interval=options.cleanup_interval,
+        max_flows=options.max_flows,
+        classification_policy=options.classification_policy,
+        bidirectional=options.bidirectional,
+        flow_storage=options.flow_storage,
+        flow_features=options.flow_features,
+    )
+    backend = build_capture_backend(
+        role=options.role,
+        interface=options.interface,
+        requested_backend=options.requested_backend,
+        ring_block_size=options.ring_block_size,
+        ring_block_count=options.ring_block_count,
+        capture_filter=options.capture_filter,
+        capture_filter_program=options.capture_filter_program,
+        fanout_group=options.fanout_group,
+    )
+
+    def _publish_status() -> None:
+        results.put(
+            (
+                "status",
+                shard_index,
+                {
+                    "pid": os.getpid(),
+                    "capture": backend.status_snapshot(),
+                    "flow_manager": flow_manager.status_snapshot(),
+                    "domain_cache": domain_cache.status_snapshot(),
+                    "tls_reassembly": reassembler.status_snapshot() if reassembler else None,
+                },
+            )
+        )
+
+    def _save_snapshot() -> None:
+        try:
+            domain_cache.save_snapshot(snapshot_path)
+        except OSError as exc:
+            logger.debug("Shard %s domain hint snapshot failed: %s", shard_index, exc)
+
+    def _status_worker() -> None:
+        # Poll instead of stop_event.wait(): a process that exits while blocked
+        # in a multiprocessing Event wait leaves the parent's set() hanging.
+        next_status_at = time.monotonic() + options.status_interval
+        next_snapshot_at = time.monotonic() + options.domain_cache_snapshot_interval
+        while not stop_event.is_set():
+            time.sleep(0.2)
+            if time.monotonic() >= next_status_at:
+                _publish_status()
+                next_status_at = time.monotonic() + options.status_interval
+            if snapshot_path is not None and time.monotonic() >= next_snapshot_at:
+                _save_snapshot()
+                next_snapshot_at = time.monotonic() + options.domain_cache_snapshot_interval
+        backend.stop()
+
+    def _process_batch(packets: list) -> int:
+        observations = []
+        for packet in packets:
+            try:
+                observation = PacketObservation.from_packet(
+                    packet,
+                    source_type=options.source_type,
+                    metadata_only=options.metadata_only,
+                    domain_cache=domain_cache,
+                    inspect_flow=flow_manager.should_inspect,
+                    reassembler=reassembler,
+                )
+            except Exception as exc:
+                logger.debug("Shard %s packet decode failed: %s", shard_index, exc)
+                continue
+            if observation is not None:
+                observations.append(observation)
+        return flow_manager.update_from_observations(observations)
+
+    threading.Thread(target=_status_worker, daemon=True).start()
+    success, error = backend.start(timeout=timeout, on_batch=_process_batch)
+    flow_manager.stop()
+    # Live flows would die with the process; hand their counters to the parent.
+    flow_manager.flush_all()
+    if snapshot_path is not None:
+        _save_snapshot()
+    _publish_status()
+    results.put(("exit", shard_index, {"success": success, "error": error}))
+
+
+class FanoutCaptureSupervisor:
+    """
+    Runs N capture worker processes that share one PACKET_FANOUT_HASH group.
+
+    The kernel hashes each flow to a single member socket, so every worker owns
+    a disjoint FlowManager shard and parsing scales past the GIL. Expired
+    summaries from all shards are funnelled into ``on_flow_expired`` in the
+    parent process. DNS answers and the flows they describe usually hash to
+    different shards, so domain hints are only correlated within a shard.
+    """
+
+    def __init__(
+        self,
+        *,
+        worker_count: int,
+        options: CaptureShardOptions,
+        on_flow_expired: Callable[[FlowSummary], None],
+    ) -> None:
+        self.worker_count = max(int(worker_count), 1)
+        self.options = options
+        self.on_flow_expired = on_flow_expired
+        self._context = multiprocessing.get_context("spawn")
+        self._results = None
+        self._stop_event = None
+        self._processes: list = []
+        self._lock = threading.Lock()
+        self._shards: dict[int, dict] = {}
+        self._forwarded_flows = 0
+        self._forward_errors = 0
+        self._running = False
+
+    @property
+    def backend_name(self) -> str:
+        return "fanout"
+
+    def stop(self) -> None:
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def _handle_message(self, message) -> None:
+        kind, shard_index, payload = message
+        if kind == "flow":
+            try:
+                self.on_flow_expired(FlowSummary(**payload))
+            except Exception as exc:
+                logger.debug("Fan-out flow forward failed: %s", exc)
+                with self._lock:
+                    self._forward_errors += 1
+                return
+            with self._lock:
+                self._forwarded_flows += 1
+                shard = self._shards.setdefault(shard_index, {"shard": shard_index})
+                shard["flows_forwarded"] = int(shard.get("flows_forwarded") or 0) + 1
+            return
+
+        with self._lock:
+            shard = self._shards.setdefault(shard_index, {"shard": shard_index})
+            if kind == "status":
+                shard.update(payload)
+            elif kind == "exit":
+                shard["exit"] = payload
+
+    def _drain(self, block_seconds: float) -> None:
+        try:
+            message = self._results.get(timeout=block_seconds)
+        except queue.Empty:
+            return
+        self._handle_message(message)
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._handle_message(message)
+
+    def _shards_pending(self) -> bool:
+        if not any(process.is_alive() for process in self._processes):
+            return False
+        with self._lock:
+            return any("exit" not in shard for shard in self._shards.values())
+
+    def start(self, timeout: int | float | None = None) -> tuple[bool, Optional[str]]:
+        backend_name = str(self.options.requested_backend or "").strip().lower() or "auto"
+        if backend_name == "auto" and platform.system().lower() == "linux":
+            backend_name = "linux_raw"
+            self.options = replace(self.options, requested_backend=backend_name)
+        if backend_name not in FANOUT_CAPABLE_BACKENDS:
+            return False, f"Capture fan-out requires a Linux raw or mmap backend, not '{backend_name}'."
+        if not self.options.interface:
+            return False, "Capture fan-out requires an interface name."
+
+        self._results = self._context.Queue()
+        self._stop_event = self._context.Event()
+        with self._lock:
+            self._shards = {index: {"shard": index} for index in range(self.worker_count)}
+            self._forwarded_flows = 0
+            self._forward_errors = 0
+            self._running = True
+
+        self._processes = [
+            self._context.Process(
+                target=_run_capture_shard,
+                args=(index, self.options, self._results, self._stop_event, timeout),
+                name=f"netvisor-capture-shard-{index}",
+                daemon=True,
+            )
+            for index in range(self.worker_count)
+        ]
+        for process in self._processes:
+            process.start()
+
+        try:
+            while self._shards_pending():
+                self._drain(0.5)
+        finally:
+            self.stop()
+            # Shards flush their flow tables before reporting "exit" and cannot
+            # exit until the queue feeder has handed everything over, so keep
+            # draining until every shard has reported "exit" before joining.
+            deadline = time.monotonic() + 10.0
+            while self._shards_pending() and time.monotonic() < deadline:
+                self._drain(0.2)
+            for process in self._processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    logger.warning("Capture shard %s did not exit; terminating.", process.name)
+                    process.terminate()
+            self._drain(0.1)
+            with self._lock:
+                self._running = False
+
+        errors = [
+            str(shard.get("exit", {}).get("error"))
+            for shard in self._shards.values()
+            if shard.get("exit") and not shard["exit"].get("success")
+        ]
+        if errors:
+            return False, "; ".join(sorted(set(errors)))
+        return True, None
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            shards = [dict(self._shards[index]) for index in sorted(self._shards)]
+            forwarded = self._forwarded_flows
+            forward_errors = self._forward_errors
+            running = self._running
+
+        alive = {process.name: process.is_alive() for process in self._processes}
+        totals = {"packets_seen": 0, "packets_emitted": 0, "packets_dropped": 0, "active_flow_count": 0}
+        for shard in shards:
+            shard["alive"] = alive.get(f"netvisor-capture-shard-{shard['shard']}", False)
+            capture = shard.get("capture") or {}
+            flow_manager = shard.get("flow_manager") or {}
+            totals["packets_seen"] += int(capture.get("packets_seen") or 0)
+            totals["packets_emitted"] += int(capture.get("packets_emitted") or 0)
+            totals["packets_dropped"] += int(capture.get("packets_dropped") or 0)
+            totals["active_flow_count"] += int(flow_manager.get("active_flow_count") or 0)
+
+        return {
+            "requested_backend": self.options.requested_backend,
+            "active_backend": self.backend_name,
+            "capture_interface": self.options.interface,
+            "fanout_group": self.options.fanout_group,
+            "worker_count": self.worker_count,
+            "running": running,
+            "flows_forwarded": forwarded,
+            "flow_forward_errors": forward_errors,
+            **totals,
+            "shards": shards,
+        }
+
+
+def default_fanout_group() -> int:
+    return os.getpid() & 0xFFFF
+
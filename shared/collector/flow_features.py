@@ -0,0 +1,125 @@
+"""
+Streaming per-flow statistics for the server's anomaly model.
+
+The collector already sees every packet, so it keeps a few fixed-size
+statistics on each ``FlowState`` and ships them with the flow summary as a
+compact vector (``FLOW_FEATURE_NAMES``). The server would otherwise only
+have totals to work with. All statistics are O(1) per packet and are reset
+with the counters whenever an interim summary is flushed, so each vector
+describes the same window as the counters it travels with.
+
+The names are a wire contract with ``app/ml/features.py``; append new
+features at the end and bump ``FLOW_FEATURE_VERSION``.
+"""
+
+from __future__ import annotations
+
+import math
+
+FLOW_FEATURE_VERSION = "edge-v1"
+
+# Upper bounds of the packet-size histogram bins; the last bin is open-ended.
+PACKET_SIZE_BOUNDS = (64, 128, 256, 512, 1024)
+SIZE_BIN_FIELDS = (
+    "size_bin_64",
+    "size_bin_128",
+    "size_bin_256",
+    "size_bin_512",
+    "size_bin_1024",
+    "size_bin_max",
+)
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+
+DIRECTION_OUT = 1
+DIRECTION_IN = 2
+
+# FlowState fields holding the statistics, all reset on flush except
+# ``last_direction``, which carries over so a flush does not count a change.
+FLOW_STATISTIC_FIELDS = SIZE_BIN_FIELDS + (
+    "iat_count",
+    "iat_mean",
+    "iat_m2",
+    "syn_packets",
+    "fin_packets",
+    "rst_packets",
+    "psh_packets",
+    "direction_changes",
+)
+
+FLOW_FEATURE_NAMES = (
+    "size_le_64_ratio",
+    "size_le_128_ratio",
+    "size_le_256_ratio",
+    "size_le_512_ratio",
+    "size_le_1024_ratio",
+    "size_gt_1024_ratio",
+    "iat_mean",
+    "iat_std",
+    "syn_ratio",
+    "fin_ratio",
+    "rst_ratio",
+    "psh_ratio",
+    "direction_changes",
+)
+
+
+def size_bin_field(packet_size: int) -> str:
+    for bound, field in zip(PACKET_SIZE_BOUNDS, SIZE_BIN_FIELDS):
+        if packet_size <= bound:
+            return field
+    return SIZE_BIN_FIELDS[-1]
+
+
+def update_flow_statistics(state, *, packet_size: int, count: int, tcp_flags: int, direction: int, gap: float | None) -> None:
+    """Fold one observation (standing for ``count`` packets) into ``state``."""
+    field = size_bin_field(packet_size)
+    setattr(state, field, getattr(state, field) + count)
+    if tcp_flags:
+        if tcp_flags & TCP_SYN:
+            state.syn_packets += count
+        if tcp_flags & TCP_FIN:
+            state.fin_packets += count
+        if tcp_flags & TCP_RST:
+            state.rst_packets += count
+        if tcp_flags & TCP_PSH:
+            state.psh_packets += count
+    if gap is not None:
+        # Welford's online mean/variance; a sampled observation spreads its
+        # gap over the packets it stands for.
+        value = max(gap, 0.0) / count
+        state.iat_count += 1
+        delta = value - state.iat_mean
+        state.iat_mean += delta / state.iat_count
+        state.iat_m2 += delta * (value - state.iat_mean)
+    if state.last_direction and state.last_direction != direction:
+        state.direction_changes += 1
+    state.last_direction = direction
+
+
+def reset_flow_statistics(state) -> None:
+    for field in FLOW_STATISTIC_FIELDS:
+        setattr(state, field, 0)
+
+
+def flow_feature_vector(state) -> tuple[float, ...]:
+    """Return the ``FLOW_FEATURE_NAMES`` vector for ``state``, or () if nothing was recorded."""
+    binned = [getattr(state, field) for field in SIZE_BIN_FIELDS]
+    total = sum(binned)
+    if total <= 0:
+        return ()
+    iat_std = math.sqrt(state.iat_m2 / state.iat_count) if state.iat_count > 1 else 0.0
+    values = [count / total for count in binned]
+    values += [
+        state.iat_mean,
+        iat_std,
+        state.syn_packets / total,
+        state.fin_packets / total,
+        state.rst_packets / total,
+        state.psh_packets / total,
+        float(state.direction_changes),
+    ]
+    return tuple(round(value, 6) for value in values)
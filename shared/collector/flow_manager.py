@@ -1,17 +1,49 @@
 from __future__ import annotations
 
+import math
 import threading
 import time
-import heapq
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Callable, Dict, Optional, Tuple
-
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .flow_features import (
+    DIRECTION_IN,
+    DIRECTION_OUT,
+    FLOW_STATISTIC_FIELDS,
+    flow_feature_vector,
+    reset_flow_statistics,
+    update_flow_statistics,
+)
+from .flow_table import DictFlowTable, build_flow_table
 from .observations import PacketObservation
 
 
 FlowKey = Tuple[str, str, int, int, str]
+EVICTION_REASON_CAPACITY = "capacity"
+EVICTION_REASON_SHUTDOWN = "shutdown"
 GENERIC_LAYER4_PROTOCOLS = {"TCP", "UDP", "IP", "IPV4", "IPV6", "UNKNOWN"}
+# DNS traffic keeps feeding the DomainHintCache, so it is never short-circuited.
+ALWAYS_INSPECT_PORTS = frozenset({53, 5353, 5355})
+
+
+@dataclass(frozen=True, slots=True)
+class ClassificationPolicy:
+    """
+    Decides when packets of an already-classified flow skip payload inspection.
+
+    A flow is short-circuited once its confidence reaches ``min_confidence``
+    (a value above 1.0 disables skipping). Flows without a domain keep being
+    inspected for their first ``unenriched_packet_budget`` packets so HTTP Host
+    headers and TLS SNI that arrive after the handshake are still picked up,
+    and every flow is re-examined once per ``recheck_interval`` seconds
+    (0 disables re-examination).
+    """
+
+    min_confidence: float = 0.9
+    recheck_interval: float = 30.0
+    unenriched_packet_budget: int = 8
+    always_inspect_ports: frozenset[int] = ALWAYS_INSPECT_PORTS
 
 
 def _merge_signals(existing: tuple[str, ...], incoming: tuple[str, ...]) -> tuple[str, ...]:
@@ -25,6 +57,63 @@ def _merge_signals(existing: tuple[str, ...], incoming: tuple[str, ...]) -> tupl
     return tuple(merged)
 
 
+class _ExpiryWheel:
+    """
+    Expiry index bucketed by absolute tick number.
+
+    Flows are filed under the tick at which they next need attention (flush or
+    idle timeout). Entries are never moved when a packet arrives; a popped
+    entry whose flow is not actually due is simply filed again, and entries
+    left behind by evicted or rescheduled flows are dropped when their tick
+    comes up (callers compare the tick against ``FlowState.expiry_slot``).
+    Entries are opaque handles from the stripe's flow table (the flow key,
+    or a row number for columnar storage).
+    """
+
+    __slots__ = ("tick", "_buckets", "_cursor", "_entries")
+
+    def __init__(self, tick: float) -> None:
+        self.tick = tick
+        self._buckets: Dict[int, list[Hashable]] = {}
+        self._cursor: int | None = None
+        self._entries = 0
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def slot_for(self, due: float) -> int:
+        slot = int(math.ceil(due / self.tick))
+        if self._cursor is not None and slot < self._cursor:
+            return self._cursor
+        return slot
+
+    def schedule(self, handle: Hashable, due: float) -> int:
+        slot = self.slot_for(due)
+        self._buckets.setdefault(slot, []).append(handle)
+        self._entries += 1
+        return slot
+
+    def pop_due(self, now: float) -> list[tuple[int, Hashable]]:
+        current = int(now // self.tick)
+        cursor = self._cursor
+        if cursor is None:
+            cursor = min(self._buckets, default=current)
+        if current - cursor > len(self._buckets):
+            # Long gap (first run or clock jump): only visit occupied ticks.
+            slots = sorted(slot for slot in self._buckets if slot <= current)
+        else:
+            slots = range(cursor, current + 1)
+
+        due: list[tuple[int, Hashable]] = []
+        for slot in slots:
+            bucket = self._buckets.pop(slot, None)
+            if bucket:
+                self._entries -= len(bucket)
+                due.extend((slot, handle) for handle in bucket)
+        self._cursor = current + 1
+        return due
+
+
 @dataclass(slots=True)
 class FlowState:
     start_time: float
@@ -41,6 +130,34 @@ class FlowState:
     analysis_source: str = "transport_fallback"
     analysis_confidence: float = 0.0
     analysis_signals: tuple[str, ...] = ()
+    inspected_packets: int = 0
+    last_inspected: float = 0.0
+    expiry_slot: int = -1
+    # "out" is initiator -> responder, "in" the reply direction. ``reversed``
+    # is set when the initiator sent the reverse of the stored key.
+    packets_out: int = 0
+    packets_in: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    reversed: bool = False
+    # Streaming statistics behind FlowSummary.flow_features (see flow_features).
+    size_bin_64: int = 0
+    size_bin_128: int = 0
+    size_bin_256: int = 0
+    size_bin_512: int = 0
+    size_bin_1024: int = 0
+    size_bin_max: int = 0
+    iat_count: int = 0
+    iat_mean: float = 0.0
+    iat_m2: float = 0.0
+    syn_packets: int = 0
+    fin_packets: int = 0
+    rst_packets: int = 0
+    psh_packets: int = 0
+    direction_changes: int = 0
+    last_direction: int = 0
+    # Highest load-shedding level seen while the flow was live.
+    load_shed_level: int = 0
 
     @property
     def duration(self) -> float:
@@ -81,11 +198,73 @@ class FlowSummary:
     analysis_signals: tuple[str, ...] = ()
     source_type: str = "agent"
     metadata_only: bool = False
+    packets_out: int = 0
+    packets_in: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    # Set when the flow was pushed out of the table early (e.g. "capacity")
+    # rather than flushed or idled out.
+    eviction_reason: Optional[str] = None
+    # Highest load-shedding level in force while the flow was captured.
+    load_shed_level: int = 0
+    # FLOW_FEATURE_NAMES vector for the server's anomaly model; () when off.
+    flow_features: tuple[float, ...] = ()
+
+
+class _FlowStripe:
+    """One shard of the flow table: its own lock, expiry index and running totals."""
+
+    __slots__ = (
+        "lock",
+        "flows",
+        "wheel",
+        "packet_count",
+        "byte_count",
+        "inspected_packets",
+        "skipped_packets",
+        "expiry_last_due",
+        "expiry_last_stall",
+        "expiry_max_stall",
+        "evicted",
+        "evicted_flows",
+    )
+
+    def __init__(self, tick: float, flows=None) -> None:
+        self.lock = threading.Lock()
+        # A DictFlowTable or ColumnarFlowTable; both map FlowKey to a
+        # FlowState-like object.
+        self.flows = DictFlowTable() if flows is None else flows
+        self.wheel = _ExpiryWheel(tick=tick)
+        # packet/byte totals mirror the sum of the live FlowState counters,
+        # which reset on every flush.
+        self.packet_count = 0
+        self.byte_count = 0
+        self.inspected_packets = 0
+        self.skipped_packets = 0
+        self.expiry_last_due = 0
+        self.expiry_last_stall = 0.0
+        self.expiry_max_stall = 0.0
+        # Summaries of flows evicted under the lock, emitted once it is released.
+        self.evicted: list[FlowSummary] = []
+        self.evicted_flows = 0
 
 
 class FlowManager:
     """
     Flow-based aggregation engine shared by the agent and gateway runtimes.
+
+    The flow table is split into ``stripe_count`` stripes keyed by flow-key
+    hash, each with its own lock and expiry index, so several capture threads
+    and the expiry worker only contend when they touch the same stripe.
+
+    With ``bidirectional`` enabled both directions of a conversation share one
+    canonical key; summaries keep the initiator as ``src`` and split the
+    counters into ``*_out`` (initiator to responder) and ``*_in``.
+
+    ``flow_storage="columnar"`` swaps the per-stripe dicts for preallocated
+    :class:`~shared.collector.flow_table.ColumnarFlowTable` columns sized
+    from ``max_flows``, trading some per-packet speed for a fixed memory
+    footprint at very large flow counts.
     """
 
     def __init__(
@@ -101,6 +280,12 @@ class FlowManager:
         max_flows: int = 50_000,
         cleanup_interval: float = 5.0,
         start_worker: bool = True,
+        classification_policy: ClassificationPolicy | None = None,
+        stripe_count: int = 16,
+        bidirectional: bool = False,
+        flow_storage: str = "dict",
+        clock: Callable[[], float] | None = None,
+        flow_features: bool = True,
     ) -> None:
         self.agent_id = agent_id
         self.organization_id = organization_id
@@ -112,9 +297,21 @@ class FlowManager:
         self.flush_interval = flush_interval
         self.max_flows = max_flows
         self.cleanup_interval = cleanup_interval
-
-        self._flows: Dict[FlowKey, FlowState] = {}
-        self._lock = threading.Lock()
+        self.classification_policy = classification_policy or ClassificationPolicy()
+        self.stripe_count = max(int(stripe_count), 1)
+        self.bidirectional = bool(bidirectional)
+        # Expiry follows the capture's timebase, which is not wall time during replay.
+        self.clock = clock or time.time
+        self.flow_features = bool(flow_features)
+
+        self.flow_storage = str(flow_storage or "dict").strip().lower()
+
+        tick = min(max(float(cleanup_interval), 0.1), 1.0)
+        self._stripe_capacity = max(math.ceil(max_flows / self.stripe_count), 1)
+        self._stripes = tuple(
+            _FlowStripe(tick, build_flow_table(self.flow_storage, self._stripe_capacity))
+            for _ in range(self.stripe_count)
+        )
         self._stop_event = threading.Event()
 
         self._worker_started = False
@@ -126,35 +323,96 @@ class FlowManager:
     def stop(self) -> None:
         self._stop_event.set()
 
-    def status_snapshot(self) -> dict:
-        with self._lock:
-            active_flows = len(self._flows)
-            oldest_seen = 0.0
-            longest_lived = 0.0
-            total_packets = 0
-            total_bytes = 0
-            now = time.time()
-            for state in self._flows.values():
-                oldest_seen = max(oldest_seen, max(now - state.last_seen, 0.0))
-                longest_lived = max(longest_lived, max(now - state.start_time, 0.0))
-                total_packets += int(state.packet_count)
-                total_bytes += int(state.byte_count)
+    def __len__(self) -> int:
+        return sum(len(stripe.flows) for stripe in self._stripes)
 
+    def _storage_key(self, key: FlowKey) -> FlowKey:
+        if not self.bidirectional:
+            return key
+        reverse = (key[1], key[0], key[3], key[2], key[4])
+        return reverse if reverse < key else key
+
+    def _stripe_for(self, key: FlowKey) -> _FlowStripe:
+        return self._stripes[hash(key) % self.stripe_count]
+
+    def flow_state(self, key: FlowKey):
+        key = self._storage_key(key)
+        return self._stripe_for(key).flows.get(key)
+
+    def status_snapshot(self) -> dict:
+        active_flows = 0
+        total_packets = 0
+        total_bytes = 0
+        inspected_packets = 0
+        skipped_packets = 0
+        scheduled_entries = 0
+        expiry_last_due = 0
+        expiry_last_stall = 0.0
+        expiry_max_stall = 0.0
+        table_bytes = 0
+        evicted_flows = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                active_flows += len(stripe.flows)
+                total_packets += stripe.packet_count
+                total_bytes += stripe.byte_count
+                inspected_packets += stripe.inspected_packets
+                skipped_packets += stripe.skipped_packets
+                scheduled_entries += len(stripe.wheel)
+                expiry_last_due += stripe.expiry_last_due
+                expiry_last_stall += stripe.expiry_last_stall
+                expiry_max_stall = max(expiry_max_stall, stripe.expiry_max_stall)
+                table_bytes += stripe.flows.storage_bytes() or 0
+                evicted_flows += stripe.evicted_flows
+
+        classified_packets = inspected_packets + skipped_packets
         return {
             "active_flow_count": active_flows,
             "max_flows": self.max_flows,
+            "stripe_count": self.stripe_count,
+            "bidirectional": self.bidirectional,
+            "flow_storage": self.flow_storage,
+            "flow_table_bytes": table_bytes if self.flow_storage == "columnar" else None,
             "tcp_timeout_seconds": self.tcp_timeout,
             "udp_timeout_seconds": self.udp_timeout,
             "flush_interval_seconds": self.flush_interval,
             "cleanup_interval_seconds": self.cleanup_interval,
             "source_type": self.source_type,
             "metadata_only": self.metadata_only,
-            "oldest_flow_age_seconds": round(oldest_seen, 3),
-            "longest_flow_age_seconds": round(longest_lived, 3),
             "packet_count": total_packets,
             "byte_count": total_bytes,
+            "evicted_flow_count": evicted_flows,
+            "classification_min_confidence": self.classification_policy.min_confidence,
+            "classification_inspected_packets": inspected_packets,
+            "classification_skipped_packets": skipped_packets,
+            "classification_skip_rate": round(skipped_packets / classified_packets, 4) if classified_packets else 0.0,
+            "expiry_scheduled_entries": scheduled_entries,
+            "expiry_last_due_flows": expiry_last_due,
+            "expiry_last_stall_ms": round(expiry_last_stall * 1000.0, 3),
+            "expiry_max_stall_ms": round(expiry_max_stall * 1000.0, 3),
         }
 
+    def should_inspect(self, key: FlowKey, now: float | None = None) -> bool:
+        """
+        Return False when packets of ``key`` can skip payload inspection.
+
+        Runs on the capture hot path without taking the stripe lock: a stale
+        read only means one extra (or one fewer) inspected packet.
+        """
+        policy = self.classification_policy
+        state = self.flow_state(key)
+        if state is None or state.analysis_confidence < policy.min_confidence:
+            return True
+        if key[2] in policy.always_inspect_ports or key[3] in policy.always_inspect_ports:
+            return True
+        if not state.domain and state.inspected_packets < policy.unenriched_packet_budget:
+            return True
+        if policy.recheck_interval > 0:
+            current = self.clock() if now is None else now
+            if current - state.last_inspected >= policy.recheck_interval:
+                return True
+        return False
+
     def update_from_packet(self, packet) -> None:
         observation = PacketObservation.from_packet(
             packet,
@@ -166,62 +424,163 @@ class FlowManager:
         self.update_from_observation(observation)
 
     def update_from_observation(self, observation: PacketObservation) -> None:
-        key: FlowKey = observation.flow_key
+        key = self._storage_key(observation.flow_key)
+        stripe = self._stripe_for(key)
+        with stripe.lock:
+            self._apply_observation_locked(stripe, key, observation)
+            evicted = self._take_evicted_locked(stripe)
+        if evicted:
+            self._emit_summaries(evicted)
+
+    def update_from_observations(self, observations: Iterable[PacketObservation]) -> int:
+        """Apply a capture batch, taking each touched stripe's lock once."""
+        grouped: Dict[int, list[tuple[FlowKey, PacketObservation]]] = {}
+        for observation in observations:
+            key = self._storage_key(observation.flow_key)
+            grouped.setdefault(hash(key) % self.stripe_count, []).append((key, observation))
+
+        applied = 0
+        for index, batch in grouped.items():
+            stripe = self._stripes[index]
+            with stripe.lock:
+                for key, observation in batch:
+                    self._apply_observation_locked(stripe, key, observation)
+                evicted = self._take_evicted_locked(stripe)
+            if evicted:
+                self._emit_summaries(evicted)
+            applied += len(batch)
+        return applied
+
+    @staticmethod
+    def _take_evicted_locked(stripe: _FlowStripe) -> list[FlowSummary]:
+        if not stripe.evicted:
+            return []
+        evicted, stripe.evicted = stripe.evicted, []
+        return evicted
+
+    def _emit_summaries(self, summaries: Iterable[FlowSummary]) -> None:
+        for summary in summaries:
+            try:
+                self.on_flow_expired(summary)
+            except Exception:
+                continue
+
+    def _apply_observation_locked(self, stripe: _FlowStripe, key: FlowKey, observation: PacketObservation) -> None:
+        packet_key = observation.flow_key
         now = observation.observed_at
-        size = observation.packet_size
+        count = observation.sample_weight
+        size = observation.packet_size * count
         src_mac = observation.src_mac
         dst_mac = observation.dst_mac
 
-        with self._lock:
-            state = self._flows.get(key)
-            if state is None:
-                if len(self._flows) >= self.max_flows:
-                    self._evict_oldest_locked()
-
-                self._flows[key] = FlowState(
-                    start_time=now,
-                    last_seen=now,
-                    last_flushed=now,
-                    packet_count=1,
-                    byte_count=size,
-                    domain=observation.domain,
-                    sni=observation.sni,
-                    src_mac=src_mac,
-                    dst_mac=dst_mac,
-                    application_protocol=observation.application_protocol,
-                    service_name=observation.service_name,
-                    analysis_source=observation.analysis_source,
-                    analysis_confidence=observation.analysis_confidence,
-                    analysis_signals=observation.analysis_signals,
+        if observation.inspected:
+            stripe.inspected_packets += 1
+        else:
+            stripe.skipped_packets += 1
+        stripe.packet_count += count
+        stripe.byte_count += size
+
+        state = stripe.flows.get(key)
+        if state is None:
+            if len(stripe.flows) >= self._stripe_capacity:
+                self._evict_lru_locked(stripe)
+
+            state = stripe.flows.insert(key, FlowState(
+                start_time=now,
+                last_seen=now,
+                last_flushed=now,
+                packet_count=count,
+                byte_count=size,
+                domain=observation.domain,
+                sni=observation.sni,
+                src_mac=src_mac,
+                dst_mac=dst_mac,
+                application_protocol=observation.application_protocol,
+                service_name=observation.service_name,
+                analysis_source=observation.analysis_source,
+                analysis_confidence=observation.analysis_confidence,
+                analysis_signals=observation.analysis_signals,
+                inspected_packets=1 if observation.inspected else 0,
+                last_inspected=now if observation.inspected else 0.0,
+                packets_out=count,
+                bytes_out=size,
+                reversed=packet_key != key,
+                load_shed_level=observation.load_shed_level,
+            ))
+            if self.flow_features:
+                update_flow_statistics(
+                    state,
+                    packet_size=observation.packet_size,
+                    count=count,
+                    tcp_flags=observation.tcp_flags,
+                    direction=DIRECTION_OUT,
+                    gap=None,
                 )
+            self._schedule_locked(stripe, key, state)
+        else:
+            stripe.flows.touch(key, state)
+            gap = now - state.last_seen
+            state.last_seen = now
+            state.packet_count += count
+            state.byte_count += size
+            if observation.load_shed_level > state.load_shed_level:
+                state.load_shed_level = observation.load_shed_level
+            if (packet_key == key) != state.reversed:
+                direction = DIRECTION_OUT
+                state.packets_out += count
+                state.bytes_out += size
             else:
-                state.last_seen = now
-                state.packet_count += 1
-                state.byte_count += size
-                if observation.domain:
-                    state.domain = observation.domain
-                if observation.sni:
-                    state.sni = observation.sni
-                if src_mac:
-                    state.src_mac = src_mac
-                if dst_mac:
-                    state.dst_mac = dst_mac
-                if observation.application_protocol:
-                    candidate_protocol = str(observation.application_protocol).strip().upper()
-                    if candidate_protocol and (
-                        not state.application_protocol
-                        or state.application_protocol.upper() in GENERIC_LAYER4_PROTOCOLS
-                        or candidate_protocol not in GENERIC_LAYER4_PROTOCOLS
-                    ):
-                        state.application_protocol = candidate_protocol
-                if observation.service_name:
-                    state.service_name = observation.service_name
-                if observation.analysis_source:
-                    if state.analysis_source == "transport_fallback" or observation.analysis_source != "transport_fallback":
-                        state.analysis_source = observation.analysis_source
-                if observation.analysis_confidence >= state.analysis_confidence:
-                    state.analysis_confidence = observation.analysis_confidence
-                state.analysis_signals = _merge_signals(state.analysis_signals, observation.analysis_signals)
+                # Reply direction: the packet's source is the flow's responder.
+                direction = DIRECTION_IN
+                state.packets_in += count
+                state.bytes_in += size
+                src_mac, dst_mac = dst_mac, src_mac
+            if self.flow_features:
+                update_flow_statistics(
+                    state,
+                    packet_size=observation.packet_size,
+                    count=count,
+                    tcp_flags=observation.tcp_flags,
+                    direction=direction,
+                    gap=gap,
+                )
+            if src_mac:
+                state.src_mac = src_mac
+            if dst_mac:
+                state.dst_mac = dst_mac
+            if state.packet_count == count:
+                # First packet since the last flush: it needs a flush deadline,
+                # which may be earlier than the idle timeout it is filed under.
+                flush_slot = stripe.wheel.slot_for(state.last_flushed + self.flush_interval)
+                if flush_slot < state.expiry_slot:
+                    state.expiry_slot = stripe.wheel.schedule(
+                        stripe.flows.handle(key, state), state.last_flushed + self.flush_interval
+                    )
+            if not observation.inspected:
+                # Header-only observation of a classified flow: counters only.
+                return
+            state.inspected_packets += 1
+            state.last_inspected = now
+            if observation.domain:
+                state.domain = observation.domain
+            if observation.sni:
+                state.sni = observation.sni
+            if observation.application_protocol:
+                candidate_protocol = str(observation.application_protocol).strip().upper()
+                if candidate_protocol and (
+                    not state.application_protocol
+                    or state.application_protocol.upper() in GENERIC_LAYER4_PROTOCOLS
+                    or candidate_protocol not in GENERIC_LAYER4_PROTOCOLS
+                ):
+                    state.application_protocol = candidate_protocol
+            if observation.service_name:
+                state.service_name = observation.service_name
+            if observation.analysis_source:
+                if state.analysis_source == "transport_fallback" or observation.analysis_source != "transport_fallback":
+                    state.analysis_source = observation.analysis_source
+            if observation.analysis_confidence >= state.analysis_confidence:
+                state.analysis_confidence = observation.analysis_confidence
+            state.analysis_signals = _merge_signals(state.analysis_signals, observation.analysis_signals)
 
     def _expiry_worker(self) -> None:
         print("[*] FlowManager expiry worker started.")
@@ -232,20 +591,41 @@ class FlowManager:
                 print(f"ERROR in FlowManager expiry worker: {exc}")
             self._stop_event.wait(self.cleanup_interval)
 
+    def _timeout_for(self, proto: str) -> int:
+        return self.tcp_timeout if proto == "TCP" else self.udp_timeout
+
+    def _schedule_locked(self, stripe: _FlowStripe, key: FlowKey, state: FlowState) -> None:
+        due = state.last_seen + self._timeout_for(key[4])
+        if state.packet_count > 0:
+            due = min(due, state.last_flushed + self.flush_interval)
+        state.expiry_slot = stripe.wheel.schedule(stripe.flows.handle(key, state), due)
+
     def _expire_flows(self) -> None:
-        now = time.time()
+        now = self.clock()
+        for stripe in self._stripes:
+            self._expire_stripe(stripe, now)
+
+    def _expire_stripe(self, stripe: _FlowStripe, now: float) -> None:
         expired: Dict[FlowKey, FlowState] = {}
         flushed: Dict[FlowKey, FlowState] = {}
 
-        with self._lock:
-            for key, state in list(self._flows.items()):
-                _, _, _, _, proto = key
-                timeout = self.tcp_timeout if proto == "TCP" else self.udp_timeout
-                if now - state.last_seen >= timeout:
+        with stripe.lock:
+            started = time.perf_counter()
+            due_entries = stripe.wheel.pop_due(now)
+            for slot, handle in due_entries:
+                resolved = stripe.flows.resolve(handle)
+                if resolved is None or resolved[1].expiry_slot != slot:
+                    continue
+                key, state = resolved
+                if now - state.last_seen >= self._timeout_for(key[4]):
+                    stripe.packet_count -= state.packet_count
+                    stripe.byte_count -= state.byte_count
+                    # pop() hands back a detached state that outlives the row.
+                    state = stripe.flows.pop(key)
                     if state.packet_count > 0:
                         expired[key] = state
-                    del self._flows[key]
-                elif state.packet_count > 0 and now - state.last_flushed >= self.flush_interval:
+                    continue
+                if state.packet_count > 0 and now - state.last_flushed >= self.flush_interval:
                     flushed[key] = FlowState(
                         start_time=state.start_time,
                         last_seen=state.last_seen,
@@ -261,22 +641,40 @@ class FlowManager:
                         analysis_source=state.analysis_source,
                         analysis_confidence=state.analysis_confidence,
                         analysis_signals=state.analysis_signals,
+                        packets_out=state.packets_out,
+                        packets_in=state.packets_in,
+                        bytes_out=state.bytes_out,
+                        bytes_in=state.bytes_in,
+                        reversed=state.reversed,
+                        load_shed_level=state.load_shed_level,
+                        **{field: getattr(state, field) for field in FLOW_STATISTIC_FIELDS},
                     )
+                    stripe.packet_count -= state.packet_count
+                    stripe.byte_count -= state.byte_count
                     state.start_time = state.last_seen
                     state.last_flushed = now
                     state.packet_count = 0
                     state.byte_count = 0
+                    state.packets_out = 0
+                    state.packets_in = 0
+                    state.bytes_out = 0
+                    state.bytes_in = 0
+                    # Each flushed summary reports the level seen over its own interval.
+                    state.load_shed_level = 0
+                    reset_flow_statistics(state)
+                self._schedule_locked(stripe, key, state)
+            stall = time.perf_counter() - started
+            stripe.expiry_last_due = len(due_entries)
+            stripe.expiry_last_stall = stall
+            stripe.expiry_max_stall = max(stripe.expiry_max_stall, stall)
 
         for collection in (flushed, expired):
-            for key, state in collection.items():
-                summary = self._build_summary(key, state)
-                try:
-                    self.on_flow_expired(summary)
-                except Exception:
-                    continue
+            self._emit_summaries(self._build_summary(key, state) for key, state in collection.items())
 
-    def _build_summary(self, key: FlowKey, state: FlowState) -> FlowSummary:
+    def _build_summary(self, key: FlowKey, state: FlowState, eviction_reason: str | None = None) -> FlowSummary:
         src_ip, dst_ip, sport, dport, proto = key
+        if state.reversed:
+            src_ip, dst_ip, sport, dport = dst_ip, src_ip, dport, sport
         start_dt = datetime.fromtimestamp(state.start_time, tz=timezone.utc)
         last_dt = datetime.fromtimestamp(state.last_seen, tz=timezone.utc)
 
@@ -305,13 +703,40 @@ class FlowManager:
             organization_id=self.organization_id,
             source_type=self.source_type,
             metadata_only=self.metadata_only,
+            packets_out=state.packets_out,
+            packets_in=state.packets_in,
+            bytes_out=state.bytes_out,
+            bytes_in=state.bytes_in,
+            eviction_reason=eviction_reason,
+            load_shed_level=state.load_shed_level,
+            flow_features=flow_feature_vector(state),
         )
 
-    def _evict_oldest_locked(self) -> None:
-        if not self._flows:
+    def flush_all(self, eviction_reason: str | None = EVICTION_REASON_SHUTDOWN) -> int:
+        """Remove every live flow and emit its final summary; returns how many were emitted."""
+        emitted = 0
+        for stripe in self._stripes:
+            summaries = []
+            with stripe.lock:
+                while (oldest := stripe.flows.pop_oldest()) is not None:
+                    key, state = oldest
+                    if state.packet_count > 0:
+                        summaries.append(self._build_summary(key, state, eviction_reason))
+                stripe.packet_count = 0
+                stripe.byte_count = 0
+                summaries.extend(self._take_evicted_locked(stripe))
+            self._emit_summaries(summaries)
+            emitted += len(summaries)
+        return emitted
+
+    def _evict_lru_locked(self, stripe: _FlowStripe) -> None:
+        """Evict the stripe's least recently seen flow, queueing its final summary."""
+        oldest = stripe.flows.pop_oldest()
+        if oldest is None:
             return
-
-        batch_size = max(1, len(self._flows) // 20)
-        oldest = heapq.nsmallest(batch_size, self._flows.items(), key=lambda kv: kv[1].last_seen)
-        for key, _ in oldest:
-            self._flows.pop(key, None)
+        key, state = oldest
+        stripe.packet_count -= state.packet_count
+        stripe.byte_count -= state.byte_count
+        stripe.evicted_flows += 1
+        if state.packet_count > 0:
+            stripe.evicted.append(self._build_summary(key, state, EVICTION_REASON_CAPACITY))
@@ -0,0 +1,476 @@
+"""
+Flow table storage engines for :class:`~shared.collector.flow_manager.FlowManager`.
+
+``DictFlowTable`` keeps one ``FlowState`` object per flow in an ordered dict. It is the
+default and the fastest per packet. ``ColumnarFlowTable`` preallocates
+``array`` columns for a fixed number of rows and finds rows through an
+open-addressing index over packed binary keys, so a million-flow table costs
+a predictable ~240 bytes per flow instead of several hundred bytes of Python
+objects. Strings and signal tuples are interned in a reference-counted side
+table. Rows are handed out as ``FlowRow`` views that read and write the
+columns in place and expose the same attributes as ``FlowState``.
+
+Both engines keep flows in recency order: ``touch`` moves a flow to the
+most-recent end on every packet and ``pop_oldest`` removes the least recently
+seen flow in O(1).
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+from array import array
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Hashable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .flow_manager import FlowKey, FlowState
+
+_EMPTY = -1
+_TOMBSTONE = -2
+
+# family byte + 16 address bytes per endpoint, then ports and protocol id.
+_KEY = struct.Struct("!17s17sHHH")
+_INTERNED_ADDRESS = struct.Struct("!i12x")
+_IPV4_PADDING = bytes(12)
+
+_NUMERIC_COLUMNS = (
+    ("start_time", "d"),
+    ("last_seen", "d"),
+    ("last_flushed", "d"),
+    ("packet_count", "I"),
+    ("byte_count", "Q"),
+    ("analysis_confidence", "d"),
+    ("inspected_packets", "I"),
+    ("last_inspected", "d"),
+    ("expiry_slot", "q"),
+    ("packets_out", "I"),
+    ("packets_in", "I"),
+    ("bytes_out", "Q"),
+    ("bytes_in", "Q"),
+    ("reversed", "B"),
+    ("size_bin_64", "I"),
+    ("size_bin_128", "I"),
+    ("size_bin_256", "I"),
+    ("size_bin_512", "I"),
+    ("size_bin_1024", "I"),
+    ("size_bin_max", "I"),
+    ("iat_count", "I"),
+    ("iat_mean", "d"),
+    ("iat_m2", "d"),
+    ("syn_packets", "I"),
+    ("fin_packets", "I"),
+    ("rst_packets", "I"),
+    ("psh_packets", "I"),
+    ("direction_changes", "I"),
+    ("last_direction", "B"),
+    ("load_shed_level", "B"),
+)
+_INTERNED_COLUMNS = (
+    "domain",
+    "sni",
+    "src_mac",
+    "dst_mac",
+    "application_protocol",
+    "service_name",
+    "analysis_source",
+    "analysis_signals",
+)
+_STATE_FIELDS = tuple(name for name, _ in _NUMERIC_COLUMNS) + _INTERNED_COLUMNS
+
+
+class DictFlowTable(OrderedDict):
+    """Default storage: an ordered dict of ``FlowState`` objects, least recently seen first."""
+
+    storage_name = "dict"
+
+    def insert(self, key: "FlowKey", state: "FlowState") -> "FlowState":
+        self[key] = state
+        return state
+
+    def touch(self, key: "FlowKey", state: "FlowState") -> None:
+        self.move_to_end(key)
+
+    def pop_oldest(self) -> tuple["FlowKey", "FlowState"] | None:
+        if not self:
+            return None
+        return self.popitem(last=False)
+
+    def handle(self, key: "FlowKey", state: "FlowState") -> Hashable:
+        return key
+
+    def resolve(self, handle: Hashable) -> tuple["FlowKey", "FlowState"] | None:
+        state = self.get(handle)
+        if state is None:
+            return None
+        return handle, state
+
+    def storage_bytes(self) -> int | None:
+        return None
+
+
+class _InternTable:
+    """Reference-counted value <-> id table shared by the interned columns."""
+
+    __slots__ = ("_ids", "_values", "_refs", "_free")
+
+    def __init__(self) -> None:
+        self._ids: dict[Hashable, int] = {}
+        self._values: list[Hashable] = []
+        self._refs = array("I")
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def peek(self, value: Hashable) -> int:
+        return self._ids.get(value, _EMPTY)
+
+    def value(self, value_id: int) -> Hashable:
+        return self._values[value_id]
+
+    def acquire(self, value: Hashable) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            if self._free:
+                value_id = self._free.pop()
+                self._values[value_id] = value
+                self._refs[value_id] = 0
+            else:
+                value_id = len(self._values)
+                self._values.append(value)
+                self._refs.append(0)
+            self._ids[value] = value_id
+        self._refs[value_id] += 1
+        return value_id
+
+    def release(self, value_id: int) -> None:
+        self._refs[value_id] -= 1
+        if self._refs[value_id] == 0:
+            del self._ids[self._values[value_id]]
+            self._values[value_id] = None
+            self._free.append(value_id)
+
+
+def _numeric_property(name: str) -> property:
+    def _get(self):
+        return self._columns[name][self._row]
+
+    def _set(self, value) -> None:
+        self._columns[name][self._row] = value
+
+    return property(_get, _set)
+
+
+def _interned_property(name: str) -> property:
+    def _get(self):
+        value_id = self._columns[name][self._row]
+        return None if value_id < 0 else self._strings.value(value_id)
+
+    def _set(self, value) -> None:
+        column = self._columns[name]
+        old_id = column[self._row]
+        if old_id < 0:
+            if value is None:
+                return
+        elif self._strings.value(old_id) == value:
+            return
+        column[self._row] = _EMPTY if value is None else self._strings.acquire(value)
+        if old_id >= 0:
+            self._strings.release(old_id)
+
+    return property(_get, _set)
+
+
+class FlowRow:
+    """Live view of one row of a :class:`ColumnarFlowTable`; valid until the row is removed."""
+
+    __slots__ = ("_columns", "_strings", "_row")
+
+    def __init__(self, columns: dict[str, array], strings: _InternTable, row: int) -> None:
+        self._columns = columns
+        self._strings = strings
+        self._row = row
+
+    @property
+    def duration(self) -> float:
+        if self.last_seen < self.start_time:
+            return 0.0
+        return self.last_seen - self.start_time
+
+    @property
+    def average_packet_size(self) -> float:
+        if self.packet_count <= 0:
+            return 0.0
+        return self.byte_count / self.packet_count
+
+
+for _name, _ in _NUMERIC_COLUMNS:
+    setattr(FlowRow, _name, _numeric_property(_name))
+for _name in _INTERNED_COLUMNS:
+    setattr(FlowRow, _name, _interned_property(_name))
+
+
+class ColumnarFlowTable:
+    """
+    Fixed-capacity flow table stored column-wise in ``array`` buffers.
+
+    Keys are packed to 40 bytes (addresses via ``inet_pton``), so keys read
+    back from the table use the canonical ``inet_ntop`` spelling.
+    """
+
+    storage_name = "columnar"
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(int(capacity), 1)
+        slot_count = 1
+        while slot_count < self.capacity * 2:
+            slot_count <<= 1
+        self._mask = slot_count - 1
+        self._slots = array("i", [_EMPTY]) * slot_count
+        self._tombstones = 0
+        self._keys = bytearray(_KEY.size * self.capacity)
+        self._occupied = bytearray(self.capacity)
+        self._free_rows = array("i", range(self.capacity - 1, -1, -1))
+        self._strings = _InternTable()
+        self._columns: dict[str, array] = {}
+        for name, typecode in _NUMERIC_COLUMNS:
+            self._columns[name] = array(typecode, [0]) * self.capacity
+        for name in _INTERNED_COLUMNS:
+            self._columns[name] = array("i", [_EMPTY]) * self.capacity
+        # Recency list threaded through the rows, least recently seen at the head.
+        self._newer = array("i", [_EMPTY]) * self.capacity
+        self._older = array("i", [_EMPTY]) * self.capacity
+        self._oldest = _EMPTY
+        self._newest = _EMPTY
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __contains__(self, key: "FlowKey") -> bool:
+        return self._find_key(key)[1] >= 0
+
+    def __iter__(self) -> Iterator["FlowKey"]:
+        for row in range(self.capacity):
+            if self._occupied[row]:
+                yield self._unpack_key(row)
+
+    def __getitem__(self, key: "FlowKey") -> FlowRow:
+        row = self._find_key(key)[1]
+        if row < 0:
+            raise KeyError(key)
+        return FlowRow(self._columns, self._strings, row)
+
+    def __setitem__(self, key: "FlowKey", state: "FlowState") -> None:
+        self.insert(key, state)
+
+    def __delitem__(self, key: "FlowKey") -> None:
+        if self.pop(key, None) is None:
+            raise KeyError(key)
+
+    def get(self, key: "FlowKey", default=None) -> Optional[FlowRow]:
+        row = self._find_key(key)[1]
+        if row < 0:
+            return default
+        return FlowRow(self._columns, self._strings, row)
+
+    def items(self) -> Iterator[tuple["FlowKey", FlowRow]]:
+        for row in range(self.capacity):
+            if self._occupied[row]:
+                yield self._unpack_key(row), FlowRow(self._columns, self._strings, row)
+
+    def values(self) -> Iterator[FlowRow]:
+        for row in range(self.capacity):
+            if self._occupied[row]:
+                yield FlowRow(self._columns, self._strings, row)
+
+    def insert(self, key: "FlowKey", state: "FlowState") -> FlowRow:
+        packed, row = self._find_key(key)
+        if row < 0:
+            if not self._free_rows:
+                raise OverflowError("Columnar flow table is full; evict before inserting.")
+            packed = self._pack_key(key, acquire=True)
+            row = self._free_rows.pop()
+            self._occupied[row] = 1
+            self._keys[row * _KEY.size : (row + 1) * _KEY.size] = packed
+            self._index_insert(packed, row)
+            self._link_newest(row)
+            self._size += 1
+        view = FlowRow(self._columns, self._strings, row)
+        for name in _STATE_FIELDS:
+            setattr(view, name, getattr(state, name))
+        return view
+
+    def pop(self, key: "FlowKey", default=None):
+        """Remove ``key`` and return a detached ``FlowState`` copy of its row."""
+        from .flow_manager import FlowState
+
+        packed, row = self._find_key(key)
+        if row < 0:
+            return default
+        view = FlowRow(self._columns, self._strings, row)
+        state = FlowState(**{name: getattr(view, name) for name in _STATE_FIELDS})
+        state.reversed = bool(state.reversed)
+
+        for name in _INTERNED_COLUMNS:
+            setattr(view, name, None)
+        self._release_key(packed)
+        self._slots[self._slot_of(packed, row)] = _TOMBSTONE
+        self._tombstones += 1
+        self._unlink(row)
+        self._occupied[row] = 0
+        self._free_rows.append(row)
+        self._size -= 1
+        if self._tombstones > self.capacity // 2:
+            self._rebuild_index()
+        return state
+
+    def touch(self, key: "FlowKey", state: FlowRow) -> None:
+        row = state._row
+        if row != self._newest:
+            self._unlink(row)
+            self._link_newest(row)
+
+    def pop_oldest(self) -> tuple["FlowKey", "FlowState"] | None:
+        if self._oldest == _EMPTY:
+            return None
+        key = self._unpack_key(self._oldest)
+        return key, self.pop(key)
+
+    def handle(self, key: "FlowKey", state: FlowRow) -> Hashable:
+        return state._row
+
+    def resolve(self, handle: Hashable) -> tuple["FlowKey", FlowRow] | None:
+        row = int(handle)
+        if not self._occupied[row]:
+            return None
+        return self._unpack_key(row), FlowRow(self._columns, self._strings, row)
+
+    def storage_bytes(self) -> int:
+        columns = sum(column.itemsize * len(column) for column in self._columns.values())
+        columns += self._newer.itemsize * len(self._newer) + self._older.itemsize * len(self._older)
+        return columns + len(self._keys) + len(self._occupied) + self._slots.itemsize * len(self._slots)
+
+    def _link_newest(self, row: int) -> None:
+        self._older[row] = self._newest
+        self._newer[row] = _EMPTY
+        if self._newest == _EMPTY:
+            self._oldest = row
+        else:
+            self._newer[self._newest] = row
+        self._newest = row
+
+    def _unlink(self, row: int) -> None:
+        older = self._older[row]
+        newer = self._newer[row]
+        if older == _EMPTY:
+            self._oldest = newer
+        else:
+            self._newer[older] = newer
+        if newer == _EMPTY:
+            self._newest = older
+        else:
+            self._older[newer] = older
+        self._older[row] = _EMPTY
+        self._newer[row] = _EMPTY
+
+    def _pack_address(self, address: str, *, acquire: bool) -> bytes | None:
+        try:
+            if ":" in address:
+                return b"\x06" + socket.inet_pton(socket.AF_INET6, address)
+            return b"\x04" + socket.inet_pton(socket.AF_INET, address) + _IPV4_PADDING
+        except (OSError, TypeError):
+            value_id = self._strings.acquire(address) if acquire else self._strings.peek(address)
+            if value_id < 0:
+                return None
+            return b"\x00" + _INTERNED_ADDRESS.pack(value_id)
+
+    def _unpack_address(self, packed: bytes) -> str:
+        family = packed[0]
+        if family == 4:
+            return socket.inet_ntop(socket.AF_INET, packed[1:5])
+        if family == 6:
+            return socket.inet_ntop(socket.AF_INET6, packed[1:])
+        return self._strings.value(_INTERNED_ADDRESS.unpack(packed[1:])[0])
+
+    def _pack_key(self, key: "FlowKey", *, acquire: bool) -> bytes | None:
+        src_ip, dst_ip, src_port, dst_port, protocol = key
+        protocol_id = self._strings.acquire(protocol) if acquire else self._strings.peek(protocol)
+        if protocol_id < 0:
+            return None
+        src = self._pack_address(src_ip, acquire=acquire)
+        dst = self._pack_address(dst_ip, acquire=acquire)
+        if src is None or dst is None:
+            return None
+        return _KEY.pack(src, dst, src_port, dst_port, protocol_id)
+
+    def _unpack_key(self, row: int) -> "FlowKey":
+        src, dst, src_port, dst_port, protocol_id = _KEY.unpack_from(self._keys, row * _KEY.size)
+        return (
+            self._unpack_address(src),
+            self._unpack_address(dst),
+            src_port,
+            dst_port,
+            self._strings.value(protocol_id),
+        )
+
+    def _release_key(self, packed: bytes) -> None:
+        src, dst, _, _, protocol_id = _KEY.unpack(packed)
+        self._strings.release(protocol_id)
+        for address in (src, dst):
+            if address[0] == 0:
+                self._strings.release(_INTERNED_ADDRESS.unpack(address[1:])[0])
+
+    def _find_key(self, key: "FlowKey") -> tuple[bytes | None, int]:
+        packed = self._pack_key(key, acquire=False)
+        if packed is None:
+            return None, _EMPTY
+        return packed, self._find(packed)
+
+    def _find(self, packed: bytes) -> int:
+        slots = self._slots
+        keys = self._keys
+        width = _KEY.size
+        index = hash(packed) & self._mask
+        while True:
+            row = slots[index]
+            if row == _EMPTY:
+                return _EMPTY
+            if row >= 0 and keys[row * width : (row + 1) * width] == packed:
+                return row
+            index = (index + 1) & self._mask
+
+    def _slot_of(self, packed: bytes, row: int) -> int:
+        index = hash(packed) & self._mask
+        while self._slots[index] != row:
+            index = (index + 1) & self._mask
+        return index
+
+    def _index_insert(self, packed: bytes, row: int) -> None:
+        index = hash(packed) & self._mask
+        while self._slots[index] >= 0:
+            index = (index + 1) & self._mask
+        if self._slots[index] == _TOMBSTONE:
+            self._tombstones -= 1
+        self._slots[index] = row
+
+    def _rebuild_index(self) -> None:
+        self._slots = array("i", [_EMPTY]) * len(self._slots)
+        self._tombstones = 0
+        width = _KEY.size
+        for row in range(self.capacity):
+            if self._occupied[row]:
+                self._index_insert(bytes(self._keys[row * width : (row + 1) * width]), row)
+
+
+def build_flow_table(storage: str, capacity: int):
+    storage_name = str(storage or "dict").strip().lower()
+    if storage_name == "columnar":
+        return ColumnarFlowTable(capacity)
+    if storage_name == "dict":
+        return DictFlowTable()
+    raise ValueError(f"Unknown flow table storage '{storage}'.")
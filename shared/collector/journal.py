@@ -0,0 +1,468 @@
+"""
+Durable on-disk journal for collector uploads.
+
+Flow summaries are appended to the journal before they are uploaded and are
+only released once the backend has accepted the batch that carried them, so
+a backend outage or a collector restart no longer loses what was captured in
+the meantime. Records live in append-only segment files named after their
+first sequence number; every record is framed as::
+
+    !QdII  sequence, appended_at, payload length, crc32(payload)
+    payload (compact JSON)
+
+A torn write at the tail of the newest segment is truncated on ``open()``.
+Acknowledged segments are deleted and the acknowledgement watermark is kept
+in a small side file. When the journal outgrows ``max_bytes`` its oldest
+segments are dropped, acknowledged or not, and counted as
+``dropped_records``.
+
+Batches may be acknowledged in any order. A batch that failed is requeued
+as the same sequence range and is served again, whole and before newer
+records, so a resend carries the same payload and batch id the server may
+already have queued. Only a range the backend rejected as too large (413) is
+re-cut, and the pieces are flagged ``resplit``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Iterable, Optional
+
+_RECORD = struct.Struct("!QdII")
+SEGMENT_SUFFIX = ".seg"
+ACK_FILE = "acked"
+# Records appended within this many seconds share one lag mark.
+_MARK_RESOLUTION = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class JournalBatch:
+    first_seq: int
+    last_seq: int
+    records: list
+    oldest_appended_at: float
+    # Older than the journal's replay threshold: backlog from an outage.
+    replay: bool = False
+    # Cut from a range the backend rejected as too large, so its batch id
+    # differs from the original send.
+    resplit: bool = False
+
+
+class _Segment:
+    __slots__ = ("first_seq", "last_seq", "path", "size")
+
+    def __init__(self, first_seq: int, path: Path, last_seq: int = 0, size: int = 0) -> None:
+        self.first_seq = first_seq
+        self.last_seq = last_seq
+        self.path = path
+        self.size = size
+
+
+def _segment_path(directory: Path, first_seq: int) -> Path:
+    return directory / f"{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+class RateBudget:
+    """Token bucket in records per second; ``rate <= 0`` means unlimited."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = max(float(rate or 0.0), 0.0)
+        self.burst = max(float(burst if burst is not None else self.rate), 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self, count: int) -> float:
+        """Reserve ``count`` tokens and return how long to wait before spending them."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+            self._updated = now
+            self._tokens -= count
+            return max(-self._tokens / self.rate, 0.0)
+
+
+class UploadJournal:
+    def __init__(
+        self,
+        directory: Path | str,
+        *,
+        max_bytes: int = 256 * 1024 * 1024,
+        segment_bytes: int = 4 * 1024 * 1024,
+        replay_after: float = 30.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max(int(max_bytes), 2 * 1024)
+        self.segment_bytes = min(max(int(segment_bytes), 1024), self.max_bytes // 2)
+        self.replay_after = max(float(replay_after), 0.0)
+        self._lock = threading.Lock()
+        self._opened = False
+        self._segments: list[_Segment] = []
+        self._writer = None
+        self._next_seq = 1
+        self._acked_seq = 0
+        # Acknowledged ranges above the watermark, from out-of-order acks.
+        self._acked_ranges: list[tuple[int, int]] = []
+        self._read_seq = 1
+        self._retry: deque[tuple[int, int, bool]] = deque()  # (first, last, may re-cut)
+        self._reader: tuple[int, int, int] | None = None  # (segment first seq, next seq, offset)
+        self._marks: deque[tuple[int, float]] = deque()
+        self._appended_records = 0
+        self._acked_records = 0
+        self._dropped_records = 0
+        self._requeued_batches = 0
+        self._resplit_batches = 0
+        self._truncated_bytes = 0
+        self._last_ack_at: float | None = None
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def open(self) -> None:
+        """Recover segments and the ack watermark; call once before appending."""
+        with self._lock:
+            if self._opened:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._acked_seq = self._load_ack()
+            segments = []
+            for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+                try:
+                    first_seq = int(path.stem)
+                except ValueError:
+                    continue
+                segment = self._recover_segment(_Segment(first_seq, path))
+                if segment is None:
+                    continue
+                if segment.last_seq <= self._acked_seq:
+                    path.unlink(missing_ok=True)
+                    continue
+                segments.append(segment)
+            self._segments = segments
+            if segments:
+                # Segments dropped by the size cap before the watermark was
+                # stored must not leave the reader waiting for them.
+                self._acked_seq = max(self._acked_seq, segments[0].first_seq - 1)
+            last_seq = max((segment.last_seq for segment in segments), default=0)
+            self._next_seq = max(last_seq, self._acked_seq) + 1
+            self._read_seq = self._acked_seq + 1
+            self._opened = True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._writer.close()
+                self._writer = None
+            self._opened = False
+
+    def _load_ack(self) -> int:
+        try:
+            return max(int((self.directory / ACK_FILE).read_text(encoding="ascii").strip() or 0), 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _store_ack(self) -> None:
+        path = self.directory / ACK_FILE
+        temp = path.with_suffix(".tmp")
+        try:
+            temp.write_text(str(self._acked_seq), encoding="ascii")
+            os.replace(temp, path)
+        except OSError:
+            pass
+
+    def _recover_segment(self, segment: _Segment) -> Optional[_Segment]:
+        """Scan a segment, truncating it after the last intact record."""
+        valid_end = 0
+        last_seq = 0
+        try:
+            with segment.path.open("rb") as handle:
+                while True:
+                    header = handle.read(_RECORD.size)
+                    if len(header) < _RECORD.size:
+                        break
+                    seq, appended_at, length, crc = _RECORD.unpack(header)
+                    payload = handle.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break
+                    valid_end += _RECORD.size + length
+                    last_seq = seq
+                    if seq > self._acked_seq:
+                        self._mark(seq, appended_at)
+            size = segment.path.stat().st_size
+            if size > valid_end:
+                self._truncated_bytes += size - valid_end
+                with segment.path.open("r+b") as handle:
+                    handle.truncate(valid_end)
+        except OSError:
+            return None
+        if not last_seq:
+            segment.path.unlink(missing_ok=True)
+            return None
+        segment.last_seq = last_seq
+        segment.size = valid_end
+        return segment
+
+    # -- writing -------------------------------------------------------------
+
+    def _mark(self, seq: int, appended_at: float) -> None:
+        if self._marks and appended_at - self._marks[-1][1] < _MARK_RESOLUTION:
+            self._marks[-1] = (seq, self._marks[-1][1])
+        else:
+            self._marks.append((seq, appended_at))
+
+    def append(self, records: Iterable[dict]) -> int:
+        """Append records durably (flushed to the OS); returns how many were written."""
+        appended_at = time.time()
+        frames = []
+        for record in records:
+            payload = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+            frames.append(payload)
+        if not frames:
+            return 0
+        with self._lock:
+            if not self._opened:
+                raise RuntimeError("UploadJournal.open() must be called before append().")
+            for payload in frames:
+                segment = self._active_segment(len(payload))
+                seq = self._next_seq
+                self._writer.write(_RECORD.pack(seq, appended_at, len(payload), zlib.crc32(payload)))
+                self._writer.write(payload)
+                segment.last_seq = seq
+                segment.size += _RECORD.size + len(payload)
+                self._next_seq += 1
+            self._writer.flush()
+            self._mark(self._next_seq - 1, appended_at)
+            self._appended_records += len(frames)
+            self._enforce_cap()
+        return len(frames)
+
+    def _active_segment(self, payload_size: int) -> _Segment:
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or self._writer is None or segment.size + _RECORD.size + payload_size > self.segment_bytes:
+            if segment is not None and segment.size == 0:
+                return segment
+            if self._writer is not None:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._writer.close()
+            segment = _Segment(self._next_seq, _segment_path(self.directory, self._next_seq))
+            self._segments.append(segment)
+            self._writer = segment.path.open("ab")
+        return segment
+
+    def _enforce_cap(self) -> None:
+        dropped = False
+        while len(self._segments) > 1 and sum(segment.size for segment in self._segments) > self.max_bytes:
+            oldest = self._segments.pop(0)
+            oldest.path.unlink(missing_ok=True)
+            unacked = sum(
+                1
+                for seq in range(max(oldest.first_seq, self._acked_seq + 1), oldest.last_seq + 1)
+                if not self._is_acked(seq)
+            )
+            self._dropped_records += unacked
+            self._advance_watermark(oldest.last_seq)
+            dropped = True
+        if dropped:
+            self._store_ack()
+
+    # -- reading and acknowledgement ----------------------------------------
+
+    def next_batch(self, max_records: int, max_bytes: int | None = None) -> Optional[JournalBatch]:
+        """
+        Return the next unsent records (requeued ranges first), or None.
+
+        ``max_bytes`` bounds the summed payload size; a batch always holds at
+        least one record. Requeued ranges come back exactly as first sent and
+        ignore both limits unless they were requeued with ``split=True``.
+        """
+        with self._lock:
+            if not self._opened:
+                return None
+            max_records = max(int(max_records), 1)
+            while self._retry:
+                first, last, split = self._retry.popleft()
+                first = max(first, self._acked_seq + 1)
+                if first > last:
+                    continue
+                if not split:
+                    batch = self._read(first, last, None, sequential=False)
+                    if batch is not None:
+                        return batch
+                    continue
+                batch = self._read(first, min(last, first + max_records - 1), max_bytes, sequential=False)
+                if batch is not None:
+                    if batch.last_seq < last:
+                        self._retry.appendleft((batch.last_seq + 1, last, True))
+                    self._resplit_batches += 1
+                    return replace(batch, resplit=True)
+            self._read_seq = max(self._read_seq, self._acked_seq + 1)
+            if self._read_seq >= self._next_seq:
+                return None
+            batch = self._read(
+                self._read_seq, min(self._next_seq - 1, self._read_seq + max_records - 1), max_bytes, sequential=True
+            )
+            if batch is not None:
+                self._read_seq = batch.last_seq + 1
+            return batch
+
+    def _read(self, first: int, last: int, max_bytes: int | None, *, sequential: bool) -> Optional[JournalBatch]:
+        if not self._segments:
+            return None
+        # A range starting below the oldest segment starts at that segment.
+        index = max(bisect_right([segment.first_seq for segment in self._segments], first) - 1, 0)
+        records: list = []
+        oldest = None
+        last_read = first - 1
+        size = 0
+        full = False
+        while index < len(self._segments) and last_read < last and not full:
+            segment = self._segments[index]
+            offset = 0
+            # Sequential reads resume where the previous batch stopped instead
+            # of rescanning the segment's headers from the start.
+            if sequential and self._reader is not None and self._reader[:2] == (segment.first_seq, last_read + 1):
+                offset = self._reader[2]
+            with segment.path.open("rb") as handle:
+                handle.seek(offset)
+                while last_read < last:
+                    position = handle.tell()
+                    header = handle.read(_RECORD.size)
+                    if len(header) < _RECORD.size:
+                        break
+                    seq, appended_at, length, _crc = _RECORD.unpack(header)
+                    if seq < first:
+                        handle.seek(length, os.SEEK_CUR)
+                        continue
+                    if max_bytes and records and size + length > max_bytes:
+                        handle.seek(position)
+                        full = True
+                        break
+                    size += length
+                    payload = handle.read(length)
+                    if len(payload) < length:
+                        break
+                    records.append(json.loads(payload.decode("utf-8")))
+                    oldest = appended_at if oldest is None else min(oldest, appended_at)
+                    last_read = seq
+                if sequential:
+                    self._reader = (segment.first_seq, last_read + 1, handle.tell())
+            index += 1
+        if not records:
+            return None
+        return JournalBatch(
+            first_seq=first,
+            last_seq=last_read,
+            records=records,
+            oldest_appended_at=oldest,
+            replay=bool(self.replay_after) and time.time() - oldest > self.replay_after,
+        )
+
+    def _is_acked(self, seq: int) -> bool:
+        return seq <= self._acked_seq or any(first <= seq <= last for first, last in self._acked_ranges)
+
+    def _advance_watermark(self, seq: int) -> None:
+        self._acked_seq = max(self._acked_seq, seq)
+        ranges = sorted(self._acked_ranges)
+        while ranges and ranges[0][0] <= self._acked_seq + 1:
+            self._acked_seq = max(self._acked_seq, ranges.pop(0)[1])
+        self._acked_ranges = ranges
+        while self._marks and self._marks[0][0] <= self._acked_seq:
+            self._marks.popleft()
+
+    def ack(self, batch: JournalBatch) -> None:
+        """Release a batch the backend accepted."""
+        with self._lock:
+            if batch.last_seq <= self._acked_seq:
+                return
+            self._acked_records += batch.last_seq - max(batch.first_seq, self._acked_seq + 1) + 1
+            self._last_ack_at = time.time()
+            self._release(batch)
+
+    def reject(self, batch: JournalBatch) -> None:
+        """Set aside a batch the backend will never accept, counting it as dropped."""
+        with self._lock:
+            if batch.last_seq <= self._acked_seq:
+                return
+            self._dropped_records += batch.last_seq - max(batch.first_seq, self._acked_seq + 1) + 1
+            self._release(batch)
+
+    def _release(self, batch: JournalBatch) -> None:
+        if batch.first_seq <= self._acked_seq + 1:
+            self._advance_watermark(batch.last_seq)
+        else:
+            self._acked_ranges.append((batch.first_seq, batch.last_seq))
+            return
+        released = [segment for segment in self._segments[:-1] if segment.last_seq <= self._acked_seq]
+        for segment in released:
+            segment.path.unlink(missing_ok=True)
+            self._segments.remove(segment)
+        self._store_ack()
+
+    def requeue(self, batch: JournalBatch, *, split: bool = False) -> None:
+        """
+        Hand a failed batch back; it is served again before newer records.
+
+        Pass ``split=True`` only when the backend rejected the payload as too
+        large: the range is then re-cut to the limits of the next call.
+        """
+        with self._lock:
+            self._requeued_batches += 1
+            self._retry.append((batch.first_seq, batch.last_seq, split))
+
+    # -- reporting -----------------------------------------------------------
+
+    @property
+    def unsent_records(self) -> int:
+        with self._lock:
+            return max(self._next_seq - max(self._read_seq, self._acked_seq + 1), 0) + sum(
+                last - first + 1 for first, last, _ in self._retry
+            )
+
+    def fill_ratio(self) -> float:
+        """Share of ``max_bytes`` held on disk; the load governor's backlog signal."""
+        with self._lock:
+            return min(sum(segment.size for segment in self._segments) / self.max_bytes, 1.0)
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            pending = self._next_seq - 1 - self._acked_seq - sum(last - first + 1 for first, last in self._acked_ranges)
+            segments = list(self._segments)
+            if not self._opened:
+                # Not opened by this process: report what is on disk.
+                segments = [
+                    _Segment(0, path, size=path.stat().st_size)
+                    for path in self.directory.glob(f"*{SEGMENT_SUFFIX}")
+                    if path.is_file()
+                ] if self.directory.exists() else []
+                pending = None
+            return {
+                "opened": self._opened,
+                "path": str(self.directory),
+                "segments": len(segments),
+                "bytes": sum(segment.size for segment in segments),
+                "max_bytes": self.max_bytes,
+                "pending_records": max(pending, 0) if pending is not None else None,
+                "lag_seconds": round(max(time.time() - self._marks[0][1], 0.0), 1) if self._marks else 0.0,
+                "next_seq": self._next_seq,
+                "acked_seq": self._acked_seq,
+                "appended_records": self._appended_records,
+                "acked_records": self._acked_records,
+                "dropped_records": self._dropped_records,
+                "requeued_batches": self._requeued_batches,
+                "resplit_batches": self._resplit_batches,
+                "truncated_bytes": self._truncated_bytes,
+                "last_ack_at": self._last_ack_at,
+            }
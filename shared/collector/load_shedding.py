@@ -0,0 +1,189 @@
+"""
+Adaptive load shedding for saturated collectors.
+
+``LoadGovernor`` turns CPU readings and queue fill ratios into one pressure
+value and steps through degradation levels with hysteresis:
+
+0. ``normal`` - every packet is analysed.
+1. ``no_inspection`` - payload inspection stops; packets only update counters.
+2. ``sampling`` - additionally only 1 in ``sample_rate`` packets is processed
+   and its counters are scaled by ``sample_rate``.
+3. ``aggregation`` - additionally packets of flows that are not tracked yet
+   are folded into one port-less bucket per host pair and protocol, so bursts
+   of short connections cost one flow entry instead of one each.
+
+Each level is entered after ``escalate_after`` consecutive high readings and
+left after ``relax_after`` consecutive low ones, so a short spike does not
+flap between levels.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import threading
+from typing import Callable, Iterable, Optional, Sequence
+
+from .observations import InspectFlowCallback, PacketObservation
+
+LOAD_SHED_NORMAL = 0
+LOAD_SHED_NO_INSPECTION = 1
+LOAD_SHED_SAMPLING = 2
+LOAD_SHED_AGGREGATION = 3
+LOAD_SHED_LEVEL_NAMES = ("normal", "no_inspection", "sampling", "aggregation")
+
+QueueFillProvider = Callable[[], float]
+
+
+def queue_fill_ratio(handle) -> float:
+    """Fill ratio of a bounded ``queue.Queue``-like object (0.0 when unbounded or unknown)."""
+    try:
+        capacity = int(getattr(handle, "maxsize", 0) or 0)
+        return min(handle.qsize() / capacity, 1.0) if capacity > 0 else 0.0
+    except (NotImplementedError, OSError):
+        return 0.0
+
+
+class LoadGovernor:
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        high_watermark: float = 0.85,
+        low_watermark: float = 0.6,
+        escalate_after: int = 2,
+        relax_after: int = 3,
+        sample_rate: int = 10,
+        max_level: int = LOAD_SHED_AGGREGATION,
+        queue_providers: Sequence[QueueFillProvider] = (),
+    ) -> None:
+        self.enabled = bool(enabled)
+        self.high_watermark = min(max(float(high_watermark), 0.0), 1.0)
+        self.low_watermark = min(max(float(low_watermark), 0.0), self.high_watermark)
+        self.escalate_after = max(int(escalate_after), 1)
+        self.relax_after = max(int(relax_after), 1)
+        self.sample_rate = max(int(sample_rate), 1)
+        self.max_level = min(max(int(max_level), LOAD_SHED_NORMAL), LOAD_SHED_AGGREGATION)
+        self.queue_providers = list(queue_providers)
+        self.level = LOAD_SHED_NORMAL
+        self._lock = threading.Lock()
+        self._high_streak = 0
+        self._low_streak = 0
+        self._sample_counter = 0
+        self._cpu_percent = 0.0
+        self._queue_fill = 0.0
+        self._transitions = 0
+        self._skipped_inspections = 0
+        self._sampled_out_packets = 0
+        self._aggregated_packets = 0
+        # Per-thread skip counts from the inspect_flow wrapper, which runs once
+        # per packet; shape() folds them into the totals once per batch.
+        self._pending = threading.local()
+
+    @property
+    def level_name(self) -> str:
+        return LOAD_SHED_LEVEL_NAMES[self.level]
+
+    def update(self, cpu_percent: float, queue_fill: Optional[float] = None) -> int:
+        """Feed one CPU reading (0-100) and return the level now in force."""
+        if queue_fill is None:
+            queue_fill = max((provider() for provider in self.queue_providers), default=0.0)
+        cpu = min(max(float(cpu_percent or 0.0), 0.0), 100.0)
+        pressure = max(cpu / 100.0, min(max(float(queue_fill), 0.0), 1.0))
+        with self._lock:
+            self._cpu_percent = cpu
+            self._queue_fill = float(queue_fill)
+            if not self.enabled:
+                return self.level
+            if pressure >= self.high_watermark:
+                self._high_streak += 1
+                self._low_streak = 0
+                if self._high_streak >= self.escalate_after and self.level < self.max_level:
+                    self.level += 1
+                    self._high_streak = 0
+                    self._transitions += 1
+            elif pressure <= self.low_watermark:
+                self._low_streak += 1
+                self._high_streak = 0
+                if self._low_streak >= self.relax_after and self.level > LOAD_SHED_NORMAL:
+                    self.level -= 1
+                    self._low_streak = 0
+                    self._transitions += 1
+            else:
+                self._high_streak = 0
+                self._low_streak = 0
+            return self.level
+
+    def inspect_flow(self, inspect_flow: InspectFlowCallback | None) -> InspectFlowCallback | None:
+        """Wrap a FlowManager.should_inspect callback so shedding can veto inspection."""
+        if not self.enabled:
+            return inspect_flow
+
+        def _inspect(key) -> bool:
+            if self.level >= LOAD_SHED_NO_INSPECTION:
+                self._pending.skipped_inspections = getattr(self._pending, "skipped_inspections", 0) + 1
+                return False
+            return inspect_flow(key) if inspect_flow is not None else True
+
+        return _inspect
+
+    def sample(self, packets: list) -> tuple[list, int]:
+        """Return the packets to process from one capture batch and their counter weight."""
+        if self.level < LOAD_SHED_SAMPLING:
+            return packets, 1
+        rate = self.sample_rate
+        with self._lock:
+            offset = (-self._sample_counter) % rate
+            self._sample_counter = (self._sample_counter + len(packets)) % rate
+            kept = packets[offset::rate]
+            self._sampled_out_packets += len(packets) - len(kept)
+        return kept, rate
+
+    def shape(
+        self,
+        observations: Iterable[PacketObservation],
+        weight: int,
+        is_tracked: Callable[[tuple[str, str, int, int, str]], bool],
+    ) -> list[PacketObservation]:
+        """
+        Stamp the level in force and the sampling weight and, at the
+        aggregation level, fold untracked flows into host-pair buckets.
+        """
+        shaped = []
+        level = self.level
+        aggregate = level >= LOAD_SHED_AGGREGATION
+        aggregated = 0
+        for observation in observations:
+            changes: dict = {}
+            if level > observation.load_shed_level:
+                changes["load_shed_level"] = level
+            if weight > 1:
+                changes["sample_weight"] = weight
+            if aggregate and observation.src_port and not is_tracked(observation.flow_key):
+                changes.update(src_port=0, dst_port=0)
+                aggregated += 1
+            shaped.append(dataclasses.replace(observation, **changes) if changes else observation)
+        skipped = getattr(self._pending, "skipped_inspections", 0)
+        if aggregated or skipped:
+            self._pending.skipped_inspections = 0
+            with self._lock:
+                self._aggregated_packets += aggregated
+                self._skipped_inspections += skipped
+        return shaped
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "level": self.level,
+                "level_name": self.level_name,
+                "sample_rate": self.sample_rate if self.level >= LOAD_SHED_SAMPLING else 1,
+                "cpu_percent": round(self._cpu_percent, 1),
+                "queue_fill": round(self._queue_fill, 3),
+                "high_watermark": self.high_watermark,
+                "low_watermark": self.low_watermark,
+                "transitions": self._transitions,
+                "skipped_inspections": self._skipped_inspections,
+                "sampled_out_packets": self._sampled_out_packets,
+                "aggregated_packets": self._aggregated_packets,
+            }
+
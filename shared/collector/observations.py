@@ -4,11 +4,17 @@ import time
 from functools import lru_cache
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-from .analysis import analyze_packet
+from .analysis import analyze_frame, analyze_packet
+from .decoder import DecodedFrame, decode_frame
+from .reassembly import TlsHelloReassembler
 from .traffic_metadata import DomainHintCache
 
+# Returns False when a flow is already classified and its packets may skip
+# payload inspection (see FlowManager.should_inspect).
+InspectFlowCallback = Callable[[tuple[str, str, int, int, str]], bool]
+
 
 @lru_cache(maxsize=1)
 def _load_scapy_primitives():
@@ -43,6 +49,10 @@ class FlowObservation:
     analysis_source: str = "transport_fallback"
     analysis_confidence: float = 0.0
     analysis_signals: tuple[str, ...] = ()
+    packets_out: int = 0
+    packets_in: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
 
     @classmethod
     def from_packet_observation(
@@ -79,6 +89,8 @@ class FlowObservation:
             analysis_source=observation.analysis_source,
             analysis_confidence=observation.analysis_confidence,
             analysis_signals=observation.analysis_signals,
+            packets_out=1,
+            bytes_out=observation.packet_size,
         )
 
     def as_dict(self) -> dict[str, Any]:
@@ -107,6 +119,10 @@ class FlowObservation:
             "analysis_source": self.analysis_source,
             "analysis_confidence": self.analysis_confidence,
             "analysis_signals": list(self.analysis_signals),
+            "packets_out": self.packets_out,
+            "packets_in": self.packets_in,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
         }
 
 
@@ -133,6 +149,12 @@ class PacketObservation:
     analysis_source: str = "transport_fallback"
     analysis_confidence: float = 0.0
     analysis_signals: tuple[str, ...] = ()
+    inspected: bool = True
+    # Packets this observation stands for when load shedding samples 1 in N.
+    sample_weight: int = 1
+    # Load-shedding level in force when the packet was captured.
+    load_shed_level: int = 0
+    tcp_flags: int = 0
 
     @property
     def flow_key(self) -> tuple[str, str, int, int, str]:
@@ -158,26 +180,67 @@ class PacketObservation:
         metadata_only: bool = False,
         domain_cache: DomainHintCache | None = None,
         observed_at: float | None = None,
+        inspect_flow: InspectFlowCallback | None = None,
+        reassembler: TlsHelloReassembler | None = None,
     ) -> "PacketObservation | None":
+        if isinstance(packet, (bytes, bytearray, memoryview)):
+            return cls.from_frame(
+                packet,
+                source_type=source_type,
+                metadata_only=metadata_only,
+                domain_cache=domain_cache,
+                # Replayed frames carry their capture timestamp.
+                observed_at=observed_at if observed_at is not None else getattr(packet, "observed_at", None),
+                inspect_flow=inspect_flow,
+                reassembler=reassembler,
+            )
+
         Ether, IP, IPv6, TCP, UDP = _load_scapy_primitives()
         if not packet or not (packet.haslayer(IP) or packet.haslayer(IPv6)):
             return None
 
-        analysis = analyze_packet(packet, domain_cache=domain_cache)
         ip = packet[IP] if packet.haslayer(IP) else packet[IPv6]
+        analysis = None
+        tcp_flags = 0
         if packet.haslayer(TCP):
             proto = "TCP"
             sport = int(packet[TCP].sport)
             dport = int(packet[TCP].dport)
+            tcp_flags = int(packet[TCP].flags)
         elif packet.haslayer(UDP):
             proto = "UDP"
             sport = int(packet[UDP].sport)
             dport = int(packet[UDP].dport)
         else:
+            analysis = analyze_packet(packet, domain_cache=domain_cache, reassembler=reassembler)
             proto = analysis.transport_protocol if analysis else str(getattr(ip, "proto", getattr(ip, "nh", "UNKNOWN")))
             sport = 0
             dport = 0
 
+        src_mac = packet[Ether].src if packet.haslayer(Ether) else None
+        dst_mac = packet[Ether].dst if packet.haslayer(Ether) else None
+        if analysis is None:
+            if (
+                inspect_flow is not None
+                and not (reassembler is not None and reassembler.pending((str(ip.src), str(ip.dst), sport, dport)))
+                and not inspect_flow((str(ip.src), str(ip.dst), sport, dport, proto))
+            ):
+                return cls._header_only(
+                    observed_at,
+                    source_type,
+                    metadata_only,
+                    str(ip.src),
+                    str(ip.dst),
+                    sport,
+                    dport,
+                    proto,
+                    len(packet),
+                    src_mac,
+                    dst_mac,
+                    tcp_flags,
+                )
+            analysis = analyze_packet(packet, domain_cache=domain_cache, reassembler=reassembler)
+
         domain = getattr(packet, "captured_domain", None)
         sni = getattr(packet, "captured_sni", None)
         if analysis:
@@ -196,13 +259,109 @@ class PacketObservation:
             packet_size=len(packet),
             domain=domain,
             sni=sni,
-            src_mac=packet[Ether].src if packet.haslayer(Ether) else None,
-            dst_mac=packet[Ether].dst if packet.haslayer(Ether) else None,
+            src_mac=src_mac,
+            dst_mac=dst_mac,
+            application_protocol=analysis.application_protocol if analysis else proto,
+            service_name=analysis.service_name if analysis else None,
+            analysis_source=analysis.classification_source if analysis else "transport_fallback",
+            analysis_confidence=analysis.confidence if analysis else 0.0,
+            analysis_signals=analysis.signals if analysis else (),
+            tcp_flags=tcp_flags,
+        )
+
+    @classmethod
+    def from_frame(
+        cls,
+        frame,
+        *,
+        source_type: str = "agent",
+        metadata_only: bool = False,
+        domain_cache: DomainHintCache | None = None,
+        observed_at: float | None = None,
+        decoded: DecodedFrame | None = None,
+        inspect_flow: InspectFlowCallback | None = None,
+        reassembler: TlsHelloReassembler | None = None,
+    ) -> "PacketObservation | None":
+        """Build an observation straight from a raw Ethernet frame, bypassing scapy."""
+        if decoded is None:
+            decoded = decode_frame(frame)
+        if decoded is None:
+            return None
+
+        proto = "TCP" if decoded.is_tcp else "UDP" if decoded.is_udp else decoded.transport_protocol
+        if (
+            inspect_flow is not None
+            and not (reassembler is not None and reassembler.pending((decoded.src_ip, decoded.dst_ip, decoded.src_port, decoded.dst_port)))
+            and not inspect_flow((decoded.src_ip, decoded.dst_ip, decoded.src_port, decoded.dst_port, proto))
+        ):
+            return cls._header_only(
+                observed_at,
+                source_type,
+                metadata_only,
+                decoded.src_ip,
+                decoded.dst_ip,
+                decoded.src_port,
+                decoded.dst_port,
+                proto,
+                decoded.frame_length,
+                decoded.src_mac,
+                decoded.dst_mac,
+                decoded.tcp_flags,
+            )
+
+        analysis = analyze_frame(decoded, domain_cache=domain_cache, reassembler=reassembler)
+        return cls(
+            observed_at=observed_at if observed_at is not None else time.time(),
+            source_type=str(source_type or "agent"),
+            metadata_only=bool(metadata_only),
+            src_ip=decoded.src_ip,
+            dst_ip=decoded.dst_ip,
+            src_port=decoded.src_port,
+            dst_port=decoded.dst_port,
+            protocol=proto,
+            packet_size=decoded.frame_length,
+            domain=analysis.domain if analysis else None,
+            sni=analysis.sni if analysis else None,
+            src_mac=decoded.src_mac,
+            dst_mac=decoded.dst_mac,
             application_protocol=analysis.application_protocol if analysis else proto,
             service_name=analysis.service_name if analysis else None,
             analysis_source=analysis.classification_source if analysis else "transport_fallback",
             analysis_confidence=analysis.confidence if analysis else 0.0,
             analysis_signals=analysis.signals if analysis else (),
+            tcp_flags=decoded.tcp_flags,
+        )
+
+    @classmethod
+    def _header_only(
+        cls,
+        observed_at: float | None,
+        source_type: str,
+        metadata_only: bool,
+        src_ip: str,
+        dst_ip: str,
+        src_port: int,
+        dst_port: int,
+        protocol: str,
+        packet_size: int,
+        src_mac: str | None,
+        dst_mac: str | None,
+        tcp_flags: int = 0,
+    ) -> "PacketObservation":
+        return cls(
+            observed_at=observed_at if observed_at is not None else time.time(),
+            source_type=str(source_type or "agent"),
+            metadata_only=bool(metadata_only),
+            src_ip=src_ip,
+            dst_ip=dst_ip,
+            src_port=src_port,
+            dst_port=dst_port,
+            protocol=protocol,
+            packet_size=packet_size,
+            src_mac=src_mac,
+            dst_mac=dst_mac,
+            inspected=False,
+            tcp_flags=tcp_flags,
         )
 
 
@@ -0,0 +1,168 @@
+"""
+Single-pass payload inspection for the collector hot path.
+
+``inspect_payload`` looks at no more than ``PAYLOAD_SCAN_LIMIT`` bytes of a
+transport payload through a memoryview and reports everything the hint
+extractor and the classifier need (HTTP request/response line, Host header,
+TLS record and ClientHello SNI, banner signatures) in one result, so a
+payload is sliced and decoded once per packet instead of once per caller.
+"""
+
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import Optional, Union
+
+PayloadBuffer = Union[bytes, bytearray, memoryview]
+
+# Large enough for a full-MTU segment (and a ClientHello with PQ key shares).
+PAYLOAD_SCAN_LIMIT = 4096
+HTTP_HEADER_LINE_LIMIT = 16
+
+HTTP_METHOD_PREFIXES = (b"GET ", b"POST ", b"PUT ", b"PATCH ", b"DELETE ", b"HEAD ", b"OPTIONS ", b"CONNECT ")
+HTTP_RESPONSE_PREFIX = b"HTTP/"
+
+# Payload prefixes that identify a protocol regardless of port.
+BANNER_SIGNATURES = (
+    (b"SSH-", "SSH", "ssh"),
+    (b"RFB 0", "VNC", "vnc"),
+    (b"\x13BitTorrent protocol", "BitTorrent", "bittorrent"),
+)
+
+_U16 = struct.Struct("!H")
+
+
+def _normalize_domain(domain: str | None) -> str | None:
+    if not domain:
+        return None
+
+    value = domain.strip().lower().rstrip(".")
+    if not value or " " in value:
+        return None
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class PayloadInspection:
+    has_payload: bool = False
+    http_request: bool = False
+    http_response: bool = False
+    http_host: Optional[str] = None
+    tls_record: bool = False
+    sni: Optional[str] = None
+    banner: Optional[tuple[str, str]] = None
+
+    @property
+    def is_http(self) -> bool:
+        return self.http_request or self.http_response
+
+
+EMPTY_INSPECTION = PayloadInspection()
+OPAQUE_INSPECTION = PayloadInspection(has_payload=True)
+
+
+def _http_first_line(view: memoryview) -> bytes:
+    # Mirrors str.splitlines()[0].strip(): the line ends at the first CR or LF.
+    head = bytes(view[:64])
+    for terminator in (b"\r", b"\n"):
+        index = head.find(terminator)
+        if index >= 0:
+            head = head[:index]
+    return head.strip()
+
+
+def _extract_http_host(view: memoryview) -> str | None:
+    headers = bytes(view)
+    end = headers.find(b"\r\n\r\n")
+    if end >= 0:
+        headers = headers[:end]
+    for line in headers.splitlines()[1:HTTP_HEADER_LINE_LIMIT]:
+        if not line:
+            break
+        name, sep, value = line.partition(b":")
+        if sep and name.strip().lower() == b"host":
+            return _normalize_domain(value.decode("utf-8", errors="ignore"))
+    return None
+
+
+def _extract_tls_sni(view: memoryview) -> str | None:
+    """Return the SNI of a TLS ClientHello whose record is fully inside ``view``."""
+    if len(view) < 5 or view[0] != 0x16:
+        return None
+
+    record_length = _U16.unpack_from(view, 3)[0]
+    if len(view) < 5 + record_length:
+        return None
+
+    handshake = view[5 : 5 + record_length]
+    if len(handshake) < 4 or handshake[0] != 0x01:
+        return None
+
+    body = handshake[4:]
+    index = 34
+    if index >= len(body):
+        return None
+
+    index += 1 + body[index]
+    if index + 2 > len(body):
+        return None
+
+    index += 2 + _U16.unpack_from(body, index)[0]
+    if index >= len(body):
+        return None
+
+    index += 1 + body[index]
+    if index + 2 > len(body):
+        return None
+
+    extensions_end = min(len(body), index + 2 + _U16.unpack_from(body, index)[0])
+    index += 2
+
+    while index + 4 <= extensions_end:
+        extension_type, extension_size = struct.unpack_from("!HH", body, index)
+        extension_start = index + 4
+        extension_end = extension_start + extension_size
+        if extension_end > extensions_end:
+            return None
+
+        if extension_type == 0x0000 and extension_size >= 5:
+            pointer = extension_start + 2
+            list_end = min(extension_end, pointer + _U16.unpack_from(body, extension_start)[0])
+            while pointer + 3 <= list_end:
+                name_type = body[pointer]
+                name_length = _U16.unpack_from(body, pointer + 1)[0]
+                pointer += 3
+                if pointer + name_length > list_end:
+                    return None
+                if name_type == 0:
+                    return _normalize_domain(bytes(body[pointer : pointer + name_length]).decode("utf-8", errors="ignore"))
+                pointer += name_length
+
+        index = extension_end
+
+    return None
+
+
+def inspect_payload(payload: PayloadBuffer | None, *, limit: int = PAYLOAD_SCAN_LIMIT) -> PayloadInspection:
+    """Inspect the first ``limit`` bytes of a TCP payload in one pass."""
+    if not payload:
+        return EMPTY_INSPECTION
+
+    view = memoryview(payload)[:limit]
+    first_line = _http_first_line(view)
+    if first_line.startswith(HTTP_METHOD_PREFIXES):
+        return PayloadInspection(has_payload=True, http_request=True, http_host=_extract_http_host(view))
+    if first_line.startswith(HTTP_RESPONSE_PREFIX):
+        return PayloadInspection(has_payload=True, http_response=True, http_host=_extract_http_host(view))
+
+    tls_record = len(view) >= 5 and view[0] == 0x16 and view[1] == 0x03
+    sni = _extract_tls_sni(view)
+    if tls_record or sni:
+        return PayloadInspection(has_payload=True, tls_record=tls_record, sni=sni)
+
+    for prefix, application_protocol, service_name in BANNER_SIGNATURES:
+        if first_line.startswith(prefix):
+            return PayloadInspection(has_payload=True, banner=(application_protocol, service_name))
+
+    return OPAQUE_INSPECTION
@@ -0,0 +1,382 @@
+"""
+Pipelined capture -> analysis stages.
+
+In pipelined mode the capture thread only timestamps raw frames and hands
+them, sharded by a symmetric flow hash, to bounded per-worker inboxes. A
+pool of analysis worker processes decodes and classifies the frames (each
+with its own DomainHintCache, snapshotted to its own file, and TLS
+reassembler) and sends the resulting PacketObservations back over a bounded
+results queue, where one collector thread applies them to the FlowManager.
+A slow packet therefore delays one worker instead of the capture socket,
+and a full inbox drops frames in user space where they are counted, rather
+than in the kernel where they are not.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from .decoder import ETH_P_IP, ETH_P_IPV6, IPPROTO_TCP, IPPROTO_UDP, VLAN_ETHERTYPES
+from .load_shedding import LOAD_SHED_NO_INSPECTION
+from .observations import PacketObservation
+from .reassembly import build_tls_reassembler
+from .traffic_metadata import DomainHintCache
+
+logger = logging.getLogger("netvisor.capture.pipeline")
+
+ObservationCallback = Callable[[list[PacketObservation]], object]
+
+_U16 = struct.Struct("!H")
+
+
+@dataclass(frozen=True, slots=True)
+class AnalysisWorkerOptions:
+    source_type: str = "agent"
+    metadata_only: bool = False
+    queue_batches: int = 256
+    status_interval: float = 2.0
+    domain_cache_ttl: int = 300
+    domain_cache_max_entries: int = 2048
+    domain_cache_snapshot_path: str | None = None
+    domain_cache_snapshot_interval: float = 60.0
+    tls_reassembly_flow_bytes: int = 16384
+    tls_reassembly_budget_bytes: int = 1024 * 1024
+
+
+def flow_shard(frame, shard_count: int) -> int:
+    """
+    Map a raw Ethernet frame to a worker so both directions of a flow agree.
+
+    Only the L2/L3/L4 header fields needed for the hash are read; anything
+    that is not IPv4/IPv6 lands on shard 0.
+    """
+    if shard_count <= 1 or len(frame) < 14:
+        return 0
+    offset = 12
+    ether_type = _U16.unpack_from(frame, offset)[0]
+    while ether_type in VLAN_ETHERTYPES and offset + 6 <= len(frame):
+        offset += 4
+        ether_type = _U16.unpack_from(frame, offset)[0]
+    offset += 2
+
+    if ether_type == ETH_P_IP and offset + 20 <= len(frame):
+        protocol = frame[offset + 9]
+        src, dst = bytes(frame[offset + 12 : offset + 16]), bytes(frame[offset + 16 : offset + 20])
+        transport = offset + (frame[offset] & 0x0F) * 4
+    elif ether_type == ETH_P_IPV6 and offset + 40 <= len(frame):
+        protocol = frame[offset + 6]
+        src, dst = bytes(frame[offset + 8 : offset + 24]), bytes(frame[offset + 24 : offset + 40])
+        transport = offset + 40
+    else:
+        return 0
+
+    if protocol in (IPPROTO_TCP, IPPROTO_UDP) and transport + 4 <= len(frame):
+        src += bytes(frame[transport : transport + 2])
+        dst += bytes(frame[transport + 2 : transport + 4])
+    return hash((src, dst) if src <= dst else (dst, src)) % shard_count
+
+
+def _worker_snapshot_path(path: str | None, worker_index: int) -> Path | None:
+    if not path:
+        return None
+    base = Path(path)
+    return base.with_name(f"{base.stem}.worker{worker_index}{base.suffix}")
+
+
+def _run_analysis_worker(worker_index: int, options: AnalysisWorkerOptions, inbox, results, stop_event) -> None:
+    """Analysis worker process body: frames in, PacketObservations out."""
+    domain_cache = DomainHintCache(ttl_seconds=options.domain_cache_ttl, max_entries=options.domain_cache_max_entries)
+    snapshot_path = _worker_snapshot_path(options.domain_cache_snapshot_path, worker_index)
+    if snapshot_path is not None:
+        # DNS answers hash to arbitrary workers, so warm up from every worker's
+        # file (and the single-process snapshot, if the mode was switched).
+        base = Path(options.domain_cache_snapshot_path)
+        for candidate in sorted(base.parent.glob(f"{base.stem}*{base.suffix}")):
+            domain_cache.load_snapshot(candidate)
+    reassembler = build_tls_reassembler(options.tls_reassembly_flow_bytes, options.tls_reassembly_budget_bytes)
+    processed_frames = 0
+    failed_frames = 0
+    skipped_inspections = 0
+    next_status_at = time.monotonic() + options.status_interval
+    next_snapshot_at = time.monotonic() + options.domain_cache_snapshot_interval
+
+    def _save_snapshot() -> None:
+        try:
+            domain_cache.save_snapshot(snapshot_path)
+        except OSError as exc:
+            logger.debug("Analysis worker %s domain hint snapshot failed: %s", worker_index, exc)
+
+    def _publish_status() -> None:
+        results.put(
+            (
+                "status",
+                worker_index,
+                {
+                    "processed_frames": processed_frames,
+                    "failed_frames": failed_frames,
+                    "skipped_inspections": skipped_inspections,
+                    "domain_cache": domain_cache.status_snapshot(),
+                    "tls_reassembly": reassembler.status_snapshot() if reassembler else None,
+                },
+            )
+        )
+
+    def _skip_inspection(key) -> bool:
+        nonlocal skipped_inspections
+        skipped_inspections += 1
+        return False
+
+    while not stop_event.is_set():
+        if time.monotonic() >= next_status_at:
+            _publish_status()
+            next_status_at = time.monotonic() + options.status_interval
+        if snapshot_path is not None and time.monotonic() >= next_snapshot_at:
+            _save_snapshot()
+            next_snapshot_at = time.monotonic() + options.domain_cache_snapshot_interval
+        try:
+            item = inbox.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+
+        sample_weight, shed_level, batch = item
+        # The parent's load governor decides; the level travels with the batch.
+        inspect_flow = _skip_inspection if shed_level >= LOAD_SHED_NO_INSPECTION else None
+        observations = []
+        for observed_at, frame in batch:
+            try:
+                observation = PacketObservation.from_frame(
+                    frame,
+                    source_type=options.source_type,
+                    metadata_only=options.metadata_only,
+                    domain_cache=domain_cache,
+                    inspect_flow=inspect_flow,
+                    observed_at=observed_at,
+                    reassembler=reassembler,
+                )
+            except Exception as exc:
+                logger.debug("Analysis worker %s frame decode failed: %s", worker_index, exc)
+                failed_frames += 1
+                continue
+            processed_frames += 1
+            if observation is not None:
+                if sample_weight > 1 or shed_level:
+                    observation = dataclasses.replace(
+                        observation, sample_weight=sample_weight, load_shed_level=shed_level
+                    )
+                observations.append(observation)
+        if observations:
+            results.put(("observations", worker_index, observations))
+
+    if snapshot_path is not None:
+        _save_snapshot()
+    _publish_status()
+    results.put(("exit", worker_index, {}))
+
+
+class AnalysisWorkerPool:
+    """
+    Pool of analysis processes fed from the capture thread.
+
+    ``submit`` is the capture backend's ``on_batch`` callback: it stamps and
+    shards the frames and returns how many were queued, so frames refused by
+    a full inbox show up as capture drops as well as in ``dropped_frames``.
+    Observations are passed to ``on_observations`` on a collector thread in
+    the parent process. The results queue is bounded too: when that thread
+    falls behind, workers block on it and the backlog shows up in the
+    inboxes and in ``queue_fill()`` instead of growing parent memory.
+
+    DNS answers and the flows they describe can land on different workers,
+    so domain hints are only correlated within a worker.
+    """
+
+    def __init__(
+        self,
+        *,
+        worker_count: int,
+        options: AnalysisWorkerOptions,
+        on_observations: ObservationCallback,
+    ) -> None:
+        self.worker_count = max(int(worker_count), 1)
+        self.options = options
+        self.on_observations = on_observations
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes: list = []
+        self._results = None
+        self._stop_event = None
+        self._processes: list = []
+        self._collector: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._workers: dict[int, dict] = {}
+        self._enqueued_frames = [0] * self.worker_count
+        self._dropped_frames = [0] * self.worker_count
+        self._applied_observations = 0
+        self._apply_errors = 0
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._inboxes = [self._context.Queue(maxsize=max(int(self.options.queue_batches), 1)) for _ in range(self.worker_count)]
+        self._results = self._context.Queue(maxsize=max(int(self.options.queue_batches), 1) * self.worker_count)
+        self._stop_event = self._context.Event()
+        with self._lock:
+            self._workers = {index: {"worker": index} for index in range(self.worker_count)}
+            self._enqueued_frames = [0] * self.worker_count
+            self._dropped_frames = [0] * self.worker_count
+            self._running = True
+
+        self._processes = [
+            self._context.Process(
+                target=_run_analysis_worker,
+                args=(index, self.options, self._inboxes[index], self._results, self._stop_event),
+                name=f"netvisor-analysis-worker-{index}",
+                daemon=True,
+            )
+            for index in range(self.worker_count)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, name="netvisor-analysis-collector", daemon=True)
+        self._collector.start()
+
+    def submit(self, frames: list, sample_weight: int = 1, shed_level: int = 0) -> int:
+        """
+        Queue one capture poll's frames; returns how many were accepted.
+
+        ``sample_weight`` is stamped on the resulting observations when load
+        shedding forwards only 1 in N frames; ``shed_level`` is the governor
+        level in force, which turns payload inspection off in the workers.
+        """
+        if not self._running or not frames:
+            return 0
+        observed_at = time.time()
+        shards: list[list] = [[] for _ in range(self.worker_count)]
+        for frame in frames:
+            # mmap ring slots are recycled after delivery, so copy the bytes out.
+            payload = frame if type(frame) is bytes else bytes(frame)
+            shards[flow_shard(payload, self.worker_count)].append((getattr(frame, "observed_at", observed_at), payload))
+
+        accepted = 0
+        for index, batch in enumerate(shards):
+            if not batch:
+                continue
+            try:
+                self._inboxes[index].put_nowait((sample_weight, shed_level, batch))
+            except queue.Full:
+                with self._lock:
+                    self._dropped_frames[index] += len(batch)
+                continue
+            accepted += len(batch)
+            with self._lock:
+                self._enqueued_frames[index] += len(batch)
+        return accepted
+
+    def _handle_message(self, message) -> None:
+        kind, worker_index, payload = message
+        if kind == "observations":
+            try:
+                self.on_observations(payload)
+            except Exception as exc:
+                logger.debug("Analysis observation apply failed: %s", exc)
+                with self._lock:
+                    self._apply_errors += 1
+                return
+            with self._lock:
+                self._applied_observations += len(payload)
+            return
+
+        with self._lock:
+            worker = self._workers.setdefault(worker_index, {"worker": worker_index})
+            if kind == "status":
+                worker.update(payload)
+            elif kind == "exit":
+                worker["exited"] = True
+
+    def _collect(self) -> None:
+        while self._running or any(process.is_alive() for process in self._processes):
+            try:
+                message = self._results.get(timeout=0.2)
+            except queue.Empty:
+                if not self._running:
+                    return
+                continue
+            self._handle_message(message)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        for inbox in self._inboxes:
+            try:
+                inbox.put(None, timeout=0.5)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(timeout=max(deadline - time.monotonic(), 0.1))
+        self._stop_event.set()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        self._running = False
+        if self._collector is not None:
+            self._collector.join(timeout=2)
+
+    @staticmethod
+    def _queue_depth(inbox) -> Optional[int]:
+        try:
+            return inbox.qsize()
+        except (NotImplementedError, OSError):
+            return None
+
+    def queue_fill(self) -> float:
+        """Fill ratio of the fullest worker inbox or the results queue, for the load governor."""
+        capacity = max(int(self.options.queue_batches), 1)
+        depths = [self._queue_depth(inbox) or 0 for inbox in self._inboxes]
+        inbox_fill = max(depths, default=0) / capacity
+        results_depth = (self._queue_depth(self._results) or 0) if self._results is not None else 0
+        return min(max(inbox_fill, results_depth / (capacity * self.worker_count)), 1.0)
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            workers = [dict(self._workers[index]) for index in sorted(self._workers)]
+            enqueued = list(self._enqueued_frames)
+            dropped = list(self._dropped_frames)
+            applied = self._applied_observations
+            apply_errors = self._apply_errors
+            running = self._running
+
+        alive = {process.name: process.is_alive() for process in self._processes}
+        for worker in workers:
+            index = worker["worker"]
+            worker["alive"] = alive.get(f"netvisor-analysis-worker-{index}", False)
+            worker["enqueued_frames"] = enqueued[index] if index < len(enqueued) else 0
+            worker["dropped_frames"] = dropped[index] if index < len(dropped) else 0
+            worker["queue_depth"] = self._queue_depth(self._inboxes[index]) if index < len(self._inboxes) else None
+
+        return {
+            "worker_count": self.worker_count,
+            "running": running,
+            "queue_batches": self.options.queue_batches,
+            "enqueued_frames": sum(enqueued),
+            "dropped_frames": sum(dropped),
+            "processed_frames": sum(int(worker.get("processed_frames") or 0) for worker in workers),
+            "result_queue_depth": self._queue_depth(self._results) if self._results is not None else None,
+            "applied_observations": applied,
+            "apply_errors": apply_errors,
+            "workers": workers,
+        }
@@ -0,0 +1,189 @@
+"""
+Bounded TLS ClientHello reassembly.
+
+A ClientHello carrying post-quantum key shares is often larger than one TCP
+segment, so its SNI is invisible to the single-segment parser. The
+reassembler keeps the first bytes of such a client->server stream in a small
+per-flow buffer until the handshake record is complete, then re-runs the SNI
+parser once over the joined bytes. Buffers are capped per flow, share a
+global byte budget and are released least recently used first.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .payload import PayloadBuffer, PayloadInspection, _U16, _extract_tls_sni
+
+ReassemblyKey = tuple[str, str, int, int]
+
+_SEQ_MODULO = 1 << 32
+_SEQ_HALF = 1 << 31
+TLS_RECORD_HEADER_LENGTH = 5
+
+
+def _pending_record_length(view: memoryview) -> int:
+    """Return the ClientHello record length when ``view`` holds only part of it, else 0."""
+    if len(view) < TLS_RECORD_HEADER_LENGTH + 1 or view[0] != 0x16 or view[1] != 0x03 or view[5] != 0x01:
+        return 0
+    record_length = TLS_RECORD_HEADER_LENGTH + _U16.unpack_from(view, 3)[0]
+    return record_length if record_length > len(view) else 0
+
+
+class _HelloBuffer:
+    __slots__ = ("data", "next_seq", "record_length", "last_seen")
+
+    def __init__(self, data: bytearray, next_seq: int, record_length: int, last_seen: float) -> None:
+        self.data = data
+        self.next_seq = next_seq
+        self.record_length = record_length
+        self.last_seen = last_seen
+
+
+class TlsHelloReassembler:
+    """
+    Joins ClientHello records split across in-order TCP segments.
+
+    ``feed`` is called with every inspected client payload. Segments that
+    arrive out of order or overflow ``max_flow_bytes`` abandon the buffer, and
+    buffers idle for ``timeout_seconds`` are dropped lazily. When buffered
+    bytes would exceed ``max_total_bytes`` the least recently fed flows are
+    released first.
+    """
+
+    def __init__(
+        self,
+        max_flow_bytes: int = 16384,
+        max_total_bytes: int = 4 * 1024 * 1024,
+        timeout_seconds: float = 10.0,
+        sweep_batch: int = 8,
+    ) -> None:
+        self.max_flow_bytes = max(int(max_flow_bytes), TLS_RECORD_HEADER_LENGTH + 1)
+        self.max_total_bytes = max(int(max_total_bytes), self.max_flow_bytes)
+        self.timeout_seconds = max(float(timeout_seconds), 0.1)
+        self.sweep_batch = max(int(sweep_batch), 1)
+        self._buffers: "OrderedDict[ReassemblyKey, _HelloBuffer]" = OrderedDict()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._started = 0
+        self._reassembled = 0
+        self._abandoned = 0
+        self._evicted = 0
+        self._expired = 0
+
+    def pending(self, key: ReassemblyKey) -> bool:
+        """Return True while a partial ClientHello is buffered for ``key``."""
+        return key in self._buffers
+
+    def feed(
+        self,
+        key: ReassemblyKey,
+        seq: int,
+        payload: PayloadBuffer,
+        inspection: PayloadInspection,
+    ) -> PayloadInspection:
+        """
+        Account for one client->server segment and return the inspection to use.
+
+        The segment's own ``inspection`` is returned unchanged unless it
+        completes a buffered ClientHello, in which case the result describes
+        the reassembled record.
+        """
+        if not payload:
+            return inspection
+        if not self._buffers and (inspection.sni or not inspection.tls_record):
+            return inspection
+
+        view = memoryview(payload)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep_locked(now)
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                if inspection.sni or not inspection.tls_record:
+                    return inspection
+                record_length = _pending_record_length(view)
+                if not record_length or record_length > self.max_flow_bytes:
+                    return inspection
+                self._buffers[key] = _HelloBuffer(bytearray(view), (seq + len(view)) % _SEQ_MODULO, record_length, now)
+                self._buffered_bytes += len(view)
+                self._started += 1
+                self._enforce_budget_locked(key)
+                return inspection
+
+            self._buffers.move_to_end(key)
+            buffer.last_seen = now
+            offset = (buffer.next_seq - seq) % _SEQ_MODULO
+            if offset >= _SEQ_HALF:
+                # A gap: an earlier segment was lost or reordered.
+                self._release_locked(key)
+                self._abandoned += 1
+                return inspection
+            if offset >= len(view):
+                return inspection
+
+            chunk = view[offset:]
+            if len(buffer.data) + len(chunk) > self.max_flow_bytes:
+                self._release_locked(key)
+                self._abandoned += 1
+                return inspection
+            buffer.data += chunk
+            buffer.next_seq = (buffer.next_seq + len(chunk)) % _SEQ_MODULO
+            self._buffered_bytes += len(chunk)
+            if len(buffer.data) < buffer.record_length:
+                self._enforce_budget_locked(key)
+                return inspection
+
+            record = bytes(buffer.data[: buffer.record_length])
+            self._release_locked(key)
+            self._reassembled += 1
+
+        return PayloadInspection(has_payload=True, tls_record=True, sni=_extract_tls_sni(memoryview(record)))
+
+    def _release_locked(self, key: ReassemblyKey) -> None:
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            self._buffered_bytes -= len(buffer.data)
+
+    def _enforce_budget_locked(self, keep: ReassemblyKey) -> None:
+        while self._buffered_bytes > self.max_total_bytes and self._buffers:
+            oldest = next(iter(self._buffers))
+            if oldest == keep:
+                break
+            self._release_locked(oldest)
+            self._evicted += 1
+
+    def _sweep_locked(self, now: float) -> None:
+        # Buffers are ordered by last feed, so stale ones sit at the front.
+        for _ in range(self.sweep_batch):
+            if not self._buffers:
+                return
+            key, buffer = next(iter(self._buffers.items()))
+            if now - buffer.last_seen < self.timeout_seconds:
+                return
+            self._release_locked(key)
+            self._expired += 1
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "flows": len(self._buffers),
+                "buffered_bytes": self._buffered_bytes,
+                "max_flow_bytes": self.max_flow_bytes,
+                "max_total_bytes": self.max_total_bytes,
+                "started": self._started,
+                "reassembled": self._reassembled,
+                "abandoned": self._abandoned,
+                "evicted": self._evicted,
+                "expired": self._expired,
+            }
+
+
+def build_tls_reassembler(max_flow_bytes: int, max_total_bytes: int) -> Optional[TlsHelloReassembler]:
+    """Build a reassembler, or return None when ``max_total_bytes`` disables it."""
+    if int(max_total_bytes) <= 0:
+        return None
+    return TlsHelloReassembler(max_flow_bytes=max_flow_bytes, max_total_bytes=max_total_bytes)
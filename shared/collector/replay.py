@@ -0,0 +1,431 @@
+"""
+Offline capture replay.
+
+``PcapReplayCaptureBackend`` feeds recorded pcap/pcapng traffic through the
+same batch callbacks as the live backends, so captures can be replayed into
+the FlowManager and upload path to load-test or size a collector. Frames
+carry their capture timestamp as ``observed_at`` and ``clock()`` follows the
+replayed time, so flow expiry behaves as it did when the traffic was live.
+
+Replay is paced from the packet timestamps: ``speed`` 1 is realtime, N is N
+times faster and 0 replays as fast as the consumer accepts frames. A
+directory source replays every capture in it in modification order; with
+``watch`` it keeps polling for the files tcpdump rotates out (``-C``/``-G``)
+and leaves the newest one alone until a newer file shows it is complete.
+"""
+
+from __future__ import annotations
+
+import gzip
+import logging
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from .capture import BatchCallback, CaptureBackend, PacketCallback
+
+logger = logging.getLogger("netvisor.capture.replay")
+
+PCAP_MAGIC_MICROSECONDS = 0xA1B2C3D4
+PCAP_MAGIC_NANOSECONDS = 0xA1B23C4D
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_PACKET = 2
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_OPTION_TSRESOL = 9
+PCAPNG_OPTION_TSOFFSET = 14
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_ETH_P_IP = b"\x08\x00"
+_ETH_P_IPV6 = b"\x86\xdd"
+_NO_MAC = bytes(6)
+
+# A consumer that falls this far behind the schedule is re-anchored instead
+# of being fed a catch-up burst.
+REPLAY_MAX_LAG_SECONDS = 1.0
+# Delays shorter than this are not worth a wake-up; the frame joins the batch.
+REPLAY_MIN_SLEEP_SECONDS = 0.002
+
+
+class ReplayFrame(bytes):
+    """An Ethernet frame carrying the timestamp it was captured at."""
+
+    observed_at: float
+
+
+def _frame(data: bytes, observed_at: float) -> ReplayFrame:
+    frame = ReplayFrame(data)
+    frame.observed_at = observed_at
+    return frame
+
+
+def parse_replay_speed(value) -> float:
+    """Parse ``realtime``, ``max``/``0`` or a multiplier such as ``10`` / ``10x``."""
+    text = str(value if value is not None else "realtime").strip().lower()
+    if text in {"", "realtime", "real", "1x"}:
+        return 1.0
+    if text in {"max", "fast", "asap", "unlimited"}:
+        return 0.0
+    try:
+        speed = float(text.rstrip("x"))
+    except ValueError as exc:
+        raise ValueError(f"Invalid replay speed: {value!r}") from exc
+    return max(speed, 0.0)
+
+
+def _to_ethernet(link_type: int, data: bytes) -> Optional[bytes]:
+    """Rewrite a captured frame as Ethernet, or return None for unsupported link types."""
+    if link_type == LINKTYPE_ETHERNET:
+        return data
+    if link_type in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not data:
+            return None
+        ether_type = _ETH_P_IPV6 if data[0] >> 4 == 6 else _ETH_P_IP
+        return _NO_MAC + _NO_MAC + ether_type + data
+    if link_type == LINKTYPE_LINUX_SLL and len(data) >= 16:
+        return _NO_MAC + data[6:12] + data[14:16] + data[16:]
+    if link_type == LINKTYPE_LINUX_SLL2 and len(data) >= 20:
+        return _NO_MAC + data[12:18] + data[0:2] + data[20:]
+    return None
+
+
+def _open_capture(path: Path) -> BinaryIO:
+    handle = path.open("rb")
+    if handle.peek(2)[:2] == b"\x1f\x8b":
+        handle.close()
+        return gzip.open(path, "rb")
+    return handle
+
+
+def _read_pcap(handle: BinaryIO) -> Iterator[tuple[float, int, bytes]]:
+    header = handle.read(24)
+    if len(header) < 24:
+        return
+    endian = "<" if struct.unpack("<I", header[:4])[0] in (PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS) else ">"
+    divisor = 1e9 if struct.unpack(endian + "I", header[:4])[0] == PCAP_MAGIC_NANOSECONDS else 1e6
+    link_type = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        raw = handle.read(record.size)
+        if len(raw) < record.size:
+            return
+        seconds, fraction, captured_length, _ = record.unpack(raw)
+        data = handle.read(captured_length)
+        if len(data) < captured_length:
+            # A truncated final record: the writer was cut off mid-packet.
+            return
+        yield seconds + fraction / divisor, link_type, data
+
+
+def _pcapng_resolution(options: bytes, endian: str) -> tuple[float, float]:
+    resolution, offset = 1e-6, 0.0
+    index = 0
+    while index + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, index)
+        if code == 0:
+            break
+        value = options[index + 4 : index + 4 + length]
+        if code == PCAPNG_OPTION_TSRESOL and value:
+            exponent = value[0] & 0x7F
+            resolution = 2.0**-exponent if value[0] & 0x80 else 10.0**-exponent
+        elif code == PCAPNG_OPTION_TSOFFSET and len(value) >= 8:
+            offset = float(struct.unpack(endian + "q", value[:8])[0])
+        index += 4 + ((length + 3) & ~3)
+    return resolution, offset
+
+
+def _read_pcapng(handle: BinaryIO) -> Iterator[tuple[float, int, bytes]]:
+    endian = "<"
+    interfaces: list[tuple[int, float, float]] = []
+    last_timestamp = 0.0
+    while True:
+        head = handle.read(12)
+        if len(head) < 12:
+            return
+        if struct.unpack("<I", head[:4])[0] == PCAPNG_SECTION_HEADER:
+            # Each section header restates the byte order and resets interfaces.
+            endian = "<" if struct.unpack("<I", head[8:12])[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            interfaces = []
+        block_type, total_length = struct.unpack(endian + "II", head[:8])
+        if total_length < 12 or total_length % 4:
+            raise ValueError(f"Corrupt pcapng block length {total_length}")
+        rest = handle.read(total_length - 12)
+        if len(rest) < total_length - 12:
+            return
+        body = (head[8:] + rest)[:-4]
+
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION and len(body) >= 8:
+            link_type = struct.unpack_from(endian + "H", body, 0)[0]
+            resolution, offset = _pcapng_resolution(body[8:], endian)
+            interfaces.append((link_type, resolution, offset))
+        elif block_type == PCAPNG_ENHANCED_PACKET and len(body) >= 20:
+            interface_id, high, low, captured_length, _ = struct.unpack_from(endian + "IIIII", body, 0)
+            if interface_id < len(interfaces):
+                link_type, resolution, offset = interfaces[interface_id]
+                last_timestamp = ((high << 32) | low) * resolution + offset
+                yield last_timestamp, link_type, body[20 : 20 + captured_length]
+        elif block_type == PCAPNG_PACKET and len(body) >= 20:
+            interface_id, _, high, low, captured_length, _ = struct.unpack_from(endian + "HHIIII", body, 0)
+            if interface_id < len(interfaces):
+                link_type, resolution, offset = interfaces[interface_id]
+                last_timestamp = ((high << 32) | low) * resolution + offset
+                yield last_timestamp, link_type, body[20 : 20 + captured_length]
+        elif block_type == PCAPNG_SIMPLE_PACKET and len(body) >= 4 and interfaces:
+            # Simple packets have no timestamp; they inherit the previous one.
+            original_length = struct.unpack_from(endian + "I", body, 0)[0]
+            yield last_timestamp, interfaces[0][0], body[4 : 4 + original_length]
+
+
+def iter_capture_records(path: str | Path) -> Iterator[tuple[float, int, bytes]]:
+    """Yield ``(timestamp, link_type, data)`` for each packet of a pcap/pcapng file, gzipped or not."""
+    with _open_capture(Path(path)) as handle:
+        magic = handle.peek(4)[:4]
+        if len(magic) < 4:
+            return
+        if struct.unpack("<I", magic)[0] == PCAPNG_SECTION_HEADER:
+            yield from _read_pcapng(handle)
+        elif {struct.unpack("<I", magic)[0], struct.unpack(">I", magic)[0]} & {
+            PCAP_MAGIC_MICROSECONDS,
+            PCAP_MAGIC_NANOSECONDS,
+        }:
+            yield from _read_pcap(handle)
+        else:
+            raise ValueError(f"{path} is not a pcap or pcapng capture")
+
+
+class PcapReplayCaptureBackend(CaptureBackend):
+    """
+    Replays pcap/pcapng files (or a directory of tcpdump rotations) as capture.
+
+    ``interface`` is unused; ``replay_path`` names the file or directory.
+    Kernel BPF filters cannot be applied to recorded traffic, so a configured
+    capture filter is ignored with a warning.
+    """
+
+    live = False
+
+    def __init__(
+        self,
+        *,
+        replay_path: str | Path | None,
+        speed: float = 1.0,
+        watch: bool = False,
+        poll_interval: float = 1.0,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.replay_path = Path(replay_path) if replay_path else None
+        self.speed = max(float(speed), 0.0)
+        self.watch = bool(watch)
+        self.poll_interval = max(float(poll_interval), 0.1)
+        self._replay_lock = threading.Lock()
+        self._reset_replay_counters()
+
+    @property
+    def backend_name(self) -> str:
+        return "pcap"
+
+    def _reset_replay_counters(self) -> None:
+        with self._replay_lock:
+            self._completed_files: list[str] = []
+            self._current_file: Optional[str] = None
+            self._replayed_packets = 0
+            self._replayed_bytes = 0
+            self._unsupported_packets = 0
+            self._file_errors = 0
+            self._first_packet_ts: Optional[float] = None
+            self._replay_ts: Optional[float] = None
+            self._replay_wall: Optional[float] = None
+            self._replay_started: Optional[float] = None
+            self._replay_finished: Optional[float] = None
+
+    def clock(self) -> float:
+        """The replayed time: the last packet's timestamp advanced by wall time at the replay speed."""
+        with self._replay_lock:
+            replay_ts, replay_wall = self._replay_ts, self._replay_wall
+        if replay_ts is None:
+            return time.time()
+        return replay_ts + (time.monotonic() - replay_wall) * (self.speed or 1.0)
+
+    def _candidate_files(self) -> list[Path]:
+        files = [
+            entry
+            for entry in self.replay_path.iterdir()
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        files.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+        return files
+
+    def _iter_sources(self, deadline: Optional[float]) -> Iterator[Path]:
+        if self.replay_path.is_file():
+            yield self.replay_path
+            return
+
+        replayed: set[Path] = set()
+        while not self._stop_event.is_set():
+            pending = [entry for entry in self._candidate_files() if entry not in replayed]
+            if self.watch and pending:
+                # tcpdump is still writing the newest capture.
+                newest = max(pending, key=lambda entry: (entry.stat().st_mtime, entry.name))
+                pending = [entry for entry in pending if entry != newest]
+            for entry in pending:
+                replayed.add(entry)
+                yield entry
+                if self._stop_event.is_set():
+                    return
+            if not self.watch:
+                return
+            if deadline is not None and time.time() >= deadline:
+                return
+            self._stop_event.wait(self.poll_interval)
+
+    def _replay_file(
+        self,
+        path: Path,
+        on_packet: PacketCallback | None,
+        on_batch: BatchCallback | None,
+        batch_limit: int,
+        deadline: Optional[float],
+    ) -> bool:
+        """Replay one capture; returns False once the replay should stop."""
+        with self._replay_lock:
+            self._current_file = str(path)
+        pending: list[ReplayFrame] = []
+        anchor_ts: Optional[float] = None
+        anchor_wall = 0.0
+        unsupported = 0
+        try:
+            for timestamp, link_type, data in iter_capture_records(path):
+                if self._stop_event.is_set() or (deadline is not None and time.time() >= deadline):
+                    return False
+                frame = _to_ethernet(link_type, data)
+                if frame is None:
+                    unsupported += 1
+                    continue
+
+                now = time.monotonic()
+                if self.speed > 0:
+                    if anchor_ts is None:
+                        anchor_ts, anchor_wall = timestamp, now
+                    delay = anchor_wall + (timestamp - anchor_ts) / self.speed - now
+                    if delay > REPLAY_MIN_SLEEP_SECONDS:
+                        self._deliver(pending, on_packet, on_batch)
+                        pending = []
+                        if self._stop_event.wait(delay):
+                            return False
+                        now = time.monotonic()
+                    elif delay < -REPLAY_MAX_LAG_SECONDS:
+                        anchor_ts, anchor_wall = timestamp, now
+
+                pending.append(_frame(frame, timestamp))
+                with self._replay_lock:
+                    if self._first_packet_ts is None:
+                        self._first_packet_ts = timestamp
+                    self._replay_ts, self._replay_wall = timestamp, now
+                    self._replayed_packets += 1
+                    self._replayed_bytes += len(frame)
+                if len(pending) >= batch_limit:
+                    self._deliver(pending, on_packet, on_batch)
+                    pending = []
+        finally:
+            self._deliver(pending, on_packet, on_batch)
+            with self._replay_lock:
+                self._unsupported_packets += unsupported
+                self._current_file = None
+        with self._replay_lock:
+            self._completed_files.append(str(path))
+        return True
+
+    def start(
+        self,
+        on_packet: PacketCallback | None = None,
+        timeout: int | float | None = None,
+        *,
+        on_batch: BatchCallback | None = None,
+        batch_size: int = 256,
+    ) -> tuple[bool, Optional[str]]:
+        self._require_callback(on_packet, on_batch)
+        if self.replay_path is None or not self.replay_path.exists():
+            message = f"Replay capture needs an existing pcap file or directory, got {self.replay_path}."
+            self._record_drop(message)
+            self._mark_stopped()
+            return False, message
+
+        self._mark_started()
+        self._reset_replay_counters()
+        if self.capture_filter or self.capture_filter_program:
+            logger.warning("Capture filters are not applied to replayed traffic.")
+        deadline = None if timeout is None else time.time() + max(float(timeout), 0.0)
+        batch_limit = max(int(batch_size), 1) if on_batch is not None else 64
+        with self._replay_lock:
+            self._replay_started = time.monotonic()
+        try:
+            for path in self._iter_sources(deadline):
+                try:
+                    if not self._replay_file(path, on_packet, on_batch, batch_limit, deadline):
+                        break
+                except (OSError, ValueError, EOFError) as exc:
+                    if self.replay_path.is_file():
+                        raise
+                    # One unreadable rotation must not end a directory replay.
+                    logger.warning("Skipping unreadable capture %s: %s", path, exc)
+                    with self._replay_lock:
+                        self._file_errors += 1
+                    self._record_drop(str(exc))
+        except Exception as exc:
+            self._record_drop(str(exc))
+            return False, str(exc)
+        finally:
+            with self._replay_lock:
+                self._replay_finished = time.monotonic()
+            self._mark_stopped()
+            replay = self.replay_snapshot()
+            logger.info(
+                "Replayed %s packets from %s file(s) in %.1fs (%s pps)",
+                replay["packets_replayed"],
+                len(replay["completed_files"]),
+                replay["elapsed_seconds"],
+                replay["achieved_pps"],
+            )
+        return True, None
+
+    def replay_snapshot(self) -> dict:
+        with self._replay_lock:
+            started, finished = self._replay_started, self._replay_finished
+            elapsed = 0.0 if started is None else (finished or time.monotonic()) - started
+            span = (
+                self._replay_ts - self._first_packet_ts
+                if self._replay_ts is not None and self._first_packet_ts is not None
+                else 0.0
+            )
+            return {
+                "source": str(self.replay_path) if self.replay_path else None,
+                "speed": self.speed or "max",
+                "watch": self.watch,
+                "current_file": self._current_file,
+                "completed_files": list(self._completed_files),
+                "file_errors": self._file_errors,
+                "packets_replayed": self._replayed_packets,
+                "bytes_replayed": self._replayed_bytes,
+                "unsupported_packets": self._unsupported_packets,
+                "replay_position": self._format_ts(self._replay_ts),
+                "elapsed_seconds": round(elapsed, 3),
+                "captured_seconds": round(span, 3),
+                "achieved_pps": round(self._replayed_packets / elapsed, 1) if elapsed > 0 else 0.0,
+                "achieved_speed": round(span / elapsed, 2) if elapsed > 0 else None,
+            }
+
+    def status_snapshot(self) -> dict:
+        snapshot = super().status_snapshot()
+        snapshot["replay"] = self.replay_snapshot()
+        return snapshot
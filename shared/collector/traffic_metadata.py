@@ -1,51 +1,38 @@
 from __future__ import annotations
 
-import ipaddress
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
 import time
+from collections import OrderedDict
 from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
 
+from ..network.scope import is_ip_address, is_trackable_private_ip
+from .payload import PayloadInspection, _normalize_domain, inspect_payload
 
-@lru_cache(maxsize=1)
-def _load_scapy_primitives():
-    from scapy.all import DNS, DNSQR, DNSRR, IP, Raw, TCP  # type: ignore
-
-    return DNS, DNSQR, DNSRR, IP, Raw, TCP
-
-
-def _normalize_domain(domain: str | None) -> str | None:
-    if not domain:
-        return None
-
-    value = domain.strip().lower().rstrip(".")
-    if not value or " " in value:
-        return None
-    return value
+if TYPE_CHECKING:
+    from .decoder import DecodedFrame, DnsMessage
 
+logger = logging.getLogger("netvisor.collector.traffic_metadata")
 
-def _is_ip_address(value: str | None) -> bool:
-    if not value:
-        return False
-    try:
-        ipaddress.ip_address(value)
-        return True
-    except ValueError:
-        return False
+# Domain hint snapshot: header, then one record per entry (oldest first)
+# followed by the UTF-8 domain. Expiry times are absolute wall-clock seconds.
+_SNAPSHOT_MAGIC = b"NVDH"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("!4sBdI")
+_SNAPSHOT_RECORD = struct.Struct("!dB16sB")
 
 
-def _is_trackable_private_ip(value: str | None) -> bool:
-    if not _is_ip_address(value):
-        return False
+@lru_cache(maxsize=1)
+def _load_scapy_primitives():
+    from scapy.all import DNS, DNSQR, DNSRR, IP, Raw, TCP  # type: ignore
 
-    ip = ipaddress.ip_address(value)
-    return (
-        ip.version == 4
-        and ip.is_private
-        and not ip.is_loopback
-        and not ip.is_multicast
-        and not ip.is_unspecified
-        and not ip.is_reserved
-        and not ip.is_link_local
-    )
+    return DNS, DNSQR, DNSRR, IP, Raw, TCP
 
 
 def _select_remote_ip(packet) -> str | None:
@@ -55,8 +42,8 @@ def _select_remote_ip(packet) -> str | None:
 
     src_ip = packet[IP].src
     dst_ip = packet[IP].dst
-    src_private = _is_trackable_private_ip(src_ip)
-    dst_private = _is_trackable_private_ip(dst_ip)
+    src_private = is_trackable_private_ip(src_ip)
+    dst_private = is_trackable_private_ip(dst_ip)
 
     if src_private and not dst_private:
         return dst_ip
@@ -65,6 +52,19 @@ def _select_remote_ip(packet) -> str | None:
     return None
 
 
+def _select_remote_frame_ip(decoded: "DecodedFrame") -> str | None:
+    if decoded.ip_version != 4:
+        return None
+
+    src_private = is_trackable_private_ip(decoded.src_ip)
+    dst_private = is_trackable_private_ip(decoded.dst_ip)
+    if src_private and not dst_private:
+        return decoded.dst_ip
+    if dst_private and not src_private:
+        return decoded.src_ip
+    return None
+
+
 def _iter_dns_answers(answer, answer_count: int, dns_rr_type):
     yielded = 0
     current = answer
@@ -90,44 +90,183 @@ def _iter_dns_answers(answer, answer_count: int, dns_rr_type):
 
 
 class DomainHintCache:
-    def __init__(self, ttl_seconds: int = 300, max_entries: int = 2048) -> None:
-        self.ttl_seconds = ttl_seconds
-        self.max_entries = max_entries
-        self._entries: dict[str, tuple[str, float]] = {}
-
-    def _prune(self) -> None:
-        if not self._entries:
-            return
+    """
+    IP -> domain hints learned from DNS answers, kept as a TTL-aware LRU.
 
-        now = time.time()
-        expired = [ip for ip, (_, expires_at) in self._entries.items() if expires_at <= now]
-        for ip in expired:
-            self._entries.pop(ip, None)
+    Entries live in an ``OrderedDict`` in recency order: ``remember`` and
+    lookup hits move an entry to the tail, so capacity evictions pop from the
+    head in O(1). Expired entries are dropped when they are looked up, and
+    each ``remember`` sweeps at most ``sweep_batch`` expired entries off the
+    head, so no call ever scans or sorts the whole cache.
 
-        if len(self._entries) <= self.max_entries:
-            return
+    ``save_snapshot``/``load_snapshot`` persist the live entries with their
+    remaining TTLs so a restarted collector keeps tagging CDN flows with
+    domains before clients re-resolve.
+    """
 
-        oldest = sorted(self._entries.items(), key=lambda item: item[1][1])[: len(self._entries) - self.max_entries]
-        for ip, _ in oldest:
-            self._entries.pop(ip, None)
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 2048, sweep_batch: int = 8) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(int(max_entries), 1)
+        self.sweep_batch = max(int(sweep_batch), 1)
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+        self._snapshot_path: str | None = None
+        self._snapshot_saved_at: float | None = None
+        self._snapshot_loaded = 0
+        self._snapshot_saved = 0
+
+    def _sweep_locked(self, now: float) -> None:
+        entries = self._entries
+        for _ in range(self.sweep_batch):
+            if not entries:
+                return
+            ip, (_, expires_at) = next(iter(entries.items()))
+            if expires_at > now:
+                return
+            del entries[ip]
+            self._expired += 1
 
     def remember(self, ip_value: str | None, domain: str | None) -> None:
         normalized_domain = _normalize_domain(domain)
-        if not normalized_domain or not _is_ip_address(ip_value):
+        if not normalized_domain or not is_ip_address(ip_value):
             return
 
-        self._prune()
-        self._entries[str(ip_value)] = (normalized_domain, time.time() + self.ttl_seconds)
+        now = time.time()
+        key = str(ip_value)
+        with self._lock:
+            self._sweep_locked(now)
+            self._entries[key] = (normalized_domain, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted += 1
 
     def lookup(self, ip_value: str | None) -> str | None:
-        if not _is_ip_address(ip_value):
+        # Only validated addresses are ever stored, so anything else just misses.
+        if not ip_value:
             return None
 
-        self._prune()
-        record = self._entries.get(str(ip_value))
-        if not record:
-            return None
-        return record[0]
+        key = str(ip_value)
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                self._misses += 1
+                return None
+            if record[1] <= time.time():
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return record[0]
+
+    def save_snapshot(self, path: str | Path) -> int:
+        """Atomically write the unexpired entries to ``path``; returns the entry count."""
+        now = time.time()
+        with self._lock:
+            items = [(ip, domain, expires_at) for ip, (domain, expires_at) in self._entries.items() if expires_at > now]
+
+        chunks = []
+        for ip, domain, expires_at in items:
+            try:
+                packed = socket.inet_pton(socket.AF_INET6, ip) if ":" in ip else socket.inet_pton(socket.AF_INET, ip)
+            except OSError:
+                continue
+            encoded = domain.encode("utf-8")[:255]
+            chunks.append(_SNAPSHOT_RECORD.pack(expires_at, 6 if len(packed) == 16 else 4, packed, len(encoded)))
+            chunks.append(encoded)
+
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary = target.with_name(target.name + ".tmp")
+        with temporary.open("wb") as handle:
+            handle.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, now, len(chunks) // 2))
+            handle.write(b"".join(chunks))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, target)
+
+        with self._lock:
+            self._snapshot_path = str(target)
+            self._snapshot_saved_at = now
+            self._snapshot_saved = len(chunks) // 2
+        return len(chunks) // 2
+
+    def load_snapshot(self, path: str | Path) -> int:
+        """Merge the unexpired entries of a snapshot file; returns the entries loaded."""
+        target = Path(path)
+        if not target.is_file():
+            return 0
+        try:
+            with target.open("rb") as handle:
+                if os.fstat(handle.fileno()).st_size < _SNAPSHOT_HEADER.size:
+                    return 0
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    records, saved_at = self._read_snapshot(view)
+        except (OSError, ValueError, struct.error) as exc:
+            logger.warning("Ignoring domain hint snapshot %s: %s", target, exc)
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for ip, domain, expires_at in records:
+                if expires_at <= now or ip in self._entries:
+                    continue
+                self._entries[ip] = (domain, min(expires_at, now + self.ttl_seconds))
+                loaded += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+            self._snapshot_path = self._snapshot_path or str(target)
+            self._snapshot_saved_at = self._snapshot_saved_at or saved_at
+            self._snapshot_loaded += loaded
+        return loaded
+
+    @staticmethod
+    def _read_snapshot(view) -> tuple[list[tuple[str, str, float]], float]:
+        magic, version, saved_at, count = _SNAPSHOT_HEADER.unpack_from(view, 0)
+        if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+            raise ValueError("unrecognised snapshot header")
+        records = []
+        offset = _SNAPSHOT_HEADER.size
+        for _ in range(count):
+            expires_at, family, packed, length = _SNAPSHOT_RECORD.unpack_from(view, offset)
+            offset += _SNAPSHOT_RECORD.size
+            if offset + length > len(view):
+                raise ValueError("truncated snapshot record")
+            if family == 4:
+                ip = socket.inet_ntop(socket.AF_INET, packed[:4])
+            else:
+                ip = socket.inet_ntop(socket.AF_INET6, packed)
+            records.append((ip, view[offset : offset + length].decode("utf-8", errors="ignore"), expires_at))
+            offset += length
+        return records, saved_at
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "expired": self._expired,
+                "evicted": self._evicted,
+                "snapshot_path": self._snapshot_path,
+                "snapshot_loaded_entries": self._snapshot_loaded,
+                "snapshot_saved_entries": self._snapshot_saved,
+                "snapshot_age_seconds": (
+                    round(time.time() - self._snapshot_saved_at, 1) if self._snapshot_saved_at is not None else None
+                ),
+            }
 
     def observe_dns(self, packet) -> str | None:
         DNS, DNSQR, DNSRR, _, _, _ = _load_scapy_primitives()
@@ -150,106 +289,40 @@ class DomainHintCache:
 
         return question_name
 
+    def observe_dns_message(self, message: "DnsMessage") -> str | None:
+        question_name = _normalize_domain(message.question_name)
+        if not message.is_response:
+            return question_name
 
-def _extract_tls_sni(payload: bytes) -> str | None:
-    if len(payload) < 5 or payload[0] != 0x16:
-        return None
-
-    record_length = int.from_bytes(payload[3:5], "big")
-    if len(payload) < 5 + record_length:
-        return None
-
-    handshake = payload[5 : 5 + record_length]
-    if len(handshake) < 4 or handshake[0] != 0x01:
-        return None
-
-    body = handshake[4:]
-    if len(body) < 34:
-        return None
-
-    index = 34
-    if index >= len(body):
-        return None
-
-    session_id_length = body[index]
-    index += 1 + session_id_length
-    if index + 2 > len(body):
-        return None
-
-    cipher_suites_length = int.from_bytes(body[index : index + 2], "big")
-    index += 2 + cipher_suites_length
-    if index >= len(body):
-        return None
-
-    compression_length = body[index]
-    index += 1 + compression_length
-    if index + 2 > len(body):
-        return None
-
-    extensions_length = int.from_bytes(body[index : index + 2], "big")
-    index += 2
-    extensions_end = min(len(body), index + extensions_length)
-
-    while index + 4 <= extensions_end:
-        extension_type = int.from_bytes(body[index : index + 2], "big")
-        extension_size = int.from_bytes(body[index + 2 : index + 4], "big")
-        extension_start = index + 4
-        extension_end = extension_start + extension_size
-        if extension_end > extensions_end:
-            return None
-
-        if extension_type == 0x0000 and extension_size >= 5:
-            server_name_list_length = int.from_bytes(body[extension_start : extension_start + 2], "big")
-            pointer = extension_start + 2
-            list_end = min(extension_end, pointer + server_name_list_length)
-            while pointer + 3 <= list_end:
-                name_type = body[pointer]
-                name_length = int.from_bytes(body[pointer + 1 : pointer + 3], "big")
-                pointer += 3
-                if pointer + name_length > list_end:
-                    return None
-                if name_type == 0:
-                    return _normalize_domain(body[pointer : pointer + name_length].decode("utf-8", errors="ignore"))
-                pointer += name_length
-
-        index = extension_end
-
-    return None
-
-
-def _extract_http_host(payload: bytes) -> str | None:
-    if not payload:
-        return None
-
-    try:
-        text = payload.decode("utf-8", errors="ignore")
-    except Exception:
-        return None
-
-    lines = text.splitlines()
-    if not lines:
-        return None
+        for answer in message.answers:
+            if answer.rr_type in (1, 28) and answer.address:
+                self.remember(answer.address, _normalize_domain(answer.name) or question_name)
 
-    request_line = lines[0].strip()
-    if not (
-        request_line.startswith(("GET ", "POST ", "PUT ", "PATCH ", "DELETE ", "HEAD ", "OPTIONS ", "CONNECT "))
-        or request_line.startswith("HTTP/")
-    ):
-        return None
+        return question_name
 
-    for line in lines[1:16]:
-        if not line:
-            break
-        header_name, sep, header_value = line.partition(":")
-        if not sep:
-            continue
-        if header_name.strip().lower() == "host":
-            return _normalize_domain(header_value)
 
+def _hints_from_inspection(
+    inspection: PayloadInspection,
+    remote_ip: str | None,
+    domain_cache: DomainHintCache | None,
+) -> dict[str, str | None] | None:
+    if inspection.http_host:
+        if domain_cache:
+            domain_cache.remember(remote_ip, inspection.http_host)
+        return {"domain": inspection.http_host, "sni": None}
+    if inspection.sni:
+        if domain_cache:
+            domain_cache.remember(remote_ip, inspection.sni)
+        return {"domain": inspection.sni, "sni": inspection.sni}
     return None
 
 
-def extract_flow_hints(packet, domain_cache: DomainHintCache | None = None) -> dict[str, str | None]:
+def extract_flow_hints(
+    packet,
+    domain_cache: DomainHintCache | None = None,
+    *,
+    inspection: PayloadInspection | None = None,
+) -> dict[str, str | None]:
     DNS, DNSQR, _, _, Raw, TCP = _load_scapy_primitives()
     if packet.haslayer(DNS) and packet.haslayer(DNSQR):
         domain = (
@@ -260,18 +333,11 @@ def extract_flow_hints(packet, domain_cache: DomainHintCache | None = None) -> d
         return {"domain": domain, "sni": None}
 
     if packet.haslayer(TCP) and packet.haslayer(Raw):
-        raw_payload = bytes(packet[Raw].load)
-        http_domain = _extract_http_host(raw_payload)
-        if http_domain:
-            if domain_cache:
-                domain_cache.remember(_select_remote_ip(packet), http_domain)
-            return {"domain": http_domain, "sni": None}
-
-        tls_domain = _extract_tls_sni(raw_payload)
-        if tls_domain and domain_cache:
-            domain_cache.remember(_select_remote_ip(packet), tls_domain)
-        if tls_domain:
-            return {"domain": tls_domain, "sni": tls_domain}
+        if inspection is None:
+            inspection = inspect_payload(packet[Raw].load)
+        hints = _hints_from_inspection(inspection, _select_remote_ip(packet), domain_cache)
+        if hints is not None:
+            return hints
 
     if domain_cache:
         cached_domain = domain_cache.lookup(_select_remote_ip(packet))
@@ -280,6 +346,36 @@ def extract_flow_hints(packet, domain_cache: DomainHintCache | None = None) -> d
     return {"domain": None, "sni": None}
 
 
+def extract_frame_hints(
+    decoded: "DecodedFrame",
+    domain_cache: DomainHintCache | None = None,
+    *,
+    dns_message: "DnsMessage | None" = None,
+    inspection: PayloadInspection | None = None,
+) -> dict[str, str | None]:
+    """Byte-native counterpart of :func:`extract_flow_hints` for decoded frames."""
+    if dns_message is not None:
+        domain = (
+            domain_cache.observe_dns_message(dns_message)
+            if domain_cache
+            else _normalize_domain(dns_message.question_name)
+        )
+        return {"domain": domain, "sni": None}
+
+    if decoded.is_tcp and decoded.payload:
+        if inspection is None:
+            inspection = inspect_payload(decoded.payload)
+        hints = _hints_from_inspection(inspection, _select_remote_frame_ip(decoded), domain_cache)
+        if hints is not None:
+            return hints
+
+    if domain_cache:
+        cached_domain = domain_cache.lookup(_select_remote_frame_ip(decoded))
+        return {"domain": cached_domain, "sni": None}
+
+    return {"domain": None, "sni": None}
+
+
 def extract_domain_hint(packet, domain_cache: DomainHintCache | None = None) -> str | None:
     hints = extract_flow_hints(packet, domain_cache)
     return hints.get("sni") or hints.get("domain")
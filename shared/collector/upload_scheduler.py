@@ -0,0 +1,189 @@
+"""
+Adaptive batch sizing and pacing for collector uploads.
+
+Every upload is a signed request the backend authenticates, replay-checks
+and inserts into its flow queue, so a fixed batch of 20 turns a busy
+collector into hundreds of small requests a minute. The scheduler grows
+the batch additively while the backend answers within ``target_latency``
+and halves it when responses slow down (AIMD), bounded by a record count
+and a byte budget. A batch is sent as soon as it is full or after
+``linger`` seconds, whichever comes first, and up to ``max_in_flight``
+batches may be outstanding at once.
+
+Backpressure (429/503) halves the batch and pauses uploads for the
+server's ``Retry-After`` hint, or for an exponential backoff when there is
+none; other failures only back off. A 413 halves both the batch and its
+byte budget and pauses briefly; once the batch is already at its minimum
+the 413 counts as a failure, so a payload no proxy will pass backs off
+exponentially instead of being resent in a tight loop.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+BACKPRESSURE_STATUSES = frozenset({429, 503})
+PAYLOAD_TOO_LARGE_STATUS = 413
+MIN_BATCH_BYTES = 1024
+
+
+def parse_retry_after(value, *, now: float | None = None) -> float | None:
+    """Seconds to wait from a ``Retry-After`` value (delta-seconds or HTTP-date)."""
+    text = str(value or "").strip()
+    if not text:
+        return None
+    try:
+        return max(float(text), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(text)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    current = now if now is not None else time.time()
+    return max(when.timestamp() - current, 0.0)
+
+
+class UploadScheduler:
+    def __init__(
+        self,
+        *,
+        min_batch: int = 20,
+        max_batch: int = 500,
+        max_batch_bytes: int = 1024 * 1024,
+        linger: float = 5.0,
+        target_latency: float = 1.0,
+        max_backoff: float = 60.0,
+        max_in_flight: int = 1,
+        clock=time.monotonic,
+    ) -> None:
+        self.min_batch = max(int(min_batch), 1)
+        self.max_batch = max(int(max_batch), self.min_batch)
+        self.max_batch_bytes = max(int(max_batch_bytes), MIN_BATCH_BYTES)
+        self.linger = max(float(linger), 0.0)
+        self.target_latency = max(float(target_latency), 0.01)
+        self.max_backoff = max(float(max_backoff), 1.0)
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self.batch_size = self.min_batch
+        # Shrinks on 413 and grows back additively, like batch_size.
+        self.batch_bytes = self.max_batch_bytes
+        self._bytes_step = max(self.max_batch_bytes // 16, MIN_BATCH_BYTES)
+        self._last_send = clock()
+        self._resume_at = 0.0
+        self._consecutive_failures = 0
+        self._latency_ewma: float | None = None
+        self._increases = 0
+        self._decreases = 0
+        self._backpressure_events = 0
+        self._too_large_events = 0
+        self._last_retry_after: float | None = None
+        self._last_status: int | None = None
+
+    def _decrease(self) -> None:
+        self.batch_size = max(self.batch_size // 2, self.min_batch)
+        self._decreases += 1
+
+    def _backoff(self) -> float:
+        return min(2.0 * 2 ** max(self._consecutive_failures - 1, 0), self.max_backoff)
+
+    def due(self, unsent_records: int) -> bool:
+        """True when a batch should be sent now."""
+        if unsent_records <= 0:
+            return False
+        with self._lock:
+            now = self.clock()
+            if now < self._resume_at:
+                return False
+            return unsent_records >= self.batch_size or now - self._last_send >= self.linger
+
+    def acquire_slot(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for an in-flight slot."""
+        with self._slot_freed:
+            if not self._slot_freed.wait_for(lambda: self._in_flight < self.max_in_flight, timeout):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release_slot(self) -> None:
+        with self._slot_freed:
+            self._in_flight = max(self._in_flight - 1, 0)
+            self._slot_freed.notify()
+
+    def record_success(self, sent: int, latency: float) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._last_status = 200
+            self._last_send = self.clock()
+            self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+            if self.batch_bytes < self.max_batch_bytes:
+                self.batch_bytes = min(self.batch_bytes + self._bytes_step, self.max_batch_bytes)
+            if latency > self.target_latency:
+                self._decrease()
+            elif sent >= self.batch_size and self.batch_size < self.max_batch:
+                # Only a full batch says anything about whether a bigger one fits.
+                self.batch_size = min(self.batch_size + self.min_batch, self.max_batch)
+                self._increases += 1
+
+    def record_failure(self, response=None) -> bool:
+        """
+        Account for a failed upload; ``response`` is the HTTP response, if any.
+
+        Returns True when the backend rejected the payload as too large, so the
+        batch should be re-cut rather than resent as is.
+        """
+        status = getattr(response, "status_code", None)
+        headers = getattr(response, "headers", None) or {}
+        with self._lock:
+            self._last_status = status
+            if status == PAYLOAD_TOO_LARGE_STATUS:
+                self._too_large_events += 1
+                if self.batch_size <= self.min_batch and self.batch_bytes <= MIN_BATCH_BYTES:
+                    self._consecutive_failures += 1
+                self._decrease()
+                self.batch_bytes = max(self.batch_bytes // 2, MIN_BATCH_BYTES)
+                self._last_send = self.clock()
+                self._resume_at = self._last_send + self._backoff()
+                return True
+            self._consecutive_failures += 1
+            delay = self._backoff()
+            if status in BACKPRESSURE_STATUSES:
+                self._backpressure_events += 1
+                self._decrease()
+                retry_after = parse_retry_after(headers.get("Retry-After"))
+                self._last_retry_after = retry_after
+                if retry_after is not None:
+                    delay = min(retry_after, self.max_backoff)
+            self._resume_at = self.clock() + delay
+            return False
+
+    def status_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "min_batch": self.min_batch,
+                "max_batch": self.max_batch,
+                "batch_bytes": self.batch_bytes,
+                "max_batch_bytes": self.max_batch_bytes,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "linger_seconds": self.linger,
+                "target_latency_seconds": self.target_latency,
+                "latency_ewma_seconds": round(self._latency_ewma, 4) if self._latency_ewma is not None else None,
+                "paused_for_seconds": round(max(self._resume_at - self.clock(), 0.0), 2),
+                "consecutive_failures": self._consecutive_failures,
+                "backpressure_events": self._backpressure_events,
+                "too_large_events": self._too_large_events,
+                "last_retry_after_seconds": self._last_retry_after,
+                "last_status": self._last_status,
+                "increases": self._increases,
+                "decreases": self._decreases,
+            }
@@ -0,0 +1,25 @@
+"""Shared network address helpers."""
+
+from .scope import (
+    IpScope,
+    classify_ip_scope,
+    ip_scope,
+    is_ip_address,
+    is_multicast_or_broadcast_ip,
+    is_rfc1918_device_ip,
+    is_trackable_private_ip,
+    normalize_ip,
+    scope_cache_info,
+)
+
+__all__ = [
+    "IpScope",
+    "classify_ip_scope",
+    "ip_scope",
+    "is_ip_address",
+    "is_multicast_or_broadcast_ip",
+    "is_rfc1918_device_ip",
+    "is_trackable_private_ip",
+    "normalize_ip",
+    "scope_cache_info",
+]
@@ -0,0 +1,133 @@
+"""
+IP scope classification over packed integer addresses.
+
+Addresses are parsed once with ``inet_pton``, matched against precomputed
+``(network, mask)`` prefix tables and the result is memoised in an LRU, so
+the collector hot path and server-side flow ingest no longer build
+``ipaddress`` objects per packet or per flow.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import socket
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+SCOPE_CACHE_SIZE = 65536
+
+
+def _prefix_table(*networks: str) -> tuple[tuple[int, int], ...]:
+    table = []
+    for network in networks:
+        parsed = ipaddress.ip_network(network)
+        table.append((int(parsed.network_address), int(parsed.netmask)))
+    return tuple(table)
+
+
+RFC1918_V4 = _prefix_table("10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16")
+# ipaddress.is_private minus loopback, link-local, multicast and reserved space.
+TRACKABLE_PRIVATE_V4 = RFC1918_V4 + _prefix_table(
+    "0.0.0.0/8",
+    "192.0.0.0/29",
+    "192.0.0.170/31",
+    "192.0.2.0/24",
+    "198.18.0.0/15",
+    "198.51.100.0/24",
+    "203.0.113.0/24",
+)
+CONTROL_V4 = _prefix_table("224.0.0.0/4", "127.0.0.0/8", "0.0.0.0/32")
+CONTROL_V6 = _prefix_table("ff00::/8", "::1/128", "::/128")
+
+
+def _in_table(value: int, table: tuple[tuple[int, int], ...]) -> bool:
+    for network, mask in table:
+        if value & mask == network:
+            return True
+    return False
+
+
+@dataclass(frozen=True, slots=True)
+class IpScope:
+    address: Optional[str]
+    version: int = 0
+    value: int = 0
+    scope: str = "invalid"
+    is_rfc1918: bool = False
+    is_trackable_private: bool = False
+
+
+_INVALID = IpScope(address=None)
+
+
+@lru_cache(maxsize=SCOPE_CACHE_SIZE)
+def _scope_for_text(text: str) -> IpScope:
+    if ":" in text:
+        try:
+            parsed = ipaddress.IPv6Address(text)
+        except ValueError:
+            return _INVALID
+        value = int(parsed)
+        scope = "control" if _in_table(value, CONTROL_V6) else "external"
+        return IpScope(address=str(parsed), version=6, value=value, scope=scope)
+
+    try:
+        packed = socket.inet_pton(socket.AF_INET, text)
+    except OSError:
+        return _INVALID
+    value = int.from_bytes(packed, "big")
+    is_rfc1918 = _in_table(value, RFC1918_V4)
+    if _in_table(value, CONTROL_V4) or value & 0xFF == 0xFF:
+        scope = "control"
+    elif is_rfc1918:
+        scope = "internal"
+    else:
+        scope = "external"
+    return IpScope(
+        address=socket.inet_ntop(socket.AF_INET, packed),
+        version=4,
+        value=value,
+        scope=scope,
+        is_rfc1918=is_rfc1918,
+        is_trackable_private=value != 0 and _in_table(value, TRACKABLE_PRIVATE_V4),
+    )
+
+
+def ip_scope(value: object) -> IpScope:
+    """Return the cached :class:`IpScope` for ``value`` (any object whose ``str`` is an address)."""
+    if value is None:
+        return _INVALID
+    text = value.strip() if isinstance(value, str) else str(value).strip()
+    if not text:
+        return _INVALID
+    return _scope_for_text(text)
+
+
+def normalize_ip(value: object) -> Optional[str]:
+    return ip_scope(value).address
+
+
+def is_ip_address(value: object) -> bool:
+    return ip_scope(value).address is not None
+
+
+def is_rfc1918_device_ip(value: object) -> bool:
+    return ip_scope(value).is_rfc1918
+
+
+def is_trackable_private_ip(value: object) -> bool:
+    return ip_scope(value).is_trackable_private
+
+
+def is_multicast_or_broadcast_ip(value: object) -> bool:
+    return ip_scope(value).scope == "control"
+
+
+def classify_ip_scope(value: object) -> str:
+    return ip_scope(value).scope
+
+
+def scope_cache_info() -> dict:
+    info = _scope_for_text.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize, "max_entries": info.maxsize}
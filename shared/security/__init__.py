@@ -16,9 +16,26 @@ from .agent_auth import (
     signature_message,
     verify_signature,
 )
+from .body_encoding import (
+    ACCEPT_ENCODING_HEADER,
+    CONTENT_ENCODING_HEADER,
+    IDENTITY_ENCODING,
+    BodyEncodingError,
+    BodyTooLargeError,
+    choose_body_encoding,
+    decode_body,
+    encode_body,
+    parse_accept_encoding,
+    supported_body_encodings,
+)
 
 __all__ = [
+    "ACCEPT_ENCODING_HEADER",
     "AGENT_ID_HEADER",
+    "BodyEncodingError",
+    "BodyTooLargeError",
+    "CONTENT_ENCODING_HEADER",
+    "IDENTITY_ENCODING",
     "GATEWAY_BOOTSTRAP_KEY_HEADER",
     "GATEWAY_ID_HEADER",
     "KEY_VERSION_HEADER",
@@ -29,7 +46,12 @@ __all__ = [
     "TIMESTAMP_HEADER",
     "body_sha256_hex",
     "canonical_path",
+    "choose_body_encoding",
+    "decode_body",
+    "encode_body",
+    "parse_accept_encoding",
     "sign_request",
     "signature_message",
+    "supported_body_encodings",
     "verify_signature",
 ]
@@ -41,16 +41,22 @@ def signature_message(
     timestamp: str,
     nonce: str,
     body_digest: str,
+    content_encoding: str | None = None,
 ) -> bytes:
-    return "\n".join(
-        [
-            str(method or "GET").upper(),
-            path or "/",
-            str(timestamp or ""),
-            str(nonce or ""),
-            str(body_digest or ""),
-        ]
-    ).encode("utf-8")
+    lines = [
+        str(method or "GET").upper(),
+        path or "/",
+        str(timestamp or ""),
+        str(nonce or ""),
+        str(body_digest or ""),
+    ]
+    # The digest covers the body as sent; a compressed body also binds its
+    # coding so the header cannot be swapped. Uncompressed requests keep the
+    # original five-line message.
+    encoding = str(content_encoding or "").strip().lower()
+    if encoding and encoding != "identity":
+        lines.append(encoding)
+    return "\n".join(lines).encode("utf-8")
 
 
 def sign_request(
@@ -61,6 +67,7 @@ def sign_request(
     timestamp: str,
     nonce: str,
     body: bytes | str | None,
+    content_encoding: str | None = None,
 ) -> str:
     secret_bytes = secret if isinstance(secret, bytes) else secret.encode("utf-8")
     body_digest = body_sha256_hex(body)
@@ -70,6 +77,7 @@ def sign_request(
         timestamp=timestamp,
         nonce=nonce,
         body_digest=body_digest,
+        content_encoding=content_encoding,
     )
     return hmac.new(secret_bytes, message, hashlib.sha256).hexdigest()
 
@@ -83,6 +91,7 @@ def verify_signature(
     timestamp: str,
     nonce: str,
     body: bytes | str | None,
+    content_encoding: str | None = None,
 ) -> bool:
     expected = sign_request(
         secret=secret,
@@ -91,5 +100,6 @@ def verify_signature(
         timestamp=timestamp,
         nonce=nonce,
         body=body,
+        content_encoding=content_encoding,
     )
     return hmac.compare_digest(expected, str(provided_signature or ""))
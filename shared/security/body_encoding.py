@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import gzip
+import io
+import zlib
+from typing import Iterable
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional on both ends
+    zstandard = None
+
+
+CONTENT_ENCODING_HEADER = "Content-Encoding"
+# RFC 7694: a server lists the request content codings it accepts in an
+# Accept-Encoding response header.
+ACCEPT_ENCODING_HEADER = "Accept-Encoding"
+IDENTITY_ENCODING = "identity"
+
+
+class BodyEncodingError(ValueError):
+    pass
+
+
+class BodyTooLargeError(BodyEncodingError):
+    pass
+
+
+def supported_body_encodings() -> tuple[str, ...]:
+    """Request codings this process can produce and decode, most preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def normalize_encoding(value: str | None) -> str:
+    text = str(value or "").strip().lower()
+    return text or IDENTITY_ENCODING
+
+
+def parse_accept_encoding(value: str | None) -> tuple[str, ...]:
+    codings = []
+    for part in str(value or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        weight = params.strip().lower()
+        if weight.startswith("q="):
+            try:
+                if float(weight[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            codings.append(coding)
+    return tuple(codings)
+
+
+def choose_body_encoding(offered: Iterable[str], preference: str = "auto") -> str | None:
+    """
+    Pick the coding to compress request bodies with, or None for identity.
+
+    ``preference`` is ``auto`` (best coding both sides support), ``off``, or
+    a coding name that is used only if the server offered it.
+    """
+    preference = str(preference or "auto").strip().lower()
+    if preference in {"off", "none", "false", "0", IDENTITY_ENCODING}:
+        return None
+    offered = set(offered)
+    candidates = supported_body_encodings() if preference == "auto" else (preference,)
+    for coding in candidates:
+        if coding in offered and coding in supported_body_encodings():
+            return coding
+    return None
+
+
+def encode_body(body: bytes, encoding: str | None) -> bytes:
+    encoding = normalize_encoding(encoding)
+    if encoding == IDENTITY_ENCODING:
+        return body
+    if encoding == "gzip":
+        # mtime=0 keeps the output (and so the signed digest) reproducible.
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    raise BodyEncodingError(f"Unsupported content encoding: {encoding}")
+
+
+def decode_body(body: bytes, encoding: str | None, *, max_bytes: int) -> bytes:
+    """Decompress a request body, refusing to inflate past ``max_bytes``."""
+    encoding = normalize_encoding(encoding)
+    if encoding == IDENTITY_ENCODING:
+        if len(body) > max_bytes:
+            raise BodyTooLargeError("Request body exceeds the size limit.")
+        return body
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            decoded = decompressor.decompress(body, max_bytes + 1)
+        except zlib.error as exc:
+            raise BodyEncodingError(f"Invalid gzip request body: {exc}") from exc
+        if len(decoded) > max_bytes or decompressor.unconsumed_tail:
+            raise BodyTooLargeError("Decompressed request body exceeds the size limit.")
+        if not decompressor.eof:
+            raise BodyEncodingError("Truncated gzip request body.")
+        return decoded
+    if encoding == "zstd" and zstandard is not None:
+        chunks: list[bytes] = []
+        total = 0
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+                while chunk := reader.read(65536):
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise BodyTooLargeError("Decompressed request body exceeds the size limit.")
+                    chunks.append(chunk)
+        except zstandard.ZstdError as exc:
+            raise BodyEncodingError(f"Invalid zstd request body: {exc}") from exc
+        return b"".join(chunks)
+    raise BodyEncodingError(f"Unsupported content encoding: {encoding}")
@@ -0,0 +1,25 @@
+"""Shared wire formats for collector uploads."""
+
+from .flow_batch import (
+    ACCEPT_POST_HEADER,
+    FLOW_BATCH_MAX_ROWS,
+    FLOW_BATCH_MEDIA_TYPE,
+    FLOW_BATCH_VERSION,
+    FlowBatchError,
+    decode_flow_batch,
+    encode_flow_batch,
+    parse_media_types,
+    replace_flow_batch_columns,
+)
+
+__all__ = [
+    "ACCEPT_POST_HEADER",
+    "FLOW_BATCH_MAX_ROWS",
+    "FLOW_BATCH_MEDIA_TYPE",
+    "FLOW_BATCH_VERSION",
+    "FlowBatchError",
+    "decode_flow_batch",
+    "encode_flow_batch",
+    "parse_media_types",
+    "replace_flow_batch_columns",
+]
@@ -0,0 +1,346 @@
+"""
+Compact columnar wire format for flow summary batches.
+
+Collectors post batches of flow summaries that share most of their strings
+(agent and organization ids, protocols, analysis sources) and carry ISO
+timestamps the server only parses back. This format stores a batch column
+by column::
+
+    !4sBIH   magic "NVFB", version, row count, column count
+    string table: !I count, then (!I length, UTF-8 bytes) per string
+    per column: !IBI name index, kind, payload length, then the payload
+
+Every string (column names included) is stored once in the table and
+referenced by index. A column whose rows all hold the same scalar is
+stored once as a constant, and UTC ISO timestamps travel as epoch
+microseconds. Other columns are packed as fixed-width arrays. A column
+with missing values carries a presence bitmap and packs only the present
+values; missing values are left out of decoded rows, which matches the
+flow schema's defaults.
+
+Column blocks are self-delimiting, so ``replace_flow_batch_columns`` can
+rewrite constant columns (the server stamps identity and load-shedding
+fields) while copying every other block byte for byte.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+FLOW_BATCH_MEDIA_TYPE = "application/vnd.netvisor.flow-batch"
+FLOW_BATCH_VERSION = 1
+# Constant columns cost nothing per row, so bound what a tiny body can claim.
+FLOW_BATCH_MAX_ROWS = 100_000
+# A server lists the request media types a resource accepts in Accept-Post.
+ACCEPT_POST_HEADER = "Accept-Post"
+
+_MAGIC = b"NVFB"
+_HEADER = struct.Struct("!4sBIH")
+_COLUMN = struct.Struct("!IBI")
+_U32 = struct.Struct("!I")
+
+_CONST, _INT, _FLOAT, _BOOL, _STR, _TIME, _STR_LIST, _FLOAT_LIST, _JSON = range(9)
+_NULLABLE = 0x80
+_SCALAR_FORMATS = {_INT: "q", _FLOAT: "d", _BOOL: "B", _STR: "I", _TIME: "q", _JSON: "I"}
+_MAX_LIST = 0xFFFF
+_INT64 = (-(2**63), 2**63 - 1)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class FlowBatchError(ValueError):
+    pass
+
+
+def parse_media_types(value: str | None) -> tuple[str, ...]:
+    """Media types from an Accept-Post style header, parameters dropped."""
+    return tuple(
+        media_type
+        for media_type in (part.split(";", 1)[0].strip().lower() for part in str(value or "").split(","))
+        if media_type
+    )
+
+
+def _format_time(micros: int) -> str:
+    return (_EPOCH + micros * _MICROSECOND).isoformat()
+
+
+def _time_micros(value: str) -> int | None:
+    """Epoch microseconds for a UTC ISO timestamp that formats back to exactly ``value``."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.utcoffset() != timedelta(0):
+        return None
+    micros = (parsed - _EPOCH) // _MICROSECOND
+    return micros if _format_time(micros) == value else None
+
+
+class _StringTable:
+    def __init__(self, strings: Iterable[str] = ()) -> None:
+        self.strings = list(strings)
+        self._index = {value: index for index, value in enumerate(self.strings)}
+
+    def add(self, value: str) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def pack(self) -> bytes:
+        parts = [_U32.pack(len(self.strings))]
+        for value in self.strings:
+            encoded = value.encode("utf-8")
+            parts.append(_U32.pack(len(encoded)))
+            parts.append(encoded)
+        return b"".join(parts)
+
+
+def _scalar_kind(value) -> int | None:
+    kind = type(value)
+    if kind is bool:
+        return _BOOL
+    if kind is int:
+        return _INT if _INT64[0] <= value <= _INT64[1] else None
+    if kind is float:
+        return _FLOAT
+    if kind is str:
+        return _STR
+    return None
+
+
+def _column_kind(present: list) -> int:
+    kinds = {type(value) for value in present}
+    if kinds == {bool}:
+        return _BOOL
+    if kinds == {int} and all(_INT64[0] <= value <= _INT64[1] for value in present):
+        return _INT
+    if kinds <= {int, float}:
+        return _FLOAT
+    if kinds == {str}:
+        return _TIME if all(_time_micros(value) is not None for value in present) else _STR
+    if kinds <= {list, tuple} and all(len(value) <= _MAX_LIST for value in present):
+        items = [item for value in present for item in value]
+        item_kinds = {type(item) for item in items}
+        if item_kinds <= {str}:
+            return _STR_LIST
+        if item_kinds <= {int, float}:
+            return _FLOAT_LIST
+    return _JSON
+
+
+def _pack_const(value, strings: _StringTable) -> bytes:
+    kind = _scalar_kind(value)
+    if kind is None:
+        raise FlowBatchError(f"Constant column values must be scalars, got {type(value).__name__}.")
+    payload = strings.add(value) if kind == _STR else value
+    return bytes((kind,)) + struct.pack("!" + _SCALAR_FORMATS[kind], payload)
+
+
+def _pack_values(kind: int, present: list, strings: _StringTable) -> bytes:
+    count = len(present)
+    if kind in (_STR_LIST, _FLOAT_LIST):
+        items = [item for value in present for item in value]
+        item_format = "I" if kind == _STR_LIST else "d"
+        if kind == _STR_LIST:
+            items = [strings.add(item) for item in items]
+        return struct.pack(f"!{count}H", *(len(value) for value in present)) + struct.pack(
+            f"!{len(items)}{item_format}", *items
+        )
+    if kind == _STR:
+        present = [strings.add(value) for value in present]
+    elif kind == _TIME:
+        present = [_time_micros(value) for value in present]
+    elif kind == _JSON:
+        present = [strings.add(json.dumps(value, separators=(",", ":"), default=str)) for value in present]
+    return struct.pack(f"!{count}{_SCALAR_FORMATS[kind]}", *present)
+
+
+def _column_block(name_index: int, kind: int, payload: bytes) -> bytes:
+    return _COLUMN.pack(name_index, kind, len(payload)) + payload
+
+
+def encode_flow_batch(rows: list[dict]) -> bytes:
+    """Encode a list of flow summary dicts; ``None`` values are not transmitted."""
+    if len(rows) > FLOW_BATCH_MAX_ROWS:
+        raise FlowBatchError(f"Flow batches are limited to {FLOW_BATCH_MAX_ROWS} rows.")
+    names: dict[str, None] = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+
+    strings = _StringTable()
+    blocks = []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        present = [value for value in values if value is not None]
+        if not present:
+            continue
+        name_index = strings.add(str(name))
+        first = present[0]
+        if (
+            len(present) == len(values)
+            and _scalar_kind(first) is not None
+            and all(type(value) is type(first) and value == first for value in present)
+        ):
+            blocks.append(_column_block(name_index, _CONST, _pack_const(first, strings)))
+            continue
+        kind = _column_kind(present)
+        payload = _pack_values(kind, present, strings)
+        if len(present) < len(values):
+            bitmap = bytearray((len(values) + 7) // 8)
+            for index, value in enumerate(values):
+                if value is not None:
+                    bitmap[index >> 3] |= 1 << (index & 7)
+            kind |= _NULLABLE
+            payload = bytes(bitmap) + payload
+        blocks.append(_column_block(name_index, kind, payload))
+
+    header = _HEADER.pack(_MAGIC, FLOW_BATCH_VERSION, len(rows), len(blocks))
+    return header + strings.pack() + b"".join(blocks)
+
+
+def _read_frame(data) -> tuple[int, list[str], list[tuple[int, int, memoryview, bytes]]]:
+    """Parse the header, string table and column blocks of an encoded batch."""
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise FlowBatchError("Flow batch is truncated.")
+    magic, version, row_count, column_count = _HEADER.unpack_from(view, 0)
+    if magic != _MAGIC:
+        raise FlowBatchError("Not a flow batch.")
+    if version != FLOW_BATCH_VERSION:
+        raise FlowBatchError(f"Unsupported flow batch version {version}.")
+    if row_count > FLOW_BATCH_MAX_ROWS:
+        raise FlowBatchError(f"Flow batches are limited to {FLOW_BATCH_MAX_ROWS} rows.")
+    try:
+        offset = _HEADER.size
+        (string_count,) = _U32.unpack_from(view, offset)
+        offset += _U32.size
+        if string_count > len(view):
+            raise FlowBatchError("Flow batch string table is corrupt.")
+        strings = []
+        for _ in range(string_count):
+            (length,) = _U32.unpack_from(view, offset)
+            offset += _U32.size
+            if offset + length > len(view):
+                raise FlowBatchError("Flow batch string table is truncated.")
+            strings.append(bytes(view[offset : offset + length]).decode("utf-8"))
+            offset += length
+        columns = []
+        for _ in range(column_count):
+            start = offset
+            name_index, kind, length = _COLUMN.unpack_from(view, offset)
+            offset += _COLUMN.size
+            if offset + length > len(view):
+                raise FlowBatchError("Flow batch column is truncated.")
+            columns.append((name_index, kind, view[offset : offset + length], bytes(view[start : offset + length])))
+            offset += length
+    except struct.error as exc:
+        raise FlowBatchError(f"Flow batch is truncated: {exc}") from exc
+    except UnicodeDecodeError as exc:
+        raise FlowBatchError(f"Flow batch string is not UTF-8: {exc}") from exc
+    if offset != len(view):
+        raise FlowBatchError("Flow batch has trailing bytes.")
+    return row_count, strings, columns
+
+
+def _string(strings: list[str], index: int) -> str:
+    if index >= len(strings):
+        raise FlowBatchError("Flow batch string index out of range.")
+    return strings[index]
+
+
+def _unpack_exact(fmt: str, payload, offset: int = 0) -> tuple:
+    size = struct.calcsize(fmt)
+    if offset + size > len(payload):
+        raise FlowBatchError("Flow batch column is truncated.")
+    return struct.unpack_from(fmt, payload, offset)
+
+
+def _decode_values(kind: int, count: int, payload, strings: list[str]) -> tuple[list, int]:
+    if kind in (_STR_LIST, _FLOAT_LIST):
+        lengths = _unpack_exact(f"!{count}H", payload)
+        offset = 2 * count
+        total = sum(lengths)
+        items = _unpack_exact(f"!{total}{'I' if kind == _STR_LIST else 'd'}", payload, offset)
+        offset += struct.calcsize(f"!{total}{'I' if kind == _STR_LIST else 'd'}")
+        if kind == _STR_LIST:
+            items = [_string(strings, item) for item in items]
+        values, position = [], 0
+        for length in lengths:
+            values.append(list(items[position : position + length]))
+            position += length
+        return values, offset
+    if kind not in _SCALAR_FORMATS:
+        raise FlowBatchError(f"Unknown flow batch column kind {kind}.")
+    fmt = f"!{count}{_SCALAR_FORMATS[kind]}"
+    values = list(_unpack_exact(fmt, payload))
+    if kind == _STR:
+        values = [_string(strings, value) for value in values]
+    elif kind == _BOOL:
+        values = [bool(value) for value in values]
+    elif kind == _TIME:
+        values = [_format_time(value) for value in values]
+    elif kind == _JSON:
+        values = [json.loads(_string(strings, value)) for value in values]
+    return values, struct.calcsize(fmt)
+
+
+def decode_flow_batch(data) -> list[dict[str, Any]]:
+    """Decode an encoded batch back into flow summary dicts."""
+    row_count, strings, columns = _read_frame(data)
+    rows: list[dict[str, Any]] = [{} for _ in range(row_count)]
+    for name_index, kind, payload, _block in columns:
+        name = _string(strings, name_index)
+        if kind == _CONST:
+            if not len(payload):
+                raise FlowBatchError("Flow batch constant column is empty.")
+            inner = payload[0]
+            if inner not in (_INT, _FLOAT, _BOOL, _STR):
+                raise FlowBatchError(f"Unknown flow batch constant kind {inner}.")
+            values, consumed = _decode_values(inner, 1, payload[1:], strings)
+            if consumed + 1 != len(payload):
+                raise FlowBatchError("Flow batch constant column has trailing bytes.")
+            for row in rows:
+                row[name] = values[0]
+            continue
+
+        present_rows = range(row_count)
+        body = payload
+        if kind & _NULLABLE:
+            kind &= ~_NULLABLE
+            bitmap_size = (row_count + 7) // 8
+            if len(payload) < bitmap_size:
+                raise FlowBatchError("Flow batch presence bitmap is truncated.")
+            bitmap = bytes(payload[:bitmap_size])
+            present_rows = [index for index in range(row_count) if bitmap[index >> 3] & (1 << (index & 7))]
+            body = payload[bitmap_size:]
+        values, consumed = _decode_values(kind, len(present_rows), body, strings)
+        if consumed != len(body):
+            raise FlowBatchError("Flow batch column has trailing bytes.")
+        for index, value in zip(present_rows, values):
+            rows[index][name] = value
+    return rows
+
+
+def replace_flow_batch_columns(data, values: dict[str, Any]) -> bytes:
+    """
+    Return ``data`` with the named columns set to one value for every row.
+
+    Other column blocks are copied unchanged; a ``None`` value removes the
+    column.
+    """
+    row_count, strings, columns = _read_frame(data)
+    table = _StringTable(strings)
+    replaced = {table.add(str(name)): value for name, value in values.items()}
+    blocks = [block for name_index, _kind, _payload, block in columns if name_index not in replaced]
+    for name_index, value in replaced.items():
+        if value is not None:
+            blocks.append(_column_block(name_index, _CONST, _pack_const(value, table)))
+    header = _HEADER.pack(_MAGIC, FLOW_BATCH_VERSION, row_count, len(blocks))
+    return header + table.pack() + b"".join(blocks)
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import json
+
 import pytest
 import requests
 
 from agent.security.dpapi import DataProtector
 from agent.security.transport import AgentApiClient
+from shared.security import decode_body, verify_signature
+from shared.wire import FLOW_BATCH_MEDIA_TYPE, decode_flow_batch
 
 
 class FakeProtector(DataProtector):
@@ -59,3 +63,88 @@ def test_private_lan_http_is_allowed_when_opt_in_enabled(tmp_path, monkeypatch):
     client = _client(tmp_path)
 
     client._enforce_transport_policy("http://10.159.79.96:8000/api/v1/collect/register")
+
+
+def test_request_bodies_are_compressed_once_the_backend_advertises_codings(tmp_path, monkeypatch):
+    client = _client(tmp_path)
+    client._state["agent_credentials"] = {"agent_id": "AGENT-1", "key_version": 1, "secret": "agent-secret"}
+    sent = []
+
+    def _send(prepared, **kwargs):
+        sent.append(prepared)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Accept-Encoding"] = "gzip"
+        response._content = b"{}"
+        return response
+
+    monkeypatch.setattr(client.session, "send", _send)
+    batch = [{"agent_id": "AGENT-1", "src_ip": "10.0.0.10", "dst_ip": "8.8.8.8"}] * 50
+    url = "http://127.0.0.1:8000/api/v1/collect/flow/batch"
+
+    client.request("POST", url, json_body=batch)
+    client.request("POST", url, json_body=batch)
+
+    assert "Content-Encoding" not in sent[0].headers
+    compressed = sent[1]
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(decode_body(compressed.body, "gzip", max_bytes=1 << 20)) == batch
+    assert len(compressed.body) < len(sent[0].body)
+    assert verify_signature(
+        secret="agent-secret",
+        provided_signature=compressed.headers["X-NetVisor-Signature"],
+        method="POST",
+        path=compressed.path_url,
+        timestamp=compressed.headers["X-NetVisor-Timestamp"],
+        nonce=compressed.headers["X-NetVisor-Nonce"],
+        body=compressed.body,
+        content_encoding="gzip",
+    )
+    assert client.status_snapshot()["request_encoding"] == "gzip"
+    assert client.status_snapshot()["compressed_requests"] == 1
+
+
+def test_flow_batches_switch_to_binary_once_the_backend_accepts_it(tmp_path, monkeypatch):
+    client = _client(tmp_path)
+    client._state["agent_credentials"] = {"agent_id": "AGENT-1", "key_version": 1, "secret": "agent-secret"}
+    sent = []
+    accept_post = [f"application/json, {FLOW_BATCH_MEDIA_TYPE}", None]
+
+    def _send(prepared, **kwargs):
+        sent.append(prepared)
+        response = requests.Response()
+        response.status_code = 200 if accept_post[0] else 415
+        if accept_post[0]:
+            response.headers["Accept-Post"] = accept_post[0]
+        response._content = b"{}"
+        return response
+
+    monkeypatch.setattr(client.session, "send", _send)
+    batch = [{"agent_id": "AGENT-1", "src_ip": "10.0.0.10", "dst_port": 443 + index} for index in range(5)]
+    url = "http://127.0.0.1:8000/api/v1/collect/flow/batch"
+
+    client.post_flow_batch(url, batch)
+    client.post_flow_batch(url, batch)
+    accept_post.pop(0)
+    client.post_flow_batch(url, batch)
+    client.post_flow_batch(url, batch)
+
+    assert [request.headers["Content-Type"] for request in sent] == [
+        "application/json",
+        FLOW_BATCH_MEDIA_TYPE,
+        FLOW_BATCH_MEDIA_TYPE,
+        "application/json",
+    ]
+    assert decode_flow_batch(sent[1].body) == batch
+    assert verify_signature(
+        secret="agent-secret",
+        provided_signature=sent[1].headers["X-NetVisor-Signature"],
+        method="POST",
+        path=sent[1].path_url,
+        timestamp=sent[1].headers["X-NetVisor-Timestamp"],
+        nonce=sent[1].headers["X-NetVisor-Nonce"],
+        body=sent[1].body,
+    )
+    # A 415 without Accept-Post drops back to JSON.
+    assert client.status_snapshot()["flow_wire_format"] == "application/json"
+    assert client.status_snapshot()["binary_flow_batches"] == 2
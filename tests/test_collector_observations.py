@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+from types import SimpleNamespace
+
 from scapy.all import Ether, IP, TCP  # type: ignore
 
 from shared.collector import (
+    CaptureShardOptions,
+    FanoutCaptureSupervisor,
     DpiObservation,
     FlowManager,
     FlowObservation,
+    LinuxMmapCaptureBackend,
     LinuxRawSocketCaptureBackend,
     PacketObservation,
     ScapyCaptureBackend,
+    UploadJournal,
+    UploadScheduler,
     build_capture_backend,
 )
+from shared.collector.capture import parse_bpf_program
 import shared.collector.capture as capture_module
 
 
@@ -86,7 +94,7 @@ def test_flow_manager_preserves_analyzer_metadata_in_summaries():
     )
 
     manager.update_from_observation(observation)
-    state = manager._flows[observation.flow_key]
+    state = manager.flow_state(observation.flow_key)
     summary = manager._build_summary(observation.flow_key, state)
 
     assert state.application_protocol == "DNS"
@@ -119,6 +127,186 @@ def test_build_capture_backend_uses_scapy_on_windows(monkeypatch):
     assert backend.backend_name == "scapy"
 
 
+def test_parse_bpf_program_accepts_tcpdump_bytecode():
+    program = parse_bpf_program("4,40 0 0 12,21 0 1 2048,6 0 0 262144,6 0 0 0")
+
+    assert program == [(40, 0, 0, 12), (21, 0, 1, 2048), (6, 0, 0, 262144), (6, 0, 0, 0)]
+    assert parse_bpf_program([[6, 0, 0, 0]]) == [(6, 0, 0, 0)]
+    assert parse_bpf_program("") is None
+
+
+def test_scapy_backend_passes_capture_filter_to_sniff(monkeypatch):
+    calls = []
+
+    def fake_sniff(**kwargs):
+        calls.append(kwargs)
+        backend.stop()
+
+    monkeypatch.setattr(capture_module, "_load_scapy_primitives", lambda: (None, fake_sniff))
+    backend = build_capture_backend(role="agent", interface=None, requested_backend="scapy", capture_filter="ip or ip6")
+
+    success, error = backend.start(lambda packet: True, timeout=5)
+    snapshot = backend.status_snapshot()
+
+    assert success is True and error is None
+    assert calls[0]["filter"] == "ip or ip6"
+    assert snapshot["capture_filter"] == "ip or ip6"
+    assert snapshot["capture_filter_attached"] is True
+    assert snapshot["filter_packets_accepted"] == 0
+
+
+def test_scapy_backend_keeps_capturing_when_filter_cannot_compile(monkeypatch):
+    calls = []
+
+    def fake_sniff(**kwargs):
+        calls.append(kwargs)
+        if kwargs["filter"]:
+            raise ImportError("libpcap is not available")
+        backend.stop()
+
+    monkeypatch.setattr(capture_module, "_load_scapy_primitives", lambda: (None, fake_sniff))
+    backend = build_capture_backend(role="agent", interface=None, requested_backend="scapy", capture_filter="udp")
+
+    success, _ = backend.start(lambda packet: True, timeout=5)
+    snapshot = backend.status_snapshot()
+
+    assert success is True
+    assert [call["filter"] for call in calls] == ["udp", None]
+    assert snapshot["capture_filter_attached"] is False
+    assert snapshot["last_error"].startswith("capture_filter_unavailable")
+
+
+def test_raw_backends_join_packet_fanout_hash_group():
+    class FakeSocket:
+        def __init__(self):
+            self.options = []
+
+        def setsockopt(self, level, option, value):
+            self.options.append((level, option, value))
+
+    backend = build_capture_backend(role="gateway", interface="eth0", requested_backend="linux_raw", fanout_group=0x12345)
+    fake_socket = FakeSocket()
+
+    backend._join_fanout_group(fake_socket)
+
+    assert backend.status_snapshot()["fanout_group"] == 0x2345
+    level, option, value = fake_socket.options[0]
+    assert (level, option) == (capture_module.SOL_PACKET, capture_module.PACKET_FANOUT)
+    assert int.from_bytes(value, "little") == 0x2345 | (capture_module.PACKET_FANOUT_FLAG_DEFRAG << 16)
+
+
+def test_scapy_backend_refuses_fanout_group():
+    backend = ScapyCaptureBackend(role="gateway", interface="eth0", fanout_group=7)
+
+    success, error = backend.start(lambda packet: True, timeout=1)
+
+    assert success is False
+    assert "PACKET_FANOUT" in error
+
+
+def test_fanout_supervisor_merges_shard_flows_and_counters():
+    forwarded = []
+    supervisor = FanoutCaptureSupervisor(
+        worker_count=2,
+        options=CaptureShardOptions(
+            role="gateway",
+            interface="eth0",
+            requested_backend="linux_raw",
+            fanout_group=42,
+            agent_id="GW-1",
+            organization_id="ORG-1",
+        ),
+        on_flow_expired=forwarded.append,
+    )
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        start_worker=False,
+    )
+    observation = PacketObservation(
+        observed_at=1_710_000_000.0,
+        source_type="gateway",
+        metadata_only=True,
+        src_ip="10.0.0.10",
+        dst_ip="1.1.1.1",
+        src_port=40000,
+        dst_port=443,
+        protocol="TCP",
+        packet_size=60,
+    )
+    manager.update_from_observation(observation)
+    flow = manager._build_summary(observation.flow_key, manager.flow_state(observation.flow_key))
+
+    supervisor._handle_message(("flow", 1, dict(flow.__dict__)))
+    supervisor._handle_message(("status", 0, {"capture": {"packets_seen": 5, "packets_emitted": 4}, "flow_manager": {"active_flow_count": 2}}))
+    supervisor._handle_message(("status", 1, {"capture": {"packets_seen": 7, "packets_emitted": 7}, "flow_manager": {"active_flow_count": 1}}))
+    snapshot = supervisor.status_snapshot()
+
+    assert forwarded == [flow]
+    assert snapshot["active_backend"] == "fanout"
+    assert snapshot["packets_seen"] == 12
+    assert snapshot["packets_emitted"] == 11
+    assert snapshot["active_flow_count"] == 3
+    assert snapshot["flows_forwarded"] == 1
+    assert [shard["shard"] for shard in snapshot["shards"]] == [0, 1]
+    assert snapshot["shards"][1]["flows_forwarded"] == 1
+
+
+def test_fanout_supervisor_keeps_draining_until_every_live_shard_reports_exit():
+    class _Process:
+        def __init__(self, alive):
+            self.alive = alive
+
+        def is_alive(self):
+            return self.alive
+
+    supervisor = FanoutCaptureSupervisor(
+        worker_count=2,
+        options=CaptureShardOptions(
+            role="gateway",
+            interface="eth0",
+            requested_backend="linux_raw",
+            fanout_group=42,
+            agent_id="GW-1",
+            organization_id="ORG-1",
+        ),
+        on_flow_expired=lambda summary: None,
+    )
+    supervisor._shards = {0: {"shard": 0}, 1: {"shard": 1}}
+    supervisor._processes = [_Process(True), _Process(True)]
+
+    supervisor._handle_message(("exit", 0, {"success": True, "error": None}))
+    assert supervisor._shards_pending() is True
+
+    supervisor._handle_message(("exit", 1, {"success": True, "error": None}))
+    assert supervisor._shards_pending() is False
+
+    supervisor._shards[1].pop("exit")
+    supervisor._processes = [_Process(False), _Process(False)]
+    assert supervisor._shards_pending() is False
+
+
+def test_fanout_supervisor_rejects_scapy_backend():
+    supervisor = FanoutCaptureSupervisor(
+        worker_count=2,
+        options=CaptureShardOptions(
+            role="gateway",
+            interface="eth0",
+            requested_backend="scapy",
+            fanout_group=42,
+            agent_id="GW-1",
+            organization_id="ORG-1",
+        ),
+        on_flow_expired=lambda summary: None,
+    )
+
+    success, error = supervisor.start(timeout=1)
+
+    assert success is False
+    assert "fan-out" in error
+
+
 def test_dpi_observation_payload_omits_raw_headers():
     observation = DpiObservation(
         browser_name="Chrome",
@@ -144,3 +332,1014 @@ def test_dpi_observation_payload_omits_raw_headers():
     assert payload["browser_name"] == "Chrome"
     assert payload["source_type"] == "agent"
     assert "headers" not in payload
+
+
+def test_build_capture_backend_supports_linux_mmap_ring_options():
+    backend = build_capture_backend(
+        role="gateway",
+        interface="eth0",
+        requested_backend="linux_mmap",
+        ring_block_size=1 << 16,
+        ring_block_count=8,
+    )
+
+    assert isinstance(backend, LinuxMmapCaptureBackend)
+    assert backend.backend_name == "linux_mmap"
+    snapshot = backend.status_snapshot()
+    assert snapshot["ring_block_size"] == 1 << 16
+    assert snapshot["ring_block_count"] == 8
+    assert snapshot["ring_drops"] == 0
+
+
+def test_linux_mmap_backend_walks_tpacket_v3_block_in_place():
+    backend = LinuxMmapCaptureBackend(role="gateway", interface="eth0", block_size=4096, block_count=1)
+    frames = [b"\x01" * 60, b"\x02" * 74]
+    block = bytearray(4096)
+    first_offset = 48
+    capture_module._TPACKET_BLOCK_HEADER.pack_into(block, 0, 3, 0, capture_module.TP_STATUS_USER, len(frames), first_offset)
+    offset = first_offset
+    for index, frame in enumerate(frames):
+        mac_offset = 80
+        next_offset = 256 if index < len(frames) - 1 else 0
+        capture_module._TPACKET3_FRAME_HEADER.pack_into(
+            block, offset, next_offset, 1_710_000_000 + index, 500_000_000, len(frame), len(frame), 1, mac_offset, mac_offset + 14
+        )
+        block[offset + mac_offset : offset + mac_offset + len(frame)] = frame
+        offset += next_offset
+
+    walked = [(bytes(frame), ts) for frame, ts in backend._iter_block_frames(memoryview(block), 0)]
+
+    assert walked == [(frames[0], 1_710_000_000.5), (frames[1], 1_710_000_001.5)]
+
+
+def test_scapy_backend_delivers_batches_and_counts_partial_acceptance(monkeypatch):
+    batches = []
+
+    def fake_sniff(**kwargs):
+        for index in range(5):
+            kwargs["prn"](f"packet-{index}")
+        backend.stop()
+
+    monkeypatch.setattr(capture_module, "_load_scapy_primitives", lambda: (None, fake_sniff))
+    backend = build_capture_backend(role="agent", interface=None, requested_backend="scapy")
+
+    def on_batch(packets):
+        batches.append(list(packets))
+        return len(packets) - 1
+
+    success, _ = backend.start(timeout=5, on_batch=on_batch, batch_size=2)
+    snapshot = backend.status_snapshot()
+
+    assert success is True
+    assert batches == [["packet-0", "packet-1"], ["packet-2", "packet-3"], ["packet-4"]]
+    assert snapshot["packets_seen"] == 5
+    assert snapshot["packets_emitted"] == 2
+    assert snapshot["packets_dropped"] == 3
+
+
+def test_batch_callback_failure_drops_whole_batch():
+    backend = ScapyCaptureBackend(role="agent", interface=None)
+
+    def on_batch(packets):
+        raise RuntimeError("consumer failed")
+
+    backend._deliver(["a", "b", "c"], None, on_batch)
+    snapshot = backend.status_snapshot()
+
+    assert snapshot["packets_seen"] == 3
+    assert snapshot["packets_dropped"] == 3
+    assert snapshot["last_error"] == "consumer failed"
+
+
+def test_flow_manager_applies_observation_batches_per_stripe():
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        start_worker=False,
+    )
+    observations = [
+        PacketObservation(
+            observed_at=1_710_000_000.0 + index,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=40000 + (index % 2),
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+        )
+        for index in range(4)
+    ]
+
+    assert manager.update_from_observations(observations) == 4
+    snapshot = manager.status_snapshot()
+    assert len(manager) == 2
+    assert snapshot["packet_count"] == 4
+    assert snapshot["byte_count"] == 400
+
+
+def test_flow_manager_expiry_wheel_only_touches_due_flows(monkeypatch):
+    from shared.collector import flow_manager as flow_manager_module
+
+    clock = {"now": 1_000.0}
+    monkeypatch.setattr(flow_manager_module.time, "time", lambda: clock["now"])
+    emitted = []
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=emitted.append,
+        tcp_timeout=60,
+        flush_interval=5.0,
+        cleanup_interval=1.0,
+        start_worker=False,
+    )
+
+    def observe(port: int, at: float) -> PacketObservation:
+        observation = PacketObservation(
+            observed_at=at,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=port,
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+        )
+        manager.update_from_observation(observation)
+        return observation
+
+    for port in range(40000, 40100):
+        observe(port, 1_000.0)
+
+    clock["now"] = 1_006.0
+    manager._expire_flows()
+    assert len(emitted) == 100
+    assert manager.status_snapshot()["expiry_last_due_flows"] == 100
+
+    observe(40000, 1_008.0)
+    clock["now"] = 1_012.0
+    manager._expire_flows()
+    snapshot = manager.status_snapshot()
+    assert len(emitted) == 101
+    assert emitted[-1].src_port == 40000 and emitted[-1].packet_count == 1
+    assert snapshot["expiry_last_due_flows"] == 1
+    assert snapshot["expiry_max_stall_ms"] >= 0.0
+
+    clock["now"] = 1_070.0
+    manager._expire_flows()
+    assert len(manager) == 0
+    assert manager.status_snapshot()["packet_count"] == 0
+    assert len(emitted) == 101
+
+
+def test_flow_manager_stripes_accept_concurrent_producers():
+    import threading
+
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        start_worker=False,
+        stripe_count=4,
+    )
+
+    def produce(interface_index: int) -> None:
+        for index in range(500):
+            manager.update_from_observation(
+                PacketObservation(
+                    observed_at=1_710_000_000.0,
+                    source_type="gateway",
+                    metadata_only=True,
+                    src_ip=f"10.{interface_index}.0.1",
+                    dst_ip="1.1.1.1",
+                    src_port=40000 + (index % 50),
+                    dst_port=443,
+                    protocol="TCP",
+                    packet_size=10,
+                )
+            )
+
+    producers = [threading.Thread(target=produce, args=(index,)) for index in range(4)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    snapshot = manager.status_snapshot()
+
+    assert snapshot["stripe_count"] == 4
+    assert snapshot["active_flow_count"] == len(manager) == 200
+    assert snapshot["packet_count"] == 2000
+    assert snapshot["byte_count"] == 20000
+    assert sum(1 for stripe in manager._stripes if stripe.flows) > 1
+
+
+def test_bidirectional_flow_manager_folds_replies_into_initiator_flow():
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        start_worker=False,
+        bidirectional=True,
+    )
+
+    def observe(src_ip, dst_ip, src_port, dst_port, size, src_mac, dst_mac):
+        observation = PacketObservation(
+            observed_at=1_710_000_000.0,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip=src_ip,
+            dst_ip=dst_ip,
+            src_port=src_port,
+            dst_port=dst_port,
+            protocol="TCP",
+            packet_size=size,
+            src_mac=src_mac,
+            dst_mac=dst_mac,
+        )
+        manager.update_from_observation(observation)
+        return observation
+
+    # The first packet sorts after its reverse, so the flow is stored under the reply key.
+    request = observe("93.184.216.34", "10.0.0.10", 443, 51000, 100, "66:77:88:99:aa:bb", "00:11:22:33:44:55")
+    observe("10.0.0.10", "93.184.216.34", 51000, 443, 1400, "00:11:22:33:44:55", "66:77:88:99:aa:bb")
+    observe("10.0.0.10", "93.184.216.34", 51000, 443, 1400, "00:11:22:33:44:55", "66:77:88:99:aa:bb")
+    state = manager.flow_state(request.flow_key)
+    summary = manager._build_summary(manager._storage_key(request.flow_key), state)
+
+    assert len(manager) == 1
+    assert (summary.src_ip, summary.src_port, summary.dst_ip, summary.dst_port) == ("93.184.216.34", 443, "10.0.0.10", 51000)
+    assert (summary.packet_count, summary.byte_count) == (3, 2900)
+    assert (summary.packets_out, summary.bytes_out) == (1, 100)
+    assert (summary.packets_in, summary.bytes_in) == (2, 2800)
+    assert (summary.src_mac, summary.dst_mac) == ("66:77:88:99:aa:bb", "00:11:22:33:44:55")
+
+
+def test_columnar_flow_table_round_trips_rows_and_releases_interned_strings():
+    from shared.collector import ColumnarFlowTable
+    from shared.collector.flow_manager import FlowState
+
+    table = ColumnarFlowTable(capacity=4)
+    v4_key = ("10.0.0.10", "1.1.1.1", 40000, 443, "TCP")
+    v6_key = ("2001:db8::1", "2001:db8::2", 5353, 5353, "UDP")
+    row = table.insert(
+        v4_key,
+        FlowState(
+            start_time=1.0,
+            last_seen=2.0,
+            last_flushed=1.0,
+            packet_count=3,
+            byte_count=300,
+            domain="example.com",
+            analysis_confidence=0.9,
+            analysis_signals=("tls_sni",),
+            reversed=True,
+        ),
+    )
+    table.insert(v6_key, FlowState(start_time=1.0, last_seen=1.0, last_flushed=1.0, packet_count=1, byte_count=90))
+    row.packet_count += 1
+    row.domain = "www.example.com"
+
+    assert len(table) == 2 and v6_key in table
+    assert set(table) == {v4_key, v6_key}
+    state = table[v4_key]
+    assert (state.packet_count, state.domain, state.sni) == (4, "www.example.com", None)
+    assert state.analysis_confidence >= 0.9 and state.analysis_signals == ("tls_sni",)
+    assert table.resolve(table.handle(v4_key, state)) is not None
+
+    detached = table.pop(v4_key)
+    assert detached.reversed is True and detached.byte_count == 300
+    assert table.get(v4_key) is None and table.resolve(state._row) is None
+    assert "www.example.com" not in table._strings._ids
+
+    for index in range(3):
+        table.insert(("10.0.0.11", "1.1.1.1", index, 443, "TCP"), detached)
+    assert len(table) == 4
+    try:
+        table.insert(("10.0.0.12", "1.1.1.1", 1, 443, "TCP"), detached)
+    except OverflowError:
+        pass
+    else:
+        raise AssertionError("full columnar table accepted a new row")
+
+
+def test_flow_manager_columnar_storage_flushes_expires_and_evicts(monkeypatch):
+    from shared.collector import flow_manager as flow_manager_module
+
+    clock = {"now": 1_000.0}
+    monkeypatch.setattr(flow_manager_module.time, "time", lambda: clock["now"])
+    emitted = []
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=emitted.append,
+        tcp_timeout=60,
+        flush_interval=5.0,
+        cleanup_interval=1.0,
+        max_flows=8,
+        stripe_count=1,
+        start_worker=False,
+        flow_storage="columnar",
+    )
+    manager.update_from_observations(
+        PacketObservation(
+            observed_at=1_000.0,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=40000 + index,
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+            domain="one.one.one.one",
+        )
+        for index in range(10)
+    )
+    snapshot = manager.status_snapshot()
+
+    assert snapshot["flow_storage"] == "columnar" and snapshot["flow_table_bytes"] > 0
+    assert len(manager) == 8
+    assert snapshot["packet_count"] == 8
+    assert [summary.src_port for summary in emitted] == [40000, 40001]
+    assert {summary.eviction_reason for summary in emitted} == {"capacity"}
+
+    clock["now"] = 1_006.0
+    manager._expire_flows()
+    assert len(emitted) == 10
+    assert {summary.domain for summary in emitted} == {"one.one.one.one"}
+    assert all(summary.packet_count == 1 for summary in emitted)
+
+    clock["now"] = 1_070.0
+    manager._expire_flows()
+    assert len(manager) == 0
+    assert manager.status_snapshot()["packet_count"] == 0
+
+
+def test_flow_manager_evicts_least_recently_seen_flow_with_final_summary():
+    emitted = []
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=emitted.append,
+        max_flows=3,
+        stripe_count=1,
+        start_worker=False,
+    )
+
+    def observe(port: int, at: float) -> None:
+        manager.update_from_observation(
+            PacketObservation(
+                observed_at=at,
+                source_type="gateway",
+                metadata_only=True,
+                src_ip="10.0.0.10",
+                dst_ip="1.1.1.1",
+                src_port=port,
+                dst_port=443,
+                protocol="TCP",
+                packet_size=100,
+            )
+        )
+
+    for offset, port in enumerate((40000, 40001, 40002)):
+        observe(port, 1_000.0 + offset)
+    observe(40000, 1_003.0)
+    observe(40000, 1_004.0)
+    observe(40003, 1_005.0)
+    snapshot = manager.status_snapshot()
+
+    assert len(manager) == 3
+    assert manager.flow_state(("10.0.0.10", "1.1.1.1", 40001, 443, "TCP")) is None
+    assert [(summary.src_port, summary.packet_count, summary.eviction_reason) for summary in emitted] == [
+        (40001, 1, "capacity")
+    ]
+    assert snapshot["evicted_flow_count"] == 1
+    assert snapshot["packet_count"] == 5
+
+
+def test_flow_shard_is_symmetric_and_pool_counts_full_queue_drops():
+    from scapy.all import UDP  # type: ignore
+
+    from shared.collector import AnalysisWorkerOptions, AnalysisWorkerPool
+    from shared.collector.pipeline import flow_shard
+
+    outbound = bytes(Ether() / IP(src="10.0.0.10", dst="1.1.1.1") / TCP(sport=40000, dport=443))
+    reply = bytes(Ether() / IP(src="1.1.1.1", dst="10.0.0.10") / TCP(sport=443, dport=40000))
+    shards = {flow_shard(bytes(Ether() / IP(src="10.0.0.10", dst="1.1.1.1") / UDP(sport=port, dport=53)), 4) for port in range(40000, 40064)}
+
+    assert flow_shard(outbound, 4) == flow_shard(reply, 4)
+    assert len(shards) > 1
+    assert flow_shard(b"\x00" * 10, 4) == 0
+
+    class _FullInbox:
+        def put_nowait(self, batch):
+            import queue
+
+            raise queue.Full
+
+        def qsize(self):
+            return 1
+
+    applied = []
+    pool = AnalysisWorkerPool(worker_count=1, options=AnalysisWorkerOptions(), on_observations=applied.extend)
+    pool._inboxes = [_FullInbox()]
+    pool._running = True
+
+    assert pool.submit([outbound, reply]) == 0
+    observation = PacketObservation.from_frame(outbound, observed_at=1_710_000_000.0)
+    pool._handle_message(("observations", 0, [observation]))
+    pool._handle_message(("status", 0, {"processed_frames": 2}))
+    snapshot = pool.status_snapshot()
+
+    assert applied == [observation]
+    assert snapshot["dropped_frames"] == 2
+    assert snapshot["processed_frames"] == 2
+    assert snapshot["applied_observations"] == 1
+    assert snapshot["workers"][0]["queue_depth"] == 1
+
+
+def test_analysis_worker_pool_round_trips_frames_through_worker_processes(tmp_path):
+    import time
+
+    from shared.collector import AnalysisWorkerOptions, AnalysisWorkerPool, DomainHintCache
+
+    snapshot = tmp_path / "domain_hints.bin"
+    seeded = DomainHintCache()
+    seeded.remember("1.1.1.1", "one.one.one.one")
+    seeded.save_snapshot(snapshot)
+
+    applied = []
+    options = AnalysisWorkerOptions(status_interval=0.1, domain_cache_snapshot_path=str(snapshot))
+    pool = AnalysisWorkerPool(worker_count=2, options=options, on_observations=applied.extend)
+    frames = [bytes(Ether() / IP(src="10.0.0.10", dst="1.1.1.1") / TCP(sport=port, dport=443)) for port in range(40000, 40016)]
+
+    pool.start()
+    try:
+        assert pool.submit(frames) == len(frames)
+        deadline = time.monotonic() + 20
+        while len(applied) < len(frames) and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert sorted(observation.src_port for observation in applied) == list(range(40000, 40016))
+    assert pool.status_snapshot()["processed_frames"] == len(frames)
+    assert pool._results._maxsize == options.queue_batches * 2
+    # Each worker warms up from the existing snapshot and saves its own file.
+    for index in range(2):
+        restored = DomainHintCache()
+        assert restored.load_snapshot(tmp_path / f"domain_hints.worker{index}.bin") == 1
+        assert restored.lookup("1.1.1.1") == "one.one.one.one"
+
+
+def test_analysis_worker_skips_inspection_at_the_shed_level_stamped_on_the_batch():
+    import queue
+    import threading
+
+    from scapy.all import Raw  # type: ignore
+
+    from shared.collector.pipeline import AnalysisWorkerOptions, _run_analysis_worker
+
+    frame = bytes(
+        Ether()
+        / IP(src="10.0.0.10", dst="1.1.1.1")
+        / TCP(sport=40000, dport=80, flags="PA")
+        / Raw(b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n")
+    )
+    outcomes = []
+    for shed_level in (0, 1):
+        inbox, results = queue.Queue(), queue.Queue()
+        inbox.put((1, shed_level, [(1_710_000_000.0, frame)]))
+        inbox.put(None)
+        _run_analysis_worker(0, AnalysisWorkerOptions(), inbox, results, threading.Event())
+        messages = [results.get_nowait() for _ in range(results.qsize())]
+        [observation] = next(payload for kind, _index, payload in messages if kind == "observations")
+        status = [payload for kind, _index, payload in messages if kind == "status"][-1]
+        outcomes.append((observation.domain, status["skipped_inspections"]))
+
+    assert outcomes == [("example.com", 0), (None, 1)]
+
+
+def test_flow_manager_flush_all_emits_every_live_flow_on_shutdown():
+    for storage in ("dict", "columnar"):
+        emitted = []
+        manager = FlowManager(
+            agent_id="GW-1",
+            organization_id="ORG-1",
+            on_flow_expired=emitted.append,
+            stripe_count=4,
+            start_worker=False,
+            flow_storage=storage,
+        )
+        manager.update_from_observations(
+            PacketObservation(
+                observed_at=1_710_000_000.0,
+                source_type="gateway",
+                metadata_only=True,
+                src_ip="10.0.0.10",
+                dst_ip="1.1.1.1",
+                src_port=40000 + index,
+                dst_port=443,
+                protocol="TCP",
+                packet_size=60,
+            )
+            for index in range(10)
+        )
+
+        assert manager.flush_all() == 10
+        assert len(manager) == 0
+        assert {summary.src_port for summary in emitted} == set(range(40000, 40010))
+        assert {summary.eviction_reason for summary in emitted} == {"shutdown"}
+        assert manager.status_snapshot()["active_flow_count"] == 0
+        assert manager.flush_all() == 0
+
+
+def test_flow_summary_keeps_the_highest_shed_level_seen_while_the_flow_was_live():
+    from shared.collector import LoadGovernor
+
+    governor = LoadGovernor(escalate_after=1, relax_after=1)
+    for storage in ("dict", "columnar"):
+        emitted = []
+        clock = {"now": 1_000.0}
+        manager = FlowManager(
+            agent_id="AGENT-1",
+            organization_id="ORG-1",
+            on_flow_expired=emitted.append,
+            flush_interval=5.0,
+            cleanup_interval=1.0,
+            stripe_count=1,
+            start_worker=False,
+            flow_storage=storage,
+            clock=lambda: clock["now"],
+        )
+        for observed_at, cpu in ((1_000.0, 99.0), (1_001.0, 10.0), (1_002.0, 10.0)):
+            governor.update(cpu)
+            observation = PacketObservation(
+                observed_at=observed_at,
+                source_type="agent",
+                metadata_only=False,
+                src_ip="10.0.0.10",
+                dst_ip="1.1.1.1",
+                src_port=40000,
+                dst_port=443,
+                protocol="TCP",
+                packet_size=100,
+            )
+            manager.update_from_observations(governor.shape([observation], 1, lambda key: True))
+        assert governor.level == 0
+
+        clock["now"] = 1_006.0
+        manager._expire_flows()
+        assert [summary.load_shed_level for summary in emitted] == [1]
+
+
+def test_load_governor_steps_levels_with_hysteresis_and_weights_sampled_counters():
+    from shared.collector import LoadGovernor
+
+    governor = LoadGovernor(escalate_after=2, relax_after=2, sample_rate=4)
+    assert governor.update(95.0) == 0
+    assert governor.update(20.0, queue_fill=0.9) == 1
+    assert governor.inspect_flow(lambda key: True)(("k",)) is False
+    governor.update(99.0)
+    governor.update(70.0)  # between the watermarks: resets both streaks
+    governor.update(99.0)
+    assert governor.update(99.0) == 2
+    governor.update(99.0)
+    assert governor.update(99.0) == 3
+
+    kept, weight = governor.sample(list(range(10)))
+    assert (kept, weight) == ([0, 4, 8], 4)
+    kept, _ = governor.sample(list(range(3)))
+    assert kept == [2]
+
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        stripe_count=1,
+        start_worker=False,
+    )
+    tracked = ("10.0.0.10", "1.1.1.1", 40000, 443, "TCP")
+    manager.update_from_observation(
+        PacketObservation(
+            observed_at=1_000.0,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=40000,
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+        )
+    )
+    observations = [
+        PacketObservation(
+            observed_at=1_001.0,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=port,
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+        )
+        for port in (40000, 50001, 50002)
+    ]
+    shaped = governor.shape(observations, 4, lambda key: manager.flow_state(key) is not None)
+    for observation in shaped:
+        manager.update_from_observation(observation)
+
+    assert [(observation.src_port, observation.sample_weight) for observation in shaped] == [
+        (40000, 4),
+        (0, 4),
+        (0, 4),
+    ]
+    assert manager.flow_state(tracked).packet_count == 5
+    assert manager.flow_state(tracked).byte_count == 500
+    assert manager.flow_state(("10.0.0.10", "1.1.1.1", 0, 0, "TCP")).packet_count == 8
+    status = governor.status_snapshot()
+    assert status["aggregated_packets"] == 2
+    assert status["sampled_out_packets"] == 9
+    # The inspection veto above is folded into the totals by the next shape().
+    assert status["skipped_inspections"] == 1
+
+    for _ in range(6):
+        governor.update(10.0, queue_fill=0.0)
+    assert governor.level == 0
+    assert governor.sample([1, 2, 3]) == ([1, 2, 3], 1)
+
+
+def test_load_governor_counters_stay_exact_across_capture_and_collector_threads():
+    import threading
+
+    from shared.collector import LoadGovernor
+
+    governor = LoadGovernor(escalate_after=1, sample_rate=2)
+    for _ in range(3):
+        governor.update(99.0)
+    inspect = governor.inspect_flow(None)
+    observations = [
+        PacketObservation(
+            observed_at=1_000.0,
+            source_type="gateway",
+            metadata_only=True,
+            src_ip="10.0.0.10",
+            dst_ip="1.1.1.1",
+            src_port=40000 + index,
+            dst_port=443,
+            protocol="TCP",
+            packet_size=100,
+        )
+        for index in range(10)
+    ]
+
+    def _hammer() -> None:
+        for _ in range(500):
+            governor.sample(list(range(10)))
+            inspect(("k",))
+            governor.shape(observations, 2, lambda key: False)
+
+    threads = [threading.Thread(target=_hammer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    status = governor.status_snapshot()
+    assert status["sampled_out_packets"] == 4 * 500 * 5
+    assert status["skipped_inspections"] == 4 * 500
+    assert status["aggregated_packets"] == 4 * 500 * 10
+
+
+def test_pcap_replay_backend_feeds_capture_timestamps_and_drives_flow_clock(tmp_path):
+    from scapy.all import UDP, wrpcap  # type: ignore
+    from scapy.utils import PcapNgWriter  # type: ignore
+
+    packets = []
+    for index in range(4):
+        packet = Ether() / IP(src="10.0.0.10", dst="1.1.1.1") / TCP(sport=40000, dport=443)
+        packet.time = 1_700_000_000.0 + index * 0.5
+        packets.append(packet)
+    late = Ether() / IP(src="10.0.0.10", dst="8.8.8.8") / UDP(sport=5353, dport=53)
+    late.time = 1_700_000_100.0
+    wrpcap(str(tmp_path / "a.pcap"), packets)
+    writer = PcapNgWriter(str(tmp_path / "b.pcapng"))
+    writer.write(late)
+    writer.close()
+
+    emitted = []
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=emitted.append,
+        stripe_count=1,
+        start_worker=False,
+    )
+    backend = build_capture_backend(
+        role="gateway",
+        interface=None,
+        requested_backend="pcap",
+        replay_path=str(tmp_path),
+        replay_speed="max",
+    )
+    manager.clock = backend.clock
+    observed = []
+
+    def on_batch(frames):
+        observations = [PacketObservation.from_packet(frame, source_type="gateway", metadata_only=True) for frame in frames]
+        observed.extend(observation.observed_at for observation in observations)
+        return manager.update_from_observations(observations)
+
+    success, error = backend.start(on_batch=on_batch)
+    replay = backend.status_snapshot()["replay"]
+
+    assert (success, error) == (True, None)
+    assert backend.live is False
+    assert observed == [1_700_000_000.0, 1_700_000_000.5, 1_700_000_001.0, 1_700_000_001.5, 1_700_000_100.0]
+    assert replay["packets_replayed"] == 5
+    assert [path.rsplit("/", 1)[-1] for path in replay["completed_files"]] == ["a.pcap", "b.pcapng"]
+    assert replay["captured_seconds"] == 100.0
+    assert replay["achieved_pps"] > 0
+    assert 1_700_000_100.0 <= backend.clock() < 1_700_000_200.0
+
+    # The replayed clock is past the TCP idle timeout, so the first flow expires.
+    manager._expire_flows()
+    assert [(summary.dst_ip, summary.packet_count) for summary in emitted] == [("1.1.1.1", 4)]
+
+    missing = build_capture_backend(role="gateway", interface=None, requested_backend="pcap", replay_path=str(tmp_path / "none"))
+    assert missing.start(on_batch=on_batch)[0] is False
+
+
+def test_flow_manager_ships_edge_flow_features_and_resets_them_on_flush():
+    from app.ml.features import EDGE_FEATURE_NAMES
+    from shared.collector.flow_features import FLOW_FEATURE_NAMES
+
+    assert FLOW_FEATURE_NAMES == EDGE_FEATURE_NAMES
+
+    def observe(manager, at, src, dst, size, flags):
+        manager.update_from_observation(
+            PacketObservation(
+                observed_at=at,
+                source_type="gateway",
+                metadata_only=True,
+                src_ip=src,
+                dst_ip=dst,
+                src_port=40000 if src == "10.0.0.10" else 443,
+                dst_port=443 if src == "10.0.0.10" else 40000,
+                protocol="TCP",
+                packet_size=size,
+                tcp_flags=flags,
+            )
+        )
+
+    for storage in ("dict", "columnar"):
+        emitted = []
+        clock = {"now": 1_000.0}
+        manager = FlowManager(
+            agent_id="GW-1",
+            organization_id="ORG-1",
+            on_flow_expired=emitted.append,
+            flush_interval=5.0,
+            cleanup_interval=1.0,
+            stripe_count=1,
+            start_worker=False,
+            bidirectional=True,
+            flow_storage=storage,
+            clock=lambda: clock["now"],
+        )
+        observe(manager, 1_000.0, "10.0.0.10", "1.1.1.1", 60, 0x02)
+        observe(manager, 1_001.0, "1.1.1.1", "10.0.0.10", 60, 0x12)
+        observe(manager, 1_002.0, "10.0.0.10", "1.1.1.1", 600, 0x18)
+        observe(manager, 1_005.0, "1.1.1.1", "10.0.0.10", 1500, 0x18)
+
+        clock["now"] = 1_006.0
+        manager._expire_flows()
+        assert len(emitted) == 1
+        features = dict(zip(FLOW_FEATURE_NAMES, emitted[0].flow_features))
+        assert features["size_le_64_ratio"] == 0.5
+        assert features["size_le_1024_ratio"] == 0.25 and features["size_gt_1024_ratio"] == 0.25
+        assert features["iat_mean"] == round(5 / 3, 6)
+        assert features["iat_std"] == round((((1 - 5 / 3) ** 2 * 2 + (3 - 5 / 3) ** 2) / 3) ** 0.5, 6)
+        assert (features["syn_ratio"], features["psh_ratio"], features["fin_ratio"]) == (0.5, 0.5, 0.0)
+        assert features["direction_changes"] == 3.0
+
+        observe(manager, 1_007.0, "1.1.1.1", "10.0.0.10", 200, 0x11)
+        clock["now"] = 1_012.0
+        manager._expire_flows()
+        features = dict(zip(FLOW_FEATURE_NAMES, emitted[1].flow_features))
+        assert features["size_le_256_ratio"] == 1.0 and features["fin_ratio"] == 1.0
+        # The interval window restarts, but the last direction carries over.
+        assert features["iat_mean"] == 2.0 and features["direction_changes"] == 0.0
+
+    disabled = []
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=disabled.append,
+        stripe_count=1,
+        start_worker=False,
+        flow_features=False,
+        clock=lambda: 2_000.0,
+    )
+    observe(manager, 1_000.0, "10.0.0.10", "1.1.1.1", 60, 0x02)
+    manager._expire_flows()
+    assert disabled[0].flow_features == ()
+
+
+def test_upload_journal_acks_out_of_order_requeues_and_recovers_torn_tail(tmp_path):
+    journal = UploadJournal(tmp_path, max_bytes=64 * 1024, segment_bytes=2048)
+    journal.open()
+    assert journal.append([{"flow": index, "pad": "x" * 40} for index in range(60)]) == 60
+
+    first = journal.next_batch(20)
+    second = journal.next_batch(20)
+    assert (first.first_seq, first.last_seq, second.first_seq, second.last_seq) == (1, 20, 21, 40)
+    assert [record["flow"] for record in second.records[:2]] == [20, 21]
+    assert not first.replay
+
+    # The second batch lands first; the failed first batch is served again before newer records.
+    journal.ack(second)
+    journal.requeue(first)
+    retry = journal.next_batch(20)
+    assert (retry.first_seq, retry.last_seq) == (1, 20)
+    assert journal.status_snapshot()["acked_seq"] == 0
+    journal.ack(retry)
+    status = journal.status_snapshot()
+    assert status["acked_seq"] == 40
+    assert status["pending_records"] == 20
+    journal.close()
+
+    newest = max(tmp_path.glob("*.seg"))
+    with newest.open("ab") as handle:
+        handle.write(b"\x00torn")
+
+    reopened = UploadJournal(tmp_path, max_bytes=64 * 1024, segment_bytes=2048)
+    reopened.open()
+    status = reopened.status_snapshot()
+    assert status["acked_seq"] == 40
+    assert status["pending_records"] == 20
+    assert status["truncated_bytes"] == 5
+    batch = reopened.next_batch(50)
+    assert (batch.first_seq, batch.last_seq) == (41, 60)
+    assert batch.records[0]["flow"] == 40
+
+    # Past the size cap the oldest segments go, and their unsent records are counted.
+    reopened.append([{"flow": index, "pad": "x" * 400} for index in range(300)])
+    status = reopened.status_snapshot()
+    assert status["bytes"] <= 64 * 1024
+    assert status["dropped_records"] > 0
+    assert reopened.next_batch(1).first_seq > 60
+    reopened.close()
+
+
+def test_upload_journal_keeps_draining_after_the_size_cap_and_a_restart(tmp_path):
+    journal = UploadJournal(tmp_path, max_bytes=4096, segment_bytes=1024)
+    journal.open()
+    journal.append([{"flow": index, "pad": "x" * 100} for index in range(60)])
+    live = journal.next_batch(5)
+    assert journal.status_snapshot()["dropped_records"] > 0
+    journal.close()
+
+    reopened = UploadJournal(tmp_path, max_bytes=4096, segment_bytes=1024)
+    reopened.open()
+    status = reopened.status_snapshot()
+    assert status["acked_seq"] == live.first_seq - 1
+    batch = reopened.next_batch(5)
+    assert batch is not None and batch.first_seq == live.first_seq
+
+    # A requeued range that now starts below the oldest segment is still served.
+    reopened.append([{"flow": index, "pad": "x" * 100} for index in range(60, 80)])
+    reopened.requeue(batch)
+    drained = []
+    while (next_batch := reopened.next_batch(50)) is not None:
+        drained.extend(record["flow"] for record in next_batch.records)
+        reopened.ack(next_batch)
+    assert drained[-1] == 79
+    assert drained == sorted(set(drained))
+    reopened.close()
+
+
+def test_upload_journal_resends_requeued_ranges_whole_unless_split_after_a_413(tmp_path):
+    journal = UploadJournal(tmp_path)
+    journal.open()
+    journal.append([{"flow": index, "pad": "x" * 200} for index in range(10)])
+    sent = journal.next_batch(10)
+    assert (sent.first_seq, sent.last_seq) == (1, 10)
+
+    # A timed-out send comes back byte for byte, whatever the current limits.
+    journal.requeue(sent)
+    retry = journal.next_batch(3, max_bytes=500)
+    assert (retry.first_seq, retry.last_seq, retry.records) == (1, 10, sent.records)
+    assert not retry.resplit
+
+    journal.requeue(retry, split=True)
+    pieces = []
+    while (piece := journal.next_batch(4, max_bytes=1000)) is not None:
+        assert piece.resplit
+        pieces.append((piece.first_seq, piece.last_seq))
+        journal.ack(piece)
+    assert pieces == [(1, 4), (5, 8), (9, 10)]
+    assert journal.status_snapshot()["resplit_batches"] == 3
+    journal.close()
+
+
+def test_upload_scheduler_backs_off_on_repeated_413_and_journal_sets_aside_a_lone_record(tmp_path):
+    now = [100.0]
+    scheduler = UploadScheduler(min_batch=20, max_batch=60, max_batch_bytes=8192, clock=lambda: now[0])
+    too_large = SimpleNamespace(status_code=413, headers={})
+
+    assert scheduler.record_failure(too_large) is True
+    status = scheduler.status_snapshot()
+    assert (status["batch_bytes"], status["paused_for_seconds"], status["consecutive_failures"]) == (4096, 2.0, 0)
+    assert not scheduler.due(100)
+
+    scheduler.record_failure(too_large)
+    scheduler.record_failure(too_large)
+    assert scheduler.batch_bytes == 1024
+    # Already at the floor: further 413s back off like any other failure.
+    scheduler.record_failure(too_large)
+    scheduler.record_failure(too_large)
+    status = scheduler.status_snapshot()
+    assert status["consecutive_failures"] == 2
+    assert status["paused_for_seconds"] == 4.0
+    assert status["too_large_events"] == 5
+
+    now[0] += 5.0
+    scheduler.record_success(20, 0.1)
+    assert scheduler.batch_bytes == 2048
+
+    journal = UploadJournal(tmp_path)
+    journal.open()
+    journal.append([{"flow": 0}, {"flow": 1}])
+    lone = journal.next_batch(1)
+    journal.reject(lone)
+    status = journal.status_snapshot()
+    assert (status["acked_seq"], status["dropped_records"], status["acked_records"]) == (1, 1, 0)
+    assert journal.next_batch(10).first_seq == 2
+    journal.close()
+
+
+def test_upload_journal_fill_ratio_tracks_the_unreleased_backlog(tmp_path):
+    journal = UploadJournal(tmp_path, max_bytes=8192, segment_bytes=1024)
+    assert journal.fill_ratio() == 0.0
+    journal.open()
+    journal.append([{"flow": index, "pad": "x" * 100} for index in range(40)])
+    backlog = journal.fill_ratio()
+    assert backlog > 0.5
+
+    while (batch := journal.next_batch(50)) is not None:
+        journal.ack(batch)
+    assert journal.fill_ratio() < backlog / 2
+    journal.close()
+
+
+def test_upload_scheduler_grows_full_fast_batches_and_backs_off_on_backpressure(tmp_path):
+    now = [100.0]
+    scheduler = UploadScheduler(min_batch=20, max_batch=60, linger=5.0, target_latency=1.0, clock=lambda: now[0])
+
+    assert not scheduler.due(0)
+    assert not scheduler.due(19)
+    assert scheduler.due(20)
+    scheduler.record_success(20, 0.2)
+    scheduler.record_success(40, 0.2)
+    scheduler.record_success(60, 0.2)
+    assert scheduler.batch_size == 60
+    scheduler.record_success(10, 0.2)  # a partial batch says nothing about capacity
+    scheduler.record_success(60, 2.5)
+    assert scheduler.batch_size == 30
+
+    now[0] += 6.0
+    assert scheduler.due(1)  # lingered long enough
+
+    backpressure = SimpleNamespace(status_code=429, headers={"Retry-After": "7"})
+    scheduler.record_failure(backpressure)
+    status = scheduler.status_snapshot()
+    assert status["batch_size"] == 20
+    assert status["paused_for_seconds"] == 7.0
+    assert not scheduler.due(100)
+    now[0] += 7.0
+    assert scheduler.due(100)
+
+    scheduler.record_failure(None)
+    scheduler.record_failure(None)
+    assert scheduler.status_snapshot()["paused_for_seconds"] == 8.0  # 2s doubling per consecutive failure
+
+    slots = UploadScheduler(max_in_flight=2)
+    assert slots.acquire_slot(timeout=0) and slots.acquire_slot(timeout=0)
+    assert not slots.acquire_slot(timeout=0.01)
+    slots.release_slot()
+    assert slots.acquire_slot(timeout=0)
+    assert slots.status_snapshot()["in_flight"] == 2
+
+    journal = UploadJournal(tmp_path)
+    journal.open()
+    journal.append([{"flow": index, "pad": "x" * 200} for index in range(10)])
+    batch = journal.next_batch(10, max_bytes=1000)
+    assert len(batch.records) == 4
+    assert journal.next_batch(10, max_bytes=1000).first_seq == 5
+    journal.close()
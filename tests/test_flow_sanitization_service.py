@@ -58,3 +58,40 @@ def test_sanitize_flow_drops_control_plane_or_broadcast_traffic():
     )
 
     assert flow_sanitization_service.sanitize_flow(flow, organization_id="default-org-id") is None
+
+
+def test_sanitize_flow_keeps_consistent_direction_counters_only():
+    flow = SimpleNamespace(
+        src_ip="10.128.88.96",
+        dst_ip="142.250.183.14",
+        src_port=51523,
+        dst_port=443,
+        protocol="tcp",
+        start_time="2026-03-21T10:00:00Z",
+        last_seen="2026-03-21T10:00:05Z",
+        packet_count=5,
+        byte_count=5000,
+        packets_out=2,
+        packets_in=3,
+        bytes_out=800,
+        bytes_in=4200,
+        eviction_reason=" Capacity ",
+        load_shed_level=7,
+        flow_features=[0.5, 0.5, 2.0],
+        duration=5.0,
+        average_packet_size=1000.0,
+        agent_id="AGENT-1",
+        source_type="gateway",
+    )
+
+    sanitized = flow_sanitization_service.sanitize_flow(flow, organization_id="default-org-id")
+    flow.bytes_in = 9000
+    inconsistent = flow_sanitization_service.sanitize_flow(flow, organization_id="default-org-id")
+
+    assert (sanitized.packets_out, sanitized.packets_in, sanitized.bytes_out, sanitized.bytes_in) == (2, 3, 800, 4200)
+    assert (inconsistent.packets_out, inconsistent.bytes_in) == (0, 0)
+    assert sanitized.eviction_reason == "capacity"
+    assert sanitized.load_shed_level == 3
+    assert sanitized.flow_features == (0.5, 0.5, 2.0)
+    flow.flow_features = [0.5, float("nan")]
+    assert flow_sanitization_service.sanitize_flow(flow, organization_id="default-org-id").flow_features == ()
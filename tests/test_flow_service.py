@@ -5,7 +5,9 @@ import json
 import pytest
 
 from app.services import flow_service as flow_service_module
-from app.services.flow_service import FlowQueueBackpressureError, flow_service
+from app.schemas.flow_schema import FlowBase
+from app.services.flow_service import FLOW_BATCH_FORMAT, FlowQueueBackpressureError, flow_service
+from shared.wire import encode_flow_batch
 
 
 def test_agent_flows_are_always_managed():
@@ -91,6 +93,8 @@ class _QueueCursor:
                     "batch_id": params[3],
                     "batch_json": params[4],
                     "flow_count": params[5],
+                    "batch_format": params[6],
+                    "batch_blob": params[7],
                 }
             )
             return
@@ -165,6 +169,54 @@ def test_buffer_flow_updates_queue_metrics(monkeypatch):
     assert len(conn.rows[0]["batch_id"]) == 64
 
 
+def test_binary_flow_batch_is_queued_as_sent_with_constant_overrides(monkeypatch):
+    conn = _QueueConnection()
+    rows = [
+        {
+            "src_ip": "10.0.0.10",
+            "dst_ip": f"8.8.8.{index}",
+            "src_port": 40000 + index,
+            "dst_port": 443,
+            "protocol": "TCP",
+            "domain": "example.com" if index % 2 else None,
+            "analysis_signals": ["tls_sni"],
+            "packet_count": 5 + index,
+            "byte_count": 500 + index,
+            "duration": 1.5,
+            "agent_id": "AGENT-1",
+            "organization_id": "org-1",
+            "start_time": "2026-04-18T00:00:00+00:00",
+            "last_seen": "2026-04-18T00:00:01.250000+00:00",
+            "average_packet_size": 100.0,
+        }
+        for index in range(3)
+    ]
+    wire_batch = encode_flow_batch(rows)
+    flows = [FlowBase(**row) for row in rows]
+
+    monkeypatch.setattr(flow_service_module, "get_db_connection", lambda: conn)
+    monkeypatch.setattr(flow_service, "_ensure_processing_ready", lambda db_conn: None)
+    monkeypatch.setattr(flow_service, "_enforce_backpressure", lambda db_conn, incoming_flows: None)
+    monkeypatch.setattr(flow_service, "_refresh_queue_depth", lambda db_conn=None: None)
+
+    queued = asyncio.run(
+        flow_service.buffer_flows(flows, wire_batch=wire_batch, wire_overrides={"load_shed_level": 2})
+    )
+
+    assert queued is True
+    [record] = conn.rows
+    assert record["batch_format"] == FLOW_BATCH_FORMAT
+    assert record["batch_json"] == ""
+    assert record["flow_count"] == 3
+    assert record["source_id"] == "AGENT-1"
+    assert len(record["batch_id"]) == 64
+
+    restored = flow_service._deserialize_batch(record)
+    assert [flow.model_dump() for flow in restored] == [
+        flow.model_copy(update={"load_shed_level": 2}).model_dump() for flow in flows
+    ]
+
+
 def test_batch_id_is_stable_for_equivalent_payloads():
     payloads = [
         {"src_ip": "10.0.0.10", "dst_ip": "8.8.8.8", "packet_count": 5},
@@ -338,11 +390,13 @@ def test_buffer_flow_raises_backpressure_when_queue_depth_is_exceeded(monkeypatc
     monkeypatch.setattr(flow_service, "_refresh_queue_depth", lambda db_conn=None: None)
     monkeypatch.setattr(flow_service_module.settings, "FLOW_INGEST_MAX_PENDING_FLOWS", 5)
     monkeypatch.setattr(flow_service_module.settings, "FLOW_INGEST_MAX_LAG_SECONDS", 30)
+    monkeypatch.setattr(flow_service_module.settings, "FLOW_INGEST_RETRY_SECONDS", 5)
 
-    with pytest.raises(FlowQueueBackpressureError):
+    with pytest.raises(FlowQueueBackpressureError) as exc_info:
         asyncio.run(flow_service.buffer_flow(item))
 
     assert conn.rolled_back is True
+    assert exc_info.value.retry_after == 5
 
 
 def test_deserialize_batch_rehydrates_flow_models():
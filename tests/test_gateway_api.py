@@ -6,13 +6,18 @@ from datetime import datetime, timezone
 
 import pytest
 from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
 
 from app.api import gateway as gateway_api
 from app.core.config import settings
+from app.core.request_encoding import DecodedBodyRequest
+from shared.security.body_encoding import encode_body
 from shared.security.agent_auth import sign_request
-from app.services.flow_service import FlowQueueBackpressureError
+from app.services.flow_service import FLOW_BATCH_FORMAT, FlowQueueBackpressureError, flow_service
 from app.services.gateway_auth_service import gateway_auth_service
-from app.schemas.flow_schema import FlowBase
+from app.services.load_shedding_service import LoadSheddingService
+from app.schemas.flow_schema import FlowBase, FlowBatch
+from shared.wire import FLOW_BATCH_MEDIA_TYPE, encode_flow_batch, replace_flow_batch_columns
 
 
 class _RequestUrl:
@@ -173,7 +178,15 @@ def _seed_credential(monkeypatch, gateway_id: str, *, key_version: int = 1, secr
     return secret, row
 
 
-def _signed_headers(*, secret: str, gateway_id: str, key_version: int, path: str, body: bytes) -> dict[str, str]:
+def _signed_headers(
+    *,
+    secret: str,
+    gateway_id: str,
+    key_version: int,
+    path: str,
+    body: bytes,
+    content_encoding: str | None = None,
+) -> dict[str, str]:
     timestamp = str(int(datetime.now(timezone.utc).timestamp()))
     nonce = f"nonce-{path.rsplit('/', 1)[-1]}"
     signature = sign_request(
@@ -183,8 +196,9 @@ def _signed_headers(*, secret: str, gateway_id: str, key_version: int, path: str
         timestamp=timestamp,
         nonce=nonce,
         body=body,
+        content_encoding=content_encoding,
     )
-    return {
+    headers = {
         "Content-Type": "application/json",
         "X-Gateway-Id": gateway_id,
         "X-NetVisor-Key-Version": str(key_version),
@@ -192,6 +206,9 @@ def _signed_headers(*, secret: str, gateway_id: str, key_version: int, path: str
         "X-NetVisor-Nonce": nonce,
         "X-NetVisor-Signature": signature,
     }
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return headers
 
 
 def test_gateway_register_bootstrap_returns_initial_credential(monkeypatch):
@@ -293,9 +310,15 @@ def test_gateway_heartbeat_accepts_signed_auth(monkeypatch):
 
     monkeypatch.setattr(gateway_api, "get_db_connection", lambda: conn)
     monkeypatch.setattr(gateway_api.gateway_service, "upsert_gateway", _upsert)
+    monkeypatch.setattr(gateway_api, "load_shedding_service", LoadSheddingService())
 
     body = json.dumps(
-        {"gateway_id": "GW-1", "hostname": "gw-host", "capture_mode": "promiscuous"},
+        {
+            "gateway_id": "GW-1",
+            "hostname": "gw-host",
+            "capture_mode": "promiscuous",
+            "load_shedding": {"level": 2, "level_name": "sampling"},
+        },
         separators=(",", ":"),
     ).encode("utf-8")
     auth_context = _run(
@@ -327,6 +350,34 @@ def test_gateway_heartbeat_accepts_signed_auth(monkeypatch):
     assert payload["message"] == "Gateway heartbeat recorded."
     assert payload["organization_id"] == "default-org-id"
     assert upserts == [("GW-1", "default-org-id", "gw-host", "promiscuous")]
+    assert gateway_api.load_shedding_service.level_for("GW-1") == 2
+
+
+def test_load_shedding_annotation_keeps_the_level_the_collector_reported():
+    service = LoadSheddingService()
+    service.record("GW-1", {"level": 2})
+    fields = {
+        "src_ip": "10.0.0.10",
+        "dst_ip": "8.8.8.8",
+        "src_port": 12345,
+        "dst_port": 443,
+        "protocol": "tcp",
+        "packet_count": 10,
+        "byte_count": 1200,
+        "duration": 1.25,
+        "agent_id": "GW-1",
+        "organization_id": "default-org-id",
+        "start_time": "2026-04-16T00:00:00Z",
+        "last_seen": "2026-04-16T00:00:01Z",
+        "average_packet_size": 120.0,
+    }
+    captured_normally = FlowBase(**fields, load_shed_level=0)
+    captured_while_shedding = FlowBase(**fields, load_shed_level=3)
+    legacy = FlowBase(**fields)
+
+    annotated = service.annotate([captured_normally, captured_while_shedding, legacy], "GW-1")
+
+    assert [flow.load_shed_level for flow in annotated] == [0, 3, 2]
 
 
 def test_gateway_flow_batch_accepts_signed_auth_and_normalizes_payload(monkeypatch):
@@ -337,7 +388,7 @@ def test_gateway_flow_batch_accepts_signed_auth_and_normalizes_payload(monkeypat
     conn = _Connection(credentials={("GW-1", 1): row}, gateway_orgs={"GW-1": "default-org-id"})
     buffered = []
 
-    async def _buffer_flows(flows):
+    async def _buffer_flows(flows, **_wire):
         buffered.extend(flows)
         return True
 
@@ -385,6 +436,7 @@ def test_gateway_flow_batch_accepts_signed_auth_and_normalizes_payload(monkeypat
 
     payload = _run(
         gateway_api.ingest_gateway_batch(
+            _Request(method="POST", path="/api/v1/gateway/flows/batch", headers={}, body=body),
             [flow],
             _rate_limited=True,
             auth_context=auth_context,
@@ -399,6 +451,117 @@ def test_gateway_flow_batch_accepts_signed_auth_and_normalizes_payload(monkeypat
     assert buffered[0].metadata_only is True
 
 
+def _asgi_request(path: str, headers: dict[str, str], body: bytes) -> DecodedBodyRequest:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "path": path,
+        "query_string": b"",
+        "headers": [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()],
+    }
+    return DecodedBodyRequest(scope, receive)
+
+
+def test_gateway_flow_batch_accepts_gzip_body_signed_as_sent(monkeypatch):
+    monkeypatch.setattr(settings, "BACKEND_TLS_PINS_JSON", "[]")
+    monkeypatch.setattr(settings, "AGENT_MAX_CLOCK_SKEW_SECONDS", 60)
+    monkeypatch.setattr(settings, "AGENT_NONCE_TTL_SECONDS", 300)
+    monkeypatch.setattr(settings, "REQUEST_MAX_DECOMPRESSED_BYTES", 4096)
+    secret, row = _seed_credential(monkeypatch, "GW-1")
+    conn = _Connection(credentials={("GW-1", 1): row}, gateway_orgs={"GW-1": "default-org-id"})
+    monkeypatch.setattr(gateway_api, "get_db_connection", lambda: conn)
+
+    path = "/api/v1/gateway/flows/batch"
+    body = json.dumps([{"agent_id": "GW-1", "src_ip": "10.0.0.10"}] * 20, separators=(",", ":")).encode("utf-8")
+    compressed = encode_body(body, "gzip")
+    headers = _signed_headers(
+        secret=secret, gateway_id="GW-1", key_version=1, path=path, body=compressed, content_encoding="gzip"
+    )
+    request = _asgi_request(path, headers, compressed)
+
+    auth_context = _run(gateway_api.validate_gateway_request(request))
+    assert auth_context["auth_mode"] == "signed"
+    assert _run(request.body()) == body
+
+    # The coding is part of the signed message, so it cannot be added or swapped.
+    unsigned_coding = _signed_headers(secret=secret, gateway_id="GW-1", key_version=1, path=path, body=compressed)
+    unsigned_coding["Content-Encoding"] = "gzip"
+    unsigned_coding["X-NetVisor-Nonce"] = "nonce-unsigned-coding"
+    with pytest.raises(HTTPException) as unsigned_error:
+        _run(gateway_api.validate_gateway_request(_asgi_request(path, unsigned_coding, compressed)))
+    assert unsigned_error.value.status_code == 403
+
+    bomb = encode_body(b"[" + b" " * 8192 + b"]", "gzip")
+    with pytest.raises(HTTPException) as too_large:
+        _run(_asgi_request(path, {"Content-Encoding": "gzip"}, bomb).body())
+    assert too_large.value.status_code == 413
+    with pytest.raises(HTTPException) as unsupported:
+        _run(_asgi_request(path, {"Content-Encoding": "br"}, compressed).body())
+    assert unsupported.value.status_code == 415
+    assert "gzip" in unsupported.value.headers["Accept-Encoding"]
+
+
+def test_gateway_flow_batch_accepts_binary_body_and_stamps_gateway_identity(monkeypatch):
+    monkeypatch.setattr(settings, "BACKEND_TLS_PINS_JSON", "[]")
+    monkeypatch.setattr(settings, "AGENT_MAX_CLOCK_SKEW_SECONDS", 60)
+    monkeypatch.setattr(settings, "AGENT_NONCE_TTL_SECONDS", 300)
+    secret, row = _seed_credential(monkeypatch, "GW-1")
+    conn = _Connection(credentials={("GW-1", 1): row}, gateway_orgs={"GW-1": "default-org-id"})
+    queued = {}
+
+    async def _buffer_flows(flows, **wire):
+        queued.update(wire, flows=flows)
+        return True
+
+    monkeypatch.setattr(gateway_api, "get_db_connection", lambda: conn)
+    monkeypatch.setattr(gateway_api.flow_service, "buffer_flows", _buffer_flows)
+
+    path = "/api/v1/gateway/flows/batch"
+    rows = [
+        {
+            "src_ip": "10.0.0.10",
+            "dst_ip": "8.8.8.8",
+            "src_port": 12345 + index,
+            "dst_port": 443,
+            "protocol": "tcp",
+            "packet_count": 10,
+            "byte_count": 1200,
+            "duration": 1.25,
+            "agent_id": "GW-1",
+            "organization_id": "default-org-id",
+            "start_time": "2026-04-16T00:00:00+00:00",
+            "last_seen": "2026-04-16T00:00:01+00:00",
+            "average_packet_size": 120.0,
+        }
+        for index in range(2)
+    ]
+    body = encode_flow_batch(rows)
+    headers = _signed_headers(secret=secret, gateway_id="GW-1", key_version=1, path=path, body=body)
+    headers["Content-Type"] = FLOW_BATCH_MEDIA_TYPE
+    request = _asgi_request(path, headers, body)
+
+    auth_context = _run(gateway_api.validate_gateway_request(request))
+    flows = TypeAdapter(FlowBatch).validate_python(_run(request.body()))
+    payload = _run(gateway_api.ingest_gateway_batch(request, flows, _rate_limited=True, auth_context=auth_context))
+
+    assert payload["message"] == "Queued 2/2 gateway flows"
+    assert queued["wire_batch"] == body
+    assert queued["wire_overrides"]["source_type"] == "gateway"
+    assert queued["wire_overrides"]["metadata_only"] is True
+    stored = flow_service._deserialize_batch(
+        {"batch_format": FLOW_BATCH_FORMAT, "batch_blob": replace_flow_batch_columns(body, queued["wire_overrides"])}
+    )
+    assert [flow.model_dump() for flow in stored] == [flow.model_dump() for flow in queued["flows"]]
+
+    with pytest.raises(ValidationError):
+        TypeAdapter(FlowBatch).validate_python(body[:-3])
+
+
 def test_gateway_flow_batch_returns_429_when_backpressure_is_active(monkeypatch):
     monkeypatch.setattr(settings, "BACKEND_TLS_PINS_JSON", "[]")
     monkeypatch.setattr(settings, "AGENT_MAX_CLOCK_SKEW_SECONDS", 60)
@@ -406,8 +569,8 @@ def test_gateway_flow_batch_returns_429_when_backpressure_is_active(monkeypatch)
     secret, row = _seed_credential(monkeypatch, "GW-1")
     conn = _Connection(credentials={("GW-1", 1): row}, gateway_orgs={"GW-1": "default-org-id"})
 
-    async def _buffer_flows(flows):
-        raise FlowQueueBackpressureError("queue overloaded")
+    async def _buffer_flows(flows, **_wire):
+        raise FlowQueueBackpressureError("queue overloaded", retry_after=7)
 
     monkeypatch.setattr(gateway_api, "get_db_connection", lambda: conn)
     monkeypatch.setattr(gateway_api.flow_service, "buffer_flows", _buffer_flows)
@@ -454,6 +617,7 @@ def test_gateway_flow_batch_returns_429_when_backpressure_is_active(monkeypatch)
     with pytest.raises(HTTPException) as exc_info:
         _run(
             gateway_api.ingest_gateway_batch(
+                _Request(method="POST", path="/api/v1/gateway/flows/batch", headers={}, body=body),
                 [flow],
                 _rate_limited=True,
                 auth_context=auth_context,
@@ -461,6 +625,7 @@ def test_gateway_flow_batch_returns_429_when_backpressure_is_active(monkeypatch)
         )
 
     assert exc_info.value.status_code == 429
+    assert exc_info.value.headers["Retry-After"] == "7"
 
 
 def test_rotate_gateway_credential_rotates_versions(monkeypatch):
@@ -101,3 +101,38 @@ def test_remote_tls_pin_mismatch_is_rejected(monkeypatch):
     except requests.exceptions.SSLError as exc:
         assert "pin mismatch" in str(exc).lower()
     assert response.closed is True
+
+
+def test_tls_pin_check_is_cached_per_connection_until_pins_rotate(monkeypatch):
+    client = _client(
+        _tmpdir(),
+        pins=[{"pin_type": "cert_sha256", "pin_sha256": "A" * 64, "status": "active"}],
+    )
+    socket_type = type("Sock", (), {})
+    kept_alive, fresh = socket_type(), socket_type()
+    inspected = []
+
+    def _response(sock):
+        response = FakeResponse()
+        response.raw = type("Raw", (), {"connection": type("Conn", (), {"sock": sock})()})()
+        return response
+
+    monkeypatch.setattr(client, "_extract_peer_certificate", lambda response: inspected.append(response) or b"cert")
+    monkeypatch.setattr(client, "_pin_fingerprint", lambda pin_type, certificate_der: "A" * 64)
+    url = "https://example.com/api/v1/gateway/flows/batch"
+
+    client._enforce_tls_pins(url, _response(kept_alive))
+    client._enforce_tls_pins(url, _response(kept_alive))
+    client._enforce_tls_pins(url, _response(fresh))
+    assert len(inspected) == 2
+
+    client.seed_pins(
+        [
+            {"pin_type": "cert_sha256", "pin_sha256": "A" * 64, "status": "next"},
+            {"pin_type": "cert_sha256", "pin_sha256": "C" * 64, "status": "active"},
+        ]
+    )
+    client._enforce_tls_pins(url, _response(kept_alive))
+    assert len(inspected) == 3
+    status = client.status_snapshot()
+    assert (status["pin_checks"], status["pin_cache_hits"]) == (3, 1)
@@ -18,7 +18,11 @@ def test_flow_feature_contract_is_versioned():
         dst_port=443,
     )
 
-    assert extract_flow_features(flow) == [10.0, 2048.0, 2.5, 204.8, 51515.0, 443.0]
+    assert extract_flow_features(flow) == [10.0, 2048.0, 2.5, 204.8, 51515.0, 443.0] + [0.0] * 13
+
+    flow.flow_features = (0.5, 0, 0, 0, 0, 0.5, 0.25, 0.1, 0.5, 0, 0, 0.5, 3)
+    assert extract_flow_features(flow)[6:] == [0.5, 0.0, 0.0, 0.0, 0.0, 0.5, 0.25, 0.1, 0.5, 0.0, 0.0, 0.5, 3.0]
+    assert extract_flow_features(flow, FEATURE_NAMES[:6]) == [10.0, 2048.0, 2.5, 204.8, 51515.0, 443.0]
     assert feature_metadata() == {
         "feature_version": FEATURE_VERSION,
         "feature_names": list(FEATURE_NAMES),
@@ -34,7 +38,7 @@ def test_unfitted_model_returns_zero():
         os.remove(temp_model_path)
     
     model = NetVisorModel(model_path=temp_model_path)
-    features = [1, 2, 3, 4, 5, 6]
+    features = list(range(len(FEATURE_NAMES)))
     
     # This should return 0.0 and NOT raise a 'NotFittedError' or log a warning
     score = model.predict(features)
@@ -49,13 +53,13 @@ def test_model_fitting_and_prediction():
     model = NetVisorModel(model_path=temp_model_path)
     
     # Create some dummy data to fit
-    X_train = np.random.rand(100, 6)
+    X_train = np.random.rand(100, len(FEATURE_NAMES))
     model.fit(X_train)
     
     assert os.path.exists(temp_model_path)
     
     # Now predict should return a value between 0 and 1
-    features = [0.5, 0.5, 0.5, 0.5, 0.5, 0.5]
+    features = [0.5] * len(FEATURE_NAMES)
     score = model.predict(features)
     assert 0.0 <= score <= 1.0
     persisted = joblib.load(temp_model_path)
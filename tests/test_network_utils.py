@@ -29,3 +29,23 @@ def test_mac_normalization_and_unicast_filtering():
     assert is_unicast_mac("aa:bb:cc:dd:ee:ff") is True
     assert is_unicast_mac("ff:ff:ff:ff:ff:ff") is False
     assert normalize_ip(" 10.0.0.5 ") == "10.0.0.5"
+
+
+def test_shared_ip_scope_matches_ipaddress_semantics_and_is_cached():
+    import ipaddress
+
+    from shared.network import ip_scope, is_trackable_private_ip, scope_cache_info
+
+    assert ip_scope("::ffff:10.0.0.1").address == str(ipaddress.ip_address("::ffff:10.0.0.1"))
+    assert ip_scope("ff02::1").scope == "control"
+    assert ip_scope("2001:db8::1").scope == "external"
+    assert ip_scope("01.2.3.4").address is None
+    assert ip_scope(ipaddress.ip_address("192.168.1.10")).scope == "internal"
+    assert is_trackable_private_ip("198.18.0.1") is True
+    assert is_trackable_private_ip("169.254.1.1") is False
+    assert is_trackable_private_ip("0.0.0.0") is False
+
+    before = scope_cache_info()["hits"]
+    for _ in range(3):
+        classify_ip_scope("10.128.88.96")
+    assert scope_cache_info()["hits"] >= before + 2
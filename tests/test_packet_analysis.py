@@ -1,4 +1,4 @@
-from scapy.all import DNS, DNSQR, Ether, IP, IPv6, Raw, TCP, UDP  # type: ignore
+from scapy.all import DNS, DNSQR, Ether, ICMP, IP, IPv6, Raw, TCP, UDP  # type: ignore
 
 from shared.collector import PacketObservation, analyze_packet
 
@@ -36,7 +36,7 @@ def test_analyze_packet_classifies_http_host_header():
 
 
 def test_analyze_packet_classifies_tls_sni(monkeypatch):
-    monkeypatch.setattr("shared.collector.analysis._extract_tls_sni", lambda _: "github.com")
+    monkeypatch.setattr("shared.collector.payload._extract_tls_sni", lambda _: "github.com")
     packet = IP(src="10.0.0.10", dst="140.82.112.4") / TCP(sport=54001, dport=443) / Raw(load=b"client-hello")
 
     analysis = analyze_packet(packet)
@@ -66,3 +66,265 @@ def test_packet_observation_supports_ipv6_and_analysis():
     assert observation.protocol == "TCP"
     assert observation.application_protocol == "HTTPS"
     assert observation.service_name == "https"
+
+
+def _scapy_and_frame_analysis(packet, domain_cache=None):
+    frame = bytes(packet if packet.haslayer(Ether) else Ether() / packet)
+    return analyze_packet(packet, domain_cache), analyze_packet(frame, domain_cache)
+
+
+def test_frame_decoder_matches_scapy_for_dns_http_and_port_signatures():
+    packets = [
+        IP(src="10.0.0.10", dst="8.8.8.8") / UDP(sport=53000, dport=53) / DNS(rd=1, qd=DNSQR(qname="example.com")),
+        Ether()
+        / IPv6(src="2001:db8::10", dst="2001:db8::20")
+        / TCP(sport=54001, dport=80)
+        / Raw(load=b"GET /index.html HTTP/1.1\r\nHost: example.com\r\nUser-Agent: netvisor\r\n\r\n"),
+        Ether() / IPv6(src="2001:db8::1", dst="2001:db8::2") / TCP(sport=12345, dport=443),
+        IP(src="10.0.0.10", dst="1.1.1.1") / UDP(sport=40000, dport=123) / Raw(load=b"\x1b" + b"\x00" * 47),
+        IP(src="10.0.0.10", dst="1.1.1.1") / TCP(sport=40000, dport=3389) / Raw(load=b"\x03\x00\x00\x13"),
+        IP(src="10.0.0.10", dst="1.1.1.1") / TCP(sport=40000, dport=40001) / Raw(load=b"HTTP/1.1 200 OK\r\n\r\n"),
+        IP(src="10.0.0.10", dst="1.1.1.1") / ICMP(),
+    ]
+
+    for packet in packets:
+        scapy_analysis, frame_analysis = _scapy_and_frame_analysis(packet)
+        assert frame_analysis == scapy_analysis, packet.summary()
+
+
+def test_frame_decoder_matches_scapy_for_tls_sni(monkeypatch):
+    monkeypatch.setattr("shared.collector.payload._extract_tls_sni", lambda _: "github.com")
+    packet = IP(src="10.0.0.10", dst="140.82.112.4") / TCP(sport=54001, dport=443) / Raw(load=b"client-hello")
+
+    scapy_analysis, frame_analysis = _scapy_and_frame_analysis(packet)
+
+    assert frame_analysis == scapy_analysis
+    assert frame_analysis.sni == "github.com"
+
+
+def test_inspect_payload_bounds_scan_and_classifies_banners():
+    from shared.collector import inspect_payload
+
+    request = b"GET / HTTP/1.1\r\nHost: Example.COM.\r\n\r\n"
+    assert inspect_payload(request).http_host == "example.com"
+    # A Host header is only trusted after an HTTP request or status line.
+    assert inspect_payload(b"From: a@b\r\nHost: attacker.example\r\n\r\n").http_host is None
+    assert inspect_payload(b"GET / HTTP/1.1\r\n" + b"X" * 64 + b"\r\nHost: late.example\r\n", limit=32).http_host is None
+    assert inspect_payload(b"").has_payload is False
+
+    packet = IP(src="10.0.0.10", dst="10.0.0.20") / TCP(sport=2222, dport=40000) / Raw(load=b"SSH-2.0-OpenSSH_9.6\r\n")
+    scapy_analysis, frame_analysis = _scapy_and_frame_analysis(packet)
+
+    assert frame_analysis == scapy_analysis
+    assert scapy_analysis.application_protocol == "SSH"
+    assert scapy_analysis.classification_source == "payload_signature"
+    assert "ssh_banner" in scapy_analysis.signals
+
+
+def test_frame_decoder_feeds_dns_answers_into_domain_cache():
+    from scapy.all import DNSRR, Dot1Q  # type: ignore
+
+    from shared.collector import DomainHintCache
+
+    cache = DomainHintCache()
+    response = (
+        Ether()
+        / Dot1Q(vlan=20)
+        / IP(src="10.128.88.1", dst="10.128.88.172")
+        / UDP(sport=53, dport=54000)
+        / DNS(id=1, qr=1, qd=DNSQR(qname="chatgpt.com"), an=DNSRR(rrname="chatgpt.com", type="A", rdata="51.116.253.169"))
+    )
+
+    analysis = analyze_packet(bytes(response), cache)
+    followup = analyze_packet(bytes(Ether() / IP(src="10.128.88.172", dst="51.116.253.169") / UDP(sport=54001, dport=443)), cache)
+
+    assert analysis.application_protocol == "DNS"
+    assert analysis.domain == "chatgpt.com"
+    assert cache.lookup("51.116.253.169") == "chatgpt.com"
+    assert followup.domain == "chatgpt.com"
+
+
+def test_packet_observation_from_frame_matches_scapy_observation():
+    packet = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb") / IP(src="10.0.0.10", dst="8.8.8.8") / TCP(sport=12345, dport=443)
+
+    scapy_observation = PacketObservation.from_packet(packet, observed_at=1_710_000_000.0)
+    frame_observation = PacketObservation.from_packet(bytes(packet), observed_at=1_710_000_000.0)
+
+    assert frame_observation == scapy_observation
+    assert frame_observation.src_mac == "00:11:22:33:44:55"
+    assert PacketObservation.from_frame(b"\x00" * 10) is None
+
+
+def test_classified_flows_skip_payload_inspection_until_recheck(monkeypatch):
+    from shared.collector import ClassificationPolicy, FlowManager
+    from shared.collector import observations as observations_module
+
+    manager = FlowManager(
+        agent_id="GW-1",
+        organization_id="ORG-1",
+        on_flow_expired=lambda summary: None,
+        start_worker=False,
+        classification_policy=ClassificationPolicy(min_confidence=0.9, recheck_interval=30.0),
+    )
+    analysed = []
+    real_analyze_frame = observations_module.analyze_frame
+
+    def counting_analyze_frame(decoded, domain_cache=None, reassembler=None):
+        analysed.append(decoded)
+        return real_analyze_frame(decoded, domain_cache=domain_cache, reassembler=reassembler)
+
+    monkeypatch.setattr(observations_module, "analyze_frame", counting_analyze_frame)
+    request = bytes(
+        Ether()
+        / IP(src="10.0.0.10", dst="93.184.216.34")
+        / TCP(sport=54000, dport=80, flags="PA")
+        / Raw(load=b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n")
+    )
+
+    for offset in range(5):
+        observation = PacketObservation.from_packet(
+            request, observed_at=1_000.0 + offset, inspect_flow=lambda key: manager.should_inspect(key, now=1_000.0 + offset)
+        )
+        manager.update_from_observation(observation)
+    state = manager.flow_state(observation.flow_key)
+    snapshot = manager.status_snapshot()
+
+    assert len(analysed) == 1
+    assert state.packet_count == 5
+    assert state.application_protocol == "HTTP"
+    assert state.domain == "example.com"
+    assert snapshot["classification_skipped_packets"] == 4
+    assert snapshot["classification_skip_rate"] == 0.8
+    assert manager.should_inspect(observation.flow_key, now=1_031.0) is True
+
+
+def test_dns_and_unenriched_flows_are_always_inspected():
+    from shared.collector import FlowManager
+
+    manager = FlowManager(agent_id="GW-1", organization_id="ORG-1", on_flow_expired=lambda summary: None, start_worker=False)
+    dns = PacketObservation.from_packet(
+        bytes(Ether() / IP(src="10.0.0.10", dst="8.8.8.8") / UDP(sport=53000, dport=53) / DNS(rd=1, qd=DNSQR(qname="example.com")))
+    )
+    ssh = PacketObservation.from_packet(bytes(Ether() / IP(src="10.0.0.10", dst="10.0.0.20") / TCP(sport=50000, dport=22)))
+    manager.update_from_observation(dns)
+    manager.update_from_observation(ssh)
+
+    assert manager.should_inspect(dns.flow_key) is True
+    assert manager.should_inspect(ssh.flow_key) is True
+    for _ in range(manager.classification_policy.unenriched_packet_budget):
+        manager.update_from_observation(ssh)
+    assert manager.should_inspect(ssh.flow_key) is False
+
+
+def test_domain_hint_cache_evicts_least_recently_used_and_expires_lazily(monkeypatch):
+    from shared.collector import DomainHintCache
+    from shared.collector import traffic_metadata
+
+    clock = {"now": 1_000.0}
+    monkeypatch.setattr(traffic_metadata.time, "time", lambda: clock["now"])
+    cache = DomainHintCache(ttl_seconds=60, max_entries=2)
+
+    cache.remember("1.1.1.1", "one.example")
+    cache.remember("2.2.2.2", "two.example")
+    assert cache.lookup("1.1.1.1") == "one.example"
+    cache.remember("3.3.3.3", "three.example")
+
+    assert cache.lookup("2.2.2.2") is None
+    assert cache.lookup("1.1.1.1") == "one.example"
+
+    clock["now"] = 1_061.0
+    assert cache.lookup("3.3.3.3") is None
+    cache.remember("4.4.4.4", "four.example")
+    snapshot = cache.status_snapshot()
+
+    assert snapshot["entries"] == 1
+    assert snapshot["hits"] == 2
+    assert snapshot["misses"] == 2
+    assert snapshot["evicted"] == 1
+    assert snapshot["expired"] == 2
+    assert snapshot["max_entries"] == 2
+
+
+def test_domain_hint_cache_snapshot_round_trip_preserves_ttls(monkeypatch, tmp_path):
+    from shared.collector import DomainHintCache
+    from shared.collector import traffic_metadata
+
+    clock = {"now": 1_000.0}
+    monkeypatch.setattr(traffic_metadata.time, "time", lambda: clock["now"])
+    snapshot_path = tmp_path / "domain_hints.bin"
+    cache = DomainHintCache(ttl_seconds=60)
+    cache.remember("51.116.253.169", "chatgpt.com")
+    cache.remember("2606:4700::6810:85e5", "cloudflare.com")
+    clock["now"] = 1_030.0
+    cache.remember("140.82.112.4", "github.com")
+
+    assert cache.save_snapshot(snapshot_path) == 3
+
+    clock["now"] = 1_070.0
+    restored = DomainHintCache(ttl_seconds=60)
+    assert restored.load_snapshot(snapshot_path) == 1
+    assert restored.lookup("140.82.112.4") == "github.com"
+    assert restored.lookup("51.116.253.169") is None
+    snapshot = restored.status_snapshot()
+    assert snapshot["snapshot_loaded_entries"] == 1
+    assert snapshot["snapshot_age_seconds"] == 40.0
+
+    clock["now"] = 1_091.0
+    assert restored.lookup("140.82.112.4") is None
+
+    corrupt_path = tmp_path / "corrupt.bin"
+    corrupt_path.write_bytes(b"NVDH" + b"\x00" * 40)
+    assert DomainHintCache().load_snapshot(corrupt_path) == 0
+    assert DomainHintCache().load_snapshot(tmp_path / "missing.bin") == 0
+
+
+def _client_hello(server_name: str) -> bytes:
+    import ssl
+
+    incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+    connection = ssl.create_default_context().wrap_bio(incoming, outgoing, server_hostname=server_name)
+    try:
+        connection.do_handshake()
+    except ssl.SSLWantReadError:
+        pass
+    return outgoing.read()
+
+
+def test_tls_reassembler_joins_client_hello_split_across_segments():
+    from shared.collector import TlsHelloReassembler
+
+    hello = _client_hello("pq.example.org")
+    head, tail = hello[:200], hello[200:]
+
+    for to_wire in (lambda packet: packet, lambda packet: bytes(Ether() / packet)):
+        reassembler = TlsHelloReassembler()
+        first = IP(src="10.0.0.10", dst="10.0.0.20") / TCP(sport=50000, dport=443, seq=1000) / Raw(load=head)
+        second = IP(src="10.0.0.10", dst="10.0.0.20") / TCP(sport=50000, dport=443, seq=1200) / Raw(load=tail)
+
+        assert analyze_packet(to_wire(first), reassembler=reassembler).sni is None
+        assert reassembler.status_snapshot()["buffered_bytes"] == 200
+        analysis = analyze_packet(to_wire(second), reassembler=reassembler)
+
+        assert analysis.sni == "pq.example.org"
+        assert analysis.application_protocol == "HTTPS"
+        assert reassembler.status_snapshot()["buffered_bytes"] == 0
+        assert reassembler.status_snapshot()["reassembled"] == 1
+
+
+def test_tls_reassembler_releases_least_recent_flow_over_budget():
+    from shared.collector import TlsHelloReassembler
+    from shared.collector.payload import inspect_payload
+
+    hello = _client_hello("budget.example.org")
+    reassembler = TlsHelloReassembler(max_flow_bytes=len(hello), max_total_bytes=len(hello))
+    for port in (50000, 50001, 50002):
+        reassembler.feed(("10.0.0.10", "10.0.0.20", port, 443), 1, hello[:300], inspect_payload(hello[:300]))
+
+    snapshot = reassembler.status_snapshot()
+    assert snapshot["flows"] == 1
+    assert snapshot["evicted"] == 2
+    assert snapshot["buffered_bytes"] <= len(hello)
+    assert reassembler.pending(("10.0.0.10", "10.0.0.20", 50002, 443))
+    # A gap abandons the buffer instead of joining unrelated bytes.
+    reassembler.feed(("10.0.0.10", "10.0.0.20", 50002, 443), 900, hello[300:], inspect_payload(hello[300:]))
+    assert reassembler.status_snapshot()["abandoned"] == 1
@@ -88,3 +88,31 @@ def test_brute_force_detection_handles_timestamp_only_bucket_entries():
     assert "Potential Brute Force Attack" in report["reasons"]
     assert report["severity"] in {"HIGH", "CRITICAL"}
 
+
+
+def test_data_exfiltration_uses_upload_direction_of_bidirectional_flows():
+    from datetime import datetime, timezone
+
+    from app.detection.signals import DetectionSignals
+
+    signals = DetectionSignals()
+    observed_at = datetime(2026, 3, 18, 10, 0, tzinfo=timezone.utc)
+    download = make_flow(
+        byte_count=9_000_000,
+        bytes_out=100_000,
+        bytes_in=8_900_000,
+        internal_device_ip="10.0.0.10",
+        external_endpoint_ip="8.8.8.8",
+    )
+    inbound_upload = make_flow(
+        src_ip="8.8.8.8",
+        dst_ip="10.0.0.10",
+        byte_count=9_000_000,
+        bytes_out=100_000,
+        bytes_in=8_900_000,
+        internal_device_ip="10.0.0.10",
+        external_endpoint_ip="8.8.8.8",
+    )
+
+    assert signals.detect_data_exfiltration(download, observed_at) is None
+    assert signals.detect_data_exfiltration(inbound_upload, observed_at) is not None